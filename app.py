@@ -1,8 +1,14 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime, timedelta
-import json
 import os
+import sqlite3
+from data import dedup, maintenance
+from data.change_log import set_actor
+from data.database import db
+from data.models import BusinessProfile, Client, Invoice, InvoiceStatus, Purchase
+from components.charts import render_series_chart
+from components.invoice_form import render_client_lookup, render_credit_warning, render_template_loader
+from utils import instrumentation, kpi
 
 # ================= CONFIGURATION =================
 st.set_page_config(
@@ -12,6 +18,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Export Prometheus optionnel sur un port dédié (local par défaut, TT_METRICS_HOST=0.0.0.0 pour l'exposer)
+if os.getenv("TT_METRICS_PORT"):
+    instrumentation.start_http_exporter(int(os.getenv("TT_METRICS_PORT")), os.getenv("TT_METRICS_HOST", "127.0.0.1"))
+
 # ================= ÉTAT DE L'APPLICATION =================
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
@@ -20,13 +30,7 @@ if 'user_role' not in st.session_state:
 if 'current_view' not in st.session_state:
     st.session_state.current_view = 'dashboard'
 
-# Initialisation des données
-if 'invoices' not in st.session_state:
-    st.session_state.invoices = []
-if 'purchases' not in st.session_state:
-    st.session_state.purchases = []
-if 'clients' not in st.session_state:
-    st.session_state.clients = []
+# Factures, achats et clients sont lus dans la base à chaque vue ; seul le profil reste en session
 if 'profile' not in st.session_state:
     st.session_state.profile = {
         'name': 'TunisieTrans SARL',
@@ -52,29 +56,50 @@ def calculate_tva(amount, rate=19):
     return round(amount * rate / 100, 3)
 
 
-def save_data():
-    """Sauvegarde les données en JSON"""
-    data = {
-        'invoices': st.session_state.invoices,
-        'purchases': st.session_state.purchases,
-        'clients': st.session_state.clients,
-        'profile': st.session_state.profile
-    }
-    with open('data.json', 'w') as f:
-        json.dump(data, f, indent=2)
-
-
 def load_data():
-    """Charge les données depuis JSON"""
+    """À la connexion : migre l'ancien data.json si besoin et charge le profil"""
+    from data import migration
+
     try:
-        with open('data.json', 'r') as f:
-            data = json.load(f)
-            st.session_state.invoices = data.get('invoices', [])
-            st.session_state.purchases = data.get('purchases', [])
-            st.session_state.clients = data.get('clients', [])
-            st.session_state.profile = data.get('profile', st.session_state.profile)
-    except:
-        pass
+        migration.migrate_if_present()
+    except (ValueError, sqlite3.Error) as e:
+        st.warning(f"Migration de data.json impossible : {e}")
+
+    # Échéances dépassées depuis la dernière connexion (encours en retard mis à jour par trigger)
+    db.mark_overdue_invoices()
+    load_profile()
+
+
+def load_profile():
+    """Copie le profil entreprise en session, avec sa version (rechargé s'il change, même ailleurs)"""
+    st.session_state.profile_version = db.get_data_version('business_profile')
+    profile = db.get_profile()
+    if profile:
+        st.session_state.profile = {
+            'name': profile.name,
+            'matricule_fiscal': profile.matricule_fiscal,
+            'address': profile.address,
+            'rib': profile.rib,
+            'industry': profile.industry,
+            'phone': profile.phone,
+            'email': profile.email,
+            'capital': profile.capital_social
+        }
+
+
+def save_profile():
+    """Enregistre le profil entreprise dans la base"""
+    profile = st.session_state.profile
+    db.save_profile(BusinessProfile(
+        name=profile['name'],
+        matricule_fiscal=profile['matricule_fiscal'],
+        address=profile['address'],
+        rib=profile['rib'],
+        industry=profile.get('industry', BusinessProfile.industry),
+        phone=profile['phone'],
+        email=profile['email'],
+        capital_social=profile.get('capital', BusinessProfile.capital_social)
+    ))
 
 
 # ================= PAGES =================
@@ -150,13 +175,15 @@ def sidebar():
             if st.button("👑 Gestion Utilisateurs", use_container_width=True):
                 st.session_state.current_view = "users"
                 st.rerun()
+            if st.button("🩺 Diagnostics", use_container_width=True):
+                st.session_state.current_view = "diagnostics"
+                st.rerun()
 
         st.divider()
         st.write(f"👤 {st.session_state.username}")
         st.write(f"📋 {st.session_state.user_role}")
 
         if st.button("🚪 Déconnexion", use_container_width=True, type="primary"):
-            save_data()
             st.session_state.authenticated = False
             st.rerun()
 
@@ -166,24 +193,26 @@ def show_dashboard():
     """Tableau de bord"""
     st.title("🏠 Tableau de Bord")
 
-    # Métriques
+    # Métriques de la période, comparées à la période précédente (cube d'analyse, utils/kpi.py)
+    # Libellés comme options : l'état du widget reste valide d'une exécution à l'autre
+    periods = {label: period for period, label in kpi.PERIODS.items()}
+    label = st.radio("Période", list(periods), horizontal=True, label_visibility="collapsed")
+    kpis = kpi.dashboard_kpis(db)[periods[label]]
+    st.caption(f"{kpis.current[0]} → {kpis.current[1]}, comparé à {kpis.previous[0]} → {kpis.previous[1]}")
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        total_ventes = sum(inv.get('total_ttc', 0) for inv in st.session_state.invoices)
-        st.metric("Chiffre d'Affaires", f"{total_ventes:,.0f} DT", "+12%")
+        st.metric("Chiffre d'Affaires", f"{kpis.revenue.current:,.0f} DT", kpis.revenue.delta())
 
     with col2:
-        total_clients = len(st.session_state.clients)
-        st.metric("Clients Actifs", total_clients, "+3")
+        st.metric("Clients Actifs", kpis.active_clients.current, kpis.active_clients.delta(relative=False))
 
     with col3:
-        factures_impayees = sum(1 for inv in st.session_state.invoices if inv.get('status') == 'impayée')
-        st.metric("Factures Impayées", factures_impayees, "-2")
+        st.metric("Factures Impayées", kpis.pending_invoices.current,
+                  kpis.pending_invoices.delta(relative=False), delta_color="inverse")
 
     with col4:
-        total_achats = sum(pur.get('montant_ttc', 0) for pur in st.session_state.purchases)
-        st.metric("Dépenses Total", f"{total_achats:,.0f} DT", "-5%")
+        st.metric("Dépenses", f"{kpis.expenses.current:,.0f} DT", kpis.expenses.delta(), delta_color="inverse")
 
     # Profil entreprise
     st.divider()
@@ -209,22 +238,21 @@ def show_dashboard():
     st.divider()
     st.subheader("🧾 Dernières Factures")
 
-    if st.session_state.invoices:
-        recent_invoices = st.session_state.invoices[-5:] if len(
-            st.session_state.invoices) > 5 else st.session_state.invoices
-        for inv in reversed(recent_invoices):
+    recent_invoices = db.get_invoices(limit=5)
+    if recent_invoices:
+        client_names = db.get_client_names()
+        for inv in recent_invoices:
             with st.container():
                 col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
                 with col1:
-                    st.write(f"**{inv.get('numero', 'N/A')}** - {inv.get('client', 'Client')}")
+                    st.write(f"**{inv.id}** - {client_names.get(inv.client_id, 'Client')}")
                 with col2:
-                    st.write(f"{inv.get('total_ttc', 0):,.0f} DT")
+                    st.write(f"{inv.total_amount:,.0f} DT")
                 with col3:
-                    status = inv.get('status', 'brouillon')
-                    status_icons = {'payée': '✅', 'impayée': '🔴', 'brouillon': '⚪'}
-                    st.write(f"{status_icons.get(status, '⚪')} {status}")
+                    status_icons = {'payée': '✅', 'envoyée': '🟡', 'en retard': '🔴', 'brouillon': '⚪'}
+                    st.write(f"{status_icons.get(inv.status, '⚪')} {inv.status}")
                 with col4:
-                    if st.button("📋", key=f"view_{inv.get('id')}"):
+                    if st.button("📋", key=f"view_{inv.id}"):
                         st.session_state.selected_invoice = inv
                         st.session_state.current_view = "invoice_detail"
     else:
@@ -250,22 +278,33 @@ def edit_profile():
                 'phone': new_phone,
                 'email': new_email
             })
-            save_data()
+            save_profile()
             st.success("Profil mis à jour!")
             st.rerun()
 
 
 def show_invoices():
     """Gestion des factures de vente"""
+    import pandas as pd
+
     st.title("🧾 Factures de Vente")
 
-    tab1, tab2, tab3 = st.tabs(["📋 Toutes les Factures", "➕ Nouvelle Facture", "📊 Statistiques"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["📋 Toutes les Factures", "➕ Nouvelle Facture", "📊 Statistiques",
+                                                  "⏳ Balance âgée", "🏦 Rapprochement", "💶 Trésorerie"])
 
     with tab1:
         # Liste des factures
-        if st.session_state.invoices:
-            df = pd.DataFrame(st.session_state.invoices)
-            st.dataframe(df[['numero', 'client', 'date', 'total_ttc', 'status']], use_container_width=True)
+        invoices = db.get_invoices()
+        if invoices:
+            client_names = db.get_client_names()
+            df = pd.DataFrame([{
+                'numero': inv.id,
+                'client': client_names.get(inv.client_id, inv.client_id),
+                'date': inv.date.strftime('%d/%m/%Y'),
+                'total_ttc': inv.total_amount,
+                'status': inv.status
+            } for inv in invoices])
+            st.dataframe(df, use_container_width=True)
 
             # Téléchargement
             csv = df.to_csv(index=False).encode('utf-8')
@@ -275,82 +314,164 @@ def show_invoices():
                 file_name="factures.csv",
                 mime="text/csv"
             )
+
+            # Factures électroniques TEIF (El Fatoora) des factures émises d'un mois
+            with st.expander("📤 Export TEIF (El Fatoora)"):
+                month = st.date_input("Mois", datetime.now().replace(day=1), key="teif_month")
+                if st.button("Générer les fichiers TEIF"):
+                    import io
+                    import tempfile
+                    import zipfile
+                    from utils import teif
+
+                    start = month.replace(day=1)
+                    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1).date()
+                    with tempfile.TemporaryDirectory() as tmp:
+                        # En processus : pas de fork du serveur Streamlit (le pool sert à la ligne de commande)
+                        result = teif.export_period(start, end, tmp, st.session_state.profile, workers=1)
+                        archive = io.BytesIO()
+                        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+                            for name in sorted(os.listdir(tmp)):
+                                zf.write(os.path.join(tmp, name), name)
+                    st.session_state.teif_export = (f"teif_{start.strftime('%Y-%m')}.zip", archive.getvalue(), result)
+
+                if st.session_state.get('teif_export'):
+                    file_name, data, result = st.session_state.teif_export
+                    st.write(f"{result['written']} facture(s) exportée(s) en {result['duration']:.1f} s")
+                    for invoice_id, errors in list(result['errors'].items())[:10]:
+                        st.warning(f"{invoice_id} : {'; '.join(errors)}")
+                    st.download_button("📥 Télécharger l'archive TEIF", data=data, file_name=file_name,
+                                       mime="application/zip")
+
+            # Envoi des factures par email : file en base, expédition dans un fil de fond
+            with st.expander("📧 Envoi par email"):
+                from utils import mailer
+
+                mail_month = st.date_input("Mois", datetime.now().replace(day=1), key="mail_month")
+                start = mail_month.replace(day=1)
+                end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1).date()
+                to_send = [inv.id for inv in invoices
+                           if inv.status != InvoiceStatus.DRAFT and start <= inv.date.date() < end]
+                delivered = db.get_deliveries(to_send) if to_send else {}
+                unsent = [invoice_id for invoice_id in to_send if invoice_id not in delivered]
+                st.write(f"{len(to_send)} facture(s) émise(s) sur le mois, {len(unsent)} jamais envoyée(s)")
+
+                settings = mailer.SmtpSettings.from_env()
+                if settings is None:
+                    st.warning("Serveur SMTP non configuré (TT_SMTP_HOST) : les messages restent en file.")
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("📥 Mettre en file les factures non envoyées", disabled=not unsent):
+                        result = mailer.queue_invoices(unsent)
+                        st.success(f"{result['queued']} message(s) mis en file")
+                        if result['skipped']:
+                            st.warning(f"{len(result['skipped'])} client(s) sans email valide")
+                with col2:
+                    if st.button("📤 Envoyer la file", disabled=settings is None):
+                        if mailer.dispatch_in_background(settings=settings):
+                            st.success("Envoi lancé en arrière-plan")
+                        else:
+                            st.info("Un envoi est déjà en cours")
+
+                summary = db.get_outbox_summary()
+                if summary:
+                    st.write(" · ".join(f"{status} : {count}" for status, count in sorted(summary.items())))
+
+            # Paiement ou changement de statut
+            with st.form("invoice_status_form"):
+                col1, col2, col3 = st.columns([2, 2, 1])
+                with col1:
+                    status_number = st.text_input("Numéro de facture", placeholder="FACT-202401-001")
+                with col2:
+                    new_status = st.selectbox("Nouveau statut", [status.value for status in InvoiceStatus])
+                with col3:
+                    st.write("")  # Espace
+                    st.write("")  # Espace
+                    update_status = st.form_submit_button("💾 Mettre à jour")
+            if update_status and status_number:
+                if db.update_invoice_status(status_number.strip(), new_status):
+                    st.success(f"Facture {status_number.strip()} : {new_status}")
+                else:
+                    st.error(f"Facture {status_number.strip()} introuvable")
         else:
             st.info("Aucune facture disponible")
 
     with tab2:
-        # Formulaire nouvelle facture
-        with st.form("new_invoice_form"):
-            st.subheader("Nouvelle Facture de Vente")
+        st.subheader("Nouvelle Facture de Vente")
 
-            col1, col2 = st.columns(2)
+        # Articles
+        if 'invoice_items' not in st.session_state:
+            st.session_state.invoice_items = []
+
+        # Ajouter un article (formulaire séparé : st.button est interdit dans un st.form)
+        st.subheader("🛍️ Articles")
+        render_template_loader("new_invoice_template", client_key="new_invoice_client_name")
+        with st.form("new_invoice_item_form", clear_on_submit=True):
+            col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
             with col1:
-                client_name = st.text_input("Nom du Client*", placeholder="Société X")
-                client_matricule = st.text_input("Matricule Fiscal Client", placeholder="123456/A/M/000")
-                client_address = st.text_area("Adresse du Client")
+                item_desc = st.text_input("Description", key="item_desc_new", placeholder="Transport marchandises")
             with col2:
-                invoice_date = st.date_input("Date de facturation", datetime.now())
-                due_date = st.date_input("Date d'échéance", datetime.now() + timedelta(days=30))
-                payment_method = st.selectbox("Mode de paiement", ["Virement", "Chèque", "Espèces"])
+                item_qty = st.number_input("Qté", min_value=1, value=1, key="item_qty_new")
+            with col3:
+                item_price = st.number_input("Prix unitaire (DT)", min_value=0.0, value=100.0, key="item_price_new")
+            with col4:
+                item_tva = st.number_input("TVA %", min_value=0.0, value=19.0, key="item_tva_new")
+            with col5:
+                st.write("")  # Espace
+                st.write("")  # Espace
+                add_item = st.form_submit_button("➕ Ajouter")
+
+        if add_item and item_desc:
+            item_total_ht = item_qty * item_price
+            item_tva_amount = calculate_tva(item_total_ht, item_tva)
+
+            st.session_state.invoice_items.append({
+                'description': item_desc,
+                'quantity': item_qty,
+                'unit_price': item_price,
+                'tva_rate': item_tva,
+                'total_ht': item_total_ht,
+                'tva_amount': item_tva_amount,
+                'total_ttc': item_total_ht + item_tva_amount
+            })
+            st.success(f"Article ajouté: {item_desc}")
 
-            st.divider()
-            st.subheader("🛍️ Articles")
+        # Totaux
+        total_ht = sum(item['total_ht'] for item in st.session_state.invoice_items)
+        total_tva = sum(item['tva_amount'] for item in st.session_state.invoice_items)
+        total_ttc = sum(item['total_ttc'] for item in st.session_state.invoice_items)
 
-            # Articles
-            if 'invoice_items' not in st.session_state:
-                st.session_state.invoice_items = []
+        # Afficher les articles ajoutés
+        if st.session_state.invoice_items:
+            st.subheader("Articles ajoutés")
+            items_df = pd.DataFrame(st.session_state.invoice_items)
+            st.dataframe(items_df, use_container_width=True)
 
-            # Ajouter un article
-            with st.container():
-                col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
-                with col1:
-                    item_desc = st.text_input("Description", key="item_desc_new", placeholder="Transport marchandises")
-                with col2:
-                    item_qty = st.number_input("Qté", min_value=1, value=1, key="item_qty_new")
-                with col3:
-                    item_price = st.number_input("Prix unitaire (DT)", min_value=0.0, value=100.0, key="item_price_new")
-                with col4:
-                    item_tva = st.number_input("TVA %", min_value=0.0, value=19.0, key="item_tva_new")
-                with col5:
-                    st.write("")  # Espace
-                    st.write("")  # Espace
-                    add_item = st.button("➕ Ajouter", key="add_item_btn")
-
-            if add_item and item_desc:
-                total_ht = item_qty * item_price
-                tva_amount = calculate_tva(total_ht, item_tva)
-                total_ttc = total_ht + tva_amount
-
-                st.session_state.invoice_items.append({
-                    'description': item_desc,
-                    'quantity': item_qty,
-                    'unit_price': item_price,
-                    'tva_rate': item_tva,
-                    'total_ht': total_ht,
-                    'tva_amount': tva_amount,
-                    'total_ttc': total_ttc
-                })
-                st.success(f"Article ajouté: {item_desc}")
-                st.rerun()
-
-            # Afficher les articles ajoutés
-            if st.session_state.invoice_items:
-                st.subheader("Articles ajoutés")
-                items_df = pd.DataFrame(st.session_state.invoice_items)
-                st.dataframe(items_df, use_container_width=True)
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Total HT", f"{total_ht:,.2f} DT")
+            with col2:
+                st.metric("Total TVA", f"{total_tva:,.2f} DT")
+            with col3:
+                st.metric("Total TTC", f"{total_ttc:,.2f} DT")
 
-                # Totaux
-                total_ht = sum(item['total_ht'] for item in st.session_state.invoice_items)
-                total_tva = sum(item['tva_amount'] for item in st.session_state.invoice_items)
-                total_ttc = sum(item['total_ttc'] for item in st.session_state.invoice_items)
+        # Client existant : pré-remplit la fiche (hors du formulaire, la recherche suit la saisie)
+        known_client = render_client_lookup("new_invoice_lookup", "new_invoice_client_name",
+                                            "new_invoice_client_matricule", "new_invoice_client_address")
 
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Total HT", f"{total_ht:,.2f} DT")
-                with col2:
-                    st.metric("Total TVA", f"{total_tva:,.2f} DT")
-                with col3:
-                    st.metric("Total TTC", f"{total_ttc:,.2f} DT")
+        # Formulaire nouvelle facture
+        with st.form("new_invoice_form"):
+            col1, col2 = st.columns(2)
+            with col1:
+                client_name = st.text_input("Nom du Client*", placeholder="Société X", key="new_invoice_client_name")
+                client_matricule = st.text_input("Matricule Fiscal Client", placeholder="123456/A/M/000",
+                                                 key="new_invoice_client_matricule")
+                client_address = st.text_area("Adresse du Client", key="new_invoice_client_address")
+            with col2:
+                invoice_date = st.date_input("Date de facturation", datetime.now())
+                due_date = st.date_input("Date d'échéance", datetime.now() + timedelta(
+                    days=known_client.payment_terms if known_client else 30))
+                payment_method = st.selectbox("Mode de paiement", ["Virement", "Chèque", "Espèces"])
 
             # Notes et validation
             st.divider()
@@ -362,39 +483,47 @@ def show_invoices():
                 elif not st.session_state.invoice_items:
                     st.error("Veuillez ajouter au moins un article")
                 else:
-                    # Créer la facture
-                    invoice_number = f"FACT-{datetime.now().strftime('%Y%m')}-{len(st.session_state.invoices) + 1:03d}"
-
-                    new_invoice = {
-                        'id': generate_id('INV'),
-                        'numero': invoice_number,
-                        'client': client_name,
-                        'client_matricule': client_matricule,
-                        'client_address': client_address,
-                        'date': invoice_date.strftime('%d/%m/%Y'),
-                        'due_date': due_date.strftime('%d/%m/%Y'),
-                        'payment_method': payment_method,
-                        'items': st.session_state.invoice_items.copy(),
-                        'total_ht': total_ht,
-                        'tva_amount': total_tva,
-                        'total_ttc': total_ttc,
-                        'status': 'brouillon',
-                        'notes': notes,
-                        'created_at': datetime.now().strftime('%d/%m/%Y %H:%M')
-                    }
-
-                    st.session_state.invoices.append(new_invoice)
+                    # Client existant (matricule ou nom), sinon nouvelle fiche
+                    client = db.find_client(client_name, client_matricule)
+                    if client is None:
+                        client = Client(
+                            id=generate_id('CLI'),
+                            name=client_name,
+                            matricule_fiscal=client_matricule,
+                            address=client_address,
+                            phone='',
+                            email='',
+                            created_at=datetime.now()
+                        )
+                        db.add_client(client)
+                    else:
+                        render_credit_warning(client, total_ttc)
+
+                    # Créer la facture (numéro attribué par la base)
+                    invoice_number = db.add_numbered_invoice(Invoice(
+                        id='',
+                        client_id=client.id,
+                        date=invoice_date,
+                        due_date=due_date,
+                        total_amount=total_ttc,
+                        tva_amount=total_tva,
+                        status='brouillon',
+                        items=st.session_state.invoice_items.copy(),
+                        notes=notes or None,
+                        payment_method=payment_method
+                    ), datetime.now())
+
                     st.session_state.invoice_items = []  # Réinitialiser
-                    save_data()
 
                     st.success(f"Facture {invoice_number} créée avec succès!")
                     st.balloons()
 
     with tab3:
         # Statistiques
-        if st.session_state.invoices:
-            total_factures = len(st.session_state.invoices)
-            total_ca = sum(inv.get('total_ttc', 0) for inv in st.session_state.invoices)
+        totals = db.get_totals()
+        if totals['invoices']:
+            total_factures = totals['invoices']
+            total_ca = totals['revenue']
             moy_facture = total_ca / total_factures if total_factures > 0 else 0
 
             col1, col2, col3 = st.columns(3)
@@ -407,17 +536,139 @@ def show_invoices():
         else:
             st.info("Aucune statistique disponible")
 
+    with tab4:
+        # Créances non réglées par ancienneté de l'échéance (requête groupée, mise en cache)
+        from utils.aging import AGING_BUCKETS, receivables_aging
+
+        as_of = st.date_input("Arrêté au", datetime.now(), key="aging_as_of")
+        report = receivables_aging(as_of=as_of)
+        if report.rows:
+            for col, label, amount in zip(st.columns(len(AGING_BUCKETS) + 1), AGING_BUCKETS + ["Total"],
+                                          report.totals + [report.total]):
+                with col:
+                    st.metric(label, f"{amount:,.0f} DT")
+
+            df = pd.DataFrame([{
+                'client': row.client_name,
+                **dict(zip(AGING_BUCKETS, row.buckets)),
+                'total': row.total,
+                'factures': row.invoice_count,
+                'plus ancienne échéance': row.oldest_due.strftime('%d/%m/%Y') if row.oldest_due else ''
+            } for row in report.rows])
+            st.dataframe(df, use_container_width=True, hide_index=True)
+
+            st.download_button(
+                label="📥 Exporter la balance âgée",
+                data=report.to_csv(),
+                file_name=f"balance_agee_{report.as_of.isoformat()}.csv",
+                mime="text/csv"
+            )
+        else:
+            st.success("Aucune créance en cours")
+
+    with tab5:
+        # Relevé bancaire CSV du compte de l'entreprise -> factures soldées
+        from utils import reconciliation
+
+        statement = st.file_uploader("Relevé bancaire (CSV)", type=["csv"], key="bank_statement")
+        if statement is not None and st.button("🔎 Importer et rapprocher"):
+            try:
+                st.session_state.reconciliation = reconciliation.import_statement(
+                    statement.getvalue(), st.session_state.profile['rib'])
+            except reconciliation.ReconciliationError as e:
+                st.error(f"Relevé refusé : {e}")
+
+        result = st.session_state.get('reconciliation')
+        if result is not None:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Rapprochements sûrs", len(result.confirmed))
+            with col2:
+                st.metric("À vérifier", len(result.to_review))
+            with col3:
+                st.metric("Crédits sans facture", len(result.unmatched))
+
+            def matches_frame(matches):
+                return pd.DataFrame([{
+                    'date': m.transaction.date.strftime('%d/%m/%Y'),
+                    'libellé': m.transaction.label,
+                    'montant': m.transaction.amount,
+                    'facture': m.invoice_id,
+                    'montant facture': m.invoice_amount,
+                    'méthode': m.method,
+                    'remarque': m.note
+                } for m in matches])
+
+            if result.confirmed:
+                st.dataframe(matches_frame(result.confirmed), use_container_width=True, hide_index=True)
+                if st.button("✅ Solder les factures rapprochées"):
+                    paid, skipped = reconciliation.apply_matches(result.confirmed)
+                    st.session_state.reconciliation = None
+                    st.success(f"{paid} facture(s) soldée(s)")
+                    if skipped:
+                        st.warning("Déjà payées entre-temps, virements laissés à rapprocher : "
+                                   + ", ".join(invoice_id for invoice_id, _ in skipped))
+            if result.to_review:
+                st.subheader("À vérifier")
+                st.caption("Solder ces factures depuis l'onglet des factures après contrôle")
+                st.dataframe(matches_frame(result.to_review), use_container_width=True, hide_index=True)
+
+    with tab6:
+        # Prévision des encaissements et décaissements (calcul vectorisé, mis en cache)
+        import plotly.graph_objects as go
+        from utils import cash_forecast
+
+        col1, col2 = st.columns(2)
+        with col1:
+            opening = st.number_input("Trésorerie actuelle (DT)", value=0.0, step=1000.0, key="forecast_opening")
+        with col2:
+            horizon = st.slider("Horizon (jours)", 30, 180, cash_forecast.HORIZON_DAYS, step=15,
+                                key="forecast_horizon")
+        forecast = cash_forecast.forecast(horizon=horizon)
+        frame = forecast.to_frame(opening)
+        low = frame.loc[frame["solde"].idxmin()]
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Encaissements prévus", f"{frame['encaissements'].sum():,.0f} DT")
+        with col2:
+            st.metric("Décaissements prévus", f"{frame['décaissements'].sum():,.0f} DT")
+        with col3:
+            st.metric(f"Solde à {horizon} jours", f"{frame['solde'].iloc[-1]:,.0f} DT")
+        with col4:
+            st.metric("Point bas", f"{low['solde']:,.0f} DT", low['date'].strftime('%d/%m/%Y'),
+                      delta_color="off")
+
+        fig = go.Figure()
+        fig.add_trace(go.Bar(x=frame["date"], y=frame["encaissements"], name="Encaissements"))
+        fig.add_trace(go.Bar(x=frame["date"], y=-frame["décaissements"], name="Décaissements"))
+        fig.add_trace(go.Scatter(x=frame["date"], y=frame["solde"], name="Solde", mode="lines"))
+        fig.update_layout(barmode="relative", yaxis_title="DT", hovermode="x unified")
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"{forecast.open_receivables} facture(s) ouverte(s), {forecast.open_payables} achat(s) non "
+                   f"payé(s) ; {forecast.beyond:,.0f} DT attendus au-delà de l'horizon. Dépenses récurrentes "
+                   f"projetées : {', '.join(cash_forecast.RECURRING_CATEGORIES)}.")
+
 
 def show_purchases():
     """Gestion des achats et dépenses"""
+    import pandas as pd
+
     st.title("🛒 Achats & Dépenses")
 
     tab1, tab2 = st.tabs(["📋 Liste des Achats", "➕ Nouvel Achat"])
 
     with tab1:
-        if st.session_state.purchases:
-            df = pd.DataFrame(st.session_state.purchases)
-            st.dataframe(df[['fournisseur', 'date', 'montant_ttc', 'categorie', 'status']], use_container_width=True)
+        purchases = db.get_purchases()
+        if purchases:
+            df = pd.DataFrame([{
+                'fournisseur': pur.supplier,
+                'date': pur.date.strftime('%d/%m/%Y'),
+                'montant_ttc': pur.total_amount,
+                'categorie': pur.category,
+                'status': pur.payment_status
+            } for pur in purchases])
+            st.dataframe(df, use_container_width=True)
         else:
             st.info("Aucun achat enregistré")
 
@@ -439,6 +690,7 @@ def show_purchases():
                 tva_rate = st.number_input("TVA %", min_value=0.0, value=19.0)
 
             description = st.text_area("Description", placeholder="Détails de l'achat...")
+            confirm = st.checkbox("Enregistrer même si un achat du même jour et du même montant existe")
 
             if st.form_submit_button("✅ Enregistrer l'achat"):
                 if not fournisseur:
@@ -447,35 +699,68 @@ def show_purchases():
                     tva_montant = calculate_tva(montant_ht, tva_rate)
                     montant_ttc = montant_ht + tva_montant
 
-                    new_purchase = {
-                        'id': generate_id('PUR'),
-                        'fournisseur': fournisseur,
-                        'num_facture': num_facture,
-                        'date': date_achat.strftime('%d/%m/%Y'),
-                        'categorie': categorie,
-                        'montant_ht': montant_ht,
-                        'tva_rate': tva_rate,
-                        'tva_montant': tva_montant,
-                        'montant_ttc': montant_ttc,
-                        'description': description,
-                        'status': 'non payé'
-                    }
-
-                    st.session_state.purchases.append(new_purchase)
-                    save_data()
-                    st.success(f"Achat enregistré: {fournisseur} - {montant_ttc:,.2f} DT")
+                    # Une facture fournisseur saisie deux fois déduirait deux fois sa TVA
+                    matches = dedup.check_purchase(fournisseur, num_facture, date_achat, montant_ttc)
+                    same = [purchase for purchase, reason in matches if reason == "numéro de facture"]
+                    if same:
+                        st.error(f"Facture {num_facture} de {same[0].supplier} déjà saisie "
+                                 f"({same[0].id}, {same[0].date:%d/%m/%Y}, {same[0].total_amount:,.3f} DT)")
+                    elif matches and not confirm:
+                        st.warning("Achat déjà saisi le même jour pour le même montant : " + ", ".join(
+                            f"{purchase.id} (n° {purchase.invoice_number or '—'})" for purchase, _ in matches)
+                            + ". Cochez la case pour l'enregistrer quand même.")
+                    else:
+                        try:
+                            db.add_purchase(Purchase(
+                                id=generate_id('PUR'),
+                                supplier=fournisseur,
+                                date=date_achat,
+                                total_amount=montant_ttc,
+                                tva_amount=tva_montant,
+                                category=categorie,
+                                invoice_number=num_facture,
+                                payment_status='non payé',
+                                description=description or None
+                            ))
+                        except sqlite3.IntegrityError:
+                            st.error(f"Facture {num_facture} de {fournisseur} déjà saisie")
+                        else:
+                            st.success(f"Achat enregistré: {fournisseur} - {montant_ttc:,.2f} DT")
 
 
 def show_clients():
     """Gestion des clients"""
+    import pandas as pd
+
     st.title("👥 Gestion des Clients")
 
-    tab1, tab2 = st.tabs(["📋 Liste des Clients", "➕ Nouveau Client"])
+    tab1, tab2, tab3 = st.tabs(["📋 Liste des Clients", "➕ Nouveau Client", "🔁 Factures récurrentes"])
 
     with tab1:
-        if st.session_state.clients:
-            df = pd.DataFrame(st.session_state.clients)
-            st.dataframe(df[['nom', 'matricule_fiscal', 'telephone', 'email', 'ville']], use_container_width=True)
+        clients = db.get_clients()
+        if clients:
+            df = pd.DataFrame([{
+                'nom': client.name,
+                'matricule_fiscal': client.matricule_fiscal,
+                'telephone': client.phone,
+                'email': client.email,
+                'ville': client.city
+            } for client in clients])
+            st.dataframe(df, use_container_width=True)
+
+            # Doublons : même matricule, noms proches, même racine de matricule (data/dedup.py)
+            report = dedup.scan()
+            if report.clients or report.similar_clients:
+                with st.expander(f"🧹 Doublons possibles ({len(report.clients) + len(report.similar_clients)})"):
+                    st.dataframe(pd.DataFrame(
+                        [{'raison': 'matricule', 'similarité': 1.0, 'client 1': f"{group[0].name} ({group[0].id})",
+                          'client 2': ", ".join(f"{client.name} ({client.id})" for client in group[1:])}
+                         for group in report.clients]
+                        + [{'raison': pair.reason, 'similarité': pair.score,
+                            'client 1': f"{pair.first.name} ({pair.first.id})",
+                            'client 2': f"{pair.second.name} ({pair.second.id})"}
+                           for pair in report.similar_clients]
+                    ), use_container_width=True, hide_index=True)
         else:
             st.info("Aucun client enregistré")
 
@@ -495,57 +780,191 @@ def show_clients():
 
             adresse = st.text_area("Adresse complète")
             notes = st.text_area("Notes", placeholder="Informations supplémentaires...")
+            confirm = st.checkbox("Enregistrer même si des clients proches existent")
 
             if st.form_submit_button("✅ Enregistrer le client"):
                 if not nom:
                     st.error("Veuillez saisir le nom du client")
                 else:
-                    new_client = {
-                        'id': generate_id('CLI'),
-                        'nom': nom,
-                        'matricule_fiscal': matricule,
-                        'activite': activite,
-                        'telephone': telephone,
-                        'email': email,
-                        'ville': ville,
-                        'adresse': adresse,
-                        'notes': notes,
-                        'date_creation': datetime.now().strftime('%d/%m/%Y')
-                    }
-
-                    st.session_state.clients.append(new_client)
-                    save_data()
-                    st.success(f"Client {nom} ajouté avec succès!")
+                    matches = dedup.check_client(nom, matricule)
+                    same = [client for client, _, reason in matches if reason == "matricule"]
+                    if same:
+                        st.error(f"Matricule fiscal déjà attribué à {same[0].name} ({same[0].id})")
+                    elif matches and not confirm:
+                        st.warning("Clients proches déjà enregistrés : " + ", ".join(
+                            f"{client.name} ({client.matricule_fiscal or client.id}, {reason})"
+                            for client, _, reason in matches) + ". Cochez la case pour l'enregistrer quand même.")
+                    else:
+                        try:
+                            db.add_client(Client(
+                                id=generate_id('CLI'),
+                                name=nom,
+                                matricule_fiscal=matricule,
+                                address=adresse,
+                                phone=telephone,
+                                email=email,
+                                created_at=datetime.now(),
+                                notes=notes or None,
+                                city=ville or None,
+                                activity=activite or None
+                            ))
+                        except sqlite3.IntegrityError:
+                            st.error(f"Matricule fiscal {matricule} déjà attribué")
+                        else:
+                            st.success(f"Client {nom} ajouté avec succès!")
+
+    with tab3:
+        from data import recurring
+
+        client_names = db.get_client_names()
+        templates = db.get_recurring_templates()
+        if templates:
+            st.dataframe(pd.DataFrame([{
+                'modèle': template.id,
+                'client': client_names.get(template.client_id, template.client_id),
+                'libellé': template.label,
+                'périodicité': template.frequency,
+                'prochaine facture': template.next_date.strftime('%d/%m/%Y'),
+                'total_ttc': template.total_amount,
+                'actif': template.active
+            } for template in templates]), use_container_width=True, hide_index=True)
+
+            # Émission groupée des factures dues (fin de mois)
+            col1, col2 = st.columns(2)
+            with col1:
+                until = st.date_input("Émettre jusqu'au", recurring.end_of_month(datetime.now().date()))
+            with col2:
+                st.write("")  # Espace
+                st.write("")  # Espace
+                if st.button("🚀 Émettre les factures dues", use_container_width=True):
+                    result = recurring.issue_due_invoices(until)
+                    if result['invoices']:
+                        st.success(f"{result['invoices']} facture(s) émise(s) pour {result['templates']} "
+                                   f"contrat(s) : {result['total']:,.3f} DT")
+                    else:
+                        st.info("Aucune facture due")
+
+        with st.form("new_template_form"):
+            st.subheader("Nouveau modèle")
+            col1, col2 = st.columns(2)
+            with col1:
+                client_id = st.selectbox("Client*", list(client_names), index=None,
+                                         format_func=lambda cid: client_names[cid])
+                label = st.text_input("Libellé", value="Contrat de transport")
+                frequency = st.selectbox("Périodicité", list(recurring.FREQUENCIES))
+            with col2:
+                start = st.date_input("Première facture", datetime.now())
+                end = st.date_input("Fin du contrat (optionnelle)", value=None)
+            items = st.data_editor(
+                pd.DataFrame([{'description': '', 'quantity': 1, 'unit_price': 0.0, 'tva_rate': 19.0}]),
+                num_rows="dynamic", use_container_width=True, key="template_items"
+            )
+
+            if st.form_submit_button("✅ Enregistrer le modèle"):
+                if client_id is None:
+                    st.error("Veuillez choisir le client")
+                else:
+                    try:
+                        template = recurring.create_template(
+                            client_id, label, items.dropna(subset=['description']).to_dict('records'),
+                            frequency, start, end_date=end
+                        )
+                        st.success(f"Modèle {template.id} enregistré : {template.total_amount:,.3f} DT TTC, "
+                                   f"première facture le {template.next_date.strftime('%d/%m/%Y')}")
+                    except recurring.RecurringError as e:
+                        st.error(str(e))
 
 
 def show_analytics():
-    """Analyses et statistiques"""
+    """Analyses et statistiques (cube pré-agrégé, voir utils/analytics_cube.py)"""
+    import plotly.express as px
+    from utils import analytics_cube
+
     st.title("📊 Analytics")
 
-    if st.session_state.invoices:
-        # Graphique des ventes par mois
-        df = pd.DataFrame(st.session_state.invoices)
+    years = analytics_cube.sales(db, by=("period",), grain="year")["period"].tolist()
+    if not years:
+        st.info("Aucune donnée disponible pour les analyses")
+        return
+
+    # Découpage : période, granularité, client
+    client_names = db.get_client_names()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if len(years) > 1:
+            first, last = st.select_slider("Exercices", options=years, value=(years[-2], years[-1]))
+        else:
+            first = last = years[0]
+    # Libellés comme options : l'état du widget reste valide d'une exécution à l'autre
+    grains = {"Mois": "month", "Trimestre": "quarter", "Année": "year"}
+    clients = {"Tous les clients": None}
+    for key in sorted(client_names, key=client_names.get):
+        name = client_names[key]
+        clients[f"{name} ({key})" if name in clients else name] = key
+    with col2:
+        grain = grains[st.selectbox("Granularité", list(grains))]
+    with col3:
+        client_id = clients[st.selectbox("Client", list(clients))]
 
-        # Convertir les dates
-        try:
-            df['date_dt'] = pd.to_datetime(df['date'], format='%d/%m/%Y')
-            df['month'] = df['date_dt'].dt.to_period('M')
+    where = {"period": (f"{first}-01", f"{last}-12")}
+    if client_id:
+        where["client_id"] = client_id
 
-            monthly_sales = df.groupby('month')['total_ttc'].sum().reset_index()
-            monthly_sales['month'] = monthly_sales['month'].dt.to_timestamp()
+    st.subheader("Évolution des ventes")
+    by_status = analytics_cube.sales(db, by=("period", "status"), where=where, grain=grain)
+    fig = px.bar(by_status, x="period", y="total_ttc", color="status",
+                 labels={"period": "Période", "total_ttc": "CA TTC (DT)", "status": "Statut"})
+    st.plotly_chart(fig, use_container_width=True)
 
-            st.subheader("Évolution des ventes")
-            st.line_chart(monthly_sales.set_index('month')['total_ttc'])
+    col_left, col_right = st.columns(2)
+    with col_left:
+        if client_id:
+            st.subheader("Statuts des factures")
+            totals = by_status.groupby("status", as_index=False)["total_ttc"].sum()
+            st.plotly_chart(px.pie(totals, values="total_ttc", names="status"), use_container_width=True)
+        else:
+            st.subheader("Top 10 Clients")
+            top = analytics_cube.sales(db, by=("client_id",), where=where).nlargest(10, "total_ttc")
+            top["client"] = top["client_id"].map(lambda key: client_names.get(key, key))
+            fig = px.bar(top.iloc[::-1], x="total_ttc", y="client", orientation="h",
+                         labels={"total_ttc": "CA TTC (DT)", "client": ""})
+            st.plotly_chart(fig, use_container_width=True)
 
-            # Top clients
-            st.subheader("Top 5 Clients")
-            client_sales = df.groupby('client')['total_ttc'].sum().nlargest(5)
-            st.bar_chart(client_sales)
+    with col_right:
+        st.subheader("Ventilation par taux de TVA")
+        rates = analytics_cube.sales(db, by=("tva_rate",), where=where)
+        rates["taux"] = rates["tva_rate"].map(lambda rate: f"{rate:g} %")
+        st.plotly_chart(px.pie(rates, values="total_ht", names="taux"), use_container_width=True)
+
+    # Les dépenses ne sont pas rattachées à un client : ventes et achats de toute l'entreprise
+    st.subheader("Ventes et achats TTC au fil des jours")
+    render_series_chart("analytics_window", ("ventes", "achats"),
+                        datetime(int(first), 1, 1).date(), datetime(int(last) + 1, 1, 1).date())
+
+    st.subheader("Ventes et dépenses HT")
+    period = {"period": where["period"]}
+    expenses = analytics_cube.purchases(db, by=("period", "category"), where=period, grain=grain)
+    if expenses.empty:
+        st.info("Aucune dépense sur la période")
+        return
+    if client_id:
+        st.caption("Tous clients confondus")
+    expenses["total_ht"] = expenses["total"] - expenses["tva"]
+    revenue = analytics_cube.sales(db, by=("period",), where=period, grain=grain)
+    margin = revenue[["period", "total_ht"]].merge(
+        expenses.groupby("period", as_index=False)["total_ht"].sum(), on="period", how="outer",
+        suffixes=("_ventes", "_achats")).fillna(0).sort_values("period")
+    margin["marge"] = margin["total_ht_ventes"] - margin["total_ht_achats"]
 
-        except:
-            st.info("Données insuffisantes pour les analyses")
-    else:
-        st.info("Aucune donnée disponible pour les analyses")
+    col_left, col_right = st.columns(2)
+    with col_left:
+        fig = px.bar(expenses, x="period", y="total_ht", color="category",
+                     labels={"period": "Période", "total_ht": "Dépenses HT (DT)", "category": "Catégorie"})
+        st.plotly_chart(fig, use_container_width=True)
+    with col_right:
+        fig = px.line(margin, x="period", y=["total_ht_ventes", "total_ht_achats", "marge"], markers=True,
+                      labels={"period": "Période", "value": "DT", "variable": ""})
+        st.plotly_chart(fig, use_container_width=True)
 
 
 def show_tax_assistant():
@@ -578,16 +997,11 @@ def show_reminders():
 
         # Vérifier les factures impayées
         today = datetime.now()
-        for invoice in st.session_state.invoices:
-            if invoice.get('status') == 'impayée':
-                try:
-                    due_date = datetime.strptime(invoice['due_date'], '%d/%m/%Y')
-                    if due_date < today:
-                        st.error(f"⚠️ Facture {invoice['numero']} en retard!")
-                    elif (due_date - today).days <= 7:
-                        st.warning(f"⏳ Facture {invoice['numero']} due dans {(due_date - today).days} jours")
-                except:
-                    pass
+        for invoice in db.get_invoices(statuses=['envoyée', 'en retard']):
+            if invoice.due_date < today:
+                st.error(f"⚠️ Facture {invoice.id} en retard!")
+            elif (invoice.due_date - today).days <= 7:
+                st.warning(f"⏳ Facture {invoice.id} due dans {(invoice.due_date - today).days} jours")
 
     with col2:
         st.subheader("➕ Nouveau rappel")
@@ -605,8 +1019,17 @@ def show_declaration():
     st.title("📋 Déclaration Fiscale")
 
     # Calculs TVA
-    total_tva_collected = sum(inv.get('tva_amount', 0) for inv in st.session_state.invoices)
-    total_tva_deductible = sum(pur.get('tva_montant', 0) for pur in st.session_state.purchases)
+    totals = db.get_totals()
+    total_tva_collected = totals['tva_collected']
+    total_tva_deductible = totals['tva_deductible']
+
+    # Factures fournisseurs saisies plusieurs fois : leur TVA n'est déduite qu'une fois
+    duplicates = dedup.scan()
+    if duplicates.duplicate_tva:
+        total_tva_deductible -= duplicates.duplicate_tva
+        st.warning(f"⚠️ {len(duplicates.purchases)} facture(s) fournisseur saisie(s) plusieurs fois : "
+                   f"{duplicates.duplicate_tva:,.3f} DT de TVA exclus de la TVA déductible "
+                   f"({', '.join(purchase.id for group in duplicates.purchases for purchase in group[1:])})")
     tva_a_payer = max(0, total_tva_collected - total_tva_deductible)
 
     col1, col2 = st.columns(2)
@@ -646,6 +1069,8 @@ def show_declaration():
 
 def show_users():
     """Gestion des utilisateurs (admin seulement)"""
+    import pandas as pd
+
     st.title("👑 Gestion des Utilisateurs")
 
     users = [
@@ -666,11 +1091,123 @@ def show_users():
             st.success(f"Utilisateur {new_username} ajouté")
 
 
+def show_diagnostics():
+    """Diagnostics de performance (admin seulement)"""
+    import pandas as pd
+
+    st.title("🩺 Diagnostics")
+
+    if st.session_state.user_role != "admin":
+        st.error("Accès réservé aux administrateurs")
+        return
+
+    show_maintenance()
+
+    if not instrumentation.ENABLED:
+        st.warning("Instrumentation désactivée (TT_METRICS=0)")
+        return
+
+    stats = instrumentation.snapshot()
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Exécutions du script", stats['reruns'])
+    with col2:
+        st.metric("Requêtes SQL par exécution", f"{stats['statements_per_rerun']:.1f}")
+
+    st.subheader("⏱️ Rendu par vue")
+    if stats['views']:
+        st.dataframe(pd.DataFrame(stats['views']), use_container_width=True, hide_index=True)
+    else:
+        st.info("Aucune vue mesurée")
+
+    st.subheader("🗄️ Requêtes SQL")
+    if stats['sql']:
+        st.dataframe(pd.DataFrame(stats['sql']), use_container_width=True, hide_index=True)
+    else:
+        st.info("Aucune requête exécutée")
+
+    st.subheader("📦 Caches")
+    if stats['caches']:
+        st.dataframe(pd.DataFrame(stats['caches']), use_container_width=True, hide_index=True)
+    else:
+        st.info("Aucun accès cache enregistré")
+
+    st.subheader("🔄 Dernières exécutions")
+    if stats['recent_reruns']:
+        st.dataframe(pd.DataFrame(stats['recent_reruns']), use_container_width=True, hide_index=True)
+
+    with st.expander("📈 Export Prometheus"):
+        metrics = instrumentation.render_prometheus()
+        st.code(metrics, language="text")
+        st.download_button(
+            label="📥 Télécharger",
+            data=metrics,
+            file_name="metrics.prom",
+            mime="text/plain"
+        )
+
+
+def show_maintenance():
+    """Taille de la base, pages libres et dernières tâches de maintenance"""
+    import pandas as pd
+
+    st.subheader("🧰 Maintenance de la base")
+    if st.button("▶️ Lancer toute la maintenance maintenant"):
+        with st.spinner("Maintenance en cours..."):
+            done = maintenance.run_due(db, force=list(maintenance.TASKS))
+        if done:
+            st.success(f"{len(done)} tâche(s) exécutée(s)")
+        else:
+            st.warning("Maintenance déjà en cours dans un autre processus")
+
+    stats = maintenance.database_stats(db.db_path)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Taille", f"{stats.file_size / 2**20:.1f} Mo")
+    with col2:
+        st.metric("Journal WAL", f"{stats.wal_size / 2**20:.1f} Mo")
+    with col3:
+        st.metric("Pages libres", stats.freelist_count, f"{stats.free_size / 2**20:.1f} Mo", delta_color="off")
+    with col4:
+        st.metric("Auto-vacuum", stats.auto_vacuum_mode)
+    if stats.auto_vacuum != 2:
+        st.info("Les pages libres ne sont rendues qu'en auto-vacuum incrémental : le bouton ci-dessus convertit "
+                "la base (VACUUM complet, écritures bloquées pendant la réécriture du fichier)")
+
+    if any(run.ok is False for run in db.get_last_maintenance_runs().values()):
+        st.error("La dernière exécution d'une tâche a échoué : voir son résultat ci-dessous")
+    runs = db.get_maintenance_runs()
+    if runs:
+        st.dataframe(pd.DataFrame([{
+            "Tâche": run.task,
+            "Début": run.started_at,
+            "Durée (s)": run.duration,
+            "Résultat": run.result or "en cours",
+            "Taille avant (Mo)": round((run.size_before or 0) / 2**20, 1),
+            "Taille après (Mo)": round((run.size_after or 0) / 2**20, 1),
+            "Pages libres avant": run.free_before,
+            "Pages libres après": run.free_after,
+        } for run in runs]), use_container_width=True, hide_index=True)
+    else:
+        st.info("Aucune tâche de maintenance exécutée")
+
+    due = [task for task, when in maintenance.due_tasks(db).items() if when is None or when <= datetime.now()]
+    st.caption(f"Tâches dues : {', '.join(due) or 'aucune'} ; "
+               f"base {'au repos' if maintenance.is_idle(db) else 'active'}")
+
+
 # ================= ROUTEUR PRINCIPAL =================
 def render_view():
     """Affiche la vue actuelle"""
     view = st.session_state.current_view
 
+    with instrumentation.timed_view(view):
+        dispatch_view(view)
+
+
+def dispatch_view(view):
+    """Appelle la fonction de la vue demandée"""
     if view == "dashboard":
         show_dashboard()
     elif view == "invoices":
@@ -689,6 +1226,8 @@ def render_view():
         show_declaration()
     elif view == "users":
         show_users()
+    elif view == "diagnostics":
+        show_diagnostics()
     else:
         show_dashboard()
 
@@ -696,14 +1235,24 @@ def render_view():
 # ================= APPLICATION PRINCIPALE =================
 def main():
     """Point d'entrée principal"""
+    with instrumentation.rerun():
+        run_app()
+
 
-    # Charger les données au démarrage
-    if st.session_state.authenticated:
-        load_data()
+def run_app():
+    """Exécution du script pour la session courante"""
 
     if not st.session_state.authenticated:
         login_page()
     else:
+        # Écritures de ce rerun attribuées à l'utilisateur dans le journal des modifications
+        set_actor(st.session_state.username)
+        # Maintenance SQLite aux heures creuses, lancée une fois par processus (pas sur la page de connexion)
+        if os.getenv("TT_MAINTENANCE", "1") != "0":
+            maintenance.start_scheduler(db)
+        # Profil modifié par une autre session ou un autre processus serveur
+        if st.session_state.get('profile_version') != db.get_data_version('business_profile'):
+            load_profile()
         sidebar()
         render_view()
 
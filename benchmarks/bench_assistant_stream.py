@@ -0,0 +1,70 @@
+"""Vérifie le streaming de l'assistant fiscal contre le faux serveur OpenAI.
+
+Mesure le temps jusqu'au premier jeton et le temps total, puis vérifie
+l'annulation et le délai d'attente.
+
+Usage:
+    python -m benchmarks.bench_assistant_stream
+"""
+import time
+
+import openai
+
+from benchmarks.fake_openai_server import FakeStreamingServer
+from utils.ai_stream import CompletionStream
+
+MESSAGES = [{"role": "user", "content": "Comment déclarer la TVA mensuelle?"}]
+
+
+def run_full(server):
+    stream = CompletionStream(MESSAGES, api_key="sk-fake")
+    text = "".join(stream)
+    print(f"Réponse complète : {len(text)} caractères")
+    print(f"  premier jeton : {stream.time_to_first_token * 1000:8.1f} ms")
+    print(f"  total         : {stream.total_time * 1000:8.1f} ms")
+    assert text == server.answer
+    assert stream.time_to_first_token < stream.total_time
+
+
+def run_cancel(server):
+    stream = CompletionStream(MESSAGES, api_key="sk-fake")
+    sent_before = server.tokens_sent
+    received = 0
+    for _ in stream:
+        received += 1
+        if received == 3:
+            break  # équivalent à une navigation : le générateur est fermé
+    time.sleep(server.token_delay * 10)
+    sent = server.tokens_sent - sent_before
+    print(f"Annulation : {received} jetons lus, {sent} envoyés par le serveur")
+    assert stream.cancelled
+    assert sent < len(server.answer.split(" "))
+
+
+def run_timeout(server):
+    server.first_token_delay, previous = 2.0, server.first_token_delay
+    stream = CompletionStream(MESSAGES, api_key="sk-fake", first_token_timeout=0.3)
+    started = time.perf_counter()
+    try:
+        "".join(stream)
+    except TimeoutError as e:
+        print(f"Délai dépassé après {(time.perf_counter() - started) * 1000:.0f} ms : {e}")
+    else:
+        raise AssertionError("TimeoutError attendue")
+    finally:
+        server.first_token_delay = previous
+
+
+def main():
+    server = FakeStreamingServer(("127.0.0.1", 0), first_token_delay=0.3, token_delay=0.02).start()
+    openai.api_base = server.api_base
+    try:
+        run_full(server)
+        run_cancel(server)
+        run_timeout(server)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
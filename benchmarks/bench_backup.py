@@ -0,0 +1,94 @@
+"""Coût d'un instantané à chaud sur une grande base, avec un écrivain concurrent.
+
+Mesure la durée de la sauvegarde, la taille compressée, la latence des
+écritures pendant la copie, puis la vérification et la restauration.
+
+Usage:
+    python -m benchmarks.bench_backup --scale large
+    python -m benchmarks.bench_backup --scale medium --pages 4096
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from dataclasses import replace
+
+from benchmarks.run_benchmarks import prepare_database
+from benchmarks.synthetic_data import SCALES
+from data import backup
+from data.database import Database
+
+
+def writer(db_path: str, stop: threading.Event, latencies: list):
+    """Insère un achat toutes les 2 ms et chronomètre chaque commit"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    n = 0
+    while not stop.is_set():
+        n += 1
+        started = time.perf_counter()
+        conn.execute(
+            "INSERT INTO purchases (id, supplier, date, total_amount, tva_amount, category, "
+            "invoice_number, payment_status) VALUES (?, 'Bench', '2026-10-01', 10, 1.9, 'Autre', ?, 'payé')",
+            (f"BENCH-{threading.get_ident()}-{n}",) * 2
+        )
+        conn.commit()
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.002)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="large")
+    parser.add_argument("--invoices", type=int)
+    parser.add_argument("--pages", type=int, default=backup.PAGES_PER_STEP)
+    parser.add_argument("--no-writer", action="store_true", help="sans écritures concurrentes")
+    args = parser.parse_args()
+
+    scale = SCALES[args.scale] if args.invoices is None else replace(SCALES[args.scale], invoices=args.invoices)
+    cached = prepare_database(scale)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "tunisietrans.db")
+        shutil.copy(cached, db_path)
+        Database(db_path)  # schéma à jour et mode WAL, comme en production
+        backup_dir = os.path.join(tmp, "backups")
+        print(f"Base : {os.path.getsize(db_path) / 1e6:.1f} Mo ({scale.invoices} factures)")
+
+        stop = threading.Event()
+        latencies = []
+        thread = threading.Thread(target=writer, args=(db_path, stop, latencies))
+        if not args.no_writer:
+            thread.start()
+            time.sleep(0.2)
+        try:
+            snapshot = backup.create_snapshot(db_path, backup_dir, pages=args.pages)
+        finally:
+            stop.set()
+            if thread.is_alive():
+                thread.join()
+
+        print(f"Instantané      : {snapshot.duration:.2f} s, {snapshot.pages} pages de {snapshot.page_size} o, "
+              f"{snapshot.restarts} relance(s)")
+        print(f"Taille          : {snapshot.size / 1e6:.1f} Mo -> {snapshot.compressed_size / 1e6:.1f} Mo "
+              f"(ratio {snapshot.size / snapshot.compressed_size:.1f}x)")
+        if latencies:
+            latencies.sort()
+            print(f"Écritures       : {len(latencies)} pendant la copie, p50 {statistics.median(latencies) * 1000:.2f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+
+        started = time.perf_counter()
+        backup.verify_snapshot(snapshot.path)
+        print(f"Vérification    : {time.perf_counter() - started:.2f} s (SHA-256 + quick_check)")
+
+        started = time.perf_counter()
+        backup.restore_snapshot(snapshot.path, db_path, keep_current=False)
+        print(f"Restauration    : {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
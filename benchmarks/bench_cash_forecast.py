@@ -0,0 +1,110 @@
+"""Prévision de trésorerie sur une base de N factures ouvertes : lecture SQL et calcul vectorisé.
+
+Base neuve : `--clients` clients, `--open` factures envoyées ou en retard,
+`--history` factures payées sur l'année écoulée (retards de paiement),
+saisies dans l'ordre des dates, et achats récurrents sur six mois.
+Mesure forecast() sans cache (lectures comprises) et le seul calcul NumPy
+(project_receivables) sur les tableaux déjà lus.
+
+Usage:
+    python -m benchmarks.bench_cash_forecast --open 100000 --history 200000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from data.database import INVOICE_COLUMNS, Database
+from utils import cash_forecast
+
+AS_OF = date(2026, 10, 1)
+ITEMS = json.dumps([{"description": "Transport", "quantity": 1, "unit_price": 100, "tva_rate": 19,
+                     "total_ht": 100, "tva_amount": 19, "total_ttc": 119}])
+
+
+def populate(db: Database, clients: int, open_items: int, history: int, seed: int = 1):
+    rng = random.Random(seed)
+    start = datetime.combine(AS_OF, datetime.min.time())
+    rows = []
+    for n in range(open_items + history):
+        issued = start - timedelta(days=rng.randint(1, 360), minutes=rng.randint(0, 1439))
+        due = issued + timedelta(days=30)
+        client = f"CLI-{rng.randrange(clients):05d}"
+        if n < open_items:
+            status = "en retard" if due < start else "envoyée"
+            rows.append((f"FACT-O-{n:07d}", client, issued, due, 119.0, 19.0, status, ITEMS, None, None, None))
+        else:
+            paid = due + timedelta(days=rng.randint(-10, 40))
+            rows.append((f"FACT-P-{n:07d}", client, issued, due, 119.0, 19.0, "payée", ITEMS, None, paid, "virement"))
+    purchases = [(f"ACH-{n:06d}", "Bench", start - timedelta(days=day), amount, 0.0, category, f"B{n}", status)
+                 for n, (day, amount, category, status) in enumerate(
+                     (rng.randint(1, 180), rng.uniform(100, 2000), rng.choice(cash_forecast.RECURRING_CATEGORIES),
+                      "non payé" if rng.random() < 0.05 else "payé") for _ in range(3000))]
+
+    rows.sort(key=lambda row: row[2])  # saisie chronologique, comme en production
+    client_rows = [(f"CLI-{n:05d}", f"Client {n}", "", "", "", "", start, 30) for n in range(clients)]
+
+    def insert(conn):
+        conn.executemany("INSERT INTO clients (id, name, matricule_fiscal, address, phone, email, created_at, "
+                         "payment_terms) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", client_rows)
+        conn.executemany(f"INSERT INTO invoices ({INVOICE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.executemany("INSERT INTO purchases (id, supplier, date, total_amount, tva_amount, category, "
+                         "invoice_number, payment_status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", purchases)
+
+    db.writer.submit(insert).result()
+
+
+def measure(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--open", type=int, default=100000, help="factures ouvertes")
+    parser.add_argument("--history", type=int, default=200000, help="factures payées (retards observés)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "forecast.db"))
+        populate(db, args.clients, args.open, args.history)
+
+        def cold():
+            db.cache.clear()
+            return cash_forecast.forecast(db, AS_OF)
+
+        result = cold()
+        full = measure(args.repeat, cold)
+
+        today = float(np.datetime64(AS_OF, "D").astype(np.int64)) + 2440587.5
+        client_ids, due, amounts = map(np.array, zip(*db.get_open_receivables(AS_OF)))
+        clients, delays = map(np.array, zip(*db.get_payment_delays(AS_OF - timedelta(days=365))))
+        codes = np.unique(np.concatenate([client_ids, clients]), return_inverse=True)[1]
+        core = measure(args.repeat, lambda: cash_forecast.project_receivables(
+            today, cash_forecast.HORIZON_DAYS, codes[:len(client_ids)], due.astype(float), amounts.astype(float),
+            codes[len(client_ids):], delays.astype(np.int64)))
+        db.writer.close()
+
+    print(json.dumps({
+        "open_items": result.open_receivables,
+        "forecast_ms": round(full * 1e3, 1),
+        "numpy_core_ms": round(core * 1e3, 1),
+        "inflows": round(float(result.inflows.sum()), 3),
+        "beyond": result.beyond,
+    }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Surcoût du journal des modifications sur les écritures : triggers et scellement, ou sans journal.
+
+Trois chemins, chacun sur une base neuve avec et sans journal (triggers
+trg_change_* supprimés, crochet de scellement retiré) :
+- « lot » : insertion de factures en une transaction (import, migration) ;
+- « file » : une facture par demande via Database.add_invoice, plusieurs fils ;
+- « statut » : changement de statut facture par facture (UPDATE, diff des colonnes).
+
+Usage:
+    python -m benchmarks.bench_change_log --rows 20000 --threads 8 --repeat 3
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from data.database import CHANGE_TRIGGERS, INVOICE_COLUMNS, Database
+
+from .bench_writes import invoice
+
+
+def open_database(path: str, journal: bool) -> Database:
+    db = Database(path)
+    if not journal:
+        with db.get_connection() as conn:
+            for name in CHANGE_TRIGGERS:
+                if "_append_only_" not in name:
+                    conn.execute(f"DROP TRIGGER {name}")
+            conn.commit()
+        db.writer._hooks = []
+    return db
+
+
+def bulk(db: Database, rows: int) -> float:
+    values = [(inv.id, inv.client_id, inv.date, inv.due_date, inv.total_amount, inv.tva_amount,
+               inv.status, json.dumps(inv.items), None, None, None) for inv in map(invoice, range(rows))]
+    started = time.perf_counter()
+    db.writer.submit(lambda conn: conn.executemany(
+        f"INSERT INTO invoices ({INVOICE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", values)).result()
+    return time.perf_counter() - started
+
+
+def queued(db: Database, rows: int, threads: int) -> float:
+    per_thread = rows // threads
+
+    def worker(index: int):
+        for k in range(per_thread):
+            db.add_invoice(invoice(1_000_000 + index * per_thread + k))
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def status_updates(db: Database, rows: int, threads: int) -> float:
+    per_thread = rows // threads
+
+    def worker(index: int):
+        for k in range(per_thread):
+            db.update_invoice_status(invoice(index * per_thread + k).id, "payée")
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def run(journal: bool, rows: int, threads: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = open_database(os.path.join(tmp, "journal.db"), journal)
+        queued_rows = rows // 10
+        timings = {
+            "lot": (bulk(db, rows), rows),
+            "file": (queued(db, queued_rows, threads), queued_rows),
+            "statut": (status_updates(db, queued_rows, threads), queued_rows),
+        }
+        with db.get_connection() as conn:
+            logged = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+            size = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE '%change_log%'").fetchone()[0]
+        db.writer.close()
+    result = {"journal": journal, "logged": logged, "log_mb": round((size or 0) / 1e6, 2)}
+    for path, (duration, count) in timings.items():
+        result[f"{path}_us_per_row"] = round(duration / count * 1e6, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000, help="factures du lot (un dixième pour la file)")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3, help="mesures alternées par mode (médiane)")
+    args = parser.parse_args()
+
+    runs = {False: [], True: []}
+    for _ in range(args.repeat):
+        for journal in runs:
+            runs[journal].append(run(journal, args.rows, args.threads))
+    results = {journal: {key: statistics.median(r[key] for r in measures) if key.endswith("_us_per_row")
+                         else measures[0][key] for key in measures[0]}
+               for journal, measures in runs.items()}
+    for result in results.values():
+        print(json.dumps(result, ensure_ascii=False))
+    overhead = {key: f"{results[True][key] / results[False][key] - 1:+.0%}"
+                for key in results[True] if key.endswith("_us_per_row")}
+    print(json.dumps({"surcoût": overhead}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
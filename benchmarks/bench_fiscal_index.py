@@ -0,0 +1,87 @@
+"""Latence et taux de réussite de l'index fiscal local.
+
+Chaque question du jeu fixe attend soit une réponse locale ("local"),
+soit un passage précis dans le top-k du retriever.
+
+Usage:
+    python -m benchmarks.bench_fiscal_index [--k 3] [--repeat 200]
+"""
+import argparse
+import statistics
+import time
+from datetime import date
+
+from utils.fiscal_knowledge import PASSAGES, answer_locally, build_context, get_index, retrieve
+
+QUESTIONS = [
+    ("Quel est le taux de TVA?", "local"),
+    ("Quels sont les taux de TVA en Tunisie?", "local"),
+    ("TVA sur 1500 DT à 7%", "local"),
+    ("Calculer la TVA d'un montant HT de 2 400 DT", "local"),
+    ("Combien fait le TTC pour 850 dinars à 13%?", "local"),
+    ("Quand payer la CNSS?", "local"),
+    ("Quelles sont les échéances fiscales ce mois?", "local"),
+    ("Date limite de l'impôt sur les sociétés", "local"),
+    ("Quelle est la date limite de la déclaration annuelle?", "local"),
+    ("Comment calculer la TVA en Tunisie?", "tva_calcul"),
+    ("Comment déclarer la TVA mensuelle?", "tva_declaration"),
+    ("Que faire en cas de crédit de TVA?", "tva_declaration"),
+    ("Quels documents pour une déclaration annuelle?", "declaration_annuelle"),
+    ("Comment optimiser mes impôts légitimement?", "optimisation"),
+    ("Puis-je récupérer la TVA sur mes achats de carburant?", "tva_deductible"),
+    ("Quelles mentions obligatoires sur une facture?", "facture_mentions"),
+    ("Quelles pénalités si je dépose en retard?", "penalites"),
+    ("Comment est calculé le bénéfice imposable d'une SARL?", "impot_societes"),
+    ("Cotisations sociales sur les salaires des chauffeurs", "cnss"),
+    ("Dois-je déposer une déclaration sans chiffre d'affaires?", "penalites"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    get_index()
+    build_ms = (time.perf_counter() - started) * 1000
+
+    today = date(2026, 1, 10)
+    hits = local_hits = local_expected = 0
+    latencies = []
+    for question, expected in QUESTIONS:
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            local = answer_locally(question, today)
+            passages = [] if local else retrieve(question, args.k)
+            latencies.append((time.perf_counter() - t0) * 1_000_000)
+
+        if expected == "local":
+            local_expected += 1
+            ok = local is not None
+            local_hits += ok
+        else:
+            ok = local is None and expected in [p.id for p in passages]
+        hits += ok
+        if not ok:
+            got = "local" if local else [p.id for p in passages]
+            print(f"  ✗ {question!r}: attendu {expected}, obtenu {got}")
+
+    full_context = "\n".join(f"- {p.title} : {p.text}" for p in PASSAGES)
+    remote = [q for q, expected in QUESTIONS if expected != "local"]
+    avg_context = statistics.mean(len(build_context(q, args.k)) for q in remote)
+
+    latencies.sort()
+    print(f"Construction de l'index : {build_ms:.2f} ms ({len(PASSAGES)} passages)")
+    print(f"Taux de réussite        : {hits}/{len(QUESTIONS)} "
+          f"(réponses locales {local_hits}/{local_expected}, top-{args.k} "
+          f"{hits - local_hits}/{len(QUESTIONS) - local_expected})")
+    print(f"Latence p50 / p95 / max : {latencies[len(latencies) // 2]:.1f} / "
+          f"{latencies[int(len(latencies) * 0.95)]:.1f} / {latencies[-1]:.1f} µs")
+    print(f"Contexte injecté moyen  : {avg_context:.0f} caractères "
+          f"(base complète : {len(full_context)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Surcoût de l'instrumentation SQL sur des requêtes courtes.
+
+Usage:
+    python -m benchmarks.bench_instrumentation [--queries 20000]
+"""
+import argparse
+import sqlite3
+import time
+
+from utils import instrumentation
+
+
+POINT_QUERY = "SELECT v FROM t WHERE id = ?"
+AGGREGATE_QUERY = "SELECT SUM(length(v)) FROM t WHERE id >= ?"
+
+
+def run(conn, sql, queries):
+    conn.execute("CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.executemany("INSERT OR IGNORE INTO t VALUES (?, ?)", [(i, str(i)) for i in range(1000)])
+    started = time.perf_counter()
+    for i in range(queries):
+        conn.execute(sql, (i % 1000,)).fetchone()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+
+    for label, sql in [("Lecture par clé", POINT_QUERY), ("Agrégat (~500 lignes)", AGGREGATE_QUERY)]:
+        plain = run(sqlite3.connect(":memory:"), sql, args.queries)
+        with instrumentation.rerun():
+            traced = run(instrumentation.connect(":memory:"), sql, args.queries)
+
+        per_query = (traced - plain) / args.queries * 1_000_000
+        print(f"{label}")
+        print(f"  sans instrumentation : {plain * 1000:8.1f} ms")
+        print(f"  avec instrumentation : {traced * 1000:8.1f} ms")
+        print(f"  surcoût              : {per_query:.2f} µs par requête ({traced / plain - 1:+.0%})")
+
+
+if __name__ == "__main__":
+    main()
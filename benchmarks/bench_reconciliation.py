@@ -0,0 +1,93 @@
+"""Rapprochement d'un relevé bancaire avec un grand nombre de factures ouvertes.
+
+Crée une base de factures envoyées, un relevé CSV dont une partie des
+virements cite le numéro de facture, une partie seulement le montant, et le
+reste ne correspond à rien ; mesure lecture, rapprochement et solde.
+
+Usage:
+    python -m benchmarks.bench_reconciliation --open 100000 --lines 5000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from data.database import Database
+from utils import reconciliation
+
+RIB = "01 234 5678901234567 89"
+
+
+def fill_open_invoices(db: Database, count: int, rng: random.Random, end: datetime):
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO invoices (id, client_id, date, due_date, total_amount, tva_amount, status, items) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'envoyée', '[]')",
+            [(f"FACT-{d:%Y%m}-{n:06d}", f"CLI-{rng.randrange(500):05d}", d, d + timedelta(days=30),
+              amount, round(amount * 19 / 119, 3))
+             for n in range(count)
+             for d, amount in [(end - timedelta(days=rng.randrange(365)), round(rng.uniform(50, 20000), 3))]]
+        )
+        conn.commit()
+        return conn.execute("SELECT id, date, total_amount FROM invoices").fetchall()
+
+
+def build_statement(invoices, lines: int, rng: random.Random) -> bytes:
+    rows = ["Banque;Relevé de compte", f"RIB : {RIB}", "", "Date opération;Libellé;Débit;Crédit"]
+    for invoice_id, date, amount in rng.sample(invoices, lines):
+        paid_on = date + timedelta(days=rng.randrange(1, 60))
+        kind = rng.random()
+        if kind < 0.5:
+            label = f"VIR RECU SOC CLIENT REF {invoice_id}"
+        elif kind < 0.9:
+            label = "VIR RECU SOC CLIENT"
+        else:
+            label, amount = "VERSEMENT ESPECES", amount + 0.5
+        rows.append(f"{paid_on:%d/%m/%Y};{label};;{amount:,.3f}".replace(",", " ").replace(".", ","))
+    return "\n".join(rows).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--open", type=int, default=100_000, help="factures ouvertes")
+    parser.add_argument("--lines", type=int, default=5_000, help="lignes du relevé")
+    parser.add_argument("--seed", type=int, default=2026)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "reconciliation.db"))
+        invoices = fill_open_invoices(db, args.open, rng, datetime(2026, 6, 30))
+        content = build_statement(invoices, args.lines, rng)
+
+        timings = {}
+        started = time.perf_counter()
+        transactions = reconciliation.read_statement(content, RIB)
+        timings["lecture"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        db.add_bank_transactions(transactions)
+        credits, open_invoices = db.get_unmatched_credits(), db.get_open_invoice_keys()
+        timings["chargement"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = reconciliation.reconcile(credits, open_invoices)
+        timings["rapprochement"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        paid, skipped = reconciliation.apply_matches(result.confirmed, db)
+        timings["solde"] = time.perf_counter() - started
+
+        print(json.dumps({
+            "open_invoices": args.open, "lines": len(transactions),
+            "confirmed": len(result.confirmed), "to_review": len(result.to_review),
+            "unmatched": len(result.unmatched), "paid": paid, "already_paid": len(skipped),
+            "timings_s": {k: round(v, 3) for k, v in timings.items()},
+        }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
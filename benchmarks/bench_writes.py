@@ -0,0 +1,98 @@
+"""Débit des écritures concurrentes : une connexion et un commit par écriture, ou fil d'écriture unique.
+
+Plusieurs fils insèrent chacun des factures en même temps, comme plusieurs
+sessions en fin de mois. Mode « direct » : chaque insertion ouvre sa
+connexion et valide sa transaction (ancien comportement) ; mode « file » :
+les insertions passent par Database.add_invoice (commits groupés).
+
+Usage:
+    python -m benchmarks.bench_writes --threads 16 --writes 200
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from data.database import INVOICE_COLUMNS, Database
+from data.models import Invoice
+from data.writer import DatabaseWriter
+
+ITEMS = [{"description": "Transport", "quantity": 1, "unit_price": 100, "tva_rate": 19,
+          "total_ht": 100, "tva_amount": 19, "total_ttc": 119}]
+
+
+def invoice(n: int) -> Invoice:
+    day = datetime(2026, 10, 1) + timedelta(minutes=n)
+    return Invoice(f"FACT-B-{n:07d}", f"CLI-{n % 50:03d}", day, day + timedelta(days=30),
+                   119.0, 19.0, "envoyée", ITEMS)
+
+
+def insert_direct(db: Database, inv: Invoice):
+    """Ancien chemin : connexion, INSERT, commit"""
+    with db.get_connection() as conn:
+        conn.execute(f"INSERT INTO invoices ({INVOICE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (inv.id, inv.client_id, inv.date, inv.due_date, inv.total_amount, inv.tva_amount,
+                      inv.status, json.dumps(inv.items), None, None, None))
+        conn.commit()
+
+
+def run(mode: str, threads: int, writes: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "writes.db"))
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def worker(index: int):
+            for k in range(writes):
+                inv = invoice(index * writes + k)
+                started = time.perf_counter()
+                try:
+                    insert_direct(db, inv) if mode == "direct" else db.add_invoice(inv)
+                except Exception as e:
+                    with lock:
+                        errors.append(type(e).__name__)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        duration = time.perf_counter() - started
+
+        writer: DatabaseWriter = db.writer
+        result = {
+            "mode": mode,
+            "writes": len(latencies),
+            "errors": len(errors),
+            "writes_per_s": round(len(latencies) / duration),
+            "latency_p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+            "latency_p99_ms": round(sorted(latencies)[int(len(latencies) * 0.99) - 1] * 1000, 2)
+                              if latencies else None,
+        }
+        if mode == "file":
+            result["mean_batch"] = round(writer.requests / max(writer.batches, 1), 1)
+        writer.close()
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--writes", type=int, default=200, help="insertions par fil")
+    args = parser.parse_args()
+
+    for threads in args.threads:
+        for mode in ("direct", "file"):
+            print(json.dumps({"threads": threads, **run(mode, threads, args.writes)}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
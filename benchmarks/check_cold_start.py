@@ -0,0 +1,103 @@
+"""Borne le démarrage à froid de la page de connexion.
+
+Lance l'application dans un interpréteur neuf (via AppTest), mesure le rendu
+de la page de connexion hors import de streamlit, et échoue si une dépendance
+lourde réservée aux vues (openai, plotly.express, fpdf) est chargée ou si la
+base de données est initialisée.
+
+Usage:
+    python -m benchmarks.check_cold_start [--max-ms 1500] [--profile benchmarks/import_profile.txt]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFERRED_MODULES = ["openai", "plotly.express", "fpdf"]
+
+CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file("app.py", default_timeout=30).run()
+t2 = time.perf_counter()
+import data.database as database
+print(json.dumps({
+    "streamlit_import_ms": (t1 - t0) * 1000,
+    "login_render_ms": (t2 - t1) * 1000,
+    "titles": [t.value for t in at.title],
+    "exception": [str(e.value) for e in at.exception],
+    "loaded": [m for m in %r if m in sys.modules],
+    "db_initialised": database.db._instance is not None,
+}))
+"""
+
+
+def run_child(importtime=False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", CHILD % DEFERRED_MODULES]
+    return subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, timeout=120)
+
+
+def write_profile(stderr: str, path: str, top: int = 40):
+    """Écrit les modules les plus coûteux (temps cumulé) à l'import"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    with open(path, "w") as f:
+        f.write("# python -X importtime, rendu de la page de connexion (python -m benchmarks.check_cold_start)\n")
+        f.write(f"# {'cumulé (µs)':>12} {'propre (µs)':>12}  module\n")
+        for cumulative_us, self_us, name in rows[:top]:
+            f.write(f"{cumulative_us:>14} {self_us:>12}  {name}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-ms", type=float, default=1500.0,
+                        help="durée max du rendu de la page de connexion (hors import de streamlit)")
+    parser.add_argument("--profile", help="fichier où écrire le profil d'import")
+    args = parser.parse_args()
+
+    result = run_child()
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(result.returncode)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    print(f"Import streamlit        : {report['streamlit_import_ms']:8.1f} ms")
+    print(f"Rendu page de connexion : {report['login_render_ms']:8.1f} ms (max {args.max_ms:.0f} ms)")
+    print(f"Modules différés chargés: {report['loaded'] or 'aucun'}")
+    print(f"Base initialisée        : {'oui' if report['db_initialised'] else 'non'}")
+
+    if args.profile:
+        write_profile(run_child(importtime=True).stderr, args.profile)
+        print(f"Profil d'import écrit dans {args.profile}")
+
+    errors = []
+    if report["exception"]:
+        errors.append(f"exception pendant le rendu : {report['exception']}")
+    if report["loaded"]:
+        errors.append(f"dépendances lourdes chargées au démarrage : {report['loaded']}")
+    if report["db_initialised"]:
+        errors.append("la base de données est initialisée par la page de connexion")
+    if report["login_render_ms"] > args.max_ms:
+        errors.append(f"rendu trop lent : {report['login_render_ms']:.0f} ms > {args.max_ms:.0f} ms")
+
+    for error in errors:
+        print(f"ÉCHEC : {error}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Faux serveur OpenAI qui renvoie une complétion en streaming (SSE).
+
+Usage:
+    python -m benchmarks.fake_openai_server --port 8765 --first-token-delay 0.8 --token-delay 0.02
+
+Puis lancer l'application avec OPENAI_API_BASE=http://127.0.0.1:8765/v1
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = (
+    "En Tunisie, la TVA est déclarée mensuellement par les assujettis au régime réel. "
+    "Les taux applicables sont de 7%, 13% et 19% selon la nature de l'opération. "
+    "La déclaration est déposée avec le paiement avant l'échéance du mois suivant."
+)
+
+
+class FakeStreamingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, first_token_delay=0.5, token_delay=0.02, answer=DEFAULT_ANSWER):
+        super().__init__(address, FakeCompletionHandler)
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.answer = answer
+        self.requests_served = 0
+        self.tokens_sent = 0
+        self.disconnects = 0
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Démarre le serveur dans un thread daemon"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        server.requests_served += 1
+
+        if not payload.get("stream"):
+            body = json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": server.answer}}]
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        time.sleep(server.first_token_delay)
+        words = server.answer.split(" ")
+        try:
+            for i, word in enumerate(words):
+                content = word if i == 0 else " " + word
+                self._send_event({
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+                })
+                server.tokens_sent += 1
+                time.sleep(server.token_delay)
+            self._send_event({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            server.disconnects += 1
+        self.close_connection = True
+
+    def _send_event(self, data):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = FakeStreamingServer((args.host, args.port), args.first_token_delay, args.token_delay)
+    print(f"Faux serveur OpenAI sur {server.api_base}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
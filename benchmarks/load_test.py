@@ -0,0 +1,257 @@
+"""Test de charge en processus : N sessions Streamlit simultanées via AppTest.
+
+Chaque utilisateur virtuel se connecte par le formulaire de connexion
+(mêmes libellés que components/auth.login_page), crée des factures et
+parcourt Dashboard / Factures / Analytics. Le rapport donne les centiles de
+latence par action et la mémoire par session.
+
+Usage:
+    python -m benchmarks.load_test --users 20 --iterations 5
+    python -m benchmarks.load_test --users 50 --output /tmp/load.json
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+CREDENTIALS = {"admin": ("admin", "admin123", "👑 Admin"), "staff": ("staff", "staff123", "👤 Staff")}
+BROWSE_VIEWS = ["dashboard", "invoices", "analytics"]
+
+
+class VirtualUser:
+    """Une session AppTest qui rejoue un parcours utilisateur"""
+
+    def __init__(self, index: int, role: str, timeout: float):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.role = role
+        self.timings = defaultdict(list)
+        self.errors = []
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def _timed(self, action: str, func):
+        started = time.perf_counter()
+        try:
+            func()
+            if self.at.exception:
+                self.errors.append(f"{action}: {self.at.exception[0].value}")
+        except Exception as e:
+            detail = f" ({self.at.exception[0].value})" if self.at.exception else ""
+            self.errors.append(f"{action}: {e}{detail}")
+        finally:
+            self.timings[action].append(time.perf_counter() - started)
+
+    def _button(self, label: str):
+        for button in self.at.button:
+            if button.label == label:
+                return button
+        raise LookupError(f"bouton {label!r} introuvable")
+
+    def _text_input(self, label: str):
+        for widget in self.at.text_input:
+            if widget.label == label:
+                return widget
+        raise LookupError(f"champ {label!r} introuvable")
+
+    def open(self):
+        self._timed("login_page", self.at.run)
+
+    def login(self):
+        username, password, button = CREDENTIALS[self.role]
+
+        def do_login():
+            self._text_input("Nom d'utilisateur").input(username)
+            self._text_input("Mot de passe").input(password)
+            self._button(button).click().run()
+            if not self.at.session_state.authenticated:
+                raise RuntimeError("connexion refusée")
+
+        self._timed("login", do_login)
+
+    def browse(self, view: str):
+        # Les boutons de la sidebar font un st.rerun() qu'AppTest rejoue avec le clic
+        # toujours actif : on navigue donc par l'état de session, comme le fait le bouton.
+        def do_browse():
+            self.at.session_state.current_view = view
+            self.at.run()
+
+        self._timed(f"view:{view}", do_browse)
+
+    def create_invoice(self, n: int):
+        def do_create():
+            if self.at.session_state.current_view != "invoices":
+                self.at.session_state.current_view = "invoices"
+                self.at.run()
+            self._text_input("Description").input(f"Transport Tunis - Sfax #{self.index}-{n}")
+            self._button("➕ Ajouter").click().run()
+            self._text_input("Nom du Client*").input(f"Client charge {self.index}")
+            self._button("✅ Créer la facture").click().run()
+
+        self._timed("create_invoice", do_create)
+
+    def state_size(self) -> int:
+        """Taille sérialisée de l'état de session (octets)"""
+        state = self.at.session_state.filtered_state
+        try:
+            return len(pickle.dumps(state))
+        except Exception:
+            return sum(len(pickle.dumps(v)) for v in state.values() if _picklable(v))
+
+
+def _picklable(value) -> bool:
+    try:
+        pickle.dumps(value)
+        return True
+    except Exception:
+        return False
+
+
+def current_rss() -> int:
+    """RSS du processus en octets (Linux), 0 si indisponible"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def percentiles(values):
+    values = sorted(values)
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return {"p50": value, "p90": value, "p95": value, "p99": value, "max": value}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p90": cuts[89], "p95": cuts[94], "p99": cuts[98], "max": values[-1]}
+
+
+def share_runtime():
+    """Partage un runtime factice et le cache de bytecode entre les sessions AppTest.
+
+    AppTest installe un Runtime factice au début de chaque exécution et le
+    retire à la fin, ce qui casse les exécutions parallèles des autres
+    threads : on renvoie donc un runtime commun quand aucun n'est installé.
+    Il recompile aussi le script à chaque exécution (ast.parse concurrent
+    échoue sous CPython 3.11) ; comme le vrai serveur, on partage un seul
+    ScriptCache.
+    """
+    from unittest.mock import MagicMock
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import local_script_runner
+
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+
+    def instance(cls):
+        return cls._instance if cls._instance is not None else shared
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: True)
+
+
+def run_user(user: VirtualUser, iterations: int, barrier: threading.Barrier):
+    user.open()
+    barrier.wait()  # toutes les sessions se connectent en même temps
+    user.login()
+    for n in range(iterations):
+        for view in BROWSE_VIEWS:
+            user.browse(view)
+        user.create_invoice(n)
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=3, help="parcours par utilisateur")
+    parser.add_argument("--admin-ratio", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=60.0, help="délai max d'une exécution AppTest")
+    parser.add_argument("--output", help="fichier JSON du rapport")
+    args = parser.parse_args()
+
+    # Répertoire de travail isolé : data.json et la base SQLite sont relatifs au cwd
+    workdir = tempfile.mkdtemp(prefix="tt-load-")
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+
+    share_runtime()
+    rss_before = current_rss()
+    users = [VirtualUser(i, "admin" if i < args.users * args.admin_ratio else "staff", args.timeout)
+             for i in range(args.users)]
+    barrier = threading.Barrier(args.users)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(lambda u: run_user(u, args.iterations, barrier), users))
+    elapsed = time.perf_counter() - started
+    rss_after = current_rss()
+
+    timings = defaultdict(list)
+    errors = []
+    for user in users:
+        for action, values in user.timings.items():
+            timings[action].extend(values)
+        errors.extend(f"utilisateur {user.index}: {e}" for e in user.errors)
+
+    state_sizes = [user.state_size() for user in users]
+    report = {
+        "users": args.users,
+        "iterations": args.iterations,
+        "elapsed_s": round(elapsed, 3),
+        "actions": {
+            action: {"count": len(values),
+                     **{k: round(v * 1000, 1) for k, v in percentiles(values).items()}}
+            for action, values in sorted(timings.items())
+        },
+        "memory": {
+            "rss_per_session_kb": round((rss_after - rss_before) / args.users / 1024, 1) if rss_before else None,
+            "state_p50_kb": round(statistics.median(state_sizes) / 1024, 1),
+            "state_max_kb": round(max(state_sizes) / 1024, 1),
+        },
+        "errors": errors[:50],
+        "error_count": len(errors),
+    }
+
+    print(f"{args.users} sessions × {args.iterations} parcours en {elapsed:.1f} s")
+    print(f"{'action':<22}{'n':>6}{'p50':>10}{'p90':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for action, stats in report["actions"].items():
+        print(f"{action:<22}{stats['count']:>6}{stats['p50']:>10}{stats['p90']:>10}"
+              f"{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+    memory = report["memory"]
+    print(f"Mémoire : RSS ≈ {memory['rss_per_session_kb']} Ko/session, "
+          f"état de session p50 {memory['state_p50_kb']} Ko, max {memory['state_max_kb']} Ko")
+    if errors:
+        print(f"{len(errors)} erreurs, par exemple : {errors[0]}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Rapport écrit dans {args.output}")
+
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""Benchmarks de bout en bout des chemins critiques sur données synthétiques.
+
+Les résultats sont écrits en JSON (un fichier par commit) pour comparer
+deux versions :
+
+    python -m benchmarks.run_benchmarks --scale small
+    python -m benchmarks.run_benchmarks --scale large --compare benchmarks/results/<commit>.json
+
+La base synthétique est mise en cache dans benchmarks/.cache/.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, replace
+from datetime import datetime
+
+from benchmarks.synthetic_data import SCALES, fill_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(ROOT, "benchmarks", ".cache")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Enregistre une fonction de benchmark (reçoit le contexte, retourne un nombre d'éléments)"""
+    def decorator(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return decorator
+
+
+# ================= CHEMINS CRITIQUES =================
+@benchmark("get_invoices")
+def bench_get_invoices(ctx):
+    return len(ctx["db"].get_invoices())
+
+
+@benchmark("get_invoices_current_year")
+def bench_get_invoices_current_year(ctx):
+    """Exercice en cours : n'attache aucune archive"""
+    from datetime import date
+
+    return len(ctx["db"].get_invoices(start=date(ctx["scale"].end.year, 1, 1)))
+
+
+@benchmark("get_monthly_stats_12m")
+def bench_monthly_stats(ctx):
+    end = ctx["scale"].end
+    for i in range(12):
+        month = (end.month - i - 1) % 12 + 1
+        year = end.year - (1 if end.month - i <= 0 else 0)
+        ctx["db"].get_monthly_stats(month, year)
+    return 12
+
+
+@benchmark("dashboard_aggregation")
+def bench_dashboard(ctx):
+    """Même travail que pages/Dashboard.show() hors rendu"""
+    from utils import analytics_cube, kpi
+
+    db = ctx["db"]
+    totals = db.get_totals()
+    kpis = kpi.dashboard_kpis(db, ctx["scale"].end)
+
+    monthly_data = analytics_cube.sales(db, by=("period",))
+    recent = db.get_invoices(limit=5)
+    assert totals["revenue"] >= kpis["month"].revenue.current and recent
+    return len(monthly_data)
+
+
+@benchmark("analytics_view")
+def bench_analytics(ctx):
+    """Requêtes de show_analytics() sur le cube (relevé du journal compris, sans cache de lecture)"""
+    from utils import analytics_cube
+
+    db = ctx["db"]
+    end = ctx["scale"].end
+    where = {"period": (f"{end.year - 1}-01", f"{end.year}-12")}
+    frames = [
+        analytics_cube.sales(db, by=("period",), grain="year"),
+        analytics_cube.sales(db, by=("period", "status"), where=where),
+        analytics_cube.sales(db, by=("client_id",), where=where),
+        analytics_cube.sales(db, by=("tva_rate",), where=where),
+        analytics_cube.purchases(db, by=("period", "category"), where=where),
+        analytics_cube.sales(db, by=("period",), where=where),
+    ]
+    return sum(len(frame) for frame in frames)
+
+
+@benchmark("analytics_rebuild_archived")
+def bench_analytics_rebuild_archived(ctx):
+    """Reconstruction complète du cube sur une copie dont le premier exercice complet est archivé"""
+    from data.archive import archive_year
+    from data.database import Database
+    from utils import analytics_cube
+
+    if "archived_db" not in ctx:
+        ctx["archived_dir"] = tempfile.TemporaryDirectory()
+        path = os.path.join(ctx["archived_dir"].name, "archived.db")
+        with ctx["db"].get_connection() as source, sqlite3.connect(path) as target:
+            source.backup(target)
+        archive_year(ctx["scale"].start.year + 1, path)
+        ctx["archived_db"] = Database(path)
+    return analytics_cube.rebuild(ctx["archived_db"])
+
+
+@benchmark("chart_series")
+def bench_chart_series(ctx):
+    """Figure « Ventes et achats » de show_analytics() : séries journalières, regroupement, LTTB (sans cache)"""
+    from utils import chart_series
+
+    figure = chart_series.figure(ctx["db"], ("ventes", "achats"))
+    return sum(len(trace.x) for trace in figure.data)
+
+
+@benchmark("client_lookup")
+def bench_client_lookup(ctx):
+    """Saisie d'un nom de client lettre à lettre, puis avec une faute de frappe (index déjà construit)"""
+    from utils import client_lookup
+
+    index = client_lookup.get_index(ctx["db"])
+    queries = 0
+    for client in list(index.clients.values())[:20]:
+        name = client.name.lower()
+        typed = [name[:size] for size in range(1, min(len(name), 12) + 1)] + [name[1:] + name[0]]
+        for query in typed:
+            assert len(index.search(query)) <= client_lookup.DEFAULT_LIMIT
+        queries += len(typed)
+    return queries
+
+
+@benchmark("dedup_scan")
+def bench_dedup_scan(ctx):
+    """Balayage des doublons (clients, achats) sans cache, comme après une écriture"""
+    from data import dedup
+
+    report = dedup.scan(ctx["db"])
+    return report.compared + len(report.purchases) + len(report.probable_purchases)
+
+
+@benchmark("receivables_aging")
+def bench_receivables_aging(ctx):
+    """Balance âgée sans cache (première vue de l'onglet après une écriture)"""
+    from utils import aging
+
+    return len(aging.receivables_aging(ctx["db"], ctx["scale"].end).rows)
+
+
+@benchmark("calculate_tax_declaration")
+def bench_tax_declaration(ctx):
+    from utils.calculations import calculate_tax_declaration
+
+    db = ctx["db"]
+    invoices = [{"total_amount": inv.total_amount, "tva_amount": inv.tva_amount}
+                for inv in db.get_invoices()]
+    with db.get_connection() as conn:
+        purchases = [{"total_amount": row[0], "tva_amount": row[1]}
+                     for row in conn.execute("SELECT total_amount, tva_amount FROM purchases")]
+    calculate_tax_declaration(invoices, purchases)
+    return len(invoices) + len(purchases)
+
+
+@benchmark("pdf_render_50")
+def bench_pdf(ctx):
+    from utils.pdf_generator import generate_invoice_pdf
+
+    company = {"name": "TunisieTrans SARL", "matricule_fiscal": "1234567/A/M/000",
+               "address": "Zone Industrielle, Tunis, Tunisie", "phone": "+216 71 234 567",
+               "email": "contact@tunisietrans.tn", "rib": "01 234 5678901234567 89"}
+    with ctx["db"].get_connection() as conn:
+        rows = conn.execute(
+            "SELECT i.id, i.client_id, c.name, c.address, i.date, i.due_date, i.total_amount, "
+            "i.tva_amount, i.items FROM invoices i JOIN clients c ON c.id = i.client_id "
+            "ORDER BY i.date DESC LIMIT 50"
+        ).fetchall()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for row in rows:
+            invoice_data = {
+                "id": row[0], "client_id": row[1], "client_name": row[2], "client_address": row[3],
+                "invoice_date": row[4].strftime("%d/%m/%Y"), "due_date": row[5].strftime("%d/%m/%Y"),
+                "items": json.loads(row[8]), "total_ht": row[6] - row[7],
+                "tva_amount": row[7], "total_ttc": row[6], "notes": ""
+            }
+            generate_invoice_pdf(invoice_data, company, os.path.join(tmp, f"{row[0]}.pdf"))
+    return len(rows)
+
+
+@benchmark("teif_render_50")
+def bench_teif(ctx):
+    """Mêmes 50 factures que pdf_render_50, en XML TEIF contrôlé"""
+    from utils.teif import generate_invoice_teif, invoice_documents, validate_teif
+
+    company = {"name": "TunisieTrans SARL", "matricule_fiscal": "1234567/A/M/000",
+               "address": "Zone Industrielle, Tunis, Tunisie", "phone": "+216 71 234 567",
+               "email": "contact@tunisietrans.tn", "rib": "01 234 5678901234567 89"}
+    end = ctx["scale"].end
+    documents = sorted(invoice_documents(end.replace(day=1), end, ctx["db"]),
+                       key=lambda doc: doc["invoice_date"], reverse=True)[:50]
+    with tempfile.TemporaryDirectory() as tmp:
+        for doc in documents:
+            validate_teif(generate_invoice_teif(doc, company, os.path.join(tmp, f"{doc['id']}.xml")))
+    return len(documents)
+
+
+@benchmark("export_csv")
+def bench_export(ctx):
+    """Même export que pages/Gestion_Factures.show_all_invoices()"""
+    import pandas as pd
+
+    invoices = ctx["db"].get_invoices()
+    df = pd.DataFrame([{
+        "ID": inv.id,
+        "Client": inv.client_id,
+        "Date": inv.date.strftime("%d/%m/%Y"),
+        "Échéance": inv.due_date.strftime("%d/%m/%Y"),
+        "Montant HT": f"{inv.total_amount - inv.tva_amount:,.2f} DT",
+        "TVA": f"{inv.tva_amount:,.2f} DT",
+        "Total TTC": f"{inv.total_amount:,.2f} DT",
+        "Statut": inv.status,
+    } for inv in invoices])
+    return len(df.to_csv(index=False).encode("utf-8"))
+
+
+# ================= EXÉCUTION =================
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def prepare_database(scale) -> str:
+    """Base synthétique mise en cache par paramètres d'échelle"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    name = f"synthetic-c{scale.clients}-i{scale.invoices}-y{scale.years}-s{scale.seed}.db"
+    path = os.path.join(CACHE_DIR, name)
+    if not os.path.exists(path):
+        print(f"Génération de {name}...")
+        started = time.perf_counter()
+        fill_database(path + ".tmp", scale)
+        os.replace(path + ".tmp", path)
+        print(f"  {time.perf_counter() - started:.1f} s")
+    return path
+
+
+def run(scale, repeat: int, only=None) -> dict:
+    from data.database import Database
+
+    db_path = prepare_database(scale)
+    ctx = {"db": Database(db_path), "scale": scale}
+    results = {}
+    for name, func in BENCHMARKS:
+        if only and name not in only:
+            continue
+        timings = []
+        try:
+            items = func(ctx)  # échauffement (cache disque, imports)
+            for _ in range(repeat):
+                # Chemins mesurés sans le cache des lectures (comparables d'une version à l'autre)
+                ctx["db"].cache.clear()
+                started = time.perf_counter()
+                func(ctx)
+                timings.append(time.perf_counter() - started)
+        except ImportError as e:
+            results[name] = {"skipped": str(e)}
+            print(f"{name:<28} ignoré ({e})")
+            continue
+        results[name] = {
+            "items": items,
+            "runs_s": [round(t, 6) for t in timings],
+            "median_s": round(statistics.median(timings), 6),
+            "min_s": round(min(timings), 6),
+        }
+        print(f"{name:<28} médiane {results[name]['median_s'] * 1000:10.1f} ms  ({items} éléments)")
+    return results
+
+
+def compare(current: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparaison avec {baseline.get('commit')} ({baseline_path})")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name, {})
+        if "median_s" not in result or "median_s" not in before:
+            continue
+        ratio = result["median_s"] / before["median_s"] if before["median_s"] else float("inf")
+        flag = "  ⚠️ régression" if ratio > 1.2 else ""
+        print(f"{name:<28} {before['median_s'] * 1000:10.1f} → {result['median_s'] * 1000:10.1f} ms "
+              f"({ratio - 1:+.0%}){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--invoices", type=int)
+    parser.add_argument("--clients", type=int)
+    parser.add_argument("--years", type=int)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="noms des benchmarks à lancer")
+    parser.add_argument("--output", help="fichier JSON de résultats (défaut : benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="fichier JSON de référence")
+    args = parser.parse_args()
+
+    overrides = {name: getattr(args, name) for name in ("invoices", "clients", "years")
+                 if getattr(args, name) is not None}
+    scale = replace(SCALES[args.scale], **overrides)
+
+    commit = git_commit()
+    results = run(scale, args.repeat, args.only)
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "scale": {**asdict(scale), "end": scale.end.isoformat()},
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}-{args.scale}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nRésultats écrits dans {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Générateur déterministe de données de facturation tunisiennes.
+
+Remplit le schéma SQLite de data.database.Database et/ou écrit un fichier
+au format data.json de app.py, à l'échelle voulue.
+
+Usage:
+    python -m benchmarks.synthetic_data --db /tmp/bench.db --clients 300 --invoices 1000000 --years 4
+    python -m benchmarks.synthetic_data --json /tmp/data.json --invoices 50000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from utils.calculations import calculate_tva
+
+CITIES = ["Tunis", "Sfax", "Sousse", "Bizerte", "Gabès", "Nabeul", "Monastir",
+          "Kairouan", "Ariana", "Ben Arous", "Gafsa", "Médenine", "Béja", "Mahdia"]
+PREFIXES = ["Société", "Ets", "Groupe", "Comptoir", "Industries", "STE"]
+ACTIVITIES = ["Textile", "Agroalimentaire", "Matériaux", "Import-Export", "Huilerie",
+              "Céramique", "Distribution", "Plasturgie", "Pharma", "Électroménager",
+              "Emballage", "Bâtiment", "Mécanique", "Câblerie"]
+FAMILY_NAMES = ["Ben Ali", "Trabelsi", "Jebali", "Gharbi", "Mejri", "Haddad", "Bouazizi",
+                "Karoui", "Chaabane", "Sassi", "Mansouri", "Ayari", "Hammami", "Dridi"]
+LEGAL_FORMS = ["SARL", "SA", "SUARL"]
+
+SERVICES = [
+    ("Transport marchandises {a} - {b}", 350.0, 1800.0, 19.0),
+    ("Transport frigorifique {a} - {b}", 600.0, 2500.0, 19.0),
+    ("Location camion avec chauffeur", 250.0, 900.0, 19.0),
+    ("Manutention et chargement", 80.0, 400.0, 19.0),
+    ("Stockage palettes entrepôt {a}", 120.0, 700.0, 19.0),
+    ("Transport produits agricoles {a} - {b}", 300.0, 1200.0, 7.0),
+    ("Dédouanement port de Radès", 150.0, 600.0, 13.0),
+]
+
+PURCHASE_CATEGORIES = [
+    # (catégorie, fournisseurs, fréquence mensuelle, montant min, montant max, TVA)
+    ("Carburant", ["Agil Energy", "STIR Distribution", "Total Tunisie", "Shell Vivo"], 20, 200.0, 1500.0, 19.0),
+    ("Maintenance", ["Garage Ennour", "Auto Service Sfax", "Mécanique du Sahel"], 4, 150.0, 3000.0, 19.0),
+    ("Péages", ["Tunisie Autoroutes"], 8, 20.0, 150.0, 19.0),
+    ("Salaires", ["Personnel roulant", "Personnel administratif"], 1, 15000.0, 40000.0, 0.0),
+    ("Loyer", ["SCI Zone Industrielle"], 1, 3500.0, 3500.0, 19.0),
+    ("Fournitures", ["Bureau Plus", "Papeterie Centrale"], 2, 40.0, 500.0, 19.0),
+    ("Autre", ["Divers"], 2, 50.0, 1000.0, 19.0),
+]
+
+
+@dataclass
+class Scale:
+    clients: int = 100
+    invoices: int = 20000
+    years: int = 3
+    purchases_per_month: int = 0  # 0 = fréquence réaliste par catégorie
+    seed: int = 2026
+    end: datetime = datetime(2026, 9, 30)
+
+    @property
+    def start(self) -> datetime:
+        return self.end.replace(year=self.end.year - self.years) + timedelta(days=1)
+
+
+SCALES = {
+    "small": Scale(clients=100, invoices=20_000, years=3),
+    "medium": Scale(clients=300, invoices=200_000, years=4),
+    "large": Scale(clients=500, invoices=1_000_000, years=5),
+}
+
+
+def matricule(rng: random.Random) -> str:
+    """Matricule fiscal au format 1234567/A/M/000"""
+    digits = rng.randint(1000000, 1999999)
+    return f"{digits}/{rng.choice('ABCDEFGHJKLMNPQRSTVWXYZ')}/{rng.choice('AMBPN')}/000"
+
+
+def phone(rng: random.Random) -> str:
+    return f"+216 {rng.choice('2579')}{rng.randint(0, 9)} {rng.randint(100, 999)} {rng.randint(100, 999)}"
+
+
+def generate_clients(scale: Scale) -> Iterator[dict]:
+    rng = random.Random(scale.seed)
+    for i in range(scale.clients):
+        if rng.random() < 0.7:
+            name = f"{rng.choice(PREFIXES)} {rng.choice(ACTIVITIES)} {rng.choice(CITIES)} {rng.choice(LEGAL_FORMS)}"
+        else:
+            name = f"{rng.choice(PREFIXES)} {rng.choice(FAMILY_NAMES)} & Fils {rng.choice(LEGAL_FORMS)}"
+        city = rng.choice(CITIES)
+        slug = "".join(c for c in name.lower().encode("ascii", "ignore").decode() if c.isalnum())[:12]
+        yield {
+            "id": f"CLI-{i + 1:05d}",
+            "name": name,
+            "matricule_fiscal": matricule(rng),
+            "address": f"{rng.randint(1, 250)} Rue {rng.choice(FAMILY_NAMES)}, {city}",
+            "city": city,
+            "activity": rng.choice(ACTIVITIES),
+            "phone": phone(rng),
+            "email": f"contact@{slug}.tn",
+            "created_at": scale.start - timedelta(days=rng.randint(0, 720)),
+            "credit_limit": float(rng.choice([0, 10000, 25000, 50000, 100000])),
+            "payment_terms": rng.choice([15, 30, 30, 45, 60, 90]),
+        }
+
+
+def generate_invoices(scale: Scale, clients: list) -> Iterator[dict]:
+    """Factures en ordre chronologique, numérotées FACT-AAAAMM-NNNN"""
+    rng = random.Random(scale.seed + 1)
+    # Quelques gros clients concentrent l'activité (loi de puissance)
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(len(clients))]
+    span = (scale.end - scale.start).total_seconds()
+    step = span / max(scale.invoices, 1)
+    counters = {}
+
+    for i in range(scale.invoices):
+        date = scale.start + timedelta(seconds=int(i * step + rng.random() * step))
+        date = date.replace(microsecond=0)
+        client = rng.choices(clients, weights)[0]
+
+        items = []
+        for _ in range(rng.choice([1, 1, 1, 2, 2, 3])):
+            label, low, high, tva_rate = rng.choice(SERVICES)
+            a, b = rng.sample(CITIES, 2)
+            quantity = rng.choice([1, 1, 1, 2, 3, 5])
+            unit_price = round(rng.uniform(low, high), 3)
+            total_ht = round(quantity * unit_price, 3)
+            tva_amount = calculate_tva(total_ht, tva_rate)
+            items.append({
+                "description": label.format(a=a, b=b),
+                "quantity": quantity,
+                "unit_price": unit_price,
+                "tva_rate": tva_rate,
+                "total_ht": total_ht,
+                "tva_amount": tva_amount,
+                "total_ttc": round(total_ht + tva_amount, 3),
+            })
+
+        total_ht = round(sum(item["total_ht"] for item in items), 3)
+        tva_amount = round(sum(item["tva_amount"] for item in items), 3)
+        due_date = (date + timedelta(days=client["payment_terms"])).date()
+        age = (scale.end - date).days
+
+        payment_date = None
+        if age > 120 or (age > client["payment_terms"] and rng.random() < 0.85) or rng.random() < 0.35:
+            status = "payée"
+            delay = int(rng.gauss(client["payment_terms"] + 8, 12))
+            payment_date = min(date + timedelta(days=max(delay, 0)), scale.end)
+        elif age < 3 and rng.random() < 0.5:
+            status = "brouillon"
+        elif scale.end.date() > due_date:
+            status = "en retard"
+        else:
+            status = "envoyée"
+
+        period = date.strftime("%Y%m")
+        counters[period] = counters.get(period, 0) + 1
+        yield {
+            "id": f"FACT-{period}-{counters[period]:04d}",
+            "client": client,
+            "date": date,
+            "due_date": due_date,
+            "total_ht": total_ht,
+            "tva_amount": tva_amount,
+            "total_ttc": round(total_ht + tva_amount, 3),
+            "status": status,
+            "items": items,
+            "payment_date": payment_date,
+        }
+
+
+def generate_purchases(scale: Scale) -> Iterator[dict]:
+    rng = random.Random(scale.seed + 2)
+    month = scale.start.replace(day=1)
+    number = 0
+    while month <= scale.end:
+        for category, suppliers, frequency, low, high, tva_rate in PURCHASE_CATEGORIES:
+            count = scale.purchases_per_month // len(PURCHASE_CATEGORIES) if scale.purchases_per_month else frequency
+            for _ in range(count):
+                number += 1
+                day = 1 if category in ("Loyer", "Salaires") else rng.randint(1, 28)
+                montant_ht = round(rng.uniform(low, high), 3)
+                tva_amount = calculate_tva(montant_ht, tva_rate)
+                date = month.replace(day=day, hour=rng.randint(8, 18), minute=rng.randint(0, 59))
+                yield {
+                    "id": f"ACH-{number:07d}",
+                    "supplier": rng.choice(suppliers),
+                    "date": date,
+                    "montant_ht": montant_ht,
+                    "tva_rate": tva_rate,
+                    "tva_amount": tva_amount,
+                    "total_amount": round(montant_ht + tva_amount, 3),
+                    "category": category,
+                    # Numéro unique par achat : (fournisseur, exercice, numéro) est une clé unique
+                    "invoice_number": f"F{date.strftime('%y%m')}-{number:05d}",
+                    "payment_status": "payé" if (scale.end - date).days > 45 or rng.random() < 0.6 else "non payé",
+                }
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+# ================= SQLITE =================
+def _batched(iterable, size):
+    batch = []
+    for row in iterable:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def fill_database(db_path: str, scale: Scale, batch_size: int = 20000) -> dict:
+    """Crée le schéma via Database puis insère les données générées"""
+    from data.database import Database
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    Database(db_path)
+
+    counts = {}
+    conn = sqlite3.connect(db_path)
+    # Une base neuve naît en auto_vacuum incrémental (2), sinon le vacuum quotidien ne rend rien
+    auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if auto_vacuum != 2:
+        conn.close()
+        raise RuntimeError(f"{db_path} : auto_vacuum = {auto_vacuum} pour une base neuve (2 attendu)")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    try:
+        clients = list(generate_clients(scale))
+        conn.executemany(
+            "INSERT INTO clients (id, name, matricule_fiscal, address, phone, email, created_at, "
+            "credit_limit, payment_terms, notes, city, activity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(c["id"], c["name"], c["matricule_fiscal"], c["address"], c["phone"], c["email"],
+              c["created_at"].isoformat(" "), c["credit_limit"], c["payment_terms"], None, c["city"], c["activity"])
+             for c in clients]
+        )
+        counts["clients"] = len(clients)
+
+        counts["invoices"] = 0
+        for batch in _batched(generate_invoices(scale, clients), batch_size):
+            conn.executemany(
+                "INSERT INTO invoices (id, client_id, date, due_date, total_amount, tva_amount, "
+                "status, items, notes, payment_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(inv["id"], inv["client"]["id"], inv["date"].isoformat(" "), inv["due_date"].isoformat(),
+                  inv["total_ttc"], inv["tva_amount"], inv["status"],
+                  json.dumps(inv["items"], ensure_ascii=False), None,
+                  inv["payment_date"].isoformat(" ") if inv["payment_date"] else None)
+                 for inv in batch]
+            )
+            counts["invoices"] += len(batch)
+
+        counts["purchases"] = 0
+        for batch in _batched(generate_purchases(scale), batch_size):
+            conn.executemany(
+                "INSERT INTO purchases (id, supplier, date, total_amount, tva_amount, category, "
+                "invoice_number, payment_status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(p["id"], p["supplier"], p["date"].isoformat(" "), p["total_amount"], p["tva_amount"],
+                  p["category"], p["invoice_number"], p["payment_status"]) for p in batch]
+            )
+            counts["purchases"] += len(batch)
+
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+
+# ================= DATA.JSON =================
+def write_json(path: str, scale: Scale) -> dict:
+    """Écrit un fichier au format data.json de app.py, élément par élément"""
+    clients = list(generate_clients(scale))
+    counts = {"clients": len(clients), "invoices": 0, "purchases": 0}
+
+    with open(path, "w") as f:
+        f.write('{\n  "invoices": [')
+        for i, inv in enumerate(generate_invoices(scale, clients)):
+            client = inv["client"]
+            f.write(("," if i else "") + "\n    " + json.dumps({
+                "id": f"INV-{inv['date'].strftime('%Y%m%d')}-{i:08x}",
+                "numero": inv["id"],
+                "client": client["name"],
+                "client_matricule": client["matricule_fiscal"],
+                "client_address": client["address"],
+                "date": inv["date"].strftime("%d/%m/%Y"),
+                "due_date": inv["due_date"].strftime("%d/%m/%Y"),
+                "payment_method": "Virement",
+                "items": inv["items"],
+                "total_ht": inv["total_ht"],
+                "tva_amount": inv["tva_amount"],
+                "total_ttc": inv["total_ttc"],
+                "status": "impayée" if inv["status"] in ("envoyée", "en retard") else inv["status"],
+                "notes": "",
+                "created_at": inv["date"].strftime("%d/%m/%Y %H:%M"),
+            }))
+            counts["invoices"] += 1
+
+        f.write('\n  ],\n  "purchases": [')
+        for i, pur in enumerate(generate_purchases(scale)):
+            f.write(("," if i else "") + "\n    " + json.dumps({
+                "id": pur["id"],
+                "fournisseur": pur["supplier"],
+                "num_facture": pur["invoice_number"],
+                "date": pur["date"].strftime("%d/%m/%Y"),
+                "categorie": pur["category"],
+                "montant_ht": pur["montant_ht"],
+                "tva_rate": pur["tva_rate"],
+                "tva_montant": pur["tva_amount"],
+                "montant_ttc": pur["total_amount"],
+                "description": "",
+                "status": pur["payment_status"],
+            }))
+            counts["purchases"] += 1
+
+        f.write('\n  ],\n  "clients": [')
+        for i, client in enumerate(clients):
+            f.write(("," if i else "") + "\n    " + json.dumps({
+                "id": client["id"],
+                "nom": client["name"],
+                "matricule_fiscal": client["matricule_fiscal"],
+                "activite": client["activity"],
+                "telephone": client["phone"],
+                "email": client["email"],
+                "ville": client["city"],
+                "adresse": client["address"],
+                "notes": "",
+                "date_creation": client["created_at"].strftime("%d/%m/%Y"),
+            }))
+
+        f.write('\n  ],\n  "profile": ' + json.dumps({
+            "name": "TunisieTrans SARL",
+            "matricule_fiscal": "1234567/A/M/000",
+            "address": "Zone Industrielle, Tunis, Tunisie",
+            "rib": "01 234 5678901234567 89",
+            "industry": "Transport et Logistique",
+            "phone": "+216 71 234 567",
+            "email": "contact@tunisietrans.tn",
+            "capital": 100000.0
+        }) + "\n}\n")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="base SQLite à (re)créer")
+    parser.add_argument("--json", help="fichier data.json à écrire")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--clients", type=int)
+    parser.add_argument("--invoices", type=int)
+    parser.add_argument("--years", type=int)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    overrides = {name: getattr(args, name) for name in ("clients", "invoices", "years", "seed")
+                 if getattr(args, name) is not None}
+    scale = replace(SCALES[args.scale], **overrides)
+
+    if not args.db and not args.json:
+        parser.error("--db et/ou --json requis")
+
+    if args.db:
+        started = time.perf_counter()
+        counts = fill_database(args.db, scale)
+        print(f"{args.db} : {counts} en {time.perf_counter() - started:.1f} s")
+    if args.json:
+        started = time.perf_counter()
+        counts = write_json(args.json, scale)
+        print(f"{args.json} : {counts} en {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
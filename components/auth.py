@@ -1,5 +1,6 @@
 import streamlit as st
 import hashlib
+from typing import Optional
 from data.database import db
 from data.models import User, UserRole
 
@@ -10,30 +11,32 @@ def hash_password(password: str) -> str:
 
 def init_default_users():
     """Initialise les utilisateurs par défaut"""
-    with db.get_connection() as conn:
-        cursor = conn.execute('SELECT COUNT(*) FROM users')
-        if cursor.fetchone()[0] == 0:
-            # Admin par défaut
-            conn.execute('''
-                INSERT INTO users VALUES (?, ?, ?, ?, ?)
-            ''', (
-                'admin',
-                hash_password('admin123'),
-                UserRole.ADMIN.value,
-                'Administrateur Principal',
-                'admin@tunisietrans.tn'
-            ))
-            # Staff par défaut
-            conn.execute('''
-                INSERT INTO users VALUES (?, ?, ?, ?, ?)
-            ''', (
-                'staff',
-                hash_password('staff123'),
-                UserRole.STAFF.value,
-                'Employé Standard',
-                'staff@tunisietrans.tn'
-            ))
-            conn.commit()
+    db.writer.submit(_insert_default_users).result()
+
+
+def _insert_default_users(conn):
+    cursor = conn.execute('SELECT COUNT(*) FROM users')
+    if cursor.fetchone()[0] == 0:
+        # Admin par défaut
+        conn.execute('''
+            INSERT INTO users VALUES (?, ?, ?, ?, ?)
+        ''', (
+            'admin',
+            hash_password('admin123'),
+            UserRole.ADMIN.value,
+            'Administrateur Principal',
+            'admin@tunisietrans.tn'
+        ))
+        # Staff par défaut
+        conn.execute('''
+            INSERT INTO users VALUES (?, ?, ?, ?, ?)
+        ''', (
+            'staff',
+            hash_password('staff123'),
+            UserRole.STAFF.value,
+            'Employé Standard',
+            'staff@tunisietrans.tn'
+        ))
 
 
 def authenticate_user(username: str, password: str) -> Optional[User]:
@@ -0,0 +1,21 @@
+import streamlit as st
+from datetime import date
+from typing import Optional, Sequence
+
+from data.database import db
+from utils import chart_series
+
+
+def render_series_chart(key: str, measures: Sequence[str] = ("ventes",), start: Optional[date] = None,
+                        end: Optional[date] = None, title: Optional[str] = None):
+    """Courbe sous-échantillonnée (utils/chart_series.py) avec une fenêtre de zoom relue à pas plus fin"""
+    # Fenêtre possible : la période demandée, limitée aux jours qui ont des données
+    first, last = chart_series.bounds(db, measures)
+    first, last = max(first, start or first), min(last, end or last)
+    if (last - first).days < 2:
+        st.info("Pas assez de données pour tracer une évolution")
+        return
+    window = st.slider("Fenêtre", min_value=first, max_value=last, value=(first, last),
+                       format="DD/MM/YYYY", key=key, label_visibility="collapsed")
+    fig = chart_series.figure(db, measures, *window, title=title)
+    st.plotly_chart(fig, use_container_width=True)
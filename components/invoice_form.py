@@ -1,20 +1,91 @@
 import streamlit as st
 from datetime import datetime, timedelta
-import pandas as pd
+from typing import Optional
+from data.database import db
+from data.models import Client
+from utils import client_lookup
+
+
+def render_credit_warning(client, amount: float) -> bool:
+    """Avertit si la facture porte l'encours du client au-delà de son plafond de crédit"""
+    if client is None:
+        return False
+    balance = db.get_client_balance(client.id)
+    if balance is None or not balance.exceeds_limit(amount):
+        return False
+    overdue = f", dont {balance.overdue:,.3f} DT en retard" if balance.overdue else ""
+    st.warning(
+        f"⚠️ Plafond de crédit dépassé pour {client.name} : encours {balance.outstanding:,.3f} DT"
+        f"{overdue} + facture {amount:,.3f} DT > plafond {balance.credit_limit:,.3f} DT"
+    )
+    return True
+
+
+def render_template_loader(key: str, client_key: Optional[str] = None):
+    """Charge les lignes d'un modèle récurrent dans la facture en cours (et le nom du client)"""
+    templates = db.get_recurring_templates(active_only=True)
+    if not templates:
+        return
+    names = db.get_client_names()
+    options = {f"{names.get(t.client_id, t.client_id)} — {t.label} ({t.total_amount:,.3f} DT)": t
+               for t in templates}
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        choice = st.selectbox("Modèle récurrent", list(options), index=None,
+                              placeholder="Reprendre les lignes d'un contrat", key=key)
+    with col2:
+        st.write("")  # Espace
+        st.write("")  # Espace
+        load = st.button("📋 Charger", key=f"{key}_load", disabled=choice is None)
+    if load and choice is not None:
+        template = options[choice]
+        st.session_state.invoice_items = [dict(item) for item in template.items]
+        # Appelé avant la création du champ client et du tableau d'articles : pas de rerun
+        if client_key:
+            st.session_state[client_key] = names.get(template.client_id, "")
+
+
+def render_client_lookup(key: str, name_key: str, matricule_key: Optional[str] = None,
+                         address_key: Optional[str] = None, phone_key: Optional[str] = None) -> Optional[Client]:
+    """Retrouve un client existant (nom ou matricule, fautes de frappe tolérées) et pré-remplit ses coordonnées"""
+    col1, col2 = st.columns([2, 3])
+    with col1:
+        query = st.text_input("🔎 Client existant", key=key, placeholder="Début du nom ou du matricule")
+    matches = client_lookup.search(query) if query.strip() else []
+    options = {f"{client.name} ({client.matricule_fiscal or client.id})": client for client, _ in matches}
+    with col2:
+        choice = st.selectbox("Suggestions", list(options), index=None, key=f"{key}_choice",
+                              placeholder="Aucun client trouvé" if query.strip() and not options
+                              else "Choisir un client", disabled=not options)
+    client = options.get(choice)
+    # Pré-remplit une fois par client choisi, avant la création des champs : les corrections restent
+    if client is not None and st.session_state.get(f"{key}_selected") != client.id:
+        st.session_state[f"{key}_selected"] = client.id
+        for field_key, value in ((name_key, client.name), (matricule_key, client.matricule_fiscal),
+                                 (address_key, client.address), (phone_key, client.phone)):
+            if field_key:
+                st.session_state[field_key] = value or ""
+    return client
 
 
 def render_invoice_form():
     """Rendu du formulaire de création de facture"""
 
+    # Contrat récurrent : reprend le client et les lignes (avant la création des champs)
+    render_template_loader("invoice_form_template", client_key="invoice_form_client_name")
+
     # Section client
     st.subheader("👥 Informations Client")
+    known_client = render_client_lookup("invoice_form_lookup", "invoice_form_client_name",
+                                        "invoice_form_client_matricule", "invoice_form_client_address",
+                                        "invoice_form_client_phone")
     col1, col2 = st.columns(2)
     with col1:
-        client_id = st.text_input("Matricule Fiscal Client*")
-        client_name = st.text_input("Nom du Client*")
+        client_id = st.text_input("Matricule Fiscal Client*", key="invoice_form_client_matricule")
+        client_name = st.text_input("Nom du Client*", key="invoice_form_client_name")
     with col2:
-        client_address = st.text_area("Adresse")
-        client_phone = st.text_input("Téléphone")
+        client_address = st.text_area("Adresse", key="invoice_form_client_address")
+        client_phone = st.text_input("Téléphone", key="invoice_form_client_phone")
 
     # Section dates
     st.subheader("📅 Dates")
@@ -22,9 +93,10 @@ def render_invoice_form():
     with col1:
         invoice_date = st.date_input("Date de facturation", datetime.now())
     with col2:
+        # Échéance du client retrouvé (change de défaut avec lui)
         due_date = st.date_input(
             "Date d'échéance",
-            datetime.now() + timedelta(days=30)
+            datetime.now() + timedelta(days=known_client.payment_terms if known_client else 30)
         )
 
     # Section articles
@@ -80,6 +152,8 @@ def render_invoice_form():
 
     # Afficher les articles ajoutés
     if st.session_state.invoice_items:
+        import pandas as pd
+
         df_items = pd.DataFrame(st.session_state.invoice_items)
         st.dataframe(df_items, use_container_width=True, hide_index=True)
 
@@ -96,6 +170,10 @@ def render_invoice_form():
         with col3:
             st.metric("Total TTC", f"{total_ttc:,.2f} DT")
 
+        # Plafond de crédit du client existant
+        if client_id or client_name:
+            render_credit_warning(known_client or db.find_client(client_name, client_id), total_ttc)
+
         # Notes
         st.subheader("📝 Notes")
         notes = st.text_area("Notes additionnelles")
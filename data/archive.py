@@ -0,0 +1,258 @@
+"""Archivage des exercices clos dans des bases annuelles en lecture seule.
+
+Les factures et achats d'un exercice clos quittent la base courante pour
+data/archives/<base>-<année>.db, avec leurs totaux mensuels précalculés
+(table period_totals) et leurs totaux annuels (table archived_years de la
+base courante). Database ne lit ces archives que lorsqu'une période
+demandée les recoupe.
+
+Usage:
+    python -m data.archive list
+    python -m data.archive close 2023
+    python -m data.archive reopen 2023
+"""
+import argparse
+import os
+import sqlite3
+import stat
+import time
+from datetime import date, datetime
+from typing import List, Optional
+
+from utils.fiscal_knowledge import FISCAL_DEADLINES
+
+from .change_log import summarized
+from .database import DEFAULT_DB_PATH, INVOICE_COLUMNS, PURCHASE_COLUMNS, Database
+
+ARCHIVE_DIR = "archives"  # relatif au répertoire de la base
+ARCHIVED_TABLES = [("invoices", INVOICE_COLUMNS), ("purchases", PURCHASE_COLUMNS)]
+OPEN_STATUSES = ("brouillon", "envoyée", "en retard")
+ARCHIVE_INDEXES = [
+    "CREATE INDEX archive.idx_invoices_date ON invoices (date)",
+    "CREATE INDEX archive.idx_invoices_client ON invoices (client_id)",
+    "CREATE INDEX archive.idx_invoices_status ON invoices (status)",
+    "CREATE INDEX archive.idx_purchases_date ON purchases (date)",
+]
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def last_closed_year(today: Optional[date] = None) -> int:
+    """Dernier exercice clos : l'exercice N l'est après la déclaration annuelle de N+1"""
+    today = today or date.today()
+    day, month = next((d, m) for name, d, m in FISCAL_DEADLINES if name == "Déclaration Annuelle")
+    return today.year - 1 if today >= date(today.year, month, day) else today.year - 2
+
+
+def _table_ddl(conn, table: str, columns: str) -> str:
+    """CREATE TABLE de l'archive, avec les colonnes et types de la table courante"""
+    types = {row[1]: row[2] for row in conn.execute(f"PRAGMA main.table_info({table})")}
+    definitions = [f"{name} {types[name]}" + (" PRIMARY KEY" if name == "id" else "")
+                   for name in (column.strip() for column in columns.split(","))]
+    return f"CREATE TABLE archive.{table} ({', '.join(definitions)})"
+
+
+def _versions(conn) -> tuple:
+    """Versions (data_versions) des tables archivées : croissent à chaque écriture"""
+    names = [table for table, _ in ARCHIVED_TABLES]
+    return tuple(conn.execute(f"SELECT version FROM data_versions WHERE name IN ({', '.join('?' * len(names))}) "
+                              f"ORDER BY name", names).fetchall())
+
+
+def archive_year(year: int, db_path: str = DEFAULT_DB_PATH, today: Optional[date] = None,
+                 force: bool = False) -> dict:
+    """Déplace l'exercice `year` dans sa base d'archive.
+
+    1. copie des lignes et calcul des totaux dans un fichier temporaire, renommé
+       puis passé en lecture seule une fois vérifié ;
+    2. dans une seule transaction de la base courante : contrôle que les
+       factures et achats n'ont pas changé entre-temps (data_versions relevées
+       avec la copie), enregistrement dans archived_years et suppression des
+       lignes copiées.
+    Les factures non soldées ne sont jamais archivées : encours, balance âgée
+    et prévision de trésorerie ne lisent que la base courante. `force` ne
+    permet que d'archiver un exercice pas encore clos.
+    Une interruption entre les deux étapes laisse la base courante intacte ;
+    relancer la commande reconstruit l'archive.
+    """
+    if year > last_closed_year(today) and not force:
+        raise ArchiveError(f"l'exercice {year} n'est pas clos (dernier exercice clos : {last_closed_year(today)})")
+
+    db = Database(db_path)
+    start, end = date(year, 1, 1).isoformat(), date(year + 1, 1, 1).isoformat()
+    relative_path = os.path.join(ARCHIVE_DIR, f"{os.path.splitext(os.path.basename(db_path))[0]}-{year}.db")
+    path = db.archive_path(relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    started = time.perf_counter()
+
+    conn = db.get_connection()
+    try:
+        if conn.execute("SELECT 1 FROM archived_years WHERE year = ?", (year,)).fetchone():
+            raise ArchiveError(f"l'exercice {year} est déjà archivé")
+        open_invoices = conn.execute(f"""
+            SELECT COUNT(*) FROM invoices WHERE date >= ? AND date < ?
+            AND status IN ({", ".join("?" * len(OPEN_STATUSES))})
+        """, (start, end, *OPEN_STATUSES)).fetchone()[0]
+        if open_invoices:
+            raise ArchiveError(f"{open_invoices} facture(s) de {year} ne sont pas soldées")
+
+        # 1. Fichier d'archive
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn.execute("ATTACH DATABASE ? AS archive", (tmp_path,))
+        counts = {}
+        for table, columns in ARCHIVED_TABLES:
+            conn.execute(_table_ddl(conn, table, columns))
+            conn.execute(f"""
+                INSERT INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table} WHERE date >= ? AND date < ?
+            """, (start, end))
+            counts[table] = conn.execute(f"SELECT COUNT(*) FROM archive.{table}").fetchone()[0]
+        for ddl in ARCHIVE_INDEXES:
+            conn.execute(ddl)
+        # Même instantané que la copie : toute écriture ultérieure sur ces tables change la version
+        copied = _versions(conn)
+
+        conn.execute("""
+            CREATE TABLE archive.period_totals (
+                period TEXT PRIMARY KEY,  -- AAAA-MM
+                invoice_count INTEGER NOT NULL,
+                revenue REAL NOT NULL,
+                tva_collected REAL NOT NULL,
+                unpaid INTEGER NOT NULL,
+                purchase_count INTEGER NOT NULL,
+                expenses REAL NOT NULL,
+                tva_deductible REAL NOT NULL
+            )
+        """)
+        conn.execute(f"""
+            INSERT INTO archive.period_totals
+            SELECT period, SUM(invoice_count), SUM(revenue), SUM(tva_collected), SUM(unpaid),
+                   SUM(purchase_count), SUM(expenses), SUM(tva_deductible)
+            FROM (
+                SELECT substr(date, 1, 7) AS period, COUNT(*) AS invoice_count,
+                       SUM(total_amount) AS revenue, SUM(tva_amount) AS tva_collected,
+                       SUM(status IN ({", ".join("?" * len(OPEN_STATUSES[1:]))})) AS unpaid,
+                       0 AS purchase_count, 0 AS expenses, 0 AS tva_deductible
+                FROM archive.invoices GROUP BY period
+                UNION ALL
+                SELECT substr(date, 1, 7), 0, 0, 0, 0, COUNT(*), SUM(total_amount), SUM(tva_amount)
+                FROM archive.purchases GROUP BY 1
+            )
+            GROUP BY period
+        """, OPEN_STATUSES[1:])
+        totals = conn.execute("""
+            SELECT COALESCE(SUM(invoice_count), 0), COALESCE(SUM(revenue), 0), COALESCE(SUM(tva_collected), 0),
+                   COALESCE(SUM(unpaid), 0), COALESCE(SUM(purchase_count), 0), COALESCE(SUM(expenses), 0),
+                   COALESCE(SUM(tva_deductible), 0)
+            FROM archive.period_totals
+        """).fetchone()
+        conn.commit()
+        conn.execute("DETACH DATABASE archive")
+
+        check = sqlite3.connect(tmp_path)
+        try:
+            if check.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise ArchiveError(f"{tmp_path} : quick_check a échoué")
+            check.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            check.close()
+        if os.path.exists(path):
+            os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+        os.replace(tmp_path, path)
+        os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        # 2. Bascule dans la base courante
+        conn.execute("BEGIN IMMEDIATE")
+        if _versions(conn) != copied:
+            conn.rollback()
+            raise ArchiveError(f"factures ou achats modifiés pendant l'archivage de {year}, relancer la commande")
+        conn.execute("""
+            INSERT INTO archived_years (year, path, archived_at, invoice_count, revenue, tva_collected,
+                unpaid, purchase_count, expenses, tva_deductible)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (year, relative_path, datetime.now().isoformat(" ", "seconds"), *totals))
+        with summarized(conn, "archived_years", "ARCHIVE", year, "archivage") as summary:
+            summary["path"] = relative_path
+            for table, _ in ARCHIVED_TABLES:
+                summary[table] = conn.execute(f"DELETE FROM {table} WHERE date >= ? AND date < ?",
+                                              (start, end)).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {"year": year, "path": path, **counts, "revenue": totals[1],
+            "duration": round(time.perf_counter() - started, 3)}
+
+
+def reopen_year(year: int, db_path: str = DEFAULT_DB_PATH) -> dict:
+    """Réintègre un exercice archivé dans la base courante (correction d'un exercice clos)"""
+    db = Database(db_path)
+    conn = db.get_connection()
+    try:
+        row = conn.execute("SELECT path FROM archived_years WHERE year = ?", (year,)).fetchone()
+        if row is None:
+            raise ArchiveError(f"l'exercice {year} n'est pas archivé")
+        path = db.archive_path(row[0])
+        schema = db._attach_archive(conn, year, row[0])
+        conn.execute("BEGIN IMMEDIATE")
+        with summarized(conn, "archived_years", "REOPEN", year, "archivage") as counts:
+            for table, columns in ARCHIVED_TABLES:
+                counts[table] = conn.execute(f"""
+                    INSERT INTO main.{table} ({columns}) SELECT {columns} FROM {schema}.{table}
+                """).rowcount
+            conn.execute("DELETE FROM archived_years WHERE year = ?", (year,))
+        conn.commit()
+        conn.execute(f"DETACH DATABASE {schema}")
+    finally:
+        conn.close()
+    os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+    os.remove(path)
+    return {"year": year, **counts}
+
+
+def list_archives(db_path: str = DEFAULT_DB_PATH) -> List[dict]:
+    db = Database(db_path)
+    with db.get_connection() as conn:
+        rows = conn.execute("""
+            SELECT year, path, archived_at, invoice_count, revenue, purchase_count, expenses
+            FROM archived_years ORDER BY year
+        """).fetchall()
+    return [{"year": r[0], "path": db.archive_path(r[1]), "archived_at": r[2], "invoices": r[3],
+             "revenue": r[4], "purchases": r[5], "expenses": r[6]} for r in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="exercices archivés")
+    close = commands.add_parser("close", help="archiver un exercice clos")
+    close.add_argument("year", type=int)
+    close.add_argument("--force", action="store_true", help="archiver un exercice non clos (jamais ses factures non soldées)")
+    reopen = commands.add_parser("reopen", help="réintégrer un exercice archivé")
+    reopen.add_argument("year", type=int)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            print(f"Dernier exercice clos : {last_closed_year()}")
+            for archive in list_archives(args.db):
+                print(f"{archive['year']}  {archive['invoices']:>8} factures  {archive['revenue']:>16,.3f} DT  "
+                      f"{archive['purchases']:>6} achats  {archive['path']}")
+        elif args.command == "close":
+            result = archive_year(args.year, args.db, force=args.force)
+            print(f"Exercice {result['year']} archivé : {result['invoices']} factures, "
+                  f"{result['purchases']} achats en {result['duration']:.1f} s -> {result['path']}")
+        elif args.command == "reopen":
+            result = reopen_year(args.year, args.db)
+            print(f"Exercice {result['year']} réintégré : {result['invoices']} factures, {result['purchases']} achats")
+    except ArchiveError as e:
+        parser.exit(1, f"Erreur : {e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""Sauvegardes à chaud de la base SQLite.
+
+La copie passe par l'API de sauvegarde en ligne de SQLite, par paquets de
+pages : les écritures de l'application continuent entre deux paquets. Chaque
+instantané est compressé (gzip), horodaté et accompagné d'un manifeste JSON
+contenant son empreinte SHA-256.
+
+Usage:
+    python -m data.backup create
+    python -m data.backup list
+    python -m data.backup verify data/backups/tunisietrans-20260101-120000.db.gz
+    python -m data.backup restore data/backups/tunisietrans-20260101-120000.db.gz
+    python -m data.backup prune --keep-last 7 --keep-daily 14
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from .database import DEFAULT_DB_PATH
+
+BACKUP_DIR = "data/backups"
+PAGES_PER_STEP = 1024
+STEP_SLEEP = 0.005
+# Au-delà, la copie par paquets est relancée en une seule étape (lecture WAL non bloquante)
+MAX_RESTARTS = 3
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+
+@dataclass
+class Snapshot:
+    path: str
+    created_at: str
+    source: str
+    size: int
+    compressed_size: int
+    sha256: str
+    pages: int
+    page_size: int
+    duration: float
+    restarts: int = 0
+
+    @property
+    def manifest_path(self) -> str:
+        return manifest_path(self.path)
+
+    @property
+    def created(self) -> datetime:
+        return datetime.fromisoformat(self.created_at)
+
+
+class BackupError(Exception):
+    pass
+
+
+def manifest_path(snapshot_path: str) -> str:
+    return snapshot_path[:-len(".gz")] + ".json" if snapshot_path.endswith(".gz") else snapshot_path + ".json"
+
+
+# ================= CRÉATION =================
+def _online_copy(db_path: str, target_path: str, pages: int, sleep: float) -> tuple:
+    """Copie la base via l'API de sauvegarde ; retourne (pages, taille de page, relances)"""
+    source = sqlite3.connect(db_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    restarts = 0
+    remaining = [None]
+
+    def progress(status, left, total):
+        nonlocal restarts
+        # Une écriture concurrente relance la copie : les pages restantes remontent
+        if remaining[0] is not None and left > remaining[0]:
+            restarts += 1
+            if restarts > MAX_RESTARTS:
+                raise BackupError("trop de relances")
+        remaining[0] = left
+
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except BackupError:
+            # Base très sollicitée : une seule étape (en mode WAL, les écritures continuent)
+            source.backup(target, pages=-1)
+        page_count = target.execute("PRAGMA page_count").fetchone()[0]
+        page_size = target.execute("PRAGMA page_size").fetchone()[0]
+        # L'instantané est autonome : pas de fichier -wal à côté
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+    return page_count, page_size, restarts
+
+
+def create_snapshot(db_path: str = DEFAULT_DB_PATH, backup_dir: str = BACKUP_DIR,
+                    pages: int = PAGES_PER_STEP, sleep: float = STEP_SLEEP,
+                    check: bool = True) -> Snapshot:
+    """Instantané compressé et vérifié de la base, sans bloquer les écritures"""
+    if not os.path.exists(db_path):
+        raise BackupError(f"base introuvable : {db_path}")
+    os.makedirs(backup_dir, exist_ok=True)
+    started = time.perf_counter()
+    now = datetime.now().replace(microsecond=0)
+    stem = f"{os.path.splitext(os.path.basename(db_path))[0]}-{now.strftime(TIMESTAMP_FORMAT)}"
+    path = os.path.join(backup_dir, stem + ".db.gz")
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(backup_dir, f"{stem}-{suffix}.db.gz")
+        suffix += 1
+
+    fd, raw_path = tempfile.mkstemp(suffix=".db", dir=backup_dir)
+    os.close(fd)
+    try:
+        page_count, page_size, restarts = _online_copy(db_path, raw_path, pages, sleep)
+        if check:
+            _check_integrity(raw_path, quick=True)
+
+        digest = hashlib.sha256()
+        with open(raw_path, "rb") as src, gzip.open(path + ".tmp", "wb", compresslevel=6) as dst:
+            for chunk in iter(lambda: src.read(1 << 20), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        size = os.path.getsize(raw_path)
+    finally:
+        os.remove(raw_path)
+    os.replace(path + ".tmp", path)
+
+    snapshot = Snapshot(
+        path=path, created_at=now.isoformat(), source=os.path.abspath(db_path),
+        size=size, compressed_size=os.path.getsize(path), sha256=digest.hexdigest(),
+        pages=page_count, page_size=page_size,
+        duration=round(time.perf_counter() - started, 3), restarts=restarts
+    )
+    with open(snapshot.manifest_path + ".tmp", "w") as f:
+        json.dump({k: v for k, v in asdict(snapshot).items() if k != "path"}, f, indent=2)
+    os.replace(snapshot.manifest_path + ".tmp", snapshot.manifest_path)
+    return snapshot
+
+
+# ================= LISTE ET RÉTENTION =================
+def load_snapshot(path: str) -> Snapshot:
+    with open(manifest_path(path)) as f:
+        return Snapshot(path=path, **json.load(f))
+
+
+def list_snapshots(backup_dir: str = BACKUP_DIR) -> List[Snapshot]:
+    """Instantanés du répertoire, du plus récent au plus ancien"""
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = []
+    for name in os.listdir(backup_dir):
+        path = os.path.join(backup_dir, name)
+        if name.endswith(".db.gz") and os.path.exists(manifest_path(path)):
+            snapshots.append(load_snapshot(path))
+    return sorted(snapshots, key=lambda s: (s.created_at, s.path), reverse=True)
+
+
+def select_retained(snapshots: List[Snapshot], keep_last: int = 7, keep_daily: int = 14,
+                    keep_weekly: int = 8, keep_monthly: int = 12) -> List[Snapshot]:
+    """Rotation grand-père/père/fils : les N derniers, puis le plus récent par jour, semaine et mois"""
+    snapshots = sorted(snapshots, key=lambda s: (s.created_at, s.path), reverse=True)
+    kept = {s.path for s in snapshots[:keep_last]}
+    periods = [
+        (keep_daily, lambda d: d.strftime("%Y-%m-%d")),
+        (keep_weekly, lambda d: "%d-W%02d" % d.isocalendar()[:2]),
+        (keep_monthly, lambda d: d.strftime("%Y-%m")),
+    ]
+    for limit, period_of in periods:
+        seen = set()
+        for snapshot in snapshots:
+            if len(seen) >= limit:
+                break
+            period = period_of(snapshot.created)
+            if period not in seen:
+                seen.add(period)
+                kept.add(snapshot.path)
+    return [s for s in snapshots if s.path in kept]
+
+
+def apply_retention(backup_dir: str = BACKUP_DIR, **rules) -> List[Snapshot]:
+    """Supprime les instantanés hors rétention ; retourne ceux supprimés"""
+    snapshots = list_snapshots(backup_dir)
+    kept = {s.path for s in select_retained(snapshots, **rules)}
+    removed = [s for s in snapshots if s.path not in kept]
+    for snapshot in removed:
+        os.remove(snapshot.path)
+        os.remove(snapshot.manifest_path)
+    return removed
+
+
+# ================= VÉRIFICATION ET RESTAURATION =================
+def _check_integrity(db_path: str, quick: bool = False):
+    conn = sqlite3.connect(db_path)
+    try:
+        pragma = "quick_check" if quick else "integrity_check"
+        result = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise BackupError(f"{db_path} : {pragma} a échoué ({result})")
+
+
+def _decompress(snapshot: Snapshot, target_path: str):
+    """Décompresse l'instantané et contrôle son empreinte SHA-256"""
+    digest = hashlib.sha256()
+    with gzip.open(snapshot.path, "rb") as src, open(target_path, "wb") as dst:
+        for chunk in iter(lambda: src.read(1 << 20), b""):
+            digest.update(chunk)
+            dst.write(chunk)
+    if digest.hexdigest() != snapshot.sha256:
+        raise BackupError(f"{snapshot.path} : empreinte SHA-256 différente du manifeste")
+
+
+def verify_snapshot(path: str, full: bool = False) -> Snapshot:
+    """Contrôle l'empreinte puis l'intégrité SQLite (quick_check, ou integrity_check si full)"""
+    snapshot = load_snapshot(path)
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path = os.path.join(tmp, "verify.db")
+        _decompress(snapshot, raw_path)
+        _check_integrity(raw_path, quick=not full)
+    return snapshot
+
+
+def restore_snapshot(path: str, db_path: str = DEFAULT_DB_PATH, keep_current: bool = True) -> Optional[str]:
+    """Restaure un instantané dans la base, y compris pendant que l'application tourne.
+
+    La restauration passe aussi par l'API de sauvegarde (en une étape) : les
+    connexions ouvertes voient le nouveau contenu de façon atomique. La base
+    actuelle est d'abord sauvegardée si keep_current ; son chemin est retourné.
+    """
+    snapshot = load_snapshot(path)
+    previous = None
+    if keep_current and os.path.exists(db_path):
+        previous = create_snapshot(db_path, os.path.dirname(os.path.abspath(path)), check=False).path
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(db_path)) or ".") as tmp:
+        raw_path = os.path.join(tmp, "restore.db")
+        _decompress(snapshot, raw_path)
+        _check_integrity(raw_path, quick=True)
+        source = sqlite3.connect(raw_path)
+        target = sqlite3.connect(db_path, timeout=30)
+        try:
+            source.backup(target, pages=-1)
+        finally:
+            target.close()
+            source.close()
+    return previous
+
+
+# ================= LIGNE DE COMMANDE =================
+def _human(size: float) -> str:
+    for unit in ("o", "Ko", "Mo", "Go"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} To"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--dir", default=BACKUP_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="créer un instantané")
+    create.add_argument("--pages", type=int, default=PAGES_PER_STEP, help="pages copiées par étape")
+    create.add_argument("--no-check", action="store_true", help="sans quick_check de la copie")
+    create.add_argument("--prune", action="store_true", help="appliquer la rétention ensuite")
+    commands.add_parser("list", help="lister les instantanés")
+    verify = commands.add_parser("verify", help="vérifier un instantané")
+    verify.add_argument("snapshot")
+    verify.add_argument("--full", action="store_true", help="integrity_check complet")
+    restore = commands.add_parser("restore", help="restaurer un instantané")
+    restore.add_argument("snapshot")
+    restore.add_argument("--no-keep", action="store_true", help="ne pas sauvegarder la base actuelle")
+    prune = commands.add_parser("prune", help="appliquer la rétention")
+    for rule, default in (("last", 7), ("daily", 14), ("weekly", 8), ("monthly", 12)):
+        prune.add_argument(f"--keep-{rule}", type=int, default=default)
+    args = parser.parse_args()
+
+    try:
+        run_command(args)
+    except BackupError as e:
+        parser.exit(1, f"Erreur : {e}\n")
+
+
+def run_command(args):
+    if args.command == "create":
+        snapshot = create_snapshot(args.db, args.dir, pages=args.pages, check=not args.no_check)
+        print(f"{snapshot.path} : {_human(snapshot.size)} -> {_human(snapshot.compressed_size)} "
+              f"en {snapshot.duration:.2f} s ({snapshot.restarts} relance(s))")
+        if args.prune:
+            for removed in apply_retention(args.dir):
+                print(f"supprimé : {removed.path}")
+    elif args.command == "list":
+        for snapshot in list_snapshots(args.dir):
+            print(f"{snapshot.created_at}  {_human(snapshot.compressed_size):>10}  {snapshot.path}")
+    elif args.command == "verify":
+        started = time.perf_counter()
+        snapshot = verify_snapshot(args.snapshot, full=args.full)
+        print(f"{snapshot.path} : OK ({time.perf_counter() - started:.2f} s)")
+    elif args.command == "restore":
+        started = time.perf_counter()
+        previous = restore_snapshot(args.snapshot, args.db, keep_current=not args.no_keep)
+        print(f"{args.db} restaurée depuis {args.snapshot} en {time.perf_counter() - started:.2f} s")
+        if previous:
+            print(f"ancienne base sauvegardée : {previous}")
+    elif args.command == "prune":
+        removed = apply_retention(args.dir, keep_last=args.keep_last, keep_daily=args.keep_daily,
+                                  keep_weekly=args.keep_weekly, keep_monthly=args.keep_monthly)
+        print(f"{len(removed)} instantané(s) supprimé(s)")
+
+
+if __name__ == "__main__":
+    main()
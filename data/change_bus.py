@@ -0,0 +1,161 @@
+"""Invalidation des caches entre processus : chaque serveur surveille les écritures de tous les autres.
+
+Plusieurs processus Streamlit partagent le même fichier SQLite. Chaque
+processus garde une connexion de lecture et interroge `PRAGMA data_version`
+(quelques microsecondes, sans lecture de table) : la valeur change dès
+qu'une autre connexion, de ce processus ou d'un autre, a validé une
+écriture. Seulement alors la table data_versions (un compteur par table,
+tenu par triggers) est relue et comparée au dernier relevé : les tables
+modifiées sont signalées aux abonnés et les entrées de cache qui en
+dépendent ne sont plus servies, les autres restent valides.
+
+La surveillance est paresseuse : TableCache.get relève les changements
+avant de servir une entrée, si bien qu'une lecture qui suit une écriture
+validée par un autre processus n'est jamais servie périmée. Un fil de fond
+(ChangeBus.start) peut en plus notifier les abonnés sans attendre une
+lecture.
+"""
+import functools
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from utils import instrumentation
+
+POLL_INTERVAL = 0.5  # secondes, fil de fond seulement
+CACHE_SIZE = 256  # entrées par cache
+
+
+class ChangeBus:
+    """Relevé des versions de tables d'une base, partagé par les caches du processus"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._data_version: Optional[int] = None
+        self._versions: Dict[str, int] = {}
+        self._subscribers: List[Tuple[Set[str], Callable[[Set[str]], None]]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def poll(self) -> Set[str]:
+        """Tables modifiées depuis le relevé précédent (vide si rien n'a été validé entre-temps)"""
+        with self._lock:
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return set()
+            self._data_version = data_version
+            versions = dict(self._conn.execute('SELECT name, version FROM data_versions'))
+            changed = {name for name, version in versions.items() if self._versions.get(name) != version}
+            first = not self._versions
+            self._versions = versions
+            subscribers = list(self._subscribers)
+        if changed and not first:
+            for tables, callback in subscribers:
+                if tables & changed:
+                    callback(changed)
+        return set() if first else changed
+
+    def versions(self, tables: Tuple[str, ...]) -> Tuple[int, ...]:
+        """Versions des tables au dernier relevé"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+    def version(self, *tables: str) -> int:
+        """Somme des versions des tables, après relevé des derniers changements"""
+        self.poll()
+        with self._lock:
+            return sum(self._versions.get(table, 0) for table in tables or self._versions)
+
+    def subscribe(self, tables: Iterable[str], callback: Callable[[Set[str]], None]):
+        """callback(tables modifiées) est appelé quand l'une des `tables` change"""
+        with self._lock:
+            self._subscribers.append((set(tables), callback))
+
+    def start(self, interval: float = POLL_INTERVAL):
+        """Relève les changements en continu dans un fil de fond (notifications sans lecture)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, args=(interval,), name="change-bus", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.poll()
+            except sqlite3.Error:
+                continue
+
+
+class TableCache:
+    """Cache de lectures dont chaque entrée dépend de tables nommées.
+
+    Chaque entrée garde les versions de ses tables relevées avant le calcul :
+    une écriture sur `invoices` ne fait manquer que les entrées qui dépendent
+    de `invoices`. Les valeurs servies sont partagées et ne doivent pas être
+    modifiées par l'appelant.
+    """
+
+    def __init__(self, bus: ChangeBus, name: str, size: int = CACHE_SIZE):
+        self.bus = bus
+        self.name = name
+        self.size = size
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple[int, ...], object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, tables: Tuple[str, ...], compute: Callable[[], object]):
+        self.bus.poll()
+        versions = self.bus.versions(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry[0] == versions
+            if hit:
+                self._entries.move_to_end(key)
+            elif entry is not None:
+                del self._entries[key]
+        instrumentation.record_cache(self.name, hit)
+        if hit:
+            return entry[1]
+
+        # Versions relevées avant la lecture : une écriture concurrente fera manquer l'entrée
+        value = compute()
+        with self._lock:
+            self._entries[key] = (versions, value)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_buses: Dict[str, ChangeBus] = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(db_path: str) -> ChangeBus:
+    """Un seul relevé par fichier de base dans le processus"""
+    db_path = os.path.abspath(db_path)
+    with _buses_lock:
+        if db_path not in _buses:
+            _buses[db_path] = ChangeBus(db_path)
+        return _buses[db_path]
+
+
+def cached(*tables: str):
+    """Méthode de lecture de Database servie par son cache tant que `tables` ne changent pas"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            return self.cache.get((method.__name__, *args), tables, lambda: method(self, *args))
+        return wrapper
+    return decorator
@@ -0,0 +1,233 @@
+"""Journal des modifications : historique inaltérable des clients, factures, achats et du profil.
+
+Chaque écriture sur une table suivie ajoute une ligne à change_log par
+trigger SQLite, dans la transaction de l'écriture elle-même : opération,
+table, clé, valeurs avant/après (pour une modification, seulement les
+colonnes changées) et horodatage. Aucun chemin d'écriture (fil d'écriture,
+migration, archivage, outil externe) ne peut y échapper. Seules les
+écritures en masse de l'archivage (summarized) remplacent leurs lignes par
+une seule ligne de résumé (ARCHIVE, REOPEN), sans quoi le journal garderait
+une copie complète de chaque exercice archivé.
+
+Le scellement chaîne des blocs : avant chaque COMMIT, le fil d'écriture
+ajoute à change_seals une ligne par suite de demandes d'un même utilisateur
+(set_actor), qui couvre les lignes du journal qu'elles ont écrites, avec
+hash = SHA-256(hash du bloc précédent + lignes du bloc). Un sceau par bloc
+plutôt qu'un hash par ligne : le journal n'est jamais réécrit et le coût
+du scellement est partagé par les demandes du lot. Les lignes écrites hors
+du fil (migration, archivage) sont scellées par leur propre transaction,
+ou au lot suivant du fil, sans utilisateur. Les
+deux tables refusent suppressions et modifications (triggers) ; une
+réécriture de l'historique casse la chaîne, que `verify` détecte à partir
+de la tête publiée.
+
+Les consommateurs incrémentaux (agrégats, recherche, caches) lisent le
+journal avec un curseur nommé (ChangeFeed) qui reprend où ils s'étaient
+arrêtés.
+
+Usage:
+    python -m data.change_log verify
+    python -m data.change_log tail --table invoices --limit 20
+"""
+import argparse
+import hashlib
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+
+from .models import ChangeRecord
+from .writer import BatchHook
+
+GENESIS = "0" * 64  # hash précédant la première ligne
+FEED_BATCH = 500  # lignes lues par appel de ChangeFeed
+
+CHANGE_FIELDS = "seq, CAST(changed_at AS TEXT), table_name, operation, row_key, before, after"
+
+_actor: ContextVar[Optional[str]] = ContextVar("change_actor", default=None)
+
+
+def set_actor(actor: Optional[str]):
+    """Utilisateur à qui sont attribuées les écritures soumises ensuite depuis ce contexte"""
+    return _actor.set(actor)
+
+
+@contextmanager
+def acting_as(actor: Optional[str]):
+    token = _actor.set(actor)
+    try:
+        yield
+    finally:
+        _actor.reset(token)
+
+
+def block_hash(previous: str, rows: List[tuple], actor: Optional[str]) -> str:
+    """Maillon de la chaîne : rows sont les (seq, changed_at, table, opération, clé, avant, après) du bloc"""
+    payload = json.dumps([previous, actor, rows], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def seal(conn, actor: Optional[str] = None, until: Optional[int] = None) -> int:
+    """Scelle les lignes en attente jusqu'à `until` (dans la transaction en cours) ; retourne leur nombre"""
+    head = conn.execute("SELECT last_seq, hash FROM change_seals ORDER BY last_seq DESC LIMIT 1").fetchone()
+    last_seq, previous = head if head else (0, GENESIS)
+    query, params = f"SELECT {CHANGE_FIELDS} FROM change_log WHERE seq > ?", [last_seq]
+    if until is not None:
+        query += " AND seq <= ?"
+        params.append(until)
+    rows = conn.execute(query + " ORDER BY seq", params).fetchall()
+    if not rows:
+        return 0
+    conn.execute("INSERT INTO change_seals (last_seq, first_seq, actor, sealed_at, hash) VALUES (?, ?, ?, ?, ?)",
+                 (rows[-1][0], rows[0][0], actor, datetime.now().replace(microsecond=0),
+                  block_hash(previous, rows, actor)))
+    return len(rows)
+
+
+@contextmanager
+def summarized(conn, table: str, operation: str, key, actor: Optional[str] = None):
+    """Écriture en masse journalisée par une seule ligne, scellée (dans la transaction en cours).
+
+    Les triggers du journal se taisent dans le bloc ; le dictionnaire produit
+    (nombre de lignes par table...) devient la colonne after du résumé.
+    """
+    summary = {}
+    conn.execute("INSERT INTO change_log_pause (reason) VALUES (?)", (f"{operation} {table}/{key}",))
+    yield summary
+    conn.execute("DELETE FROM change_log_pause")
+    conn.execute("INSERT INTO change_log (changed_at, table_name, operation, row_key, before, after) "
+                 "VALUES (?, ?, ?, ?, NULL, ?)",
+                 (datetime.now().isoformat(" ", "milliseconds"), table, operation, str(key),
+                  json.dumps(summary, ensure_ascii=False)))
+    seal(conn, actor)
+
+
+class Sealer(BatchHook):
+    """Crochet du fil d'écriture : un sceau par suite de demandes d'un même utilisateur dans le lot"""
+
+    def __init__(self):
+        self._runs = []  # [utilisateur, dernière ligne du journal (None : la suite est en cours)]
+
+    def begin(self, conn, external: bool):
+        self._runs = []
+        if external:
+            # Lignes écrites par une autre connexion depuis le lot précédent : sans utilisateur
+            seal(conn)
+
+    def before_request(self, conn):
+        actor = _actor.get()
+        if self._runs and self._runs[-1][0] == actor:
+            return
+        if self._runs:
+            self._runs[-1][1] = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        self._runs.append([actor, None])
+
+    def before_commit(self, conn):
+        for actor, until in self._runs:
+            seal(conn, actor, until)
+        self._runs = []
+
+
+def verify(conn) -> dict:
+    """Recalcule la chaîne depuis l'origine ; broken_at est le premier bloc (dernière ligne) qui diffère"""
+    previous, expected_first, blocks, rows, broken_at = GENESIS, 1, 0, 0, None
+    seals = conn.execute("SELECT last_seq, first_seq, actor, hash FROM change_seals ORDER BY last_seq").fetchall()
+    for last_seq, first_seq, actor, stored in seals:
+        block = conn.execute(f"SELECT {CHANGE_FIELDS} FROM change_log WHERE seq BETWEEN ? AND ? ORDER BY seq",
+                             (first_seq, last_seq)).fetchall()
+        previous = block_hash(previous, block, actor)
+        # Bloc recalculé, contigu au précédent et complet (aucune ligne retirée)
+        if broken_at is None and (previous != stored or first_seq != expected_first
+                                  or len(block) != last_seq - first_seq + 1):
+            broken_at = last_seq
+        expected_first = last_seq + 1
+        blocks += 1
+        rows += len(block)
+    unsealed = conn.execute("SELECT COUNT(*) FROM change_log WHERE seq >= ?", (expected_first,)).fetchone()[0]
+    return {"blocks": blocks, "rows": rows, "unsealed": unsealed, "broken_at": broken_at,
+            "head_seq": expected_first - 1, "head_hash": previous}
+
+
+def advance_cursor(conn, name: str, seq: int):
+    """Enregistre la position du consommateur `name`, dans la transaction de son traitement"""
+    conn.execute("""
+        INSERT INTO change_cursors (name, seq, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET seq = excluded.seq, updated_at = excluded.updated_at
+    """, (name, seq, datetime.now().replace(microsecond=0)))
+
+
+class ChangeFeed:
+    """Lecture incrémentale du journal pour un consommateur nommé, curseur conservé en base.
+
+    Le curseur n'avance qu'après le traitement d'un lot : un consommateur
+    interrompu reprend au premier changement non traité (livraison au moins
+    une fois, le traitement doit être idempotent).
+    """
+
+    def __init__(self, database, name: str, tables: Optional[Iterable[str]] = None, batch: int = FEED_BATCH):
+        self.database = database
+        self.name = name
+        self.tables = tuple(tables) if tables else None
+        self.batch = batch
+
+    @property
+    def position(self) -> int:
+        return self.database.get_change_cursor(self.name) or 0
+
+    def pending(self) -> List[ChangeRecord]:
+        """Prochain lot de changements après le curseur (vide si le consommateur est à jour)"""
+        return self.database.get_changes(self.position, self.tables, self.batch)
+
+    def acknowledge(self, seq: int):
+        self.database.save_change_cursor(self.name, seq)
+
+    def consume(self, handler: Callable[[List[ChangeRecord]], None]) -> int:
+        """Passe les lots à handler jusqu'à rattraper le journal ; retourne le nombre de changements"""
+        after, total = self.position, 0
+        while True:
+            changes = self.database.get_changes(after, self.tables, self.batch)
+            if not changes:
+                return total
+            handler(changes)
+            after = changes[-1].seq
+            self.acknowledge(after)
+            total += len(changes)
+
+
+def main():
+    from .database import DEFAULT_DB_PATH, Database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("verify", help="recalculer la chaîne de hachage")
+    tail = commands.add_parser("tail", help="derniers changements")
+    tail.add_argument("--table")
+    tail.add_argument("--key", help="historique d'une ligne (avec --table)")
+    tail.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    if args.command == "verify":
+        with database.get_connection() as conn:
+            result = verify(conn)
+        print(json.dumps(result, ensure_ascii=False))
+        if result["broken_at"] is not None:
+            parser.exit(1, f"Erreur : chaîne rompue au bloc finissant à la ligne {result['broken_at']}\n")
+        return
+
+    if args.key and not args.table:
+        parser.exit(1, "Erreur : --key demande --table\n")
+    if args.key:
+        changes = database.get_row_history(args.table, args.key)[-args.limit:]
+    else:
+        changes = database.get_recent_changes(args.limit, args.table)
+    for change in changes:
+        print(f"{change.seq:>8}  {change.changed_at:%Y-%m-%d %H:%M:%S}  {change.actor or '-':<12} "
+              f"{change.operation:<6} {change.table_name}/{change.row_key}  "
+              f"{json.dumps(change.after if change.operation != 'DELETE' else change.before, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
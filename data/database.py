@@ -1,21 +1,243 @@
+import os
 import sqlite3
 import json
-from datetime import datetime
-from typing import List, Optional
-import pandas as pd
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.request import pathname2url
+from .change_bus import TableCache, cached, get_bus
+from .change_log import Sealer, advance_cursor
 from .models import *
+from .writer import DatabaseWriter, get_writer, mutation
+from utils import instrumentation
+
+DEFAULT_DB_PATH = "data/tunisietrans.db"
+
+# Colonnes explicites : l'ordre de SELECT * dépend de l'historique des ALTER TABLE
+CLIENT_COLUMNS = ('id, name, matricule_fiscal, address, phone, email, created_at, '
+                  'credit_limit, payment_terms, notes, city, activity')
+INVOICE_COLUMNS = ('id, client_id, date, due_date, total_amount, tva_amount, status, '
+                   'items, notes, payment_date, payment_method')
+TEMPLATE_COLUMNS = ('id, client_id, label, items, frequency, day_of_month, next_date, '
+                    'total_amount, tva_amount, end_date, active')
+MAINTENANCE_COLUMNS = ('id, task, started_at, duration, result, ok, size_before, size_after, '
+                       'free_before, free_after')
+OUTBOX_COLUMNS = ('id, invoice_id, recipient, subject, body, status, attempts, next_attempt, '
+                  'last_error, created_at, sent_at')
+PURCHASE_COLUMNS = ('id, supplier, date, total_amount, tva_amount, category, '
+                    'invoice_number, payment_status, description')
+PROFILE_COLUMNS = ('id, name, matricule_fiscal, address, rib, industry, target_audience, '
+                   'phone, email, capital_social')
+# Utilisateur d'une ligne du journal : celui du bloc de scellement qui la couvre
+CHANGE_COLUMNS = ('seq, changed_at, table_name, operation, row_key, before, after, '
+                  '(SELECT actor FROM change_seals WHERE last_seq >= change_log.seq ORDER BY last_seq LIMIT 1)')
+
+# Colonnes ajoutées aux tables existantes (bases créées avant leur introduction)
+ADDED_COLUMNS = {
+    'clients': [('city', 'TEXT'), ('activity', 'TEXT')],
+    'invoices': [('payment_method', 'TEXT')],
+    'purchases': [('description', 'TEXT')],
+}
+
+# Factures émises non réglées : encours client (les brouillons n'engagent pas le client)
+UNPAID_STATUSES = ('envoyée', 'en retard')
+_UNPAID = "('envoyée', 'en retard')"
+
+# Encours par client tenu à jour par SQLite à chaque écriture sur invoices :
+# chaque trigger retire la contribution de l'ancienne ligne et ajoute celle de la
+# nouvelle ; seule la date la plus ancienne est relue, par idx_invoices_client_status.
+_OLDEST_UNPAID = f'''(SELECT MIN(date) FROM invoices
+                      WHERE client_id = client_balances.client_id AND status IN {_UNPAID})'''
+BALANCE_TRIGGERS = {
+    'trg_client_balance_insert': f'''
+        CREATE TRIGGER trg_client_balance_insert AFTER INSERT ON invoices
+        WHEN NEW.status IN {_UNPAID}
+        BEGIN
+            INSERT OR IGNORE INTO client_balances (client_id) VALUES (NEW.client_id);
+            UPDATE client_balances SET
+                outstanding = ROUND(outstanding + NEW.total_amount, 3),
+                overdue = ROUND(overdue + (NEW.status = 'en retard') * NEW.total_amount, 3),
+                unpaid_count = unpaid_count + 1,
+                oldest_unpaid = MIN(COALESCE(oldest_unpaid, NEW.date), NEW.date)
+            WHERE client_id = NEW.client_id;
+        END
+    ''',
+    'trg_client_balance_delete': f'''
+        CREATE TRIGGER trg_client_balance_delete AFTER DELETE ON invoices
+        WHEN OLD.status IN {_UNPAID}
+        BEGIN
+            UPDATE client_balances SET
+                outstanding = ROUND(outstanding - OLD.total_amount, 3),
+                overdue = ROUND(overdue - (OLD.status = 'en retard') * OLD.total_amount, 3),
+                unpaid_count = unpaid_count - 1,
+                oldest_unpaid = CASE WHEN oldest_unpaid < OLD.date THEN oldest_unpaid ELSE {_OLDEST_UNPAID} END
+            WHERE client_id = OLD.client_id;
+        END
+    ''',
+    'trg_client_balance_update': f'''
+        CREATE TRIGGER trg_client_balance_update
+        AFTER UPDATE OF client_id, date, total_amount, status ON invoices
+        WHEN OLD.status IN {_UNPAID} OR NEW.status IN {_UNPAID}
+        BEGIN
+            INSERT OR IGNORE INTO client_balances (client_id) VALUES (NEW.client_id);
+            UPDATE client_balances SET
+                outstanding = ROUND(outstanding - (OLD.status IN {_UNPAID}) * OLD.total_amount, 3),
+                overdue = ROUND(overdue - (OLD.status = 'en retard') * OLD.total_amount, 3),
+                unpaid_count = unpaid_count - (OLD.status IN {_UNPAID})
+            WHERE client_id = OLD.client_id;
+            UPDATE client_balances SET
+                outstanding = ROUND(outstanding + (NEW.status IN {_UNPAID}) * NEW.total_amount, 3),
+                overdue = ROUND(overdue + (NEW.status = 'en retard') * NEW.total_amount, 3),
+                unpaid_count = unpaid_count + (NEW.status IN {_UNPAID})
+            WHERE client_id = NEW.client_id;
+            UPDATE client_balances SET oldest_unpaid = {_OLDEST_UNPAID}
+            WHERE client_id IN (OLD.client_id, NEW.client_id);
+        END
+    ''',
+}
+
+
+def parse_timestamp(value: bytes) -> datetime:
+    """Convertit les colonnes TIMESTAMP ('AAAA-MM-JJ' ou 'AAAA-MM-JJ HH:MM:SS')"""
+    return datetime.fromisoformat(value.decode())
+
+
+# Les vues manipulent des datetime (inv.date.month, strftime...)
+sqlite3.register_converter("TIMESTAMP", parse_timestamp)
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.combine(value, time())
+
+
+def _date_bound(value) -> str:
+    """Borne comparable aux dates stockées ('AAAA-MM-JJ' à minuit, sinon 'AAAA-MM-JJ HH:MM:SS')"""
+    value = _as_datetime(value)
+    return value.date().isoformat() if value.time() == time() else value.isoformat(" ")
+
+# Compteur de version par table, incrémenté à chaque écriture : clé des caches de calculs
+VERSIONED_TABLES = ('clients', 'invoices', 'purchases', 'business_profile')
+VERSION_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_version_{table}_{event.lower()} AFTER {event} ON {table}
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = '{table}'; END'''
+    for table in VERSIONED_TABLES for event in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+# Journal des modifications (voir data/change_log.py) : une ligne par écriture, posée par
+# trigger dans la transaction de l'écriture ; une modification ne garde que les colonnes changées
+AUDITED_TABLES = {
+    'clients': CLIENT_COLUMNS,
+    'invoices': INVOICE_COLUMNS,
+    'purchases': PURCHASE_COLUMNS,
+    'business_profile': PROFILE_COLUMNS,
+}
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+
+def _change_triggers(table: str, columns: str) -> Dict[str, str]:
+    names = [column.strip() for column in columns.split(',')]
+
+    def row(alias):
+        return 'json_object(' + ', '.join(f"'{name}', {alias}.{name}" for name in names) + ')'
+
+    def changed(alias):
+        # Objet JSON des seules colonnes modifiées, construit sans sous-requête
+        parts = ' || '.join(f"""CASE WHEN OLD.{name} IS NOT NEW.{name} """
+                            f"""THEN '"{name}":' || json_quote({alias}.{name}) || ',' ELSE '' END"""
+                            for name in names)
+        return f"'{{' || rtrim({parts}, ',') || '}}'"
+
+    insert = (f"INSERT INTO change_log (changed_at, table_name, operation, row_key, before, after) "
+              f"VALUES ({_NOW}, '{table}'")
+    # Muets pendant une écriture en masse résumée par une seule ligne (change_log.summarized)
+    active = "NOT EXISTS (SELECT 1 FROM change_log_pause)"
+    return {
+        f'trg_change_{table}_insert':
+            f"CREATE TRIGGER trg_change_{table}_insert AFTER INSERT ON {table} WHEN {active} BEGIN "
+            f"{insert}, 'INSERT', NEW.id, NULL, {row('NEW')}); END",
+        f'trg_change_{table}_update':
+            f"CREATE TRIGGER trg_change_{table}_update AFTER UPDATE ON {table} "
+            f"WHEN ({' OR '.join(f'OLD.{name} IS NOT NEW.{name}' for name in names)}) AND {active} BEGIN "
+            f"{insert}, 'UPDATE', NEW.id, {changed('OLD')}, {changed('NEW')}); END",
+        f'trg_change_{table}_delete':
+            f"CREATE TRIGGER trg_change_{table}_delete AFTER DELETE ON {table} WHEN {active} BEGIN "
+            f"{insert}, 'DELETE', OLD.id, {row('OLD')}, NULL); END",
+    }
+
+
+CHANGE_TRIGGERS = {
+    name: ddl for table, columns in AUDITED_TABLES.items() for name, ddl in _change_triggers(table, columns).items()
+}
+# Ajout seul : ni le journal ni ses sceaux ne se modifient ou ne se suppriment
+CHANGE_TRIGGERS.update({
+    f'trg_{table}_append_only_{event.lower()}':
+        f"CREATE TRIGGER trg_{table}_append_only_{event.lower()} BEFORE {event} ON {table} BEGIN "
+        f"SELECT RAISE(ABORT, '{table} : table en ajout seul'); END"
+    for table in ('change_log', 'change_seals') for event in ('UPDATE', 'DELETE')
+})
+
+# Balance âgée : bornes (en jours de retard) des tranches après « non échu »
+AGING_BOUNDS = (30, 60, 90)
+
+
+def normalized_key(expr: str) -> str:
+    """Clé SQL d'un code saisi (matricule, numéro de facture) : majuscules, sans espaces ni séparateurs"""
+    for char in ' /-.':
+        expr = f"replace({expr}, '{char}', '')"
+    return f'upper({expr})'
+
+
+# Doublons exacts (voir data/dedup.py) : matricule fiscal normalisé d'un client, et facture
+# fournisseur (fournisseur, exercice, numéro normalisé) d'un achat ; les codes vides ne comptent pas
+MATRICULE_KEY = normalized_key('matricule_fiscal')
+SUPPLIER_KEY = 'lower(trim(supplier))'
+PURCHASE_KEY = (SUPPLIER_KEY, 'substr(date, 1, 4)', normalized_key('invoice_number'))
+UNIQUE_KEYS = {
+    'idx_clients_matricule_key': ('clients', MATRICULE_KEY, f"{MATRICULE_KEY} <> ''"),
+    'idx_purchases_invoice_key': ('purchases', ', '.join(PURCHASE_KEY), f"{PURCHASE_KEY[-1]} <> ''"),
+}
+
+
+def unique_key_ddl(name: str) -> str:
+    table, key, where = UNIQUE_KEYS[name]
+    return f'CREATE UNIQUE INDEX {name} ON {table} ({key}) WHERE {where}'
+
+
+def relax_unique_key(conn, name: str):
+    """Remplace l'index unique `name` par un index simple : des doublons vont être (ou sont) enregistrés"""
+    conn.execute(f'DROP INDEX IF EXISTS {name}')
+    conn.execute(unique_key_ddl(name).replace('UNIQUE INDEX', 'INDEX'))
 
 
 class Database:
-    def __init__(self, db_path="data/tunisietrans.db"):
+    def __init__(self, db_path=DEFAULT_DB_PATH):
         self.db_path = db_path
         self.init_database()
+        # Lectures en cache, invalidées par les écritures de tous les processus (voir data/change_bus.py)
+        self.changes = get_bus(db_path)
+        self.cache = TableCache(self.changes, 'database')
+        # Les lignes du journal sont scellées avec l'utilisateur de chaque demande d'écriture
+        self.writer.add_hook(Sealer())
 
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        # uri=True : les archives sont attachées en lecture seule (file:...?mode=ro)
+        return instrumentation.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES, uri=True)
+
+    @property
+    def writer(self) -> DatabaseWriter:
+        """Fil d'écriture partagé par toutes les instances ouvertes sur ce fichier (voir data/writer.py)"""
+        return get_writer(os.path.abspath(self.db_path))
 
     def init_database(self):
         with self.get_connection() as conn:
+            # Pages libérées rendues au système par data/maintenance.py. Avant le passage en WAL et
+            # avant toute table : ensuite le mode ne change plus sans VACUUM (sans effet sur une base existante)
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            # WAL : les lectures (et les sauvegardes à chaud) ne bloquent pas les écritures
+            conn.execute('PRAGMA journal_mode = WAL')
+
             # Table des utilisateurs
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -55,7 +277,9 @@ class Database:
                     created_at TIMESTAMP NOT NULL,
                     credit_limit REAL DEFAULT 0.0,
                     payment_terms INTEGER DEFAULT 30,
-                    notes TEXT
+                    notes TEXT,
+                    city TEXT,
+                    activity TEXT
                 )
             ''')
 
@@ -69,9 +293,10 @@ class Database:
                     total_amount REAL NOT NULL,
                     tva_amount REAL NOT NULL,
                     status TEXT NOT NULL,
-                    items TEXT NOT NULL,  # JSON array
+                    items TEXT NOT NULL,  -- JSON array
                     notes TEXT,
                     payment_date TIMESTAMP,
+                    payment_method TEXT,
                     FOREIGN KEY (client_id) REFERENCES clients (id)
                 )
             ''')
@@ -86,7 +311,8 @@ class Database:
                     tva_amount REAL NOT NULL,
                     category TEXT NOT NULL,
                     invoice_number TEXT NOT NULL,
-                    payment_status TEXT NOT NULL
+                    payment_status TEXT NOT NULL,
+                    description TEXT
                 )
             ''')
 
@@ -102,67 +328,639 @@ class Database:
                 )
             ''')
 
-            conn.commit()
+            # Exercices clos déplacés dans des bases d'archive (voir data/archive.py)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS archived_years (
+                    year INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL,  -- relatif au répertoire de la base
+                    archived_at TIMESTAMP NOT NULL,
+                    invoice_count INTEGER NOT NULL,
+                    revenue REAL NOT NULL,
+                    tva_collected REAL NOT NULL,
+                    unpaid INTEGER NOT NULL,
+                    purchase_count INTEGER NOT NULL,
+                    expenses REAL NOT NULL,
+                    tva_deductible REAL NOT NULL
+                )
+            ''')
 
-    # CRUD Operations pour les clients
-    def add_client(self, client: Client):
-        with self.get_connection() as conn:
+            # Encours par client, maintenu par les triggers BALANCE_TRIGGERS
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS client_balances (
+                    client_id TEXT PRIMARY KEY,
+                    outstanding REAL NOT NULL DEFAULT 0,  -- TTC émis non réglé
+                    overdue REAL NOT NULL DEFAULT 0,  -- dont factures en retard
+                    unpaid_count INTEGER NOT NULL DEFAULT 0,
+                    oldest_unpaid TIMESTAMP  -- date de la plus ancienne facture non réglée
+                )
+            ''')
+
+            # Modèles de factures récurrentes (voir data/recurring.py)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS recurring_templates (
+                    id TEXT PRIMARY KEY,
+                    client_id TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    items TEXT NOT NULL,  -- JSON array, lignes calculées
+                    frequency TEXT NOT NULL,
+                    day_of_month INTEGER NOT NULL,
+                    next_date TIMESTAMP NOT NULL,
+                    total_amount REAL NOT NULL,
+                    tva_amount REAL NOT NULL,
+                    end_date TIMESTAMP,
+                    active BOOLEAN DEFAULT 1,
+                    FOREIGN KEY (client_id) REFERENCES clients (id)
+                )
+            ''')
+
+            # Lignes des relevés bancaires importés (voir utils/reconciliation.py)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS bank_transactions (
+                    id TEXT PRIMARY KEY,  -- empreinte de la ligne : un relevé réimporté est ignoré
+                    rib TEXT NOT NULL,
+                    date TIMESTAMP NOT NULL,
+                    label TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    reference TEXT,
+                    invoice_id TEXT,
+                    imported_at TIMESTAMP NOT NULL
+                )
+            ''')
+
+            # File d'envoi des factures par email (voir utils/mailer.py)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS email_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    invoice_id TEXT NOT NULL,
+                    recipient TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'en attente',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt TIMESTAMP NOT NULL,  -- prochain essai, ou fin du bail d'un envoi en cours
+                    last_error TEXT,
+                    created_at TIMESTAMP NOT NULL,
+                    sent_at TIMESTAMP,
+                    FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+                )
+            ''')
+
+            # Journal des modifications (voir data/change_log.py), en ajout seul
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS change_log (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    changed_at TIMESTAMP NOT NULL,
+                    table_name TEXT NOT NULL,
+                    operation TEXT NOT NULL,  -- 'INSERT', 'UPDATE', 'DELETE' ; 'ARCHIVE', 'REOPEN' (résumés)
+                    row_key TEXT NOT NULL,
+                    before TEXT,  -- JSON
+                    after TEXT  -- JSON
+                )
+            ''')
+
+            # Scellement par blocs : une ligne par demande d'écriture, chaînée à la précédente
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS change_seals (
+                    last_seq INTEGER PRIMARY KEY,  -- dernière ligne du journal couverte
+                    first_seq INTEGER NOT NULL,
+                    actor TEXT,
+                    sealed_at TIMESTAMP NOT NULL,
+                    hash TEXT NOT NULL  -- SHA-256(hash du bloc précédent + lignes du bloc)
+                )
+            ''')
+
+            # Non vide seulement dans la transaction d'une écriture résumée (change_log.summarized)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS change_log_pause (
+                    reason TEXT PRIMARY KEY
+                )
+            ''')
+
+            # Position de chaque consommateur du journal
             conn.execute('''
-                INSERT INTO clients VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                client.id, client.name, client.matricule_fiscal, client.address,
-                client.phone, client.email, client.created_at, client.credit_limit,
-                client.payment_terms, client.notes
-            ))
+                CREATE TABLE IF NOT EXISTS change_cursors (
+                    name TEXT PRIMARY KEY,
+                    seq INTEGER NOT NULL,
+                    updated_at TIMESTAMP NOT NULL
+                )
+            ''')
+
+            # Cube d'analyse (voir utils/analytics_cube.py), tenu à jour depuis le journal
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cube_sales (
+                    month TEXT NOT NULL,  -- AAAA-MM
+                    client_id TEXT NOT NULL,
+                    tva_rate REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    invoices INTEGER NOT NULL,  -- factures ayant au moins une ligne à ce taux
+                    total_ht REAL NOT NULL,
+                    tva REAL NOT NULL,
+                    total_ttc REAL NOT NULL,
+                    PRIMARY KEY (month, client_id, tva_rate, status)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cube_purchases (
+                    month TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    purchases INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    tva REAL NOT NULL,
+                    PRIMARY KEY (month, category)
+                ) WITHOUT ROWID
+            ''')
+
+            # Exécutions de la maintenance SQLite (voir data/maintenance.py)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS maintenance_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task TEXT NOT NULL,
+                    started_at TIMESTAMP NOT NULL,
+                    duration REAL,  -- secondes ; NULL tant que la tâche tourne
+                    result TEXT,
+                    ok BOOLEAN,
+                    size_before INTEGER,  -- octets, base + WAL
+                    size_after INTEGER,
+                    free_before INTEGER,  -- pages libres
+                    free_after INTEGER
+                )
+            ''')
+
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS data_versions (
+                    name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+
+            self._upgrade_schema(conn)
+
+            # Index des requêtes courantes (listes par client, par période, par statut) ;
+            # (client_id, status, date) sert aussi à la date la plus ancienne des encours
+            conn.execute('DROP INDEX IF EXISTS idx_invoices_client')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_client_status ON invoices (client_id, status, date)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (date)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_invoices_status ON invoices (status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_purchases_date ON purchases (date)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_clients_name ON clients (name COLLATE NOCASE)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_clients_matricule ON clients (matricule_fiscal)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_templates_next ON recurring_templates (active, next_date)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON email_outbox (status, next_attempt)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_invoice ON email_outbox (invoice_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_key)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_maintenance_task ON maintenance_runs (task, started_at)')
+
+            conn.executemany('INSERT OR IGNORE INTO data_versions (name) VALUES (?)',
+                             [(table,) for table in VERSIONED_TABLES])
+            for ddl in VERSION_TRIGGERS:
+                conn.execute(ddl)
+            self._install_change_triggers(conn)
+            self._install_balance_triggers(conn)
+            self._install_unique_keys(conn)
             conn.commit()
 
+    def _upgrade_schema(self, conn):
+        """Ajoute les colonnes apparues après la création d'une base existante"""
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for column, definition in columns:
+                if column not in existing:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def _install_change_triggers(self, conn):
+        """(Re)crée les triggers du journal absents ou périmés (colonnes ajoutées depuis leur création)"""
+        existing = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"))
+        for name, ddl in CHANGE_TRIGGERS.items():
+            if existing.get(name) != ddl:
+                conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+                conn.execute(ddl)
+
+    def _install_unique_keys(self, conn):
+        """Index uniques UNIQUE_KEYS ; index simple tant que la table contient des doublons"""
+        existing = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index'"))
+        for name, (table, key, where) in UNIQUE_KEYS.items():
+            ddl = unique_key_ddl(name)
+            if existing.get(name) == ddl:
+                continue
+            duplicated = conn.execute(
+                f'SELECT 1 FROM {table} WHERE {where} GROUP BY {key} HAVING COUNT(*) > 1 LIMIT 1').fetchone()
+            if duplicated is None:
+                conn.execute(f'DROP INDEX IF EXISTS {name}')
+                conn.execute(ddl)
+            elif name not in existing:
+                # Doublons déjà saisis (python -m data.dedup) : l'index unique sera posé une fois corrigés
+                relax_unique_key(conn, name)
+
+    def _install_balance_triggers(self, conn):
+        """Crée les triggers d'encours manquants, après un recalcul complet de client_balances"""
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        if existing.issuperset(BALANCE_TRIGGERS):
+            return
+        # Même transaction que le recalcul : aucune facture écrite entre les deux n'est perdue
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        for name in BALANCE_TRIGGERS:
+            conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        self.rebuild_client_balances(conn)
+        for ddl in BALANCE_TRIGGERS.values():
+            conn.execute(ddl)
+
+    def rebuild_client_balances(self, conn):
+        """Recalcule tous les encours depuis les factures (création ou contrôle de la table)"""
+        conn.execute('DELETE FROM client_balances')
+        conn.execute(f'''
+            INSERT INTO client_balances (client_id, outstanding, overdue, unpaid_count, oldest_unpaid)
+            SELECT client_id, ROUND(SUM(total_amount), 3),
+                   ROUND(SUM((status = 'en retard') * total_amount), 3), COUNT(*), MIN(date)
+            FROM invoices WHERE status IN {_UNPAID}
+            GROUP BY client_id
+        ''')
+
+    # CRUD Operations pour les clients
+    @mutation
+    def add_client(self, conn, client: Client):
+        conn.execute(f'''
+            INSERT INTO clients ({CLIENT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            client.id, client.name, client.matricule_fiscal, client.address,
+            client.phone, client.email, client.created_at, client.credit_limit,
+            client.payment_terms, client.notes, client.city, client.activity
+        ))
+
+    @cached('clients')
     def get_clients(self) -> List[Client]:
         with self.get_connection() as conn:
-            cursor = conn.execute('SELECT * FROM clients')
+            cursor = conn.execute(f'SELECT {CLIENT_COLUMNS} FROM clients')
             return [Client(*row) for row in cursor.fetchall()]
 
-    # CRUD Operations pour les factures
-    def add_invoice(self, invoice: Invoice):
+    def get_clients_by_id(self, client_ids: List[str]) -> List[Client]:
+        if not client_ids:
+            return []
         with self.get_connection() as conn:
-            conn.execute('''
-                INSERT INTO invoices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                invoice.id, invoice.client_id, invoice.date, invoice.due_date,
-                invoice.total_amount, invoice.tva_amount, invoice.status,
-                json.dumps(invoice.items), invoice.notes, invoice.payment_date
-            ))
-            conn.commit()
+            rows = conn.execute(f'''
+                SELECT {CLIENT_COLUMNS} FROM clients WHERE id IN ({", ".join("?" * len(client_ids))})
+            ''', list(client_ids)).fetchall()
+            return [Client(*row) for row in rows]
 
-    def get_invoices(self) -> List[Invoice]:
+    def find_client(self, name: str, matricule_fiscal: str = "") -> Optional[Client]:
+        """Retrouve un client par matricule fiscal (sans casse ni séparateurs), sinon par nom (sans casse)"""
         with self.get_connection() as conn:
-            cursor = conn.execute('SELECT * FROM invoices')
+            row = None
+            if matricule_fiscal:
+                row = conn.execute(f'''
+                    SELECT {CLIENT_COLUMNS} FROM clients
+                    WHERE {MATRICULE_KEY} = {normalized_key('?')} AND {MATRICULE_KEY} <> ''
+                    ORDER BY created_at LIMIT 1
+                ''', (matricule_fiscal,)).fetchone()
+            if row is None and name:
+                row = conn.execute(f'''
+                    SELECT {CLIENT_COLUMNS} FROM clients WHERE name = ? COLLATE NOCASE LIMIT 1
+                ''', (name.strip(),)).fetchone()
+            return Client(*row) if row else None
+
+    @cached('clients')
+    def get_client_names(self) -> Dict[str, str]:
+        with self.get_connection() as conn:
+            return dict(conn.execute('SELECT id, name FROM clients'))
+
+    # CRUD Operations pour les factures
+    @mutation
+    def add_invoice(self, conn, invoice: Invoice):
+        conn.execute(f'''
+            INSERT INTO invoices ({INVOICE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            invoice.id, invoice.client_id, invoice.date, invoice.due_date,
+            invoice.total_amount, invoice.tva_amount, invoice.status,
+            json.dumps(invoice.items), invoice.notes, invoice.payment_date,
+            invoice.payment_method
+        ))
+
+    def get_invoices(self, statuses: Optional[List[str]] = None, limit: Optional[int] = None,
+                     start: Optional[date] = None, end: Optional[date] = None) -> List[Invoice]:
+        """Factures de [start, end), éventuellement filtrées par statut ; avec limit, les plus récentes d'abord"""
+        conditions, params = self._period_filter(start, end)
+        if statuses:
+            conditions.append(f'status IN ({", ".join("?" * len(statuses))})')
+            params.extend(statuses)
+        with self.get_connection() as conn:
+            rows = self._read_partitions(conn, 'invoices', INVOICE_COLUMNS, conditions, params, start, end, limit)
             invoices = []
-            for row in cursor.fetchall():
+            for row in rows:
                 items = json.loads(row[7])
                 invoices.append(Invoice(
                     id=row[0], client_id=row[1], date=row[2], due_date=row[3],
                     total_amount=row[4], tva_amount=row[5], status=row[6],
-                    items=items, notes=row[8], payment_date=row[9]
+                    items=items, notes=row[8], payment_date=row[9], payment_method=row[10]
                 ))
             return invoices
 
-    # Opérations pour le profil entreprise
-    def save_profile(self, profile: BusinessProfile):
+    def get_invoices_by_id(self, invoice_ids: List[str]) -> List[Invoice]:
+        """Factures courantes (hors exercices archivés) désignées par leur numéro"""
+        if not invoice_ids:
+            return []
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {INVOICE_COLUMNS} FROM invoices WHERE id IN ({", ".join("?" * len(invoice_ids))})
+            ''', list(invoice_ids)).fetchall()
+            return [Invoice(*row[:7], json.loads(row[7]), *row[8:]) for row in rows]
+
+    @mutation
+    def update_invoice_status(self, conn, invoice_id: str, status: str, payment_date: Optional[datetime] = None,
+                              payment_method: Optional[str] = None) -> bool:
+        """Change le statut d'une facture (encours client mis à jour par trigger)"""
+        if status == InvoiceStatus.PAID and payment_date is None:
+            payment_date = datetime.now().replace(microsecond=0)
+        cursor = conn.execute('''
+            UPDATE invoices SET status = ?,
+                payment_date = CASE WHEN ? = 'payée' THEN ? END,
+                payment_method = COALESCE(?, payment_method)
+            WHERE id = ?
+        ''', (status, status, payment_date, payment_method, invoice_id))
+        return cursor.rowcount > 0
+
+    @mutation
+    def mark_overdue_invoices(self, conn, today: Optional[date] = None) -> int:
+        """Passe 'en retard' les factures envoyées dont l'échéance est dépassée"""
+        cursor = conn.execute('''
+            UPDATE invoices SET status = 'en retard' WHERE status = 'envoyée' AND due_date < ?
+        ''', (_date_bound(today or date.today()),))
+        return cursor.rowcount
+
+    @cached('invoices', 'clients')
+    def get_client_balance(self, client_id: str) -> Optional[ClientBalance]:
+        """Encours et plafond d'un client : une lecture par clé primaire"""
+        with self.get_connection() as conn:
+            row = conn.execute('''
+                SELECT c.id, COALESCE(b.outstanding, 0), COALESCE(b.overdue, 0),
+                       COALESCE(b.unpaid_count, 0), b.oldest_unpaid, COALESCE(c.credit_limit, 0)
+                FROM clients c LEFT JOIN client_balances b ON b.client_id = c.id
+                WHERE c.id = ?
+            ''', (client_id,)).fetchone()
+            return ClientBalance(*row) if row else None
+
+    def get_open_invoice_keys(self) -> List[tuple]:
+        """(id, client_id, date, total_amount) des factures émises non réglées, sans décoder les articles"""
+        with self.get_connection() as conn:
+            return conn.execute(f'''
+                SELECT id, client_id, date, total_amount FROM invoices WHERE status IN {_UNPAID}
+            ''').fetchall()
+
+    @mutation
+    def record_payments(self, conn, payments: List[Tuple[str, datetime, str]],
+                        payment_method: str = 'Virement') -> Tuple[int, List[Tuple[str, str]]]:
+        """Solde en une transaction les factures (id, date de paiement, transaction bancaire).
+
+        Une transaction n'est liée qu'à une facture qu'elle a soldée : une facture déjà
+        payée entre-temps (autre session, import précédent) est retournée à part,
+        (facture, transaction), et la transaction reste à rapprocher.
+        """
+        linked, skipped = [], []
+        for invoice_id, paid_on, transaction_id in payments:
+            cursor = conn.execute(f'''
+                UPDATE invoices SET status = 'payée', payment_date = ?, payment_method = ?
+                WHERE id = ? AND status IN {_UNPAID}
+            ''', (paid_on, payment_method, invoice_id))
+            (linked if cursor.rowcount else skipped).append((invoice_id, transaction_id))
+        conn.executemany('UPDATE bank_transactions SET invoice_id = ? WHERE id = ?', linked)
+        return len(linked), skipped
+
+    def _next_invoice_number(self, conn, date: datetime) -> str:
+        """Prochain numéro FACT-AAAAMM-NNN du mois"""
+        return self._reserve_invoice_numbers(conn, date, 1)[0]
+
+    def _reserve_invoice_numbers(self, conn, date: datetime, count: int) -> List[str]:
+        """Bloc de `count` numéros consécutifs du mois (dans une transaction d'écriture ouverte)"""
+        prefix = f"FACT-{date.strftime('%Y%m')}-"
+        row = conn.execute('''
+            SELECT MAX(CAST(substr(id, ?) AS INTEGER)) FROM invoices WHERE id LIKE ?
+        ''', (len(prefix) + 1, prefix + '%')).fetchone()
+        first = (row[0] or 0) + 1
+        return [f"{prefix}{n:03d}" for n in range(first, first + count)]
+
+    @mutation
+    def add_numbered_invoice(self, conn, invoice: Invoice, number_date: datetime) -> str:
+        """Attribue le numéro et insère la facture dans une même transaction d'écriture"""
+        # Lot d'écriture en BEGIN IMMEDIATE : deux processus ne peuvent pas lire le même dernier numéro
+        invoice.id = self._next_invoice_number(conn, number_date)
+        conn.execute(f'''
+            INSERT INTO invoices ({INVOICE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            invoice.id, invoice.client_id, invoice.date, invoice.due_date,
+            invoice.total_amount, invoice.tva_amount, invoice.status,
+            json.dumps(invoice.items), invoice.notes, invoice.payment_date,
+            invoice.payment_method
+        ))
+        return invoice.id
+
+    # CRUD Operations pour les achats
+    @mutation
+    def add_purchase(self, conn, purchase: Purchase):
+        conn.execute(f'''
+            INSERT INTO purchases ({PURCHASE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            purchase.id, purchase.supplier, purchase.date, purchase.total_amount,
+            purchase.tva_amount, purchase.category, purchase.invoice_number,
+            purchase.payment_status, purchase.description
+        ))
+
+    def get_purchases(self, start: Optional[date] = None, end: Optional[date] = None) -> List[Purchase]:
+        conditions, params = self._period_filter(start, end)
+        with self.get_connection() as conn:
+            rows = self._read_partitions(conn, 'purchases', PURCHASE_COLUMNS, conditions, params, start, end)
+            return [Purchase(*row) for row in rows]
+
+    # Modèles de factures récurrentes
+    @mutation
+    def add_recurring_template(self, conn, template: RecurringTemplate):
+        conn.execute(f'''
+            INSERT INTO recurring_templates ({TEMPLATE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            template.id, template.client_id, template.label, json.dumps(template.items),
+            template.frequency, template.day_of_month, template.next_date, template.total_amount,
+            template.tva_amount, template.end_date, template.active
+        ))
+
+    def get_recurring_templates(self, client_id: Optional[str] = None,
+                                active_only: bool = False) -> List[RecurringTemplate]:
+        conditions, params = [], []
+        if client_id:
+            conditions.append('client_id = ?')
+            params.append(client_id)
+        if active_only:
+            conditions.append('active = 1')
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self.get_connection() as conn:
+            rows = conn.execute(f'SELECT {TEMPLATE_COLUMNS} FROM recurring_templates{where} ORDER BY next_date',
+                                params).fetchall()
+        return [RecurringTemplate(row[0], row[1], row[2], json.loads(row[3]), *row[4:10], bool(row[10]))
+                for row in rows]
+
+    @mutation
+    def set_recurring_template_active(self, conn, template_id: str, active: bool):
+        conn.execute('UPDATE recurring_templates SET active = ? WHERE id = ?', (active, template_id))
+
+    # Relevés bancaires
+    @mutation
+    def add_bank_transactions(self, conn, transactions: List[BankTransaction]) -> int:
+        """Enregistre les lignes de relevé, sauf celles déjà importées ; retourne le nombre ajouté"""
+        imported_at = datetime.now().replace(microsecond=0)
+        cursor = conn.executemany('''
+            INSERT OR IGNORE INTO bank_transactions (id, rib, date, label, amount, reference, invoice_id, imported_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(t.id, t.rib, t.date, t.label, t.amount, t.reference, t.invoice_id, imported_at)
+              for t in transactions])
+        return cursor.rowcount
+
+    def get_unmatched_credits(self, rib: Optional[str] = None) -> List[BankTransaction]:
+        """Crédits non encore rapprochés d'une facture, du plus ancien au plus récent"""
+        query = 'SELECT id, rib, date, label, amount, reference, invoice_id FROM bank_transactions ' \
+                'WHERE invoice_id IS NULL AND amount > 0'
+        params = []
+        if rib:
+            query += ' AND rib = ?'
+            params.append(rib)
         with self.get_connection() as conn:
-            # Vider la table et insérer le nouveau profil
-            conn.execute('DELETE FROM business_profile')
+            return [BankTransaction(*row) for row in conn.execute(query + ' ORDER BY date, id', params)]
+
+    # File d'envoi des emails
+    @mutation
+    def enqueue_emails(self, conn, messages: List[OutboxMessage]) -> int:
+        """Met les messages en file, sauf pour les factures dont un envoi est déjà en attente ou en cours"""
+        now = datetime.now().replace(microsecond=0)
+        cursor = conn.executemany('''
+            INSERT INTO email_outbox (invoice_id, recipient, subject, body, status, next_attempt, created_at)
+            SELECT ?, ?, ?, ?, 'en attente', ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM email_outbox
+                              WHERE invoice_id = ? AND status IN ('en attente', 'en cours'))
+        ''', [(m.invoice_id, m.recipient, m.subject, m.body, m.next_attempt or now, now, m.invoice_id)
+              for m in messages])
+        return cursor.rowcount
+
+    @mutation
+    def claim_outbox_messages(self, conn, limit: int, lease: timedelta) -> List[OutboxMessage]:
+        """Réserve les messages dus pour la durée du bail ; un envoi interrompu redevient dû à son expiration"""
+        now = datetime.now().replace(microsecond=0)
+        rows = conn.execute(f'''
+            SELECT {OUTBOX_COLUMNS} FROM email_outbox
+            WHERE status IN ('en attente', 'en cours') AND next_attempt <= ?
+            ORDER BY next_attempt, id LIMIT ?
+        ''', (now, limit)).fetchall()
+        conn.executemany("UPDATE email_outbox SET status = 'en cours', next_attempt = ? WHERE id = ?",
+                         [(now + lease, row[0]) for row in rows])
+        return [OutboxMessage(*row[:5], DeliveryStatus.SENDING, *row[6:]) for row in rows]
+
+    @mutation
+    def record_deliveries(self, conn, sent: List[int], failures: List[Tuple[int, str, Optional[datetime]]]):
+        """Enregistre le résultat d'un lot : envoyés, et échecs (id, erreur, prochain essai ou None si définitif).
+
+        Une facture en brouillon envoyée au client passe 'envoyée'.
+        """
+        now = datetime.now().replace(microsecond=0)
+        conn.executemany('''
+            UPDATE email_outbox SET status = 'envoyé', attempts = attempts + 1, sent_at = ?, last_error = NULL
+            WHERE id = ?
+        ''', [(now, message_id) for message_id in sent])
+        conn.executemany('''
+            UPDATE invoices SET status = 'envoyée'
+            WHERE status = 'brouillon' AND id = (SELECT invoice_id FROM email_outbox WHERE id = ?)
+        ''', [(message_id,) for message_id in sent])
+        conn.executemany('''
+            UPDATE email_outbox SET attempts = attempts + 1, last_error = ?,
+                status = CASE WHEN ? IS NULL THEN 'échec' ELSE 'en attente' END,
+                next_attempt = COALESCE(?, next_attempt)
+            WHERE id = ?
+        ''', [(error, retry_at, retry_at, message_id) for message_id, error, retry_at in failures])
+
+    def get_deliveries(self, invoice_ids: Optional[List[str]] = None) -> Dict[str, OutboxMessage]:
+        """Dernier envoi de chaque facture"""
+        query = f'''SELECT {OUTBOX_COLUMNS} FROM email_outbox
+                    WHERE id IN (SELECT MAX(id) FROM email_outbox GROUP BY invoice_id)'''
+        params = []
+        if invoice_ids:
+            query += f' AND invoice_id IN ({", ".join("?" * len(invoice_ids))})'
+            params = list(invoice_ids)
+        with self.get_connection() as conn:
+            return {row[1]: OutboxMessage(*row) for row in conn.execute(query, params)}
+
+    def get_outbox_summary(self) -> Dict[str, int]:
+        with self.get_connection() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM email_outbox GROUP BY status').fetchall())
+
+    # Partitions : base courante + exercices archivés (attachés seulement si la période les recoupe)
+    def archive_path(self, relative_path: str) -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), relative_path)
+
+    def _archives(self, conn, start=None, end=None) -> List[Tuple[int, str]]:
+        """Exercices archivés qui recoupent [start, end), du plus récent au plus ancien"""
+        start, end = _as_datetime(start), _as_datetime(end)
+        return [
+            (year, path) for year, path in conn.execute('SELECT year, path FROM archived_years ORDER BY year DESC')
+            if (start is None or datetime(year + 1, 1, 1) > start) and (end is None or datetime(year, 1, 1) < end)
+        ]
+
+    def _attach_archive(self, conn, year: int, path: str) -> str:
+        schema = f'archive_{year}'
+        # Une même connexion peut lire plusieurs tables d'archive (factures puis achats)
+        if schema not in {row[1] for row in conn.execute('PRAGMA database_list')}:
+            uri = f'file:{pathname2url(self.archive_path(path))}?mode=ro'
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (uri,))
+        return schema
+
+    def _period_filter(self, start, end) -> Tuple[List[str], list]:
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('date >= ?')
+            params.append(_date_bound(start))
+        if end is not None:
+            conditions.append('date < ?')
+            params.append(_date_bound(end))
+        return conditions, params
+
+    def _read_partitions(self, conn, table, columns, conditions, params, start, end, limit=None) -> list:
+        """Lit `table` dans la base courante, et dans les archives seulement si la période les atteint"""
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        archives = self._archives(conn, start, end)
+
+        if limit is not None:
+            rows = conn.execute(f'SELECT {columns} FROM main.{table}{where} ORDER BY date DESC LIMIT ?',
+                                [*params, limit]).fetchall()
+            # Les archives sont antérieures au 1er janvier suivant le dernier exercice archivé :
+            # inutile de les lire si les lignes courantes les plus anciennes sont plus récentes
+            # (la date est la 3e colonne des factures comme des achats)
+            if not archives or (len(rows) == limit and rows[-1][2] >= datetime(archives[0][0] + 1, 1, 1)):
+                return rows
+
+        schemas = ['main'] + [self._attach_archive(conn, year, path) for year, path in archives]
+        query = ' UNION ALL '.join(f'SELECT {columns} FROM {schema}.{table}{where}' for schema in schemas)
+        all_params = params * len(schemas)
+        if limit is not None:
+            query += ' ORDER BY date DESC LIMIT ?'
+            all_params.append(limit)
+        return conn.execute(query, all_params).fetchall()
+
+    # Opérations pour le profil entreprise
+    @mutation
+    def save_profile(self, conn, profile: BusinessProfile):
+        # Mise à jour en place : le journal garde les seules colonnes modifiées
+        values = (profile.name, profile.matricule_fiscal, profile.address,
+                  profile.rib, profile.industry, profile.target_audience,
+                  profile.phone, profile.email, profile.capital_social)
+        updated = conn.execute('''
+            UPDATE business_profile SET
+                name = ?, matricule_fiscal = ?, address = ?, rib = ?, industry = ?,
+                target_audience = ?, phone = ?, email = ?, capital_social = ?
+            WHERE id = (SELECT MIN(id) FROM business_profile)
+        ''', values).rowcount
+        if not updated:
             conn.execute('''
                 INSERT INTO business_profile 
                 (name, matricule_fiscal, address, rib, industry, 
                  target_audience, phone, email, capital_social)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                profile.name, profile.matricule_fiscal, profile.address,
-                profile.rib, profile.industry, profile.target_audience,
-                profile.phone, profile.email, profile.capital_social
-            ))
-            conn.commit()
+            ''', values)
 
+    @cached('business_profile')
     def get_profile(self) -> Optional[BusinessProfile]:
         with self.get_connection() as conn:
             cursor = conn.execute('SELECT * FROM business_profile LIMIT 1')
@@ -175,29 +973,278 @@ class Database:
                 )
             return None
 
+    # Journal des modifications (voir data/change_log.py)
+    def _change_records(self, rows) -> List[ChangeRecord]:
+        return [ChangeRecord(seq=row[0], changed_at=row[1], table_name=row[2], operation=row[3], row_key=row[4],
+                             before=json.loads(row[5]) if row[5] else None,
+                             after=json.loads(row[6]) if row[6] else None, actor=row[7])
+                for row in rows]
+
+    def get_changes(self, after: int = 0, tables: Optional[Tuple[str, ...]] = None,
+                    limit: int = 500) -> List[ChangeRecord]:
+        """Changements validés après le numéro `after`, dans l'ordre d'écriture"""
+        query = f'SELECT {CHANGE_COLUMNS} FROM change_log WHERE seq > ?'
+        params = [after]
+        if tables:
+            query += f' AND table_name IN ({", ".join("?" * len(tables))})'
+            params.extend(tables)
+        with self.get_connection() as conn:
+            rows = conn.execute(query + ' ORDER BY seq LIMIT ?', params + [limit]).fetchall()
+        return self._change_records(rows)
+
+    def get_recent_changes(self, limit: int = 50, table: Optional[str] = None) -> List[ChangeRecord]:
+        query = f'SELECT {CHANGE_COLUMNS} FROM change_log'
+        params = []
+        if table:
+            query += ' WHERE table_name = ?'
+            params.append(table)
+        with self.get_connection() as conn:
+            rows = conn.execute(query + ' ORDER BY seq DESC LIMIT ?', params + [limit]).fetchall()
+        return self._change_records(reversed(rows))
+
+    def get_row_history(self, table: str, key: str) -> List[ChangeRecord]:
+        """Historique complet d'une ligne (facture, client...), du plus ancien au plus récent"""
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {CHANGE_COLUMNS} FROM change_log WHERE table_name = ? AND row_key = ? ORDER BY seq
+            ''', (table, str(key))).fetchall()
+        return self._change_records(rows)
+
+    def get_change_cursor(self, name: str) -> Optional[int]:
+        """Dernier changement traité par le consommateur `name` (None s'il n'a jamais rien lu)"""
+        with self.get_connection() as conn:
+            row = conn.execute('SELECT seq FROM change_cursors WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    @mutation
+    def save_change_cursor(self, conn, name: str, seq: int):
+        advance_cursor(conn, name, seq)
+
+    # Maintenance SQLite (voir data/maintenance.py)
+    def _maintenance_runs(self, rows) -> List[MaintenanceRun]:
+        return [MaintenanceRun(*row[:5], None if row[5] is None else bool(row[5]), *row[6:]) for row in rows]
+
+    @mutation
+    def claim_maintenance_task(self, conn, task: str, due_before: datetime,
+                               lease: timedelta) -> Optional[MaintenanceRun]:
+        """Réserve une tâche non lancée depuis `due_before` ; None si elle est à jour ou déjà en cours ailleurs"""
+        now = datetime.now().replace(microsecond=0)
+        last = conn.execute('''
+            SELECT started_at, duration FROM maintenance_runs WHERE task = ? ORDER BY started_at DESC LIMIT 1
+        ''', (task,)).fetchone()
+        # Une exécution interrompue (durée jamais notée) ne bloque la tâche que le temps du bail
+        if last and (last[0] > due_before or (last[1] is None and last[0] > now - lease)):
+            return None
+        cursor = conn.execute('INSERT INTO maintenance_runs (task, started_at) VALUES (?, ?)', (task, now))
+        return MaintenanceRun(id=cursor.lastrowid, task=task, started_at=now)
+
+    @mutation
+    def finish_maintenance_run(self, conn, run: MaintenanceRun):
+        conn.execute('''
+            UPDATE maintenance_runs SET duration = ?, result = ?, ok = ?, size_before = ?, size_after = ?,
+                free_before = ?, free_after = ?
+            WHERE id = ?
+        ''', (run.duration, run.result, run.ok, run.size_before, run.size_after, run.free_before,
+              run.free_after, run.id))
+
+    def get_maintenance_runs(self, limit: int = 20) -> List[MaintenanceRun]:
+        """Dernières exécutions, de la plus récente à la plus ancienne"""
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {MAINTENANCE_COLUMNS} FROM maintenance_runs ORDER BY started_at DESC, id DESC LIMIT ?
+            ''', (limit,)).fetchall()
+        return self._maintenance_runs(rows)
+
+    def get_last_maintenance_runs(self) -> Dict[str, MaintenanceRun]:
+        """Dernière exécution de chaque tâche"""
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {MAINTENANCE_COLUMNS} FROM maintenance_runs AS run
+                WHERE id = (SELECT id FROM maintenance_runs WHERE task = run.task ORDER BY started_at DESC, id DESC
+                            LIMIT 1)
+            ''').fetchall()
+        return {run.task: run for run in self._maintenance_runs(rows)}
+
     # Statistiques
+    def get_data_version(self, *tables: str) -> int:
+        """Version des tables données (croît à chaque écriture, de tout processus) : invalide les caches"""
+        return self.changes.version(*tables)
+
+    def get_receivables_aging(self, as_of: date) -> list:
+        """Encours par client ventilé par ancienneté de l'échéance, en une requête groupée.
+
+        Retourne (client_id, nom, non échu, 0-30 j, 31-60 j, 61-90 j, +90 j, total,
+        nombre de factures, plus ancienne échéance en texte) ; les exercices
+        archivés sont soldés et ne sont pas lus.
+        """
+        as_of = _as_datetime(as_of)
+        bounds = [_date_bound(as_of)] + [_date_bound(as_of - timedelta(days=days)) for days in AGING_BOUNDS]
+        buckets = ['SUM(CASE WHEN due_date >= ? THEN total_amount ELSE 0 END)']
+        params = [bounds[0]]
+        for newer, older in zip(bounds, bounds[1:]):
+            buckets.append('SUM(CASE WHEN due_date < ? AND due_date >= ? THEN total_amount ELSE 0 END)')
+            params.extend([newer, older])
+        buckets.append('SUM(CASE WHEN due_date < ? THEN total_amount ELSE 0 END)')
+        params.append(bounds[-1])
+        with self.get_connection() as conn:
+            return conn.execute(f'''
+                SELECT a.client_id, COALESCE(c.name, a.client_id), {", ".join(f"ROUND(a.b{i}, 3)" for i in range(len(buckets)))},
+                       ROUND(a.total, 3), a.invoice_count, a.oldest_due
+                FROM (
+                    SELECT client_id, {", ".join(f"{sql} AS b{i}" for i, sql in enumerate(buckets))},
+                           SUM(total_amount) AS total, COUNT(*) AS invoice_count, MIN(due_date) AS oldest_due
+                    FROM invoices WHERE status IN {_UNPAID}
+                    GROUP BY client_id
+                ) a LEFT JOIN clients c ON c.id = a.client_id
+                ORDER BY a.total DESC
+            ''', params).fetchall()
+
+    def get_open_receivables(self, as_of: date) -> list:
+        """Factures à encaisser : (client_id, échéance en jour julien, TTC).
+
+        Un brouillon est supposé émis à `as_of`, échéance selon le délai de
+        paiement du client ; les exercices archivés sont soldés et ne sont
+        pas lus.
+        """
+        with self.get_connection() as conn:
+            return conn.execute('''
+                SELECT client_id,
+                       CASE WHEN status = 'brouillon'
+                            THEN julianday(?) + COALESCE((SELECT payment_terms FROM clients WHERE id = client_id), 30)
+                            ELSE julianday(due_date) END,
+                       total_amount
+                FROM invoices WHERE status IN ('brouillon', 'envoyée', 'en retard')
+            ''', (_date_bound(as_of),)).fetchall()
+
+    def get_payment_delays(self, since: date) -> list:
+        """(client_id, jours entre échéance et paiement) des factures payées émises depuis `since`.
+
+        Lecture par idx_invoices_date (+status écarte idx_invoices_status,
+        qui parcourrait toutes les factures payées de tous les exercices).
+        """
+        with self.get_connection() as conn:
+            return conn.execute('''
+                SELECT client_id, CAST(ROUND(julianday(payment_date) - julianday(due_date)) AS INTEGER)
+                FROM invoices WHERE date >= ? AND +status = 'payée' AND payment_date IS NOT NULL
+            ''', (_date_bound(since),)).fetchall()
+
+    def get_unpaid_purchases(self) -> list:
+        """(date en jour julien, TTC) des achats non payés"""
+        with self.get_connection() as conn:
+            return conn.execute('''
+                SELECT julianday(date), total_amount FROM purchases WHERE payment_status = 'non payé'
+            ''').fetchall()
+
+    def get_purchases_by_day(self, categories: List[str], start: date, end: date) -> list:
+        """(catégorie, date 'AAAA-MM-JJ', TTC) des achats des `categories` sur [start, end)"""
+        with self.get_connection() as conn:
+            return conn.execute(f'''
+                SELECT category, substr(date, 1, 10), total_amount FROM purchases
+                WHERE date >= ? AND date < ? AND category IN ({", ".join("?" * len(categories))})
+            ''', (_date_bound(start), _date_bound(end), *categories)).fetchall()
+
+    @cached('invoices', 'purchases')
     def get_monthly_stats(self, month: int, year: int):
+        start = date(year, month, 1)
+        end = date(year + month // 12, month % 12 + 1, 1)
         with self.get_connection() as conn:
-            # Revenus du mois
+            # Revenus du mois (plage de dates : utilise idx_invoices_date)
             cursor = conn.execute('''
-                SELECT SUM(total_amount) FROM invoices 
-                WHERE strftime('%m', date) = ? AND strftime('%Y', date) = ?
-            ''', (f"{month:02d}", str(year)))
+                SELECT SUM(total_amount) FROM invoices WHERE date >= ? AND date < ?
+            ''', (start.isoformat(), end.isoformat()))
             revenue = cursor.fetchone()[0] or 0
 
             # Dépenses du mois
             cursor = conn.execute('''
-                SELECT SUM(total_amount) FROM purchases 
-                WHERE strftime('%m', date) = ? AND strftime('%Y', date) = ?
-            ''', (f"{month:02d}", str(year)))
+                SELECT SUM(total_amount) FROM purchases WHERE date >= ? AND date < ?
+            ''', (start.isoformat(), end.isoformat()))
             expenses = cursor.fetchone()[0] or 0
 
+            # Exercice archivé : totaux précalculés à l'archivage
+            for archive_year, path in self._archives(conn, start, end):
+                schema = self._attach_archive(conn, archive_year, path)
+                row = conn.execute(f'''
+                    SELECT revenue, expenses FROM {schema}.period_totals WHERE period = ?
+                ''', (start.strftime('%Y-%m'),)).fetchone()
+                if row:
+                    revenue += row[0]
+                    expenses += row[1]
+
             return {
                 'revenue': revenue,
                 'expenses': expenses,
                 'profit': revenue - expenses
             }
 
+    @cached('invoices', 'purchases', 'clients')
+    def get_totals(self):
+        """Totaux globaux calculés par SQLite (sans charger les factures)"""
+        with self.get_connection() as conn:
+            invoices = conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(total_amount), 0), COALESCE(SUM(tva_amount), 0),
+                       COALESCE(SUM(status IN ('envoyée', 'en retard')), 0)
+                FROM invoices
+            ''').fetchone()
+            purchases = conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(total_amount), 0), COALESCE(SUM(tva_amount), 0)
+                FROM purchases
+            ''').fetchone()
+            clients = conn.execute('SELECT COUNT(*) FROM clients').fetchone()[0]
+            # Exercices archivés : totaux annuels précalculés
+            archived = conn.execute('''
+                SELECT COALESCE(SUM(invoice_count), 0), COALESCE(SUM(revenue), 0),
+                       COALESCE(SUM(tva_collected), 0), COALESCE(SUM(unpaid), 0),
+                       COALESCE(SUM(purchase_count), 0), COALESCE(SUM(expenses), 0),
+                       COALESCE(SUM(tva_deductible), 0)
+                FROM archived_years
+            ''').fetchone()
+
+        return {
+            'invoices': invoices[0] + archived[0],
+            'revenue': invoices[1] + archived[1],
+            'tva_collected': invoices[2] + archived[2],
+            'unpaid': invoices[3] + archived[3],
+            'purchases': purchases[0] + archived[4],
+            'expenses': purchases[1] + archived[5],
+            'tva_deductible': purchases[2] + archived[6],
+            'clients': clients
+        }
+
+    @cached('invoices', 'purchases')
+    def get_daily_totals(self, table: str, start: Optional[date] = None,
+                         end: Optional[date] = None) -> List[Tuple[str, float]]:
+        """Total TTC par jour ('AAAA-MM-JJ') des factures ou des achats de [start, end), archives comprises"""
+        if table not in ('invoices', 'purchases'):
+            raise ValueError(f"table sans série journalière : {table}")
+        conditions, params = self._period_filter(start, end)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self.get_connection() as conn:
+            schemas = ['main'] + [self._attach_archive(conn, year, path)
+                                  for year, path in self._archives(conn, start, end)]
+            rows = ' UNION ALL '.join(f'SELECT substr(date, 1, 10) AS day, total_amount FROM {schema}.{table}{where}'
+                                      for schema in schemas)
+            return conn.execute(f'SELECT day, ROUND(SUM(total_amount), 3) FROM ({rows}) GROUP BY day ORDER BY day',
+                                params * len(schemas)).fetchall()
+
+
+class LazyDatabase:
+    """Proxy qui n'ouvre la base (et ne crée le schéma) qu'au premier usage"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self._db_path = db_path
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Database:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = Database(self._db_path)
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
 
-# Instance globale de la base de données
-db = Database()
\ No newline at end of file
+# Instance globale de la base de données (initialisée au premier accès)
+db = LazyDatabase()
@@ -0,0 +1,283 @@
+"""Doublons : clients (même matricule fiscal, noms proches) et factures fournisseurs saisies deux fois.
+
+Doublons exacts : mêmes clés que les index uniques de la base
+(database.UNIQUE_KEYS), matricule fiscal sans casse ni séparateurs, et
+(fournisseur, exercice, numéro de facture normalisé) pour un achat. Tant
+qu'une table en contient, la base garde un index simple sur la clé ;
+l'index unique est posé à l'ouverture qui suit leur correction. Un achat en
+double compte deux fois sa TVA déductible dans la déclaration.
+
+Noms proches : les clients sont répartis en blocs (racine du matricule,
+initiales des mots du nom, chaque mot distinctif) et seules les paires d'un
+même bloc sont comparées, par similarité de Dice des trigrammes du nom sans
+forme juridique ; un bloc de plus de MAX_BLOCK clients (mot trop courant)
+est ignoré. Achats probables : même fournisseur, même jour et même montant
+TTC sous des numéros différents ou absents.
+
+À la saisie, check_client() et check_purchase() ne lisent que les index
+(clés, date) et l'index de recherche des clients (utils/client_lookup.py).
+
+Usage:
+    python -m data.dedup
+    python -m data.dedup --threshold 0.75
+"""
+import argparse
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from itertools import combinations, groupby
+from typing import Dict, List, Set, Tuple
+
+from utils import client_lookup
+
+from .database import (CLIENT_COLUMNS, DEFAULT_DB_PATH, MATRICULE_KEY, PURCHASE_COLUMNS, PURCHASE_KEY,
+                       SUPPLIER_KEY, UNIQUE_KEYS, Database, _date_bound, db, normalized_key)
+from .models import Client, Purchase
+
+NAME_THRESHOLD = 0.8  # similarité de Dice à partir de laquelle deux noms sont signalés
+WORD_THRESHOLD = 0.7  # similarité de chaque mot avec un mot de l'autre nom (faute de frappe, pluriel)
+MAX_BLOCK = 50  # clients au-delà desquels un bloc n'est pas comparé paire à paire
+CANDIDATES = 20  # clients relus par l'index de recherche pour une vérification à la saisie
+LEGAL_FORMS = {"sarl", "suarl", "sa", "snc", "ste", "societe", "ets", "etablissement", "etablissements",
+               "entreprise", "cie", "et", "fils", "de", "des", "du", "la", "le", "les"}
+
+
+@dataclass
+class SimilarClients:
+    first: Client
+    second: Client
+    score: float
+    reason: str  # 'nom' ou 'racine du matricule'
+
+
+@dataclass
+class DedupReport:
+    clients: List[List[Client]] = field(default_factory=list)  # même matricule normalisé
+    similar_clients: List[SimilarClients] = field(default_factory=list)
+    purchases: List[List[Purchase]] = field(default_factory=list)  # même fournisseur, exercice et numéro
+    probable_purchases: List[List[Purchase]] = field(default_factory=list)  # même fournisseur, jour et montant
+    enforced: Dict[str, bool] = field(default_factory=dict)  # index unique posé, par index de UNIQUE_KEYS
+    compared: int = 0  # paires de noms comparées
+    seconds: float = 0.0
+
+    @property
+    def duplicate_tva(self) -> float:
+        """TVA déductible comptée en trop par les achats en double (toutes les saisies sauf la première)"""
+        return round(sum(purchase.tva_amount for group in self.purchases for purchase in group[1:]), 3)
+
+
+def name_key(name: str) -> str:
+    """Nom comparable : minuscules sans accents, sans forme juridique"""
+    words = client_lookup.name_words(name)
+    return " ".join(word for word in words if word not in LEGAL_FORMS) or " ".join(words)
+
+
+def _compact(code: str) -> str:
+    """Équivalent Python de database.normalized_key"""
+    return re.sub(r"[ /.-]", "", code or "").upper()
+
+
+def _grams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _dice(first: Set[str], second: Set[str]) -> float:
+    return 2 * len(first & second) / (len(first) + len(second))
+
+
+def _profile(key: str) -> Tuple[Set[str], List[Set[str]]]:
+    """Trigrammes d'un nom sans forme juridique (name_key), et de chacun de ses mots"""
+    return _grams(key), [_grams(word) for word in key.split()]
+
+
+def _similarity(first: Tuple[Set[str], List[Set[str]]], second: Tuple[Set[str], List[Set[str]]],
+                threshold: float = 0.0) -> float:
+    """Dice des noms, nul si un mot du nom le plus court n'a pas d'équivalent proche dans l'autre
+    (« Huilerie Ariana » et « Câblerie Ariana » se ressemblent sans être le même client)"""
+    score = _dice(first[0], second[0])
+    if score < threshold:
+        return score
+    shorter, longer = sorted((first[1], second[1]), key=len)
+    if not all(any(_dice(word, other) >= WORD_THRESHOLD for other in longer) for word in shorter):
+        return 0.0
+    return score
+
+
+def name_similarity(first: str, second: str) -> float:
+    return _similarity(_profile(name_key(first)), _profile(name_key(second)))
+
+
+def matricule_root(value: str) -> str:
+    """Identifiant du contribuable : 7 chiffres et lettre de contrôle, sans le code d'établissement"""
+    return client_lookup.compact_matricule(value)[:8]
+
+
+def _blocks(names: List[str], matricules: List[str]) -> Dict[str, List[int]]:
+    """Blocs de clients à comparer entre eux : mêmes initiales de mots, un même mot, même racine de matricule"""
+    blocks = defaultdict(list)
+    for position, (name, matricule) in enumerate(zip(names, matricules)):
+        words = name.split()
+        keys = {"~" + " ".join(sorted(word[:3] for word in words))}  # mêmes mots, fautes en fin de mot
+        keys.update(word[:4] for word in words if len(word) >= 4)
+        if len(matricule) >= 8:
+            keys.add("#" + matricule[:8])
+        for key in keys:
+            blocks[key].append(position)
+    return blocks
+
+
+def similar_clients(clients: List[Client], threshold: float = NAME_THRESHOLD) -> Tuple[List[SimilarClients], int]:
+    """Paires de clients aux noms proches ou à la même racine de matricule, et nombre de paires comparées"""
+    names = [name_key(client.name) for client in clients]
+    profiles = [_profile(name) for name in names]
+    matricules = [client_lookup.compact_matricule(client.matricule_fiscal) for client in clients]
+    seen, pairs = set(), []
+    for members in _blocks(names, matricules).values():
+        if len(members) > MAX_BLOCK:
+            continue
+        for i, j in combinations(members, 2):
+            if (i, j) in seen:
+                continue
+            seen.add((i, j))
+            if matricules[i] and matricules[i] == matricules[j]:
+                continue  # doublon exact, déjà signalé par sa clé
+            # Dice ≥ threshold impose des noms de tailles voisines : la plupart des paires s'arrêtent là
+            low, high = sorted((len(profiles[i][0]), len(profiles[j][0])))
+            score = 0.0
+            if low >= high * threshold / (2 - threshold):
+                score = round(_similarity(profiles[i], profiles[j], threshold), 3)
+            if score >= threshold:
+                pairs.append(SimilarClients(clients[i], clients[j], score, "nom"))
+            elif len(matricules[i]) >= 8 and matricules[i][:8] == matricules[j][:8]:
+                pairs.append(SimilarClients(clients[i], clients[j], score, "racine du matricule"))
+    pairs.sort(key=lambda pair: (-pair.score, pair.first.name))
+    return pairs, len(seen)
+
+
+def _exact_clients(conn) -> List[List[Client]]:
+    rows = conn.execute(f'''
+        SELECT key, {CLIENT_COLUMNS} FROM (
+            SELECT {MATRICULE_KEY} AS key, COUNT(*) OVER (PARTITION BY {MATRICULE_KEY}) AS copies, *
+            FROM clients WHERE {MATRICULE_KEY} <> ''
+        ) WHERE copies > 1 ORDER BY key, created_at
+    ''').fetchall()
+    return [[Client(*row[1:]) for row in group] for _, group in groupby(rows, key=lambda row: row[0])]
+
+
+def _purchase_groups(conn, partition: Tuple[str, ...], where: str = "1") -> List[List[Purchase]]:
+    """Achats partageant les mêmes valeurs des expressions `partition`, groupe par groupe"""
+    keys = ", ".join(partition)
+    rows = conn.execute(f'''
+        SELECT * FROM (
+            SELECT {keys}, COUNT(*) OVER (PARTITION BY {keys}) AS copies, {PURCHASE_COLUMNS}
+            FROM purchases WHERE {where}
+        ) WHERE copies > 1 ORDER BY {", ".join(str(n) for n in range(1, len(partition) + 1))}, date, id
+    ''').fetchall()
+    width = len(partition) + 1
+    return [[Purchase(*row[width:]) for row in group] for _, group in groupby(rows, key=lambda row: row[:width - 1])]
+
+
+def scan(database=None, threshold: float = NAME_THRESHOLD) -> DedupReport:
+    """Balayage des clients et des achats non archivés, gardé en cache tant qu'ils ne changent pas"""
+    database = database or db
+
+    def build() -> DedupReport:
+        started = time.perf_counter()
+        report = DedupReport()
+        with database.get_connection() as conn:
+            report.clients = _exact_clients(conn)
+            report.purchases = _purchase_groups(conn, PURCHASE_KEY, f"{PURCHASE_KEY[-1]} <> ''")
+            # Même fournisseur, jour et montant : doublon probable, sauf si c'est le même numéro (déjà compté)
+            for group in _purchase_groups(conn, (SUPPLIER_KEY, "substr(date, 1, 10)", "round(total_amount, 3)")):
+                numbers = {_compact(purchase.invoice_number) for purchase in group}
+                if len(numbers) > 1 or numbers == {""}:
+                    report.probable_purchases.append(group)
+            indexes = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index'"))
+        report.enforced = {name: (indexes.get(name) or "").startswith("CREATE UNIQUE") for name in UNIQUE_KEYS}
+        report.similar_clients, report.compared = similar_clients(database.get_clients(), threshold)
+        report.seconds = round(time.perf_counter() - started, 3)
+        return report
+
+    return database.cache.get(("dedup_scan", threshold), ("clients", "purchases"), build)
+
+
+def check_client(name: str, matricule_fiscal: str = "", database=None,
+                 threshold: float = NAME_THRESHOLD) -> List[Tuple[Client, float, str]]:
+    """Clients existants qu'un nouveau client doublerait : (client, score, raison), le même matricule d'abord"""
+    database = database or db
+    matches = []
+    if client_lookup.compact_matricule(matricule_fiscal):
+        existing = database.find_client("", matricule_fiscal)
+        if existing is not None:
+            matches.append((existing, 1.0, "matricule"))
+    for client, _ in client_lookup.search(name, CANDIDATES, database):
+        score = round(name_similarity(name, client.name), 3)
+        if score >= threshold and all(client.id != match[0].id for match in matches):
+            matches.append((client, score, "nom"))
+
+    # Même contribuable, autre code d'établissement : intervalle de clés de l'index du matricule
+    root = matricule_root(matricule_fiscal).upper()
+    if len(root) == 8:
+        with database.get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {CLIENT_COLUMNS} FROM clients
+                WHERE {MATRICULE_KEY} >= ? AND {MATRICULE_KEY} < ? AND {MATRICULE_KEY} <> ''
+            ''', (root, root[:-1] + chr(ord(root[-1]) + 1))).fetchall()
+        for client in (Client(*row) for row in rows):
+            if all(client.id != match[0].id for match in matches):
+                matches.append((client, round(name_similarity(name, client.name), 3), "racine du matricule"))
+    return matches
+
+
+def check_purchase(supplier: str, invoice_number: str, day: date, total_amount: float,
+                   database=None) -> List[Tuple[Purchase, str]]:
+    """Achats déjà saisis qu'un nouvel achat doublerait : (achat, raison), le même numéro d'abord"""
+    database = database or db
+    supplier_key, year, number = PURCHASE_KEY
+    with database.get_connection() as conn:
+        same_number = conn.execute(f'''
+            SELECT {PURCHASE_COLUMNS} FROM purchases
+            WHERE {supplier_key} = lower(trim(?)) AND {year} = ? AND {number} = {normalized_key('?')} AND {number} <> ''
+        ''', (supplier, str(day.year), invoice_number)).fetchall()
+        same_day = conn.execute(f'''
+            SELECT {PURCHASE_COLUMNS} FROM purchases
+            WHERE date >= ? AND date < ? AND {SUPPLIER_KEY} = lower(trim(?)) AND round(total_amount, 3) = round(?, 3)
+        ''', (_date_bound(day), _date_bound(day + timedelta(days=1)), supplier, total_amount)).fetchall()
+    matches = [(Purchase(*row), "numéro de facture") for row in same_number]
+    known = {purchase.id for purchase, _ in matches}
+    return matches + [(Purchase(*row), "même jour et montant") for row in same_day if row[0] not in known]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--threshold", type=float, default=NAME_THRESHOLD, help="similarité minimale des noms")
+    args = parser.parse_args()
+    if not 0 < args.threshold <= 1:
+        parser.exit(1, "Erreur : --threshold doit être compris entre 0 et 1\n")
+
+    report = scan(Database(args.db), args.threshold)
+    for group in report.clients:
+        print(f"Matricule {group[0].matricule_fiscal} : " + ", ".join(f"{c.id} {c.name}" for c in group))
+    for pair in report.similar_clients:
+        print(f"{pair.reason} ({pair.score:.2f}) : {pair.first.id} {pair.first.name} / "
+              f"{pair.second.id} {pair.second.name}")
+    for label, groups in (("Facture fournisseur", report.purchases), ("Achat probable", report.probable_purchases)):
+        for group in groups:
+            first = group[0]
+            print(f"{label} {first.supplier} {first.invoice_number or '(sans numéro)'} du "
+                  f"{first.date:%d/%m/%Y} : {len(group)} saisies ({', '.join(p.id for p in group)})")
+    pending = [name for name, enforced in report.enforced.items() if not enforced]
+    print(f"\n{len(report.clients)} matricules en double, {len(report.similar_clients)} paires de clients proches "
+          f"({report.compared} comparées), {len(report.purchases)} factures fournisseurs en double "
+          f"({report.duplicate_tva:,.3f} DT de TVA déductible en trop), {len(report.probable_purchases)} achats "
+          f"probables ; {report.seconds * 1e3:.0f} ms")
+    if pending:
+        print(f"Index uniques en attente de correction des doublons : {', '.join(pending)}")
+
+
+if __name__ == "__main__":
+    main()
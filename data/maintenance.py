@@ -0,0 +1,303 @@
+"""Maintenance de la base SQLite : statistiques du planificateur, vacuum incrémental, contrôle d'intégrité.
+
+Chaque tâche de TASKS a son intervalle et ne tourne que base au repos (aucune
+écriture dans le journal des modifications depuis IDLE) :
+
+- optimize (quotidienne) : ANALYZE des tables dont le nombre de lignes a
+  changé de plus de STALE_RATIO depuis leur dernière analyse, puis
+  PRAGMA optimize (borné par analysis_limit) ;
+- vacuum (quotidienne) : pages libres rendues au système par
+  incremental_vacuum, par paquets de VACUUM_PAGES (les écritures passent
+  entre deux paquets), puis WAL tronqué. Une base créée avant
+  auto_vacuum = INCREMENTAL n'est convertie (VACUUM complet, qui bloque les
+  écritures le temps de réécrire le fichier) que sur demande explicite :
+  run --force vacuum, ou le bouton des diagnostics ;
+- quick_check (hebdomadaire).
+
+Les exécutions sont enregistrées dans maintenance_runs (durée, taille du
+fichier et pages libres avant/après, résultat) ; la réservation d'une tâche
+passe par le fil d'écriture, deux processus serveur ne la lancent pas deux
+fois. L'application lance le planificateur dans un fil de fond après la
+première connexion d'un utilisateur (start_scheduler, désactivé par
+TT_MAINTENANCE=0) ; son premier passage attend CHECK_INTERVAL.
+
+Usage:
+    python -m data.maintenance status
+    python -m data.maintenance run                  # tâches dues, si la base est au repos
+    python -m data.maintenance run --force vacuum   # tout de suite, même si la base est active
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from .backup import _human
+from .database import DEFAULT_DB_PATH, Database, db
+from .models import MaintenanceRun
+from .writer import BUSY_TIMEOUT
+
+TASKS = {
+    "optimize": timedelta(days=1),
+    "vacuum": timedelta(days=1),
+    "quick_check": timedelta(days=7),
+}
+IDLE = timedelta(minutes=5)  # sans écriture avant de lancer une tâche
+LEASE = timedelta(hours=1)  # une exécution interrompue redevient due à son expiration
+CHECK_INTERVAL = 600  # secondes entre deux passages du planificateur
+ANALYSIS_LIMIT = 1000  # lignes lues par index par PRAGMA optimize
+STALE_RATIO = 0.25  # variation du nombre de lignes qui rend les statistiques d'une table périmées
+STALE_ROWS = 100  # ... au moins
+MIN_FREE_PAGES = 64  # en deçà, les pages libres sont simplement réutilisées
+VACUUM_PAGES = 2048  # pages rendues par transaction
+AUTO_VACUUM_MODES = {0: "aucun", 1: "complet", 2: "incrémental"}
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceError(Exception):
+    pass
+
+
+@dataclass
+class DatabaseStats:
+    file_size: int  # octets
+    wal_size: int
+    page_size: int
+    page_count: int
+    freelist_count: int
+    auto_vacuum: int  # 0 : aucun, 1 : complet, 2 : incrémental
+
+    @property
+    def size(self) -> int:
+        return self.file_size + self.wal_size
+
+    @property
+    def free_size(self) -> int:
+        return self.freelist_count * self.page_size
+
+    @property
+    def auto_vacuum_mode(self) -> str:
+        return AUTO_VACUUM_MODES.get(self.auto_vacuum, str(self.auto_vacuum))
+
+
+def _connect(db_path: str):
+    # Autocommit : chaque paquet de vacuum est sa propre transaction
+    return sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+
+
+def database_stats(db_path: str = DEFAULT_DB_PATH) -> DatabaseStats:
+    conn = _connect(db_path)
+    try:
+        pragmas = [conn.execute(f"PRAGMA {name}").fetchone()[0]
+                   for name in ("page_size", "page_count", "freelist_count", "auto_vacuum")]
+    finally:
+        conn.close()
+    wal_path = db_path + "-wal"
+    wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    return DatabaseStats(os.path.getsize(db_path), wal_size, *pragmas)
+
+
+# ================= TÂCHES =================
+def stale_tables(conn) -> List[str]:
+    """Tables dont le nombre de lignes a changé de plus de STALE_RATIO (et STALE_ROWS) depuis le dernier ANALYZE"""
+    analyzed = {}
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        # Première valeur de stat : nombre de lignes de la table au dernier ANALYZE
+        for table, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1"):
+            analyzed[table] = int(stat.split()[0])
+    tables = [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    stale = []
+    for table in tables:
+        rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        before = analyzed.get(table)
+        if abs(rows - (before or 0)) > max(STALE_ROWS, (before or 0) * STALE_RATIO):
+            stale.append(table)
+    return stale
+
+
+def optimize(conn) -> str:
+    # PRAGMA optimize seul ne regarde que les requêtes de sa propre connexion (SQLite < 3.46) :
+    # les tables à réanalyser sont repérées ici par leur nombre de lignes. ANALYZE complet (comptes
+    # exacts) : une table qui grandit n'est réanalysée qu'à chaque STALE_RATIO de croissance
+    tables = stale_tables(conn)
+    for table in tables:
+        conn.execute(f'ANALYZE "{table}"')
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("PRAGMA optimize")
+    return f"{len(tables)} table(s) analysée(s)" + (f" : {', '.join(tables)}" if tables else "")
+
+
+def vacuum(conn, convert: bool = False) -> str:
+    """Rend les pages libres ; convertit d'abord la base en auto_vacuum incrémental si convert"""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        if convert:
+            # Le mode n'est pris en compte qu'à la reconstruction du fichier
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            result = "conversion en auto_vacuum incrémental (VACUUM complet)"
+        else:
+            result = "auto_vacuum non incrémental : conversion par python -m data.maintenance run --force vacuum"
+    else:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        released = 0
+        if free >= MIN_FREE_PAGES:
+            while free:
+                # fetchall : chaque pas de la requête ne rend qu'une page
+                conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()
+                remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                released += free - remaining
+                if remaining >= free:
+                    break
+                free = remaining
+        result = f"{released} page(s) rendue(s)"
+    busy, wal_pages, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    if busy:
+        result += f" ; WAL non tronqué ({wal_pages} pages, lecture en cours)"
+    return result
+
+
+def quick_check(conn) -> str:
+    problems = [row[0] for row in conn.execute("PRAGMA quick_check(20)")]
+    if problems != ["ok"]:
+        raise MaintenanceError(f"quick_check : {'; '.join(problems)}")
+    return "ok"
+
+
+TASK_FUNCTIONS = {"optimize": optimize, "vacuum": vacuum, "quick_check": quick_check}
+
+
+# ================= PLANIFICATION =================
+def is_idle(database=None, now: Optional[datetime] = None) -> bool:
+    """Aucune écriture journalisée depuis IDLE"""
+    database = database or db
+    last = database.get_recent_changes(1)
+    return not last or last[0].changed_at <= (now or datetime.now()) - IDLE
+
+
+def run_task(task: str, database=None, force: bool = False) -> Optional[MaintenanceRun]:
+    """Exécute la tâche si elle est due (toujours si force) ; None si elle est à jour ou en cours ailleurs"""
+    database = database or db
+    if task not in TASKS:
+        raise MaintenanceError(f"tâche inconnue : {task} ({', '.join(TASKS)})")
+    due_before = datetime.now() - (timedelta(0) if force else TASKS[task])
+    run = database.claim_maintenance_task(task, due_before, LEASE)
+    if run is None:
+        return None
+
+    before = database_stats(database.db_path)
+    started = time.perf_counter()
+    conn = _connect(database.db_path)
+    try:
+        # Conversion de l'auto_vacuum (VACUUM complet) seulement sur demande explicite
+        result = vacuum(conn, convert=force) if task == "vacuum" else TASK_FUNCTIONS[task](conn)
+        run.result, run.ok = result, True
+    except (MaintenanceError, sqlite3.Error) as e:
+        run.result, run.ok = str(e), False
+    finally:
+        conn.close()
+        run.duration = round(time.perf_counter() - started, 3)
+        after = database_stats(database.db_path)
+        run.size_before, run.size_after = before.size, after.size
+        run.free_before, run.free_after = before.freelist_count, after.freelist_count
+        database.finish_maintenance_run(run)
+    return run
+
+
+def run_due(database=None, force: Sequence[str] = ()) -> List[MaintenanceRun]:
+    """Tâches dues si la base est au repos, puis celles de `force` quoi qu'il en soit"""
+    database = database or db
+    idle = is_idle(database)
+    runs = []
+    for task in TASKS:
+        if task in force or idle:
+            run = run_task(task, database, force=task in force)
+            if run is not None:
+                runs.append(run)
+    return runs
+
+
+def due_tasks(database=None) -> Dict[str, Optional[datetime]]:
+    """Prochaine échéance de chaque tâche (None : jamais lancée, due dès que la base est au repos)"""
+    database = database or db
+    last = database.get_last_maintenance_runs()
+    return {task: last[task].started_at + interval if task in last else None
+            for task, interval in TASKS.items()}
+
+
+_scheduler: Optional[threading.Thread] = None
+_scheduler_lock = threading.Lock()
+
+
+def _schedule(database, interval: float):
+    while True:
+        # Premier passage différé : rien n'est lu au démarrage du serveur
+        time.sleep(interval)
+        try:
+            run_due(database)
+        except Exception:
+            # Base occupée, fil d'écriture saturé... : nouvel essai au passage suivant
+            logger.exception("Maintenance SQLite interrompue")
+
+
+def start_scheduler(database=None, interval: float = CHECK_INTERVAL) -> bool:
+    """Lance le planificateur dans un fil de fond s'il n'y en a pas déjà un ; False si déjà lancé"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None and _scheduler.is_alive():
+            return False
+        _scheduler = threading.Thread(target=_schedule, args=(database or db, interval),
+                                      name="sqlite-maintenance", daemon=True)
+        _scheduler.start()
+        return True
+
+
+# ================= LIGNE DE COMMANDE =================
+def describe(run: MaintenanceRun) -> str:
+    if run.duration is None:
+        return f"{run.started_at:%d/%m/%Y %H:%M}  {run.task:<12} en cours"
+    return (f"{run.started_at:%d/%m/%Y %H:%M}  {run.task:<12} {'ok ' if run.ok else 'ÉCHEC'} "
+            f"{run.duration:8.2f} s  {_human(run.size_before)} -> {_human(run.size_after)}, "
+            f"{run.free_before} -> {run.free_after} pages libres  {run.result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="taille, pages libres, dernières exécutions")
+    run = commands.add_parser("run", help="lancer les tâches dues")
+    run.add_argument("--force", nargs="*", choices=list(TASKS), metavar="TÂCHE",
+                     help=f"lancer sans attendre ({', '.join(TASKS)} ; toutes si aucune n'est donnée)")
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    if args.command == "status":
+        stats = database_stats(args.db)
+        print(f"{args.db} : {_human(stats.file_size)} (+ WAL {_human(stats.wal_size)}), "
+              f"{stats.page_count} pages de {stats.page_size} o, {stats.freelist_count} libres "
+              f"({_human(stats.free_size)}), auto_vacuum {stats.auto_vacuum_mode}")
+        print(f"base {'au repos' if is_idle(database) else 'active'}")
+        for task, due in due_tasks(database).items():
+            when = "due" if due is None or due <= datetime.now() else f"prochaine le {due:%d/%m/%Y %H:%M}"
+            print(f"  {task:<12} {when}")
+        for past in database.get_maintenance_runs():
+            print(describe(past))
+    elif args.command == "run":
+        force = list(TASKS) if args.force == [] else (args.force or [])
+        runs = run_due(database, force)
+        if not runs:
+            print("Aucune tâche due" + ("" if is_idle(database) else " (base active)"))
+        for done in runs:
+            print(describe(done))
+        if any(not done.ok for done in runs):
+            parser.exit(1, "Erreur : une tâche a échoué\n")
+
+
+if __name__ == "__main__":
+    main()
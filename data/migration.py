@@ -0,0 +1,448 @@
+"""Migration en flux de data.json (ancien stockage de app.py) vers SQLite.
+
+Le fichier est lu par morceaux : chaque élément des listes est décodé puis
+inséré par lots transactionnels, sans jamais charger le fichier entier.
+La position (en octets) du dernier lot validé est enregistrée dans la table
+migration_state, ce qui rend la migration reprenable après une interruption
+et idempotente (identifiants stables, déjà présents ignorés).
+
+Les clés métier (UNIQUE_KEYS : matricule d'un client, numéro de facture
+d'un fournisseur) ne font rien écarter : un doublon hérité de data.json est
+inséré, l'index unique redevient un index simple et le résultat le signale
+(duplicate_keys) pour python -m data.dedup.
+
+Usage:
+    python -m data.migration --json data.json --db data/tunisietrans.db
+"""
+import argparse
+import codecs
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+from .change_log import seal
+from .database import DEFAULT_DB_PATH, UNIQUE_KEYS, Database, relax_unique_key
+
+LEGACY_JSON_PATH = "data.json"
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 1000
+
+# Anciens statuts de app.py -> statuts InvoiceStatus
+LEGACY_STATUS = {"impayée": "envoyée"}
+
+WHITESPACE = " \t\n\r"
+
+
+class JsonStreamReader:
+    """Lecteur incrémental d'un objet JSON {section: [éléments...], section: {...}}.
+
+    Produit (section, valeur, position) où valeur est un élément de liste (ou la
+    valeur entière pour une section qui n'est pas une liste) et position
+    l'offset en octets juste après cette valeur. `resume_point` indique où
+    reprendre une lecture à cette position : dans la liste de la section, ou
+    entre deux sections ("").
+    """
+
+    def __init__(self, path: str, offset: int = 0, section: Optional[str] = None,
+                 chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.offset = offset
+        self.section = section
+        # Reprise juste après un élément de la liste de `section`, ou entre deux sections
+        if section is None:
+            self.state = "start"
+        else:
+            self.state = "array_next" if section else "object_next"
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    # ----- tampon -----
+    def _fill(self, f, text_decoder) -> bool:
+        if self._eof:
+            return False
+        chunk = f.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            self._buffer += text_decoder.decode(b"", final=True)
+            return False
+        if self._pos > len(self._buffer) // 2:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += text_decoder.decode(chunk)
+        return True
+
+    def _consume(self, end: int):
+        self.offset += len(self._buffer[self._pos:end].encode("utf-8"))
+        self._pos = end
+
+    def _skip_whitespace(self, f, text_decoder):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._consume(self._pos + 1)
+            if self._pos < len(self._buffer) or not self._fill(f, text_decoder):
+                return
+
+    def _peek(self, f, text_decoder) -> str:
+        self._skip_whitespace(f, text_decoder)
+        if self._pos >= len(self._buffer):
+            raise ValueError(f"{self.path}: fin de fichier inattendue (octet {self.offset})")
+        return self._buffer[self._pos]
+
+    def _expect(self, f, text_decoder, chars: str) -> str:
+        char = self._peek(f, text_decoder)
+        if char not in chars:
+            raise ValueError(f"{self.path}: '{char}' inattendu à l'octet {self.offset}, attendu {chars!r}")
+        self._consume(self._pos + 1)
+        return char
+
+    def _value(self, f, text_decoder):
+        self._skip_whitespace(f, text_decoder)
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # Un nombre en fin de tampon peut être tronqué : on exige un caractère après
+                if end < len(self._buffer) or self._eof:
+                    self._consume(end)
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill(f, text_decoder)
+
+    @property
+    def resume_point(self) -> str:
+        return self.section if self.state in ("array_item", "array_next") else ""
+
+    # ----- parcours -----
+    def __iter__(self) -> Iterator[Tuple[str, object, int]]:
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+            while self.state != "end":
+                if self.state == "start":
+                    self._expect(f, text_decoder, "{")
+                    self.state = "key" if self._peek(f, text_decoder) != "}" else "object_next"
+                elif self.state == "key":
+                    self.section = self._value(f, text_decoder)
+                    self._expect(f, text_decoder, ":")
+                    if self._peek(f, text_decoder) == "[":
+                        self._consume(self._pos + 1)
+                        self.state = "array_next" if self._peek(f, text_decoder) == "]" else "array_item"
+                    else:
+                        value = self._value(f, text_decoder)
+                        self.state = "object_next"
+                        yield self.section, value, self.offset
+                elif self.state == "array_item":
+                    value = self._value(f, text_decoder)
+                    self.state = "array_next"
+                    yield self.section, value, self.offset
+                elif self.state == "array_next":
+                    if self._expect(f, text_decoder, ",]") == ",":
+                        self.state = "array_item"
+                    else:
+                        self.state = "object_next"
+                elif self.state == "object_next":
+                    self.state = "key" if self._expect(f, text_decoder, ",}") == "," else "end"
+
+
+# ================= CORRESPONDANCE DES CHAMPS =================
+def parse_legacy_date(value: Optional[str]) -> Optional[str]:
+    """'JJ/MM/AAAA[ HH:MM]' -> 'AAAA-MM-JJ[ HH:MM:SS]' (format TIMESTAMP de la base)"""
+    if not value:
+        return None
+    for fmt in ("%d/%m/%Y %H:%M", "%d/%m/%Y"):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return parsed.isoformat(" ") if fmt.endswith("%M") else parsed.date().isoformat()
+    # Déjà au format ISO
+    return datetime.fromisoformat(value).isoformat(" ")
+
+
+def client_key(name: str, matricule_fiscal: str) -> Tuple[str, str]:
+    return (matricule_fiscal or "").strip().upper(), " ".join((name or "").lower().split())
+
+
+def derived_client_id(name: str, matricule_fiscal: str) -> str:
+    """Identifiant stable d'un client connu uniquement par ses factures"""
+    digest = hashlib.sha1("|".join(client_key(name, matricule_fiscal)).encode()).hexdigest()
+    return f"CLI-{digest[:10]}"
+
+
+class ClientResolver:
+    """Retrouve l'identifiant d'un client par matricule fiscal, sinon par nom"""
+
+    def __init__(self, conn):
+        self.by_matricule: Dict[str, str] = {}
+        self.by_name: Dict[str, str] = {}
+        for client_id, name, matricule in conn.execute("SELECT id, name, matricule_fiscal FROM clients"):
+            self.remember(client_id, name, matricule)
+
+    def remember(self, client_id: str, name: str, matricule_fiscal: str):
+        matricule, name = client_key(name, matricule_fiscal)
+        if matricule:
+            self.by_matricule.setdefault(matricule, client_id)
+        if name:
+            self.by_name.setdefault(name, (client_id, matricule))
+
+    def find(self, name: str, matricule_fiscal: str) -> Optional[str]:
+        matricule, name = client_key(name, matricule_fiscal)
+        if matricule and matricule in self.by_matricule:
+            return self.by_matricule[matricule]
+        client_id, known_matricule = self.by_name.get(name, (None, ""))
+        # Homonymes : deux matricules différents désignent deux clients distincts
+        if matricule and known_matricule and matricule != known_matricule:
+            return None
+        return client_id
+
+
+def map_invoice(record: dict, client_id: str) -> tuple:
+    invoice_id = record.get("numero") or record["id"]
+    status = record.get("status", "brouillon")
+    total_ttc = record.get("total_ttc", 0.0)
+    return (
+        invoice_id, client_id,
+        parse_legacy_date(record.get("date")) or parse_legacy_date(record.get("created_at")),
+        parse_legacy_date(record.get("due_date")) or parse_legacy_date(record.get("date")),
+        total_ttc, record.get("tva_amount", 0.0), LEGACY_STATUS.get(status, status),
+        json.dumps(record.get("items", []), ensure_ascii=False), record.get("notes") or None,
+        None, record.get("payment_method")
+    )
+
+
+def map_purchase(record: dict) -> tuple:
+    return (
+        record["id"], record.get("fournisseur", ""), parse_legacy_date(record.get("date")),
+        record.get("montant_ttc", 0.0), record.get("tva_montant", 0.0),
+        record.get("categorie", "Autre"), record.get("num_facture", ""),
+        record.get("status", "non payé"), record.get("description") or None
+    )
+
+
+def map_client(record: dict) -> tuple:
+    return (
+        record["id"], record.get("nom", ""), record.get("matricule_fiscal", ""),
+        record.get("adresse", ""), record.get("telephone", ""), record.get("email", ""),
+        parse_legacy_date(record.get("date_creation")) or datetime.now().date().isoformat(),
+        0.0, 30, record.get("notes") or None, record.get("ville") or None,
+        record.get("activite") or None
+    )
+
+
+# ================= MIGRATION =================
+STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS migration_state (
+        source TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        section TEXT,
+        offset INTEGER NOT NULL DEFAULT 0,
+        done BOOLEAN NOT NULL DEFAULT 0,
+        counts TEXT NOT NULL DEFAULT '{}',
+        updated_at TIMESTAMP NOT NULL
+    )
+"""
+
+
+def fingerprint(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class Migrator:
+    """Insère les enregistrements de data.json par lots, une transaction par lot"""
+
+    def __init__(self, json_path: str, db: Database, batch_size: int = BATCH_SIZE):
+        self.json_path = json_path
+        self.source = os.path.abspath(json_path)
+        self.db = db
+        self.batch_size = batch_size
+        self.conn = db.get_connection()
+        self.conn.execute(STATE_TABLE)
+        self.conn.commit()
+        self.clients = ClientResolver(self.conn)
+        self.counts = {"invoices": 0, "purchases": 0, "clients": 0, "profile": 0, "skipped": 0}
+        self._fingerprint = None
+        self._pending = []
+        self.relaxed_keys = set()  # index uniques UNIQUE_KEYS ramenés à des index simples
+
+    def state(self) -> Optional[tuple]:
+        return self.conn.execute(
+            "SELECT fingerprint, section, offset, done, counts FROM migration_state WHERE source = ?",
+            (self.source,)
+        ).fetchone()
+
+    def _save_state(self, section: Optional[str], offset: int, done: bool):
+        self.conn.execute("""
+            INSERT OR REPLACE INTO migration_state (source, fingerprint, section, offset, done, counts, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (self.source, self._fingerprint, section, offset, done, json.dumps(self.counts),
+              datetime.now().isoformat(" ", "seconds")))
+
+    def _execute(self, sql: str, params: tuple):
+        """INSERT ... ON CONFLICT (id) DO NOTHING ; un doublon sur une clé métier est inséré quand même"""
+        try:
+            self.conn.execute(sql, params)
+        except sqlite3.IntegrityError as e:
+            name = next((name for name in UNIQUE_KEYS if name in str(e)), None)
+            if name is None:
+                raise
+            relax_unique_key(self.conn, name)
+            self.relaxed_keys.add(name)
+            self.conn.execute(sql, params)
+
+    def _insert(self, section: str, record):
+        conn = self.conn
+        before = conn.total_changes
+        if section == "invoices":
+            name, matricule = record.get("client", ""), record.get("client_matricule", "")
+            client_id = self.clients.find(name, matricule)
+            if client_id is None:
+                # Client présent seulement sur ses factures : créé à partir de celles-ci
+                client_id = derived_client_id(name, matricule)
+                self._execute(
+                    "INSERT INTO clients (id, name, matricule_fiscal, address, phone, email, created_at) "
+                    "VALUES (?, ?, ?, ?, '', '', ?) ON CONFLICT (id) DO NOTHING",
+                    (client_id, name or "Client inconnu", matricule or "", record.get("client_address") or "",
+                     parse_legacy_date(record.get("date")) or datetime.now().date().isoformat())
+                )
+                self.clients.remember(client_id, name, matricule)
+            conn.execute("""
+                INSERT OR IGNORE INTO invoices (id, client_id, date, due_date, total_amount, tva_amount,
+                    status, items, notes, payment_date, payment_method)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, map_invoice(record, client_id))
+        elif section == "purchases":
+            self._execute("""
+                INSERT INTO purchases (id, supplier, date, total_amount, tva_amount, category,
+                    invoice_number, payment_status, description)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO NOTHING
+            """, map_purchase(record))
+        elif section == "clients":
+            row = map_client(record)
+            existing = self.clients.find(row[1], row[2])
+            if existing and existing != row[0]:
+                # Client déjà créé depuis une facture : on complète sa fiche
+                conn.execute("""
+                    UPDATE clients SET
+                        address = CASE WHEN address = '' THEN ? ELSE address END,
+                        phone = CASE WHEN phone = '' THEN ? ELSE phone END,
+                        email = CASE WHEN email = '' THEN ? ELSE email END,
+                        notes = COALESCE(notes, ?), city = COALESCE(city, ?), activity = COALESCE(activity, ?)
+                    WHERE id = ?
+                """, (row[3], row[4], row[5], row[9], row[10], row[11], existing))
+            else:
+                self._execute("""
+                    INSERT INTO clients (id, name, matricule_fiscal, address, phone, email,
+                        created_at, credit_limit, payment_terms, notes, city, activity)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO NOTHING
+                """, row)
+                self.clients.remember(row[0], row[1], row[2])
+        elif section == "profile":
+            if conn.execute("SELECT COUNT(*) FROM business_profile").fetchone()[0] == 0:
+                conn.execute("""
+                    INSERT INTO business_profile (name, matricule_fiscal, address, rib, industry,
+                        target_audience, phone, email, capital_social)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (record.get("name", ""), record.get("matricule_fiscal", ""), record.get("address", ""),
+                      record.get("rib", ""), record.get("industry", ""),
+                      record.get("target_audience", "Entreprises industrielles et commerciales"),
+                      record.get("phone"), record.get("email"), record.get("capital")))
+        else:
+            return
+        if conn.total_changes > before:
+            self.counts[section] += 1
+        else:
+            self.counts["skipped"] += 1
+
+    def _flush(self, resume_point: Optional[str], offset: int):
+        """Valide un lot et la position atteinte dans la même transaction"""
+        try:
+            for section, record in self._pending:
+                self._insert(section, record)
+            self._save_state(resume_point, offset, False)
+            seal(self.conn, "migration")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self._pending = []
+
+    def run(self, force: bool = False) -> dict:
+        self._fingerprint = fingerprint(self.json_path)
+        state = self.state()
+        offset, resume_point = 0, None
+        if state and state[0] == self._fingerprint and not force:
+            if state[3]:
+                return {**json.loads(state[4]), "status": "déjà migré"}
+            # Reprise après interruption
+            resume_point, offset = state[1], state[2]
+            self.counts.update(json.loads(state[4]))
+
+        reader = JsonStreamReader(self.json_path, offset=offset, section=resume_point)
+        for section, record, offset in reader:
+            self._pending.append((section, record))
+            if len(self._pending) >= self.batch_size:
+                self._flush(reader.resume_point, offset)
+
+        self._flush(reader.resume_point, offset)
+        self._save_state(None, offset, True)
+        self.conn.commit()
+        result = {**self.counts, "status": "terminé"}
+        if self.relaxed_keys:
+            result["duplicate_keys"] = sorted(self.relaxed_keys)
+        return result
+
+    def close(self):
+        self.conn.close()
+
+
+def migrate(json_path: str = LEGACY_JSON_PATH, db_path: str = DEFAULT_DB_PATH,
+            batch_size: int = BATCH_SIZE, force: bool = False) -> dict:
+    """Migre data.json vers la base ; sans effet si le fichier est déjà migré"""
+    migrator = Migrator(json_path, Database(db_path), batch_size)
+    try:
+        return migrator.run(force)
+    finally:
+        migrator.close()
+
+
+def migrate_if_present(json_path: str = LEGACY_JSON_PATH, database: Optional[Database] = None) -> Optional[dict]:
+    """Appelé à la connexion : migre l'ancien data.json s'il existe (sans effet ensuite)"""
+    if not os.path.exists(json_path):
+        return None
+    if database is None:
+        from .database import db
+        database = db.get()
+    migrator = Migrator(json_path, database)
+    try:
+        return migrator.run()
+    finally:
+        migrator.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--json", default=LEGACY_JSON_PATH)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--force", action="store_true", help="relire tout le fichier (insertions idempotentes)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = migrate(args.json, args.db, args.batch_size, args.force)
+    print(f"{args.json} -> {args.db} : {counts} en {time.perf_counter() - started:.1f} s")
+    if counts.get("duplicate_keys"):
+        print("Doublons importés (matricules ou numéros de facture fournisseur) : python -m data.dedup")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,12 @@ class InvoiceStatus(str, Enum):
     PAID = "payée"
     OVERDUE = "en retard"
 
+class DeliveryStatus(str, Enum):
+    PENDING = "en attente"
+    SENDING = "en cours"
+    SENT = "envoyé"
+    FAILED = "échec"
+
 @dataclass
 class User:
     username: str
@@ -45,6 +51,8 @@ class Client:
     credit_limit: float = 0.0
     payment_terms: int = 30
     notes: Optional[str] = None
+    city: Optional[str] = None
+    activity: Optional[str] = None
 
 @dataclass
 class Invoice:
@@ -58,6 +66,33 @@ class Invoice:
     items: List[dict]
     notes: Optional[str] = None
     payment_date: Optional[datetime] = None
+    payment_method: Optional[str] = None
+
+@dataclass
+class ClientBalance:
+    client_id: str
+    outstanding: float = 0.0
+    overdue: float = 0.0
+    unpaid_count: int = 0
+    oldest_unpaid: Optional[datetime] = None
+    credit_limit: float = 0.0  # 0 : pas de plafond
+
+    def exceeds_limit(self, amount: float) -> bool:
+        return self.credit_limit > 0 and self.outstanding + amount > self.credit_limit
+
+@dataclass
+class RecurringTemplate:
+    id: str
+    client_id: str
+    label: str
+    items: List[dict]  # lignes déjà calculées (total_ht, tva_amount, total_ttc)
+    frequency: str  # 'mensuelle', 'trimestrielle', 'annuelle'
+    day_of_month: int
+    next_date: datetime  # prochaine facture à émettre
+    total_amount: float = 0.0  # TTC précalculé
+    tva_amount: float = 0.0
+    end_date: Optional[datetime] = None
+    active: bool = True
 
 @dataclass
 class Purchase:
@@ -69,6 +104,42 @@ class Purchase:
     category: str
     invoice_number: str
     payment_status: str
+    description: Optional[str] = None
+
+@dataclass
+class BankTransaction:
+    id: str
+    rib: str
+    date: datetime
+    label: str
+    amount: float  # positif : crédit, négatif : débit
+    reference: Optional[str] = None
+    invoice_id: Optional[str] = None  # facture rapprochée
+
+@dataclass
+class OutboxMessage:
+    id: Optional[int]  # attribué par la base
+    invoice_id: str
+    recipient: str
+    subject: str
+    body: str
+    status: str = DeliveryStatus.PENDING
+    attempts: int = 0
+    next_attempt: Optional[datetime] = None
+    last_error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    sent_at: Optional[datetime] = None
+
+@dataclass
+class ChangeRecord:
+    seq: int
+    changed_at: datetime
+    table_name: str
+    operation: str  # 'INSERT', 'UPDATE', 'DELETE' ; 'ARCHIVE', 'REOPEN' pour un exercice entier
+    row_key: str
+    before: Optional[dict]  # ligne supprimée, ou anciennes valeurs des colonnes modifiées
+    after: Optional[dict]  # ligne insérée, ou nouvelles valeurs des colonnes modifiées
+    actor: Optional[str] = None  # None pour une ligne écrite hors du fil d'écriture ou pas encore scellée
 
 @dataclass
 class Reminder:
@@ -77,4 +148,17 @@ class Reminder:
     due_date: datetime
     type: str  # 'tax', 'invoice', 'general'
     description: str
-    completed: bool = False
\ No newline at end of file
+    completed: bool = False
+
+@dataclass
+class MaintenanceRun:
+    id: Optional[int]  # attribué par la base
+    task: str  # 'optimize', 'vacuum', 'quick_check'
+    started_at: datetime
+    duration: Optional[float] = None  # secondes ; None tant que la tâche tourne
+    result: Optional[str] = None  # 'ok', compte rendu, ou erreur
+    ok: Optional[bool] = None
+    size_before: Optional[int] = None  # octets, base + WAL
+    size_after: Optional[int] = None
+    free_before: Optional[int] = None  # pages libres
+    free_after: Optional[int] = None
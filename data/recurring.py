@@ -0,0 +1,172 @@
+"""Factures récurrentes : modèles par client et émission groupée des factures dues.
+
+Un modèle porte les lignes d'une facture, déjà calculées par
+utils.calculations (totaux précalculés), et sa prochaine date d'émission.
+L'émission crée toutes les factures dues jusqu'à une date en une seule
+transaction : numéros réservés par bloc pour chaque mois, insertion groupée,
+avancement des échéanciers. Relancer l'émission n'émet rien deux fois.
+
+Usage:
+    python -m data.recurring list
+    python -m data.recurring issue                      # jusqu'à la fin du mois courant
+    python -m data.recurring issue --until 2026-10-31 --draft
+"""
+import argparse
+import calendar
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from utils.calculations import calculate_invoice_totals
+
+from .database import INVOICE_COLUMNS, DEFAULT_DB_PATH, Database, _date_bound, db
+from .models import InvoiceStatus, RecurringTemplate
+
+FREQUENCIES = {"mensuelle": 1, "trimestrielle": 3, "annuelle": 12}
+
+
+class RecurringError(Exception):
+    pass
+
+
+def _as_date(value) -> Optional[date]:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def add_months(value: date, months: int, day: int) -> date:
+    """Même jour `day` `months` mois plus tard, ramené au dernier jour des mois courts"""
+    index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(index, 12)
+    return date(year, month + 1, min(day, calendar.monthrange(year, month + 1)[1]))
+
+
+def end_of_month(value: date) -> date:
+    return value.replace(day=calendar.monthrange(value.year, value.month)[1])
+
+
+def occurrences(next_date: date, frequency: str, day: int, until: date,
+                end_date: Optional[date] = None) -> Tuple[List[date], date]:
+    """Dates d'émission dues jusqu'à `until`, et la date suivante"""
+    dates = []
+    while next_date <= until and (end_date is None or next_date <= end_date):
+        dates.append(next_date)
+        next_date = add_months(next_date, FREQUENCIES[frequency], day)
+    return dates, next_date
+
+
+def create_template(client_id: str, label: str, items: List[dict], frequency: str, start: date,
+                    day_of_month: Optional[int] = None, end_date: Optional[date] = None,
+                    database=None) -> RecurringTemplate:
+    """Enregistre un modèle ; ses lignes et totaux sont calculés une fois pour toutes les émissions"""
+    if frequency not in FREQUENCIES:
+        raise RecurringError(f"périodicité inconnue : {frequency}")
+    items = [item for item in items if item.get("description")]
+    if not items:
+        raise RecurringError("le modèle doit comporter au moins un article")
+    day = day_of_month or start.day
+    if not 1 <= day <= 31:
+        raise RecurringError("le jour d'émission doit être compris entre 1 et 31")
+
+    totals = calculate_invoice_totals(items)
+    first = start.replace(day=min(day, calendar.monthrange(start.year, start.month)[1]))
+    if first < start:
+        first = add_months(first, 1, day)
+    template = RecurringTemplate(
+        id=f"REC-{uuid.uuid4().hex[:8].upper()}",
+        client_id=client_id,
+        label=label,
+        items=totals["items"],
+        frequency=frequency,
+        day_of_month=day,
+        next_date=first,
+        total_amount=totals["total_ttc"],
+        tva_amount=totals["tva_amount"],
+        end_date=end_date,
+    )
+    (database or db).add_recurring_template(template)
+    return template
+
+
+def _issue(conn, database: Database, until: date, status: str) -> List[tuple]:
+    """Factures dues, numéros, insertion et échéanciers : une seule transaction du fil d'écriture"""
+    rows = conn.execute("""
+        SELECT t.id, t.client_id, t.label, t.items, t.frequency, t.day_of_month, t.next_date,
+               t.total_amount, t.tva_amount, t.end_date, COALESCE(c.payment_terms, 30)
+        FROM recurring_templates t LEFT JOIN clients c ON c.id = t.client_id
+        WHERE t.active = 1 AND t.next_date <= ?
+    """, (_date_bound(until),)).fetchall()
+
+    planned = []
+    schedule_updates = []
+    for row in rows:
+        end_date = _as_date(row[9])
+        dates, following = occurrences(_as_date(row[6]), row[4], row[5], until, end_date)
+        planned.extend((issued_on, row) for issued_on in dates)
+        schedule_updates.append((following, end_date is None or following <= end_date, row[0]))
+
+    # Numéros réservés par bloc, mois par mois, dans l'ordre des dates
+    by_month = defaultdict(list)
+    for issued_on, row in sorted(planned, key=lambda p: (p[0], p[1][0])):
+        by_month[(issued_on.year, issued_on.month)].append((issued_on, row))
+    invoices = []
+    for (year, month), group in sorted(by_month.items()):
+        numbers = database._reserve_invoice_numbers(conn, date(year, month, 1), len(group))
+        for number, (issued_on, row) in zip(numbers, group):
+            invoices.append((
+                number, row[1], issued_on, issued_on + timedelta(days=row[10]), row[7], row[8],
+                status, row[3], row[2], None, None, row[0]
+            ))
+
+    conn.executemany(f"""
+        INSERT INTO invoices ({INVOICE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [invoice[:11] for invoice in invoices])
+    conn.executemany("UPDATE recurring_templates SET next_date = ?, active = ? WHERE id = ?",
+                     schedule_updates)
+    return invoices
+
+
+def issue_due_invoices(until: Optional[date] = None, database=None,
+                       status: str = InvoiceStatus.SENT) -> Dict:
+    """Émet en une transaction toutes les factures des modèles actifs dues jusqu'à `until` inclus"""
+    database = database or db
+    until = until or end_of_month(date.today())
+    invoices = database.writer.submit(_issue, database, until, status).result()
+
+    return {
+        "until": until,
+        "templates": len({invoice[11] for invoice in invoices}),
+        "invoices": len(invoices),
+        "total": round(sum(invoice[4] for invoice in invoices), 3),
+        "numbers": [invoice[0] for invoice in invoices],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="modèles actifs")
+    issue = commands.add_parser("issue", help="émettre les factures dues")
+    issue.add_argument("--until", type=date.fromisoformat, help="date limite incluse (AAAA-MM-JJ)")
+    issue.add_argument("--draft", action="store_true", help="émettre en brouillon")
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    if args.command == "list":
+        names = database.get_client_names()
+        for template in database.get_recurring_templates(active_only=True):
+            print(f"{template.id}  {names.get(template.client_id, template.client_id):<30} "
+                  f"{template.label:<30} {template.frequency:<14} {template.next_date:%d/%m/%Y} "
+                  f"{template.total_amount:>12,.3f} DT")
+    elif args.command == "issue":
+        result = issue_due_invoices(args.until, database,
+                                    InvoiceStatus.DRAFT if args.draft else InvoiceStatus.SENT)
+        numbers = result["numbers"]
+        span = f" ({numbers[0]} … {numbers[-1]})" if numbers else ""
+        print(f"{result['invoices']} factures émises jusqu'au {result['until']:%d/%m/%Y} pour "
+              f"{result['templates']} modèles, {result['total']:,.3f} DT{span}")
+
+
+if __name__ == "__main__":
+    main()
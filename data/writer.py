@@ -0,0 +1,204 @@
+"""Fil d'écriture unique : toutes les modifications de la base passent par une file.
+
+Les écritures concurrentes (plusieurs sessions Streamlit, fils d'envoi) ne se
+disputent plus le verrou du fichier : un seul fil possède la connexion
+d'écriture, prend toutes les demandes en attente et les applique dans une
+même transaction (commit groupé : une synchronisation disque par lot au lieu
+d'une par écriture). Chaque demande s'exécute dans son propre SAVEPOINT :
+une demande en erreur est annulée sans faire échouer les autres.
+
+Chaque demande s'exécute dans le contexte (contextvars) de l'appelant. Des
+crochets de lot (BatchHook, add_hook) sont appelés à l'ouverture du lot, avant
+chaque demande (dans son contexte) et avant le COMMIT.
+
+Les appelants reçoivent un Future, résolu après le COMMIT du lot. La file
+est bornée : quand elle est pleine, l'appelant attend (contre-pression) puis
+reçoit WriterBusy si le fil d'écriture ne suit plus.
+"""
+import atexit
+import contextvars
+import functools
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from utils import instrumentation
+
+MAX_BATCH = 256  # demandes par transaction
+MAX_PENDING = 1024  # demandes en file avant contre-pression
+SUBMIT_TIMEOUT = 30.0  # secondes d'attente d'une place dans la file
+BUSY_TIMEOUT = 30.0  # attente du verrou SQLite tenu par un autre processus
+
+_STOP = object()
+
+
+class WriterBusy(Exception):
+    pass
+
+
+class BatchHook:
+    """Crochet de lot du fil d'écriture ; toutes les méthodes reçoivent la connexion d'écriture"""
+
+    def begin(self, conn, external: bool):
+        """Lot ouvert ; external : une autre connexion a écrit depuis le lot précédent"""
+
+    def before_request(self, conn):
+        """Avant chaque demande, dans son SAVEPOINT et le contexte de l'appelant"""
+
+    def before_commit(self, conn):
+        """Après la dernière demande ; une erreur annule tout le lot"""
+
+
+class DatabaseWriter:
+    """Connexion d'écriture unique, servie par un fil qui regroupe les commits"""
+
+    def __init__(self, db_path: str, max_batch: int = MAX_BATCH, max_pending: int = MAX_PENDING):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._hooks = []
+        self._data_version = None
+        self.batches = 0
+        self.requests = 0
+
+    def add_hook(self, hook: BatchHook):
+        """Ajoute un crochet de lot (un seul par classe de crochet)"""
+        with self._lock:
+            if not any(type(existing) is type(hook) for existing in self._hooks):
+                self._hooks = self._hooks + [hook]
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Met en file fn(conn, *args, **kwargs) ; le Future porte son résultat une fois le lot validé"""
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+        future = Future()
+        try:
+            self._queue.put((future, contextvars.copy_context(), fn, args, kwargs), timeout=SUBMIT_TIMEOUT)
+        except queue.Full:
+            raise WriterBusy(f"file d'écriture pleine depuis {SUBMIT_TIMEOUT:.0f} s")
+        return future
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def close(self):
+        """Applique les demandes en file puis arrête le fil"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self):
+        try:
+            # isolation_level=None : transactions explicites (BEGIN IMMEDIATE ... COMMIT par lot)
+            conn = instrumentation.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES, uri=True,
+                                           isolation_level=None, timeout=BUSY_TIMEOUT)
+        except Exception as e:
+            self._fail_pending(e)
+            return
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.max_batch and batch[-1] is not _STOP:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                requests = [request for request in batch if request is not _STOP]
+                if requests:
+                    self._apply(conn, requests)
+                if batch[-1] is _STOP:
+                    return
+        finally:
+            conn.close()
+
+    def _apply(self, conn, requests):
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            hooks = self._hooks
+            # data_version ne change qu'avec les écritures des autres connexions
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            for hook in hooks:
+                hook.begin(conn, data_version != self._data_version)
+            for future, context, fn, args, kwargs in requests:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT request')
+                try:
+                    for hook in hooks:
+                        context.run(hook.before_request, conn)
+                    outcomes.append((future, context.run(fn, conn, *args, **kwargs), None))
+                    conn.execute('RELEASE request')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO request')
+                    conn.execute('RELEASE request')
+                    outcomes.append((future, None, e))
+            for hook in hooks:
+                hook.before_commit(conn)
+            conn.execute('COMMIT')
+            self._data_version = data_version
+        except Exception as e:
+            # Lot non validé (verrou, disque plein) : aucune demande n'est appliquée
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for future, *_ in requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.requests += len(outcomes)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _fail_pending(self, error: Exception):
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is not _STOP:
+                request[0].set_exception(error)
+
+
+def mutation(method):
+    """Méthode d'écriture de Database : reçoit la connexion du fil d'écriture.
+
+    L'appel attend la validation du lot et retourne le résultat ;
+    avec wait=False, il retourne le Future.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, wait: bool = True, **kwargs):
+        future = self.writer.submit(functools.partial(method, self), *args, **kwargs)
+        return future.result() if wait else future
+
+    return wrapper
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_path: str) -> DatabaseWriter:
+    """Un seul fil d'écriture par fichier de base dans le processus"""
+    with _writers_lock:
+        if db_path not in _writers:
+            _writers[db_path] = DatabaseWriter(db_path)
+        return _writers[db_path]
+
+
+@atexit.register
+def _close_writers():
+    for writer in list(_writers.values()):
+        writer.close()
@@ -1,7 +1,26 @@
 import streamlit as st
-import openai
-from datetime import datetime
 import os
+from utils.ai_stream import CompletionStream, render_stream
+from utils.fiscal_knowledge import TVA_RATES, answer_locally, build_context, upcoming_deadlines
+
+
+SYSTEM_PROMPT = """Tu es un expert fiscal tunisien spécialisé dans la législation fiscale tunisienne.
+    Fournis des réponses précises, à jour et conformes à la réglementation tunisienne.
+    Inclus les références légales quand c'est pertinent.
+    Sois concis mais complet.
+
+    Informations contextuelles:
+    - Entreprise: SARL de transport/logistique
+    - Régime: Réel normal pour la TVA
+    - Secteur: Transport et Logistique
+    - Localisation: Tunisie
+
+    Réponds en français."""
+
+CONTEXT_PROMPT = """
+
+    Extraits de référence (à privilégier s'ils répondent à la question):
+{context}"""
 
 
 def show():
@@ -21,7 +40,6 @@ def show():
         )
         if api_key:
             st.session_state.openai_api_key = api_key
-            openai.api_key = api_key
 
         st.divider()
         st.subheader("💡 Exemples de questions")
@@ -52,25 +70,45 @@ def show():
 
     # Input utilisateur
     if prompt := st.chat_input("Posez votre question fiscale..."):
+        # Questions déterministes (taux, calculs, échéances) : réponse locale immédiate
+        local_answer = answer_locally(prompt)
+        if local_answer:
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            st.session_state.messages.append({"role": "assistant", "content": local_answer})
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            with st.chat_message("assistant"):
+                st.markdown(local_answer)
+                st.caption("📚 Réponse issue des règles fiscales locales")
+
         # Vérifier la clé API
-        if not st.session_state.openai_api_key:
+        elif not st.session_state.openai_api_key:
             st.error("Veuillez configurer votre clé API OpenAI dans la sidebar.")
             return
 
-        # Ajouter le message utilisateur
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-
-        # Générer la réponse
-        with st.chat_message("assistant"):
-            with st.spinner("Analyse en cours..."):
+        else:
+            # Ajouter le message utilisateur
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            with st.chat_message("user"):
+                st.markdown(prompt)
+
+            # Générer la réponse (affichée jeton par jeton)
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                placeholder.markdown("▌")
+                stream = CompletionStream(build_messages(prompt), st.session_state.openai_api_key)
                 try:
-                    response = generate_fiscal_response(prompt)
-                    st.markdown(response)
+                    response = render_stream(stream, placeholder)
                     st.session_state.messages.append({"role": "assistant", "content": response})
-                except Exception as e:
+                    if stream.time_to_first_token is not None:
+                        st.caption(f"⚡ Premier mot en {stream.time_to_first_token * 1000:,.0f} ms "
+                                   f"· réponse complète en {stream.total_time:,.1f} s")
+                except TimeoutError as e:
+                    placeholder.empty()
                     st.error(f"Erreur: {str(e)}")
+                except Exception as e:
+                    placeholder.empty()
+                    st.error(f"Erreur lors de la génération de la réponse: {str(e)}")
 
     # Section d'outils fiscaux
     st.divider()
@@ -87,33 +125,23 @@ def show():
             show_fiscal_calendar()
 
 
-def generate_fiscal_response(prompt: str) -> str:
-    """Génère une réponse avec OpenAI"""
-
-    system_prompt = """Tu es un expert fiscal tunisien spécialisé dans la législation fiscale tunisienne.
-    Fournis des réponses précises, à jour et conformes à la réglementation tunisienne.
-    Inclus les références légales quand c'est pertinent.
-    Sois concis mais complet.
-
-    Informations contextuelles:
-    - Entreprise: SARL de transport/logistique
-    - Régime: Réel normal pour la TVA
-    - Secteur: Transport et Logistique
-    - Localisation: Tunisie
+def build_messages(prompt: str) -> list:
+    """Construit les messages envoyés au modèle, avec les extraits pertinents"""
+    system_prompt = SYSTEM_PROMPT
+    context = build_context(prompt, k=3)
+    if context:
+        system_prompt += CONTEXT_PROMPT.format(context=context)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
 
-    Réponds en français."""
 
+def generate_fiscal_response(prompt: str) -> str:
+    """Génère une réponse complète avec OpenAI (sans affichage progressif)"""
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        return response.choices[0].message.content
+        stream = CompletionStream(build_messages(prompt), st.session_state.openai_api_key)
+        return "".join(stream)
     except Exception as e:
         return f"Erreur lors de la génération de la réponse: {str(e)}"
 
@@ -124,7 +152,7 @@ def calculate_tva():
 
     with col1:
         amount = st.number_input("Montant HT (DT)", min_value=0.0, value=1000.0)
-        tva_rate = st.selectbox("Taux TVA (%)", [7, 13, 19], index=2)
+        tva_rate = st.selectbox("Taux TVA (%)", TVA_RATES, index=len(TVA_RATES) - 1)
 
     with col2:
         tva_amount = amount * (tva_rate / 100)
@@ -136,15 +164,5 @@ def calculate_tva():
 
 def show_fiscal_calendar():
     """Affiche le calendrier fiscal"""
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-
-    fiscal_deadlines = {
-        "TVA Mensuelle": f"20/{current_month:02d}/{current_year}",
-        "Déclaration Annuelle": f"25/03/{current_year + 1}",
-        "Impôt sur les Sociétés": f"25/04/{current_year + 1}",
-        "CNSS Patronale": f"15/{current_month:02d}/{current_year}"
-    }
-
-    for tax, deadline in fiscal_deadlines.items():
-        st.info(f"**{tax}:** {deadline}")
\ No newline at end of file
+    for tax, deadline in upcoming_deadlines():
+        st.info(f"**{tax}:** {deadline.strftime('%d/%m/%Y')}")
@@ -1,9 +1,8 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime, timedelta
 from data.database import db
 from data.models import BusinessProfile
-import plotly.express as px
+from components.charts import render_series_chart
+from utils import kpi
 
 
 def show():
@@ -11,31 +10,29 @@ def show():
 
     # Charger les données
     profile = db.get_profile()
-    invoices = db.get_invoices()
-    clients = db.get_clients()
+    totals = db.get_totals()
+    kpis = kpi.dashboard_kpis(db)
 
-    # Métriques principales
+    # Métriques principales, comparées à la période précédente (cube d'analyse, utils/kpi.py)
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        total_revenue = sum(inv.total_amount for inv in invoices)
-        st.metric("Chiffre d'Affaires Total", f"{total_revenue:,.0f} DT", delta="12%")
+        st.metric("Chiffre d'Affaires Total", f"{totals['revenue']:,.0f} DT",
+                  kpis["ytd"].revenue.delta(), help="Écart : exercice à date, comparé aux mêmes mois de N-1")
 
     with col2:
-        active_clients = len(clients)
-        st.metric("Clients Actifs", active_clients, delta="+3")
+        active_clients = kpis["month"].active_clients
+        st.metric("Clients Actifs", active_clients.current, active_clients.delta(relative=False),
+                  help="Clients facturés ce mois, comparé au mois précédent")
 
     with col3:
-        pending_invoices = sum(1 for inv in invoices if inv.status == "envoyée")
-        st.metric("Factures en Attente", pending_invoices, delta="-2")
+        pending_invoices = kpis["month"].pending_invoices
+        st.metric("Factures en Attente", pending_invoices.current, pending_invoices.delta(relative=False),
+                  delta_color="inverse", help="Factures du mois en attente de paiement")
 
     with col4:
-        current_month = datetime.now().month
-        month_revenue = sum(
-            inv.total_amount for inv in invoices
-            if inv.date.month == current_month
-        )
-        st.metric("CA du Mois", f"{month_revenue:,.0f} DT")
+        month_revenue = kpis["month"].revenue
+        st.metric("CA du Mois", f"{month_revenue.current:,.0f} DT", month_revenue.delta())
 
     st.divider()
 
@@ -60,27 +57,14 @@ def show():
     with col_right:
         st.subheader("📈 Évolution du CA")
 
-        # Préparer les données pour le graphique
-        if invoices:
-            df_invoices = pd.DataFrame([{
-                'date': inv.date,
-                'montant': inv.total_amount
-            } for inv in invoices])
-
-            df_invoices['month'] = df_invoices['date'].dt.to_period('M')
-            monthly_data = df_invoices.groupby('month')['montant'].sum().reset_index()
-            monthly_data['month'] = monthly_data['month'].dt.to_timestamp()
-
-            fig = px.line(monthly_data, x='month', y='montant',
-                          title="Chiffre d'Affaires Mensuel",
-                          markers=True)
-            fig.update_layout(xaxis_title="Mois", yaxis_title="Montant (DT)")
-            st.plotly_chart(fig, use_container_width=True)
+        # Série sous-échantillonnée, pas choisi selon la fenêtre (utils/chart_series.py)
+        if totals['invoices']:
+            render_series_chart("dashboard_ca_window", title="Chiffre d'Affaires")
 
     # Dernières factures
     st.subheader("🧾 Dernières Factures")
-    if invoices:
-        recent_invoices = sorted(invoices, key=lambda x: x.date, reverse=True)[:5]
+    recent_invoices = db.get_invoices(limit=5)
+    if recent_invoices:
         for inv in recent_invoices:
             col1, col2, col3 = st.columns([2, 1, 1])
             with col1:
@@ -1,5 +1,4 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 import uuid
 from data.database import db
@@ -33,6 +32,8 @@ def show():
 
 def show_all_invoices():
     """Affiche toutes les factures"""
+    import pandas as pd
+
     invoices = db.get_invoices()
 
     if not invoices:
@@ -119,9 +120,12 @@ def create_invoice():
 
         # Sauvegarder
         db.add_invoice(new_invoice)
-        st.success(f"Facture {invoice_id} créée avec succès!")
+        st.session_state.created_invoice_id = invoice_id
 
-        # Options post-création
+    # Options post-création (hors du bouton de création : elles survivent au rechargement)
+    invoice_id = st.session_state.get('created_invoice_id')
+    if invoice_id:
+        st.success(f"Facture {invoice_id} créée avec succès!")
         col1, col2, col3 = st.columns(3)
         with col1:
             if st.button("📄 Générer PDF", use_container_width=True):
@@ -129,14 +133,36 @@ def create_invoice():
                 st.info("Fonction PDF à implémenter")
         with col2:
             if st.button("📧 Envoyer au client", use_container_width=True):
-                st.info("Fonction envoi email à implémenter")
+                send_invoice_email(invoice_id)
         with col3:
             if st.button("➕ Nouvelle facture", use_container_width=True):
+                del st.session_state.created_invoice_id
                 st.rerun()
 
 
+def send_invoice_email(invoice_id: str):
+    """Met la facture dans la file d'envoi ; l'expédition se fait dans un fil de fond"""
+    from utils import mailer
+
+    result = mailer.queue_invoices([invoice_id])
+    if result['skipped']:
+        st.warning("Le client n'a pas d'adresse email valide.")
+        return
+    if not result['queued']:
+        st.info("Un envoi de cette facture est déjà en attente.")
+    settings = mailer.SmtpSettings.from_env()
+    if settings is None:
+        st.warning("Serveur SMTP non configuré (TT_SMTP_HOST) : le message reste en file.")
+        return
+    mailer.dispatch_in_background(settings=settings)
+    st.success("Facture mise en file d'envoi.")
+
+
 def show_invoice_stats():
     """Affiche les statistiques des factures"""
+    import pandas as pd
+    import plotly.express as px
+
     invoices = db.get_invoices()
 
     if not invoices:
@@ -0,0 +1,71 @@
+"""Balance âgée des créances clients (non échu, 0-30, 31-60, 61-90, +90 jours).
+
+Le calcul est une seule requête groupée (Database.get_receivables_aging) ;
+le résultat est gardé dans le cache de la base (data/change_bus.py) tant
+que les factures et les clients ne changent pas, dans aucun processus.
+"""
+import csv
+import io
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import List, Optional
+
+from data.database import AGING_BOUNDS, db
+
+AGING_BUCKETS = ["Non échu"] + [
+    f"{low + 1 if low else 0}-{high} j" for low, high in zip((0,) + AGING_BOUNDS, AGING_BOUNDS)
+] + [f"+{AGING_BOUNDS[-1]} j"]
+
+
+@dataclass
+class AgingRow:
+    client_id: str
+    client_name: str
+    buckets: List[float]  # montants TTC dans l'ordre de AGING_BUCKETS
+    total: float
+    invoice_count: int
+    oldest_due: Optional[datetime]
+
+
+@dataclass
+class AgingReport:
+    as_of: date
+    version: int
+    rows: List[AgingRow] = field(default_factory=list)
+
+    @property
+    def totals(self) -> List[float]:
+        return [round(sum(row.buckets[i] for row in self.rows), 3) for i in range(len(AGING_BUCKETS))]
+
+    @property
+    def total(self) -> float:
+        return round(sum(row.total for row in self.rows), 3)
+
+    def to_csv(self) -> bytes:
+        """Export CSV (une ligne par client, puis le total)"""
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["Client", "Nom"] + AGING_BUCKETS + ["Total", "Factures", "Plus ancienne échéance"])
+        for row in self.rows:
+            writer.writerow([row.client_id, row.client_name, *row.buckets, row.total, row.invoice_count,
+                             row.oldest_due.strftime("%d/%m/%Y") if row.oldest_due else ""])
+        writer.writerow(["TOTAL", f"au {self.as_of.strftime('%d/%m/%Y')}", *self.totals, self.total,
+                         sum(row.invoice_count for row in self.rows), ""])
+        return output.getvalue().encode("utf-8")
+
+
+def receivables_aging(database=None, as_of: Optional[date] = None) -> AgingReport:
+    """Balance âgée à la date `as_of` (aujourd'hui par défaut), recalculée seulement si les données ont changé"""
+    database = database or db
+    as_of = as_of or date.today()
+
+    def build() -> AgingReport:
+        rows = [
+            AgingRow(client_id=r[0], client_name=r[1], buckets=list(r[2:2 + len(AGING_BUCKETS)]),
+                     total=r[-3], invoice_count=r[-2],
+                     oldest_due=datetime.fromisoformat(r[-1]) if r[-1] else None)
+            for r in database.get_receivables_aging(as_of)
+        ]
+        return AgingReport(as_of=as_of, version=database.get_data_version("invoices", "clients"), rows=rows)
+
+    return database.cache.get(("receivables_aging", as_of), ("invoices", "clients"), build)
@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Pool partagé par toutes les sessions : le thread du script Streamlit ne fait
+# que consommer la file de jetons, l'appel réseau se fait ici.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="assistant-stream")
+
+_DONE = object()
+
+
+class CompletionStream:
+    """Complétion OpenAI en streaming, exécutée dans un thread de travail"""
+
+    def __init__(self, messages, api_key, model="gpt-3.5-turbo", temperature=0.7,
+                 max_tokens=500, first_token_timeout=15.0, total_timeout=90.0):
+        self.messages = messages
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.first_token_timeout = first_token_timeout
+        self.total_timeout = total_timeout
+
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self._future = None
+
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+
+    def _run(self):
+        """Lit le flux OpenAI et pousse chaque fragment dans la file"""
+        import openai
+
+        try:
+            response = openai.ChatCompletion.create(
+                model=self.model,
+                messages=self.messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                api_key=self.api_key,
+                stream=True,
+                # Délai max entre deux lectures réseau (pas pour toute la réponse)
+                request_timeout=self.first_token_timeout
+            )
+            try:
+                for chunk in response:
+                    if self._cancelled.is_set():
+                        break
+                    content = chunk["choices"][0]["delta"].get("content")
+                    if content:
+                        self._queue.put(content)
+            finally:
+                # Ferme la connexion HTTP si l'utilisateur est parti
+                close = getattr(response, "close", None)
+                if close:
+                    close()
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            self._queue.put(_DONE)
+
+    def __iter__(self):
+        """Produit les fragments de texte au fur et à mesure de leur arrivée"""
+        self.started_at = time.perf_counter()
+        self._future = _executor.submit(self._run)
+        deadline = self.started_at + self.total_timeout
+
+        try:
+            while True:
+                now = time.perf_counter()
+                if self.first_token_at is None:
+                    timeout = min(self.first_token_timeout, deadline - now)
+                else:
+                    timeout = deadline - now
+                if timeout <= 0:
+                    raise TimeoutError("Délai de réponse dépassé")
+
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    if self.first_token_at is None:
+                        raise TimeoutError("Aucune réponse du modèle dans le délai imparti")
+                    raise TimeoutError("Délai de réponse dépassé")
+
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                yield item
+        finally:
+            # Appelé aussi quand Streamlit interrompt le script (navigation, rerun)
+            self.cancel()
+            self.finished_at = time.perf_counter()
+
+    def cancel(self):
+        """Demande l'arrêt du thread de travail"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def time_to_first_token(self):
+        """Temps jusqu'au premier jeton, en secondes"""
+        if self.started_at is None or self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def total_time(self):
+        """Temps total de la réponse, en secondes"""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+def render_stream(stream: CompletionStream, placeholder, min_interval: float = 0.05) -> str:
+    """Affiche la réponse dans un placeholder Streamlit au fil de l'eau"""
+    text = ""
+    last_render = 0.0
+    for fragment in stream:
+        text += fragment
+        # Regroupe les mises à jour pour ne pas saturer le websocket
+        now = time.perf_counter()
+        if now - last_render >= min_interval:
+            placeholder.markdown(text + "▌")
+            last_render = now
+    placeholder.markdown(text)
+    return text
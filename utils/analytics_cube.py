@@ -0,0 +1,302 @@
+"""Cube d'analyse des ventes et des achats, pré-agrégé et tenu à jour depuis le journal des modifications.
+
+Ventes : une cellule par mois × client × taux de TVA × statut (factures,
+HT, TVA, TTC) ; achats : une cellule par mois × catégorie. Les montants
+des lignes de facture sont ventilés par taux ; la facture elle-même n'est
+comptée qu'une fois, sous son taux principal (le plus fort HT), si bien
+que les nombres de factures restent exacts quel que soit le regroupement.
+
+Mise à jour incrémentale : refresh lit les changements du journal
+(data/change_log.py) postérieurs à son curseur, en déduit les mois
+touchés et recalcule ces mois seulement, dans la transaction qui avance le
+curseur. Recalculer un mois plutôt qu'appliquer des différences rend
+l'opération idempotente : deux processus qui rafraîchissent en même temps
+obtiennent le même cube. Les mois des exercices archivés ne sont plus
+recalculés (leurs lignes quittent la base courante, pas le cube).
+
+Les requêtes (sales, purchases) filtrent (where), regroupent (by) et
+agrègent par mois, trimestre ou année (grain) ; leur résultat est gardé
+dans le cache de la base tant que factures ou achats ne changent pas.
+
+Usage:
+    python -m utils.analytics_cube rebuild
+    python -m utils.analytics_cube sales --by period status --grain year
+"""
+import argparse
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from data.change_log import advance_cursor
+from data.database import db
+from utils.calculations import line_amounts
+
+CURSOR = "analytics_cube"  # consommateur du journal
+REFRESH_BATCH = 5000  # changements lus par transaction
+
+SALES_DIMENSIONS = ("period", "client_id", "tva_rate", "status")
+SALES_MEASURES = ("invoices", "total_ht", "tva", "total_ttc")
+PURCHASE_DIMENSIONS = ("period", "category")
+PURCHASE_MEASURES = ("purchases", "total", "tva")
+COUNT_MEASURES = ("invoices", "purchases")
+
+# Expression de la période selon le grain (les cellules sont mensuelles, 'AAAA-MM')
+GRAINS = {
+    "month": "month",
+    "quarter": "substr(month, 1, 4) || '-T' || ((CAST(substr(month, 6, 2) AS INTEGER) + 2) / 3)",
+    "year": "substr(month, 1, 4)",
+}
+
+# Colonnes dont la modification déplace une ligne dans le cube
+WATCHED_COLUMNS = {
+    "invoices": {"client_id", "date", "status", "items", "total_amount", "tva_amount"},
+    "purchases": {"date", "category", "total_amount", "tva_amount"},
+}
+
+
+# ================= CONSTRUCTION =================
+def _month(value) -> str:
+    return value.strftime("%Y-%m") if isinstance(value, datetime) else str(value)[:7]
+
+
+def _month_bounds(month: str) -> Tuple[str, str]:
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{month}-01", f"{year + number // 12}-{number % 12 + 1:02d}-01"
+
+
+def _sales_cells(rows: Iterable[tuple]) -> Dict[tuple, list]:
+    """(mois, client, taux, statut) -> [factures, HT, TVA, TTC] depuis (client, date, statut, lignes, TTC, TVA)"""
+    cells = {}
+    for client_id, day, status, items, total, tva in rows:
+        month = _month(day)
+        by_rate = {}
+        for item in json.loads(items) if items else []:
+            line_ht, rate, line_tva = line_amounts(item)
+            amounts = by_rate.setdefault(float(rate), [0.0, 0.0])
+            amounts[0] += line_ht
+            amounts[1] += line_tva
+        if not by_rate:
+            # Facture sans lignes détaillées : taux déduit des totaux
+            total_ht = total - tva
+            by_rate[round(tva / total_ht * 100, 1) if total_ht else 0.0] = [total_ht, tva]
+        principal = max(by_rate, key=lambda rate: by_rate[rate][0])
+        for rate, (line_ht, line_tva) in by_rate.items():
+            cell = cells.setdefault((month, client_id, rate, status), [0, 0.0, 0.0, 0.0])
+            cell[0] += rate == principal
+            cell[1] += line_ht
+            cell[2] += line_tva
+            cell[3] += line_ht + line_tva
+    return cells
+
+
+def _purchase_cells(rows: Iterable[tuple]) -> Dict[tuple, list]:
+    """(mois, catégorie) -> [achats, TTC, TVA] depuis (date, catégorie, TTC, TVA)"""
+    cells = {}
+    for day, category, total, tva in rows:
+        cell = cells.setdefault((_month(day), category), [0, 0.0, 0.0])
+        cell[0] += 1
+        cell[1] += total
+        cell[2] += tva
+    return cells
+
+
+def _insert(conn, sales: Dict[tuple, list], purchases: Dict[tuple, list]):
+    conn.executemany("""
+        INSERT INTO cube_sales (month, client_id, tva_rate, status, invoices, total_ht, tva, total_ttc)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(*key, count, round(ht, 3), round(tva, 3), round(ttc, 3))
+          for key, (count, ht, tva, ttc) in sales.items()])
+    conn.executemany("""
+        INSERT INTO cube_purchases (month, category, purchases, total, tva) VALUES (?, ?, ?, ?, ?)
+    """, [(*key, count, round(total, 3), round(tva, 3)) for key, (count, total, tva) in purchases.items()])
+
+
+def _recompute(conn, sales_months: set, purchase_months: set):
+    """Recalcule les cellules des mois donnés depuis les tables courantes (fil d'écriture)"""
+    archived = {year for (year,) in conn.execute("SELECT year FROM archived_years")}
+    sales, purchases = {}, {}
+    for month in sorted(sales_months):
+        if int(month[:4]) in archived:
+            continue
+        conn.execute("DELETE FROM cube_sales WHERE month = ?", (month,))
+        sales.update(_sales_cells(conn.execute("""
+            SELECT client_id, date, status, items, total_amount, tva_amount FROM invoices
+            WHERE date >= ? AND date < ?
+        """, _month_bounds(month))))
+    for month in sorted(purchase_months):
+        if int(month[:4]) in archived:
+            continue
+        conn.execute("DELETE FROM cube_purchases WHERE month = ?", (month,))
+        purchases.update(_purchase_cells(conn.execute(
+            "SELECT date, category, total_amount, tva_amount FROM purchases WHERE date >= ? AND date < ?",
+            _month_bounds(month))))
+    _insert(conn, sales, purchases)
+
+
+def _apply(conn, changes) -> int:
+    """Recalcule les mois touchés par un lot de changements et avance le curseur, dans la même transaction"""
+    months = {"invoices": set(), "purchases": set()}
+    undated = {"invoices": set(), "purchases": set()}
+    for change in changes:
+        if change.operation == "UPDATE" and not WATCHED_COLUMNS[change.table_name] & change.after.keys():
+            continue
+        dates = [values["date"] for values in (change.before, change.after) if values and values.get("date")]
+        months[change.table_name].update(_month(day) for day in dates)
+        if not dates:
+            # Modification sans changement de date : le mois est celui de la ligne courante
+            undated[change.table_name].add(change.row_key)
+    for table, keys in undated.items():
+        keys = list(keys)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            months[table].update(_month(day) for (day,) in conn.execute(
+                f"SELECT date FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+    _recompute(conn, months["invoices"], months["purchases"])
+    advance_cursor(conn, CURSOR, changes[-1].seq)
+    return len(months["invoices"]) + len(months["purchases"])
+
+
+def _replace(conn, sales: Dict[tuple, list], purchases: Dict[tuple, list], position: int):
+    conn.execute("DELETE FROM cube_sales")
+    conn.execute("DELETE FROM cube_purchases")
+    _insert(conn, sales, purchases)
+    advance_cursor(conn, CURSOR, position)
+
+
+def rebuild(database=None) -> int:
+    """Reconstruit tout le cube, exercices archivés compris ; retourne le nombre de cellules"""
+    database = database or db
+    with database.get_connection() as conn:
+        # Position relevée avant la lecture : les changements concurrents seront rejoués (recalcul idempotent)
+        position = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        sales = _sales_cells(database._read_partitions(
+            conn, "invoices", "client_id, date, status, items, total_amount, tva_amount", [], [], None, None))
+        purchases = _purchase_cells(database._read_partitions(
+            conn, "purchases", "date, category, total_amount, tva_amount", [], [], None, None))
+    database.writer.submit(_replace, sales, purchases, position).result()
+    return len(sales) + len(purchases)
+
+
+def refresh(database=None) -> int:
+    """Applique les changements du journal depuis le dernier rafraîchissement ; retourne leur nombre"""
+    database = database or db
+    position = database.get_change_cursor(CURSOR)
+    if position is None:
+        rebuild(database)
+        return 0
+    applied = 0
+    while True:
+        changes = database.get_changes(position, tuple(WATCHED_COLUMNS), REFRESH_BATCH)
+        if not changes:
+            return applied
+        database.writer.submit(_apply, changes).result()
+        position = changes[-1].seq
+        applied += len(changes)
+
+
+# ================= REQUÊTES =================
+def _cache_key(where: Optional[dict]) -> tuple:
+    return tuple(sorted((dimension, tuple(value) if isinstance(value, (list, set, tuple)) else value)
+                        for dimension, value in (where or {}).items()))
+
+
+def _query(database, table: str, dimensions: Sequence[str], measures: Sequence[str],
+           by: Sequence[str], where: Optional[dict], grain: str):
+    import pandas as pd
+
+    unknown = (set(by) | set(where or {})) - set(dimensions)
+    if unknown:
+        raise ValueError(f"dimension(s) inconnue(s) : {', '.join(sorted(unknown))}")
+    if grain not in GRAINS:
+        raise ValueError(f"grain inconnu : {grain!r} (month, quarter, year)")
+
+    columns = {dimension: dimension for dimension in dimensions}
+    columns["period"] = GRAINS[grain]
+    conditions, params = [], []
+    for dimension, value in (where or {}).items():
+        column = "month" if dimension == "period" else dimension
+        if dimension == "period" and isinstance(value, tuple):
+            # Intervalle de mois inclus ('AAAA-MM', 'AAAA-MM')
+            conditions.append(f"{column} BETWEEN ? AND ?")
+            params.extend(value)
+        elif dimension == "period":
+            # 'AAAA' ou 'AAAA-MM'
+            conditions.append(f"{column} LIKE ?")
+            params.append(f"{value}%")
+        elif isinstance(value, (list, set)):
+            conditions.append(f"{column} IN ({', '.join('?' * len(value))})")
+            params.extend(value)
+        else:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+
+    select = [f"{columns[dimension]} AS {dimension}" for dimension in by]
+    select += [f"SUM({measure})" if measure in COUNT_MEASURES else f"ROUND(SUM({measure}), 3)"
+               for measure in measures]
+    query = f"SELECT {', '.join(select)} FROM {table}"
+    if conditions:
+        query += f" WHERE {' AND '.join(conditions)}"
+    if by:
+        query += f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}"
+
+    with database.get_connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+    if not by and rows and rows[0][0] is None:
+        rows = []
+    return pd.DataFrame(rows, columns=[*by, *measures])
+
+
+def _cached_query(database, table, dimensions, measures, source, by, where, grain):
+    database = database or db
+    by = tuple(by)
+
+    def compute():
+        refresh(database)
+        return _query(database, table, dimensions, measures, by, where, grain)
+
+    return database.cache.get((table, by, _cache_key(where), grain), (source,), compute).copy()
+
+
+def sales(database=None, by: Sequence[str] = ("period",), where: Optional[dict] = None, grain: str = "month"):
+    """Ventes agrégées par `by` (parmi SALES_DIMENSIONS), filtrées par `where`, en DataFrame.
+
+    where : {dimension: valeur | [valeurs]} ; pour period, 'AAAA', 'AAAA-MM'
+    ou un intervalle de mois inclus ('AAAA-MM', 'AAAA-MM').
+    """
+    return _cached_query(database, "cube_sales", SALES_DIMENSIONS, SALES_MEASURES, "invoices", by, where, grain)
+
+
+def purchases(database=None, by: Sequence[str] = ("period",), where: Optional[dict] = None, grain: str = "month"):
+    """Achats agrégés par `by` (parmi PURCHASE_DIMENSIONS), même filtre que sales"""
+    return _cached_query(database, "cube_purchases", PURCHASE_DIMENSIONS, PURCHASE_MEASURES, "purchases",
+                         by, where, grain)
+
+
+def main():
+    from data.database import DEFAULT_DB_PATH, Database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="reconstruire tout le cube")
+    commands.add_parser("refresh", help="appliquer les changements du journal")
+    for name, dimensions in (("sales", SALES_DIMENSIONS), ("purchases", PURCHASE_DIMENSIONS)):
+        query = commands.add_parser(name, help=f"interroger le cube ({name})")
+        query.add_argument("--by", nargs="*", default=["period"], choices=dimensions)
+        query.add_argument("--grain", choices=GRAINS, default="month")
+        query.add_argument("--period", help="'AAAA' ou 'AAAA-MM'")
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    if args.command == "rebuild":
+        print(f"{rebuild(database)} cellules")
+    elif args.command == "refresh":
+        print(f"{refresh(database)} changements appliqués")
+    else:
+        where = {"period": args.period} if args.period else None
+        frame = (sales if args.command == "sales" else purchases)(database, args.by, where, args.grain)
+        print(frame.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
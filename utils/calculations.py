@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 
 def calculate_tva(amount_ht: float, tva_rate: float = 19.0) -> float:
@@ -12,6 +12,37 @@ def calculate_total_ttc(amount_ht: float, tva_rate: float = 19.0) -> float:
     return round(amount_ht * (1 + tva_rate / 100), 3)
 
 
+def line_amounts(item: Dict) -> Tuple[float, float, float]:
+    """(HT, taux, TVA) d'une ligne de facture, recalculés si la ligne ne les porte pas"""
+    total_ht = item.get('total_ht', item.get('quantity', 1) * item.get('unit_price', 0))
+    rate = item.get('tva_rate', 19.0)
+    return total_ht, rate, item.get('tva_amount', calculate_tva(total_ht, rate))
+
+
+def calculate_invoice_totals(items: List[Dict]) -> Dict:
+    """Calcule les lignes (HT, TVA, TTC) et les totaux d'une facture à partir de
+    description, quantity, unit_price et tva_rate"""
+    priced = []
+    for item in items:
+        total_ht = round(item['quantity'] * item['unit_price'], 3)
+        tva_amount = calculate_tva(total_ht, item.get('tva_rate', 19.0))
+        priced.append({
+            'description': item['description'],
+            'quantity': item['quantity'],
+            'unit_price': item['unit_price'],
+            'tva_rate': item.get('tva_rate', 19.0),
+            'total_ht': total_ht,
+            'tva_amount': tva_amount,
+            'total_ttc': round(total_ht + tva_amount, 3)
+        })
+    return {
+        'items': priced,
+        'total_ht': round(sum(item['total_ht'] for item in priced), 3),
+        'tva_amount': round(sum(item['tva_amount'] for item in priced), 3),
+        'total_ttc': round(sum(item['total_ttc'] for item in priced), 3)
+    }
+
+
 def calculate_profit(revenue: float, expenses: float) -> float:
     """Calcule le bénéfice"""
     return revenue - expenses
@@ -0,0 +1,210 @@
+"""Prévision de trésorerie : encaissements et décaissements jour par jour sur les prochains jours.
+
+Encaissements : chaque facture ouverte (envoyée, en retard, ou brouillon
+émis aujourd'hui à l'échéance du client) est répartie en parts égales
+sur les quantiles des retards de paiement observés chez son client sur
+l'année écoulée (tous clients confondus s'il a moins de MIN_HISTORY
+paiements). Une facture pas encore échue tombe à échéance + retard ; une
+facture déjà échue, à aujourd'hui + retard des seuls paiements tardifs.
+
+Décaissements : les achats non payés à leur date + SUPPLIER_TERMS jours
+(aujourd'hui s'ils sont déjà exigibles), et les dépenses récurrentes
+(RECURRING_CATEGORIES) projetées au même jour du mois que sur les
+RECURRING_MONTHS derniers mois, en moyenne.
+
+Tout le calcul est vectorisé (NumPy, une opération par tableau, aucune
+boucle par facture) ; le résultat est gardé dans le cache de la base tant
+que factures, achats et clients ne changent pas.
+
+Usage:
+    python -m utils.cash_forecast --days 90 --opening 25000
+"""
+import argparse
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from data.database import db
+
+HORIZON_DAYS = 90
+HISTORY_DAYS = 365  # paiements observés pour les retards
+MIN_HISTORY = 5  # paiements d'un client en deçà desquels on prend la distribution de tous les clients
+QUANTILES = np.linspace(0.05, 0.95, 10)  # une part de facture par quantile de retard
+SUPPLIER_TERMS = 30  # jours entre un achat et son paiement
+RECURRING_CATEGORIES = ("Carburant", "Salaires", "Loyer")
+RECURRING_MONTHS = 6
+
+SUPPLIERS = "Fournisseurs"  # décaissements des achats non payés
+
+
+@dataclass
+class CashForecast:
+    as_of: date
+    version: int
+    days: np.ndarray  # datetime64[D], à partir de as_of
+    inflows: np.ndarray
+    outflows: Dict[str, np.ndarray] = field(default_factory=dict)  # par source
+    beyond: float = 0.0  # encaissements attendus après l'horizon
+    open_receivables: int = 0
+    open_payables: int = 0
+
+    @property
+    def total_outflows(self) -> np.ndarray:
+        return sum(self.outflows.values(), np.zeros(len(self.days)))
+
+    @property
+    def net(self) -> np.ndarray:
+        return self.inflows - self.total_outflows
+
+    def balance(self, opening: float = 0.0) -> np.ndarray:
+        """Trésorerie en fin de journée"""
+        return opening + np.cumsum(self.net)
+
+    def to_frame(self, opening: float = 0.0):
+        import pandas as pd
+
+        frame = pd.DataFrame({"date": self.days, "encaissements": self.inflows})
+        for source, values in self.outflows.items():
+            frame[source] = values
+        frame["décaissements"] = self.total_outflows
+        frame["solde"] = self.balance(opening)
+        return frame.round(3)
+
+
+def _day(julian: np.ndarray) -> np.ndarray:
+    """Jour calendaire d'un jour julien (qui commence à midi)"""
+    return np.floor(julian + 0.5)
+
+
+def delay_quantiles(codes: np.ndarray, delays: np.ndarray, keys: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantiles QUANTILES des retards par client (codes 0..keys-1) : (matrice clients × quantiles, effectifs)"""
+    counts = np.bincount(codes, minlength=keys)
+    if not len(delays):
+        return np.zeros((keys, len(QUANTILES))), counts
+    # Un seul tri : par client, puis par retard
+    order = np.argsort(codes * (np.int64(delays.max() - delays.min()) + 1) + (delays - delays.min()))
+    starts = np.cumsum(counts) - counts
+    positions = starts[:, None] + np.floor(QUANTILES * np.maximum(counts - 1, 0)[:, None]).astype(np.int64)
+    return delays[order][np.minimum(positions, len(delays) - 1)], counts
+
+
+def _client_profiles(codes: np.ndarray, history_codes: np.ndarray, delays: np.ndarray, keys: int) -> np.ndarray:
+    """Quantiles de retard de chaque facture ouverte : ceux de son client, ou ceux de tous les clients"""
+    pooled = np.quantile(delays, QUANTILES, method="inverted_cdf") if len(delays) else np.zeros(len(QUANTILES))
+    quantiles, counts = delay_quantiles(history_codes, delays, keys)
+    known = counts[codes] >= MIN_HISTORY
+    return np.where(known[:, None], quantiles[codes], pooled)
+
+
+def project_receivables(today: float, horizon: int, codes: np.ndarray, due: np.ndarray, amounts: np.ndarray,
+                        history_codes: np.ndarray, history_delays: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Encaissements par jour (index 0 = today, jour julien) et montant attendu au-delà de l'horizon.
+
+    codes et history_codes numérotent les clients de 0 à n-1 (factures
+    ouvertes et paiements observés), due est en jours juliens.
+    """
+    keys = int(max(codes.max(initial=-1), history_codes.max(initial=-1))) + 1
+    overdue = _day(due) < _day(today)
+    late = history_delays > 0
+    on_time_profile = _client_profiles(codes, history_codes, history_delays, keys)
+    late_profile = _client_profiles(codes[overdue], history_codes[late], history_delays[late], keys)
+    # Jour d'encaissement de chaque part : échéance + retard, ou aujourd'hui + retard tardif si déjà échue
+    pay = (_day(due) - _day(today))[:, None] + on_time_profile
+    pay[overdue] = late_profile
+    pay = np.maximum(pay, 0).astype(np.int64)
+    shares = np.broadcast_to(amounts[:, None] / len(QUANTILES), pay.shape)
+    inside = pay < horizon
+    inflows = np.bincount(pay[inside], weights=shares[inside], minlength=horizon)
+    return inflows, float(shares[~inside].sum())
+
+
+def project_payables(today: float, horizon: int, dates: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+    """Décaissements des achats non payés : date + SUPPLIER_TERMS, au plus tôt aujourd'hui"""
+    pay = np.maximum(_day(dates) + SUPPLIER_TERMS - _day(today), 0).astype(np.int64)
+    inside = pay < horizon
+    return np.bincount(pay[inside], weights=amounts[inside], minlength=horizon)
+
+
+def project_recurring(days: np.ndarray, history_days: np.ndarray, amounts: np.ndarray, months: int) -> np.ndarray:
+    """Dépense moyenne par jour du mois sur l'historique, reportée sur les `days` à venir"""
+    def day_of_month(values):
+        return (values - values.astype("datetime64[M]")).astype(np.int64)
+
+    profile = np.bincount(day_of_month(history_days), weights=amounts, minlength=31) / months
+    return profile[day_of_month(days)]
+
+
+def forecast(database=None, as_of: Optional[date] = None, horizon: int = HORIZON_DAYS) -> CashForecast:
+    """Prévision sur `horizon` jours à partir de `as_of` (aujourd'hui), recalculée seulement si les données ont changé"""
+    database = database or db
+    as_of = as_of or date.today()
+
+    def build() -> CashForecast:
+        today = float(np.datetime64(as_of, "D").astype(np.int64)) + 2440587.5  # jour julien à minuit
+        days = np.arange(np.datetime64(as_of, "D"), np.datetime64(as_of + timedelta(days=horizon), "D"))
+
+        receivables = database.get_open_receivables(as_of)
+        history = database.get_payment_delays(as_of - timedelta(days=HISTORY_DAYS))
+        if receivables:
+            import pandas as pd
+
+            open_items = pd.DataFrame.from_records(receivables, columns=["client", "due", "amount"])
+            paid = pd.DataFrame.from_records(history, columns=["client", "delay"])
+            # Clients numérotés ensemble pour les factures ouvertes et les paiements observés
+            codes, _ = pd.factorize(pd.concat([open_items["client"], paid["client"]], ignore_index=True))
+            inflows, beyond = project_receivables(today, horizon, codes[:len(open_items)],
+                                                  open_items["due"].to_numpy(float),
+                                                  open_items["amount"].to_numpy(float), codes[len(open_items):],
+                                                  paid["delay"].to_numpy(np.int64))
+        else:
+            inflows, beyond = np.zeros(horizon), 0.0
+
+        outflows = {}
+        payables = database.get_unpaid_purchases()
+        if payables:
+            dates, amounts = map(np.array, zip(*payables))
+            outflows[SUPPLIERS] = project_payables(today, horizon, dates, amounts)
+
+        start = as_of - timedelta(days=RECURRING_MONTHS * 365 // 12)
+        spending = database.get_purchases_by_day(list(RECURRING_CATEGORIES), start, as_of)
+        if spending:
+            categories, spent_on, amounts = map(np.array, zip(*spending))
+            spent_on = spent_on.astype("datetime64[D]")
+            for category in RECURRING_CATEGORIES:
+                selected = categories == category
+                if selected.any():
+                    outflows[category] = project_recurring(days, spent_on[selected], amounts[selected],
+                                                           RECURRING_MONTHS)
+
+        return CashForecast(as_of=as_of, version=database.get_data_version("invoices", "purchases", "clients"),
+                            days=days, inflows=inflows, outflows=outflows, beyond=round(beyond, 3),
+                            open_receivables=len(receivables), open_payables=len(payables))
+
+    return database.cache.get(("cash_forecast", as_of, horizon), ("invoices", "purchases", "clients"), build)
+
+
+def main():
+    from data.database import DEFAULT_DB_PATH, Database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--days", type=int, default=HORIZON_DAYS)
+    parser.add_argument("--as-of", type=date.fromisoformat, help="AAAA-MM-JJ (aujourd'hui par défaut)")
+    parser.add_argument("--opening", type=float, default=0.0, help="trésorerie de départ (DT)")
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.exit(1, "Erreur : --days doit être positif\n")
+
+    result = forecast(Database(args.db), args.as_of, args.days)
+    frame = result.to_frame(args.opening)
+    frame["semaine"] = frame["date"].dt.to_period("W").dt.start_time.dt.date
+    print(frame.drop(columns="date").groupby("semaine").agg(
+        {column: "last" if column == "solde" else "sum" for column in frame.columns[1:-1]}).to_string())
+    print(f"\n{result.open_receivables} factures ouvertes, {result.open_payables} achats non payés ; "
+          f"{result.beyond:,.3f} DT attendus après {args.days} jours")
+
+
+if __name__ == "__main__":
+    main()
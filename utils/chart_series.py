@@ -0,0 +1,159 @@
+"""Séries temporelles des graphiques : regroupement, sous-échantillonnage LTTB et figures en cache.
+
+Une série (ventes ou achats TTC) est lue par jour (Database.get_daily_totals,
+exercices archivés compris), jours sans écriture à zéro, puis regroupée par
+le pas le plus fin (jour, semaine, mois) qui garde au plus OVERSAMPLING fois
+le nombre de points demandé pour la fenêtre affichée. Au-delà du nombre de
+points, Largest-Triangle-Three-Buckets (Steinarsson, 2013) retient les
+points qui conservent la forme de la courbe (pics et creux compris) : le
+navigateur reçoit quelques centaines de points quelle que soit la durée.
+
+Resserrer la fenêtre (start, end) relit la même série à un pas plus fin :
+c'est le zoom, les graphiques Streamlit ne renvoyant pas le zoom Plotly au
+serveur. La figure est gardée dans le cache de la base par fenêtre et
+nombre de points, tant que les tables lues ne changent pas : une
+réexécution ne la reconstruit pas, Streamlit n'a plus qu'à la sérialiser
+(quelques centaines de points). Garder le JSON plutôt que la figure
+coûterait plus cher : la relecture par plotly.io.from_json revalide tout.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from data.database import db
+
+DEFAULT_POINTS = 400  # points par courbe et par fenêtre
+OVERSAMPLING = 4  # buckets au plus par point affiché avant LTTB
+
+MEASURES = {
+    "ventes": ("invoices", "Ventes TTC"),
+    "achats": ("purchases", "Achats TTC"),
+}
+BUCKETS = {"day": "jour", "week": "semaine", "month": "mois"}
+
+
+@dataclass
+class Series:
+    measure: str
+    bucket: str
+    x: np.ndarray  # début de chaque bucket, datetime64[D]
+    y: np.ndarray
+    buckets: int  # points avant sous-échantillonnage
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices des `threshold` points retenus par Largest-Triangle-Three-Buckets (premier et dernier inclus)"""
+    size = len(y)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Buckets intérieurs de taille égale entre le premier et le dernier point
+    edges = np.linspace(1, size - 1, threshold - 1).astype(int)
+    # Moyenne de chaque bucket, cible du triangle du bucket précédent
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:size - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:size - 1], edges[:-1] - 1) / counts
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, size - 1
+    previous = 0
+    for i in range(threshold - 2):
+        low, high = edges[i], edges[i + 1]
+        next_x, next_y = (mean_x[i + 1], mean_y[i + 1]) if i + 1 < len(counts) else (x[-1], y[-1])
+        # Aire (au facteur 1/2 près) du triangle point retenu / candidat / moyenne du bucket suivant
+        areas = np.abs((x[previous] - next_x) * (y[low:high] - y[previous])
+                       - (x[previous] - x[low:high]) * (next_y - y[previous]))
+        previous = low + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def choose_bucket(start: date, end: date, points: int) -> str:
+    """Pas le plus fin qui garde au plus OVERSAMPLING × points buckets sur [start, end)"""
+    days = (end - start).days
+    if days <= points * OVERSAMPLING:
+        return "day"
+    if days // 7 <= points * OVERSAMPLING:
+        return "week"
+    return "month"
+
+
+def _bucket_starts(days: np.ndarray, bucket: str) -> np.ndarray:
+    if bucket == "week":
+        # 1970-01-01 est un jeudi : recul au lundi
+        return days - (days.astype(np.int64) + 3) % 7
+    if bucket == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    return days
+
+
+def bounds(database=None, measures: Sequence[str] = ("ventes",), start: Optional[date] = None,
+           end: Optional[date] = None) -> Tuple[date, date]:
+    """Fenêtre complétée par défaut du premier jour au lendemain du dernier jour des séries `measures`"""
+    database = database or db
+    if start is None or end is None:
+        days = []
+        for measure in measures:
+            rows = database.get_daily_totals(MEASURES[measure][0])
+            days += [row[0] for row in rows[:1] + rows[-1:]]
+        if not days:
+            today = date.today()
+            return start or today, end or today + timedelta(days=1)
+        start = start or date.fromisoformat(min(days))
+        end = end or date.fromisoformat(max(days)) + timedelta(days=1)
+    return start, end
+
+
+def series(database=None, measure: str = "ventes", start: Optional[date] = None, end: Optional[date] = None,
+           points: int = DEFAULT_POINTS, bucket: Optional[str] = None) -> Series:
+    """Série de `measure` sur [start, end), regroupée par `bucket` (choisi si None) et réduite à `points`"""
+    database = database or db
+    if measure not in MEASURES:
+        raise ValueError(f"mesure inconnue : {measure!r} ({', '.join(MEASURES)})")
+    if bucket is not None and bucket not in BUCKETS:
+        raise ValueError(f"pas inconnu : {bucket!r} ({', '.join(BUCKETS)})")
+    start, end = bounds(database, (measure,), start, end)
+    bucket = bucket or choose_bucket(start, end, points)
+
+    # Tous les jours de la fenêtre, à zéro quand rien n'a été écrit
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D"))
+    values = np.zeros(len(days))
+    rows = database.get_daily_totals(MEASURES[measure][0], start, end)
+    if rows:
+        keys, totals = zip(*rows)
+        values[(np.array(keys, dtype="datetime64[D]") - days[0]).astype(np.int64)] = totals
+
+    starts = _bucket_starts(days, bucket)
+    x, first = np.unique(starts, return_index=True)
+    y = np.add.reduceat(values, first) if len(values) else values
+    keep = lttb(x.astype(np.int64), y, points)
+    return Series(measure=measure, bucket=bucket, x=x[keep], y=np.round(y[keep], 3), buckets=len(x))
+
+
+def figure(database=None, measures: Sequence[str] = ("ventes",), start: Optional[date] = None,
+           end: Optional[date] = None, points: int = DEFAULT_POINTS, title: Optional[str] = None):
+    """Figure Plotly des séries `measures` sur la fenêtre, gardée en cache (partagée : ne pas la modifier)"""
+    import plotly.graph_objects as go
+
+    database = database or db
+    measures = tuple(measures)
+    tables = tuple(sorted({MEASURES[measure][0] for measure in measures}))
+
+    def build():
+        window = bounds(database, measures, start, end)
+        figure = go.Figure()
+        bucket = None
+        for measure in measures:
+            data = series(database, measure, *window, points)
+            bucket = data.bucket
+            # Dates en texte : la sérialisation de datetime64 par Plotly est plus lente
+            figure.add_trace(go.Scatter(x=np.datetime_as_string(data.x), y=data.y, mode="lines",
+                                        name=MEASURES[measure][1]))
+        figure.update_layout(title=title, xaxis_title=f"Période (par {BUCKETS[bucket]})" if bucket else None,
+                             yaxis_title="Montant (DT)", hovermode="x unified",
+                             margin={"l": 10, "r": 10, "t": 40 if title else 10, "b": 10})
+        return figure
+
+    return database.cache.get(("chart_figure", measures, start, end, points, title), tables, build)
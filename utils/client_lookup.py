@@ -0,0 +1,265 @@
+"""Recherche de clients à la saisie : préfixes (trie) et trigrammes (fautes de frappe).
+
+L'index tient en mémoire, un par base et par processus, construit une fois
+depuis Database.get_clients(). Termes : chaque mot du nom (minuscules sans
+accents) et le matricule fiscal sans séparateurs ('1234567/A/M/000' ->
+'1234567am000'). Une recherche garde d'abord les clients dont chaque mot
+saisi commence un terme, les noms les plus courts en premier ; s'il en
+manque, elle complète par fautes de frappe : chaque mot saisi est comparé
+aux termes distincts par similarité de trigrammes (Dice), un client valant
+la moyenne, sur les mots saisis, de son terme le plus proche.
+
+Le trie ne descend qu'à MAX_DEPTH caractères (au-delà, les clients du nœud
+sont filtrés sur leurs termes) et chaque nœud garde ses clients triés, calculés
+à la première lecture : une saisie ne parcourt que les premiers résultats.
+
+Les créations, modifications et suppressions de clients sont appliquées
+une à une depuis le journal des modifications (data/change_log.py) dès que
+la version de la table change : pas de reconstruction, et les écritures
+des autres processus sont vues aussi.
+
+Usage:
+    python -m utils.client_lookup "transp sfax"
+"""
+import argparse
+import heapq
+import re
+import threading
+from collections import Counter
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from data.database import db
+from data.models import Client
+from utils.fiscal_knowledge import normalize
+
+DEFAULT_LIMIT = 8
+MAX_DEPTH = 8  # caractères indexés par le trie
+MIN_SIMILARITY = 0.3  # Dice des trigrammes en deçà duquel un terme n'est pas rapproché d'un mot saisi
+PREFIX_SCORE = 1.0  # les correspondances par préfixe passent avant les approchantes
+
+
+def compact_matricule(value: str) -> str:
+    """Matricule fiscal sans séparateurs, en minuscules"""
+    return re.sub(r"[^a-z0-9]", "", normalize(value or ""))
+
+
+def name_words(value: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", normalize(value or ""))
+
+
+def trigrams(value: str) -> Set[str]:
+    """Trigrammes d'un terme, complété au début seulement : une saisie partielle reste proche"""
+    padded = f"  {value}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Node:
+    __slots__ = ("children", "ids", "ranked")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.ids: Set[str] = set()  # clients dont un terme passe par ce nœud
+        self.ranked: Optional[List[str]] = None  # ids triés par rang, calculés à la première lecture
+
+
+class ClientIndex:
+    """Trie des préfixes et index inversé des trigrammes sur les termes des clients"""
+
+    def __init__(self, clients: Iterable[Client] = ()):
+        self.clients: Dict[str, Client] = {}
+        self._root = _Node()
+        self._terms: Dict[str, Set[str]] = {}  # terme -> clients
+        self._trigrams: Dict[str, Set[str]] = {}  # trigramme -> termes
+        self._keys: Dict[str, List[str]] = {}  # client -> termes
+        self._rank: Dict[str, Tuple[int, str]] = {}  # noms les plus courts d'abord : « Sotra » avant « Sotra Sud »
+        self.position = 0  # dernier changement du journal appliqué
+        self.version: Optional[int] = None
+        for client in clients:
+            self.add(client)
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def add(self, client: Client):
+        """Ajoute ou remplace un client"""
+        self.discard(client.id)
+        matricule = compact_matricule(client.matricule_fiscal)
+        keys = list(dict.fromkeys(name_words(client.name) + ([matricule] if matricule else [])))
+        for key in keys:
+            node = self._root
+            for char in key[:MAX_DEPTH]:
+                node = node.children.get(char) or node.children.setdefault(char, _Node())
+                node.ids.add(client.id)
+                node.ranked = None
+            if key not in self._terms:
+                self._terms[key] = set()
+                for gram in trigrams(key):
+                    self._trigrams.setdefault(gram, set()).add(key)
+            self._terms[key].add(client.id)
+        self.clients[client.id] = client
+        self._keys[client.id] = keys
+        self._rank[client.id] = (len(client.name), normalize(client.name))
+
+    def discard(self, client_id: str):
+        if client_id not in self._keys:
+            return
+        for key in self._keys.pop(client_id):
+            node = self._root
+            for char in key[:MAX_DEPTH]:
+                node = node.children[char]
+                node.ids.discard(client_id)
+                node.ranked = None
+            self._terms[key].discard(client_id)
+            if not self._terms[key]:
+                del self._terms[key]
+                for gram in trigrams(key):
+                    self._trigrams[gram].discard(key)
+        del self.clients[client_id], self._rank[client_id]
+
+    def _node(self, prefix: str) -> _Node:
+        node = self._root
+        for char in prefix[:MAX_DEPTH]:
+            node = node.children.get(char)
+            if node is None:
+                return _Node()
+        if node.ranked is None:
+            node.ranked = sorted(node.ids, key=self._rank.__getitem__)
+        return node
+
+    def _prefixed(self, words: List[str], limit: int) -> List[str]:
+        """Les `limit` premiers clients (par rang) dont chaque mot commence un terme"""
+        nodes = sorted((self._node(word) for word in words), key=lambda node: len(node.ids))
+        others = [node.ids for node in nodes[1:]]
+        long_words = [word for word in words if len(word) > MAX_DEPTH]
+        matches = (client_id for client_id in nodes[0].ranked or ()
+                   if all(client_id in ids for ids in others)
+                   and all(any(key.startswith(word) for key in self._keys[client_id]) for word in long_words))
+        return list(islice(matches, limit))
+
+    def _similar(self, word: str) -> Dict[str, float]:
+        """Termes proches d'un mot saisi : terme -> similarité de Dice des trigrammes"""
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+        similar = {}
+        for term, count in shared.items():
+            # Le terme compte au plus len(term) trigrammes : inutile de les recalculer s'il ne peut atteindre le seuil
+            if 2 * count >= MIN_SIMILARITY * (len(grams) + count):
+                score = 2 * count / (len(grams) + len(term))
+                if score >= MIN_SIMILARITY:
+                    similar[term] = score
+        return similar
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> List[Tuple[Client, float]]:
+        """Meilleurs clients pour une saisie partielle : (client, score), préfixes d'abord"""
+        words = name_words(query)
+        if not words:
+            return []
+        # Chaque mot saisi commence un terme du nom, ou la saisie (avec des chiffres) commence le matricule
+        matricule = compact_matricule(query) if re.search(r"\d", query) else None
+        found = dict.fromkeys(self._prefixed(words, limit) + (self._prefixed([matricule], limit) if matricule else []))
+        ranked = sorted(found, key=self._rank.__getitem__)[:limit]
+        results = [(self.clients[client_id], PREFIX_SCORE) for client_id in ranked]
+        if len(results) >= limit:
+            return results
+
+        # Complément approchant : moyenne, sur les mots saisis d'au moins trois lettres, du terme le plus proche
+        typed = [word for word in words if len(word) >= 3]
+        scores = Counter()
+        for word in typed:
+            best: Dict[str, float] = {}
+            for term, score in self._similar(word).items():
+                for client_id in self._terms[term]:
+                    if score > best.get(client_id, 0.0):
+                        best[client_id] = score
+            scores.update(best)
+        scores = {client_id: score / len(typed) for client_id, score in scores.items()}
+        if matricule and len(words) > 1:
+            for term, score in self._similar(matricule).items():
+                for client_id in self._terms[term]:
+                    scores[client_id] = max(score, scores.get(client_id, 0.0))
+        best = heapq.nsmallest(limit - len(results),
+                               [(-score, self._rank[client_id], client_id) for client_id, score in scores.items()
+                                if score >= MIN_SIMILARITY and client_id not in found])
+        return results + [(self.clients[client_id], round(-score, 3)) for score, _, client_id in best]
+
+
+_indexes: Dict[str, ClientIndex] = {}
+_lock = threading.Lock()
+
+
+def _refresh(database, index: ClientIndex):
+    """Applique au vol les changements de clients écrits depuis la dernière lecture"""
+    while True:
+        changes = database.get_changes(index.position, ("clients",))
+        if not changes:
+            return
+        touched = {change.row_key for change in changes}
+        current = {client.id: client for client in database.get_clients_by_id(list(touched))}
+        for client_id in touched:
+            if client_id in current:
+                index.add(current[client_id])
+            else:
+                index.discard(client_id)
+        index.position = changes[-1].seq
+
+
+def _current(database) -> ClientIndex:
+    """Index de la base, construit ou mis à jour (à appeler sous _lock)"""
+    index = _indexes.get(database.db_path)
+    version = database.get_data_version("clients")
+    if index is None:
+        with database.get_connection() as conn:
+            # Position relevée avant la lecture : un client écrit entre-temps sera réappliqué
+            position = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        index = _indexes[database.db_path] = ClientIndex(database.get_clients())
+        index.position = position
+    elif index.version != version:
+        _refresh(database, index)
+    index.version = version
+    return index
+
+
+def get_index(database=None) -> ClientIndex:
+    """Index des clients de la base, construit au premier appel puis tenu à jour.
+
+    L'index est partagé entre les sessions : hors d'un seul fil (ligne de
+    commande, benchmarks), passer par search(), qui le lit sous verrou.
+    """
+    with _lock:
+        return _current(database or db)
+
+
+def search(query: str, limit: int = DEFAULT_LIMIT, database=None) -> List[Tuple[Client, float]]:
+    # Sous le même verrou que les mises à jour : une autre session peut appliquer le journal en parallèle
+    with _lock:
+        return _current(database or db).search(query, limit)
+
+
+def main():
+    import time
+
+    from data.database import DEFAULT_DB_PATH, Database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("query")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    started = time.perf_counter()
+    index = get_index(database)
+    built = time.perf_counter()
+    results = index.search(args.query, args.limit)
+    done = time.perf_counter()
+    for client, score in results:
+        print(f"{score:5.2f}  {client.id:<12} {client.matricule_fiscal:<18} {client.name}")
+    print(f"\n{len(index)} clients indexés en {(built - started) * 1e3:.0f} ms ; "
+          f"recherche en {(done - built) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from utils.calculations import calculate_tva, calculate_total_ttc
+
+# ================= RÈGLES FISCALES LOCALES =================
+TVA_RATES = [7, 13, 19]
+DEFAULT_TVA_RATE = 19
+
+# (nom, jour, mois) - mois None = échéance mensuelle, sinon échéance annuelle
+FISCAL_DEADLINES = [
+    ("TVA Mensuelle", 20, None),
+    ("Déclaration Annuelle", 25, 3),
+    ("Impôt sur les Sociétés", 25, 4),
+    ("CNSS Patronale", 15, None),
+]
+
+
+@dataclass
+class Passage:
+    id: str
+    title: str
+    text: str
+    keywords: List[str] = field(default_factory=list)
+
+
+PASSAGES = [
+    Passage(
+        "tva_taux", "Taux de TVA",
+        "La TVA tunisienne comporte trois taux : 19% (taux normal, applicable notamment "
+        "aux prestations de transport de marchandises), 13% (taux intermédiaire) et 7% "
+        "(taux réduit). Le taux normal s'applique par défaut lorsqu'aucun taux spécifique "
+        "n'est prévu.",
+        ["taux", "tva", "normal", "reduit", "pourcentage"]
+    ),
+    Passage(
+        "tva_calcul", "Calcul de la TVA",
+        "La TVA se calcule sur le montant hors taxes : TVA = HT × taux. Le montant TTC "
+        "est HT + TVA, soit HT × (1 + taux). Les montants sont arrondis au millime "
+        "(3 décimales) en dinars tunisiens.",
+        ["calcul", "calculer", "ht", "ttc", "montant", "formule"]
+    ),
+    Passage(
+        "tva_declaration", "Déclaration mensuelle de TVA",
+        "Les entreprises au régime réel déposent une déclaration mensuelle de TVA avant "
+        "le 20 du mois suivant. La TVA à payer est la TVA collectée sur les ventes moins "
+        "la TVA déductible sur les achats ; un excédent constitue un crédit de TVA "
+        "reportable sur les mois suivants.",
+        ["declaration", "declarer", "mensuelle", "collectee", "deductible", "credit", "payer"]
+    ),
+    Passage(
+        "tva_deductible", "TVA déductible sur achats",
+        "La TVA supportée sur les achats est déductible si la facture fournisseur est "
+        "régulière : identité et matricule fiscal du fournisseur, numéro et date de la "
+        "facture, montant HT, taux et montant de TVA. Une même facture fournisseur ne "
+        "doit être déduite qu'une seule fois.",
+        ["deductible", "achat", "fournisseur", "deduction", "recuperer"]
+    ),
+    Passage(
+        "facture_mentions", "Mentions obligatoires d'une facture",
+        "Une facture doit comporter : numéro séquentiel, date, nom, adresse et matricule "
+        "fiscal du vendeur et du client, désignation des prestations, quantité, prix "
+        "unitaire hors taxes, taux et montant de la TVA, total HT et total TTC.",
+        ["facture", "mentions", "obligatoires", "matricule", "numero"]
+    ),
+    Passage(
+        "declaration_annuelle", "Déclaration annuelle",
+        "La déclaration annuelle de l'exercice est déposée au plus tard le 25 mars de "
+        "l'année suivante, accompagnée des états financiers (bilan, état de résultat, "
+        "état des flux de trésorerie) et des annexes.",
+        ["annuelle", "exercice", "bilan", "etats", "financiers", "documents"]
+    ),
+    Passage(
+        "impot_societes", "Impôt sur les sociétés",
+        "L'impôt sur les sociétés est liquidé sur le bénéfice de l'exercice et déclaré "
+        "au plus tard le 25 avril de l'année suivante pour les SARL. Le bénéfice fiscal "
+        "part du résultat comptable corrigé des charges non déductibles.",
+        ["impot", "societes", "is", "benefice", "sarl", "resultat"]
+    ),
+    Passage(
+        "cnss", "Cotisations CNSS",
+        "Les cotisations CNSS patronales et salariales sur les salaires versés sont "
+        "déclarées et payées avant le 15 du mois d'échéance, sur la base de la masse "
+        "salariale déclarée.",
+        ["cnss", "cotisations", "salaires", "patronale", "sociale"]
+    ),
+    Passage(
+        "optimisation", "Optimisation fiscale légitime",
+        "Les leviers légitimes : déduire toute la TVA récupérable sur achats justifiés, "
+        "amortir les véhicules et équipements, provisionner les créances douteuses "
+        "justifiées, respecter les échéances pour éviter les pénalités de retard.",
+        ["optimiser", "optimisation", "reduire", "impots", "amortissement", "penalites"]
+    ),
+    Passage(
+        "penalites", "Pénalités de retard",
+        "Un dépôt ou un paiement après l'échéance entraîne des pénalités de retard "
+        "calculées sur le montant de l'impôt dû et par mois ou fraction de mois de "
+        "retard. Une déclaration néant doit être déposée même sans opération.",
+        ["retard", "penalite", "penalites", "amende", "neant"]
+    ),
+]
+
+
+# ================= TOKENISATION =================
+STOPWORDS = {
+    "le", "la", "les", "un", "une", "des", "de", "du", "d", "l", "et", "ou", "a", "au",
+    "aux", "en", "sur", "pour", "par", "dans", "avec", "est", "sont", "ce", "ces",
+    "cette", "qui", "que", "quoi", "quel", "quelle", "quels", "quelles", "comment",
+    "je", "j", "mon", "ma", "mes", "nous", "vous", "il", "elle", "on", "se", "sa",
+    "son", "ses", "ne", "pas", "plus", "qu", "y", "s", "t", "faut", "doit", "dois"
+}
+
+
+def normalize(text: str) -> str:
+    """Minuscules sans accents"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """Découpe un texte en termes indexables"""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", normalize(text)):
+        if word in STOPWORDS:
+            continue
+        # Racinisation minimale : pluriels
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+# ================= INDEX TF-IDF =================
+class FiscalIndex:
+    """Index lexical TF-IDF sur les passages fiscaux"""
+
+    def __init__(self, passages: List[Passage]):
+        self.passages = passages
+        self.postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        self.idf: Dict[str, float] = {}
+
+        doc_terms = []
+        df = Counter()
+        for passage in passages:
+            # Le titre et les mots-clés comptent double
+            terms = Counter(tokenize(passage.text))
+            for term in tokenize(passage.title) + tokenize(" ".join(passage.keywords)):
+                terms[term] += 2
+            doc_terms.append(terms)
+            df.update(terms.keys())
+
+        n = len(passages)
+        self.idf = {term: math.log(1 + n / count) for term, count in df.items()}
+
+        for doc_id, terms in enumerate(doc_terms):
+            weights = {t: (1 + math.log(tf)) * self.idf[t] for t, tf in terms.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for term, weight in weights.items():
+                self.postings[term].append((doc_id, weight / norm))
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.05) -> List[Tuple[Passage, float]]:
+        """Retourne les k passages les plus pertinents"""
+        scores = defaultdict(float)
+        for term, tf in Counter(tokenize(query)).items():
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            q_weight = (1 + math.log(tf)) * idf
+            for doc_id, weight in self.postings[term]:
+                scores[doc_id] += q_weight * weight
+
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        return [(self.passages[doc_id], score) for doc_id, score in ranked[:k] if score >= min_score]
+
+
+_index = None
+
+
+def get_index() -> FiscalIndex:
+    """Index construit une seule fois par processus"""
+    global _index
+    if _index is None:
+        _index = FiscalIndex(PASSAGES)
+    return _index
+
+
+def retrieve(question: str, k: int = 3) -> List[Passage]:
+    """Passages les plus pertinents pour une question"""
+    return [passage for passage, _ in get_index().search(question, k)]
+
+
+def build_context(question: str, k: int = 3) -> str:
+    """Extraits de référence à injecter dans le prompt"""
+    passages = retrieve(question, k)
+    if not passages:
+        return ""
+    return "\n".join(f"- {p.title} : {p.text}" for p in passages)
+
+
+# ================= RÉPONSES DÉTERMINISTES =================
+def next_deadline(day: int, month: Optional[int], today: date) -> date:
+    """Prochaine occurrence d'une échéance"""
+    if month is None:
+        candidate = date(today.year, today.month, day)
+        if candidate < today:
+            year = today.year + (today.month == 12)
+            candidate = date(year, today.month % 12 + 1, day)
+        return candidate
+    candidate = date(today.year, month, day)
+    if candidate < today:
+        candidate = date(today.year + 1, month, day)
+    return candidate
+
+
+def upcoming_deadlines(today: Optional[date] = None) -> List[Tuple[str, date]]:
+    """Échéances fiscales à venir, triées par date"""
+    today = today or datetime.now().date()
+    deadlines = [(name, next_deadline(day, month, today)) for name, day, month in FISCAL_DEADLINES]
+    return sorted(deadlines, key=lambda x: x[1])
+
+
+CURRENCY_PATTERN = re.compile(r"(\d[\d\s]*(?:[.,]\d+)?)\s*(?:dt|tnd|dinars?)\b", re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r"\d[\d\s]*(?:[.,]\d+)?")
+RATE_PATTERN = re.compile(r"(\d{1,2}(?:[.,]\d+)?)\s*%")
+
+DEADLINE_WORDS = {"echeance", "date", "limite", "quand", "calendrier", "delai", "avant"}
+DEADLINE_ALIASES = {
+    "TVA Mensuelle": {"tva"},
+    "Déclaration Annuelle": {"annuelle"},
+    "Impôt sur les Sociétés": {"impot", "societe", "is"},
+    "CNSS Patronale": {"cnss"},
+}
+
+
+def _parse_number(raw: str) -> float:
+    return float(raw.replace(" ", "").replace(",", "."))
+
+
+def answer_locally(question: str, today: Optional[date] = None) -> Optional[str]:
+    """Répond sans appel réseau aux questions déterministes (taux, calculs, échéances)"""
+    terms = set(tokenize(question))
+
+    # Calcul de TVA sur un montant
+    if "tva" in terms or "ttc" in terms:
+        rate_match = RATE_PATTERN.search(question)
+        rate = _parse_number(rate_match.group(1)) if rate_match else None
+        text_without_rate = RATE_PATTERN.sub(" ", question)
+        raw_amounts = CURRENCY_PATTERN.findall(text_without_rate)
+        if not raw_amounts and terms & {"ht", "montant", "calcul", "calculer"}:
+            # Sans unité, un nombre n'est un montant que si la question parle de calcul
+            raw_amounts = NUMBER_PATTERN.findall(text_without_rate)
+        amounts = [a for a in (_parse_number(m) for m in raw_amounts if m.strip()) if a > 0]
+
+        if amounts:
+            amount = amounts[0]
+            rate = rate if rate is not None else DEFAULT_TVA_RATE
+            tva = calculate_tva(amount, rate)
+            ttc = calculate_total_ttc(amount, rate)
+            return (f"Pour un montant HT de {amount:,.3f} DT au taux de {rate:g}% :\n\n"
+                    f"- TVA : {tva:,.3f} DT\n"
+                    f"- Total TTC : {ttc:,.3f} DT")
+
+        if "taux" in terms and not terms & DEADLINE_WORDS:
+            rates = ", ".join(f"{r}%" for r in sorted(TVA_RATES, reverse=True))
+            return (f"Les taux de TVA en Tunisie sont : {rates}. "
+                    f"Le taux normal est de {DEFAULT_TVA_RATE}%.")
+
+    # Échéances fiscales
+    if terms & DEADLINE_WORDS:
+        deadlines = upcoming_deadlines(today)
+        matched = [(name, d) for name, d in deadlines
+                   if terms & set(tokenize(" ".join(DEADLINE_ALIASES[name])))]
+        if not matched and {"fiscale", "fiscal", "calendrier", "echeance"} & terms:
+            matched = deadlines
+        if matched:
+            lines = [f"- **{name}** : {d.strftime('%d/%m/%Y')}" for name, d in matched]
+            return "Prochaines échéances :\n\n" + "\n".join(lines)
+
+    return None
@@ -0,0 +1,371 @@
+import bisect
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Désactivable en production avec TT_METRICS=0
+ENABLED = os.getenv("TT_METRICS", "1") != "0"
+
+# Bornes des histogrammes (secondes)
+DURATION_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes (format Prometheus)"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Estimation d'un quantile (borne supérieure du bucket)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+
+class RerunStats:
+    """Compteurs d'une exécution du script Streamlit"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.view = None
+        self.duration = 0.0
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class MetricsRegistry:
+    """Métriques du processus, partagées par toutes les sessions"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.view_render: Dict[str, Histogram] = defaultdict(Histogram)
+            self.sql_duration: Dict[str, Histogram] = defaultdict(Histogram)
+            self.sql_statements: Dict[str, int] = defaultdict(int)
+            self.statements_per_rerun = Histogram([1, 2, 5, 10, 25, 50, 100, 250, 1000])
+            self.cache: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+            self.reruns = 0
+            self.recent_reruns = deque(maxlen=50)
+
+
+registry = MetricsRegistry()
+_local = threading.local()
+
+
+def _current() -> Optional[RerunStats]:
+    return getattr(_local, "rerun", None)
+
+
+_kinds: Dict[str, str] = {}
+
+
+def _statement_kind(sql: str) -> str:
+    """Premier mot-clé de la requête (SELECT, INSERT...), mis en cache par texte SQL"""
+    kind = _kinds.get(sql)
+    if kind is None:
+        stripped = sql.lstrip()
+        if stripped.startswith("--"):
+            kind = "TRIGGER"
+        else:
+            kind = stripped.split(None, 1)[0].upper() if stripped else "OTHER"
+        if len(_kinds) < 10000:
+            _kinds[sql] = kind
+    return kind
+
+
+# ================= ENREGISTREMENT =================
+@contextmanager
+def rerun():
+    """Encadre une exécution complète du script"""
+    if not ENABLED:
+        yield None
+        return
+    stats = RerunStats()
+    _local.rerun = stats
+    started = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.duration = time.perf_counter() - started
+        _local.rerun = None
+        with registry.lock:
+            registry.reruns += 1
+            registry.statements_per_rerun.observe(stats.sql_statements)
+            registry.recent_reruns.append(stats)
+
+
+@contextmanager
+def timed_view(view: str):
+    """Mesure la durée de rendu d'une vue"""
+    if not ENABLED:
+        yield
+        return
+    stats = _current()
+    if stats is not None:
+        stats.view = view
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with registry.lock:
+            registry.view_render[view].observe(elapsed)
+
+
+def record_cache(name: str, hit: bool):
+    """Compte un accès à un cache"""
+    if not ENABLED:
+        return
+    stats = _current()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+    with registry.lock:
+        registry.cache[name][0 if hit else 1] += 1
+
+
+def _on_statement(sql: str):
+    """Callback de trace SQLite : une entrée par instruction exécutée"""
+    stats = _current()
+    if stats is not None:
+        stats.sql_statements += 1
+    kind = _statement_kind(sql)
+    # Sous verrou : render_prometheus parcourt ce dictionnaire, une nouvelle clé ne doit pas y apparaître en cours
+    with registry.lock:
+        registry.sql_statements[kind] += 1
+
+
+def _observe_sql(sql: str, elapsed: float):
+    stats = _current()
+    if stats is not None:
+        stats.sql_seconds += elapsed
+    kind = _statement_kind(sql)
+    with registry.lock:
+        registry.sql_duration[kind].observe(elapsed)
+
+
+class ClosingConnection(sqlite3.Connection):
+    """Connexion fermée en sortie de bloc with (après commit ou rollback).
+
+    Sous CPython 3.11, le cache de requêtes forme un cycle avec la connexion :
+    sans fermeture explicite, elle reste ouverte (et garde ses verrous)
+    jusqu'au passage du ramasse-miettes.
+    """
+
+    def __exit__(self, *exc_info):
+        try:
+            return sqlite3.Connection.__exit__(self, *exc_info)
+        finally:
+            self.close()
+
+
+class InstrumentedConnection(ClosingConnection):
+    """Connexion SQLite qui chronomètre les requêtes"""
+
+    def execute(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return sqlite3.Connection.execute(self, sql, *args)
+        finally:
+            _observe_sql(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return sqlite3.Connection.executemany(self, sql, *args)
+        finally:
+            _observe_sql(sql, time.perf_counter() - started)
+
+    def executescript(self, sql):
+        started = time.perf_counter()
+        try:
+            return sqlite3.Connection.executescript(self, sql)
+        finally:
+            _observe_sql(sql, time.perf_counter() - started)
+
+
+def connect(db_path: str, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect instrumenté (ou non si TT_METRICS=0)"""
+    if not ENABLED:
+        return sqlite3.connect(db_path, factory=ClosingConnection, **kwargs)
+    conn = sqlite3.connect(db_path, factory=InstrumentedConnection, **kwargs)
+    conn.set_trace_callback(_on_statement)
+    return conn
+
+
+# ================= EXPORT =================
+def _labels(**labels) -> str:
+    inner = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return "{" + inner + "}" if inner else ""
+
+
+def _histogram_lines(name: str, histogram: Histogram, **labels) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def render_prometheus() -> str:
+    """Export texte au format Prometheus"""
+    with registry.lock:
+        lines = [
+            "# HELP tt_reruns_total Exécutions du script Streamlit",
+            "# TYPE tt_reruns_total counter",
+            f"tt_reruns_total {registry.reruns}",
+            "# HELP tt_view_render_seconds Durée de rendu par vue",
+            "# TYPE tt_view_render_seconds histogram",
+        ]
+        for view, histogram in sorted(registry.view_render.items()):
+            lines += _histogram_lines("tt_view_render_seconds", histogram, view=view)
+
+        lines += [
+            "# HELP tt_sql_statements_total Instructions SQL exécutées",
+            "# TYPE tt_sql_statements_total counter",
+        ]
+        for kind, count in sorted(registry.sql_statements.items()):
+            lines.append(f"tt_sql_statements_total{_labels(kind=kind)} {count}")
+
+        lines += [
+            "# HELP tt_sql_duration_seconds Durée des requêtes SQL",
+            "# TYPE tt_sql_duration_seconds histogram",
+        ]
+        for kind, histogram in sorted(registry.sql_duration.items()):
+            lines += _histogram_lines("tt_sql_duration_seconds", histogram, kind=kind)
+
+        lines += [
+            "# HELP tt_sql_statements_per_rerun Instructions SQL par exécution du script",
+            "# TYPE tt_sql_statements_per_rerun histogram",
+        ]
+        lines += _histogram_lines("tt_sql_statements_per_rerun", registry.statements_per_rerun)
+
+        lines += [
+            "# HELP tt_cache_requests_total Accès aux caches",
+            "# TYPE tt_cache_requests_total counter",
+        ]
+        for name, (hits, misses) in sorted(registry.cache.items()):
+            lines.append(f"tt_cache_requests_total{_labels(cache=name, result='hit')} {hits}")
+            lines.append(f"tt_cache_requests_total{_labels(cache=name, result='miss')} {misses}")
+
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict:
+    """Résumé lisible pour la page de diagnostic"""
+    with registry.lock:
+        views = [{
+            "Vue": view,
+            "Rendus": h.count,
+            "Moyenne (ms)": round(h.mean * 1000, 1),
+            "p95 (ms)": round(h.quantile(0.95) * 1000, 1),
+            "Max (ms)": round(h.max * 1000, 1),
+        } for view, h in sorted(registry.view_render.items())]
+
+        sql = [{
+            "Type": kind,
+            "Instructions": registry.sql_statements.get(kind, 0),
+            "Chronométrées": h.count,
+            "Moyenne (ms)": round(h.mean * 1000, 2),
+            "Max (ms)": round(h.max * 1000, 2),
+        } for kind, h in sorted(registry.sql_duration.items())]
+
+        caches = [{
+            "Cache": name,
+            "Hits": hits,
+            "Misses": misses,
+            "Taux de hit": f"{hits / (hits + misses):.0%}" if hits + misses else "-",
+        } for name, (hits, misses) in sorted(registry.cache.items())]
+
+        reruns = [{
+            "Heure": time.strftime("%H:%M:%S", time.localtime(r.started_at)),
+            "Vue": r.view or "-",
+            "Durée (ms)": round(r.duration * 1000, 1),
+            "SQL": r.sql_statements,
+            "SQL (ms)": round(r.sql_seconds * 1000, 1),
+            "Cache hit/miss": f"{r.cache_hits}/{r.cache_misses}",
+        } for r in reversed(registry.recent_reruns)]
+
+        return {
+            "reruns": registry.reruns,
+            "statements_per_rerun": registry.statements_per_rerun.mean,
+            "views": views,
+            "sql": sql,
+            "caches": caches,
+            "recent_reruns": reruns,
+        }
+
+
+_exporter_lock = threading.Lock()
+_exporter_started = False
+
+
+def start_http_exporter(port: int, host: str = "127.0.0.1") -> bool:
+    """Expose /metrics sur un port dédié (une fois par processus) ; False si le port est déjà pris.
+
+    Avec plusieurs processus serveur, seul le premier obtient le port : les
+    autres continuent sans exporteur plutôt que d'échouer au démarrage.
+    """
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return False
+        _exporter_started = True
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        warnings.warn(f"Export Prometheus non démarré sur {host}:{port} : {e}", RuntimeWarning)
+        return False
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-exporter").start()
+    return True
@@ -0,0 +1,115 @@
+"""Indicateurs du tableau de bord : valeur de la période en cours et de la période précédente.
+
+Trois périodes : le mois, le trimestre et l'exercice à date (janvier au
+mois courant, comparé aux mêmes mois de l'exercice précédent). Les
+valeurs sont lues dans le cube d'analyse (utils/analytics_cube.py), au
+mois près, sans parcourir les factures : chiffre d'affaires TTC, clients
+facturés, factures de la période encore en attente de paiement et
+dépenses. Toutes les périodes sont calculées d'un seul appel, gardé dans
+le cache de la base tant que factures et achats ne changent pas.
+
+Le mois en cours est comparé au mois précédent complet : en début de mois,
+l'écart est mécaniquement négatif.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from data.database import db
+from utils import analytics_cube
+
+PERIODS = {"month": "Mois", "quarter": "Trimestre", "ytd": "Exercice à date"}
+PENDING_STATUSES = ("envoyée", "en retard")
+
+MonthRange = Tuple[str, str]  # mois 'AAAA-MM' inclus
+
+
+@dataclass
+class Kpi:
+    current: float
+    previous: float
+
+    @property
+    def change(self) -> float:
+        return self.current - self.previous
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """Variation relative (None si la période précédente est nulle)"""
+        return self.change / self.previous if self.previous else None
+
+    def delta(self, relative: bool = True) -> Optional[str]:
+        """Écart affichable par st.metric : '+12%' ou '+3'"""
+        if relative:
+            return f"{self.ratio:+.0%}" if self.ratio is not None else None
+        return f"{self.change:+,.0f}"
+
+
+@dataclass
+class PeriodKpis:
+    period: str
+    current: MonthRange
+    previous: MonthRange
+    revenue: Kpi
+    active_clients: Kpi
+    pending_invoices: Kpi
+    expenses: Kpi
+
+
+def _shift(year: int, month: int, months: int) -> Tuple[int, int]:
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def period_months(period: str, as_of: date) -> Tuple[MonthRange, MonthRange]:
+    """Mois de la période contenant `as_of` et de la période précédente comparable"""
+    if period not in PERIODS:
+        raise ValueError(f"période inconnue : {period!r} ({', '.join(PERIODS)})")
+    year, month = as_of.year, as_of.month
+    if period == "month":
+        first, last, span = (year, month), (year, month), 1
+    elif period == "quarter":
+        start = (month - 1) // 3 * 3 + 1
+        first, last, span = (year, start), (year, start + 2), 3
+    else:
+        first, last, span = (year, 1), (year, month), 12
+    previous = (_shift(*first, -span), _shift(*last, -span))
+    return tuple(tuple(f"{y}-{m:02d}" for y, m in bounds) for bounds in ((first, last), previous))
+
+
+def _sales(conn, months: MonthRange) -> tuple:
+    return conn.execute(f"""
+        SELECT COALESCE(SUM(total_ttc), 0), COUNT(DISTINCT client_id),
+               COALESCE(SUM(CASE WHEN status IN ({', '.join('?' * len(PENDING_STATUSES))}) THEN invoices END), 0)
+        FROM cube_sales WHERE month BETWEEN ? AND ?
+    """, (*PENDING_STATUSES, *months)).fetchone()
+
+
+def _expenses(conn, months: MonthRange) -> float:
+    return conn.execute("SELECT COALESCE(SUM(total), 0) FROM cube_purchases WHERE month BETWEEN ? AND ?",
+                        months).fetchone()[0]
+
+
+def dashboard_kpis(database=None, as_of: Optional[date] = None) -> Dict[str, PeriodKpis]:
+    """Indicateurs de chaque période de PERIODS à la date `as_of` (aujourd'hui par défaut)"""
+    database = database or db
+    as_of = as_of or date.today()
+
+    def build() -> Dict[str, PeriodKpis]:
+        analytics_cube.refresh(database)
+        result = {}
+        with database.get_connection() as conn:
+            for period in PERIODS:
+                current, previous = period_months(period, as_of)
+                sales = [_sales(conn, current), _sales(conn, previous)]
+                expenses = [_expenses(conn, current), _expenses(conn, previous)]
+                result[period] = PeriodKpis(
+                    period=period, current=current, previous=previous,
+                    revenue=Kpi(round(sales[0][0], 3), round(sales[1][0], 3)),
+                    active_clients=Kpi(sales[0][1], sales[1][1]),
+                    pending_invoices=Kpi(sales[0][2], sales[1][2]),
+                    expenses=Kpi(round(expenses[0], 3), round(expenses[1], 3)),
+                )
+        return result
+
+    return database.cache.get(("dashboard_kpis", as_of), ("invoices", "purchases"), build)
@@ -0,0 +1,420 @@
+"""Envoi des factures par email : file d'attente en base et expédition SMTP groupée.
+
+Mettre une facture en file (queue_invoices) ne fait qu'écrire une ligne dans
+email_outbox ; l'expédition (dispatch_pending) se fait hors du fil de
+Streamlit, en ligne de commande ou dans un fil de fond :
+
+- les messages dus sont réservés par lots (bail : un envoi interrompu
+  redevient dû à son expiration) ;
+- le PDF est généré au moment de l'envoi ;
+- quelques connexions SMTP persistantes sont partagées entre les messages
+  (une seule session par connexion pour tout le lot, NOOP après une longue
+  inactivité, reconnexion si le serveur a fermé) ;
+- si le serveur annonce PIPELINING, MAIL FROM, RCPT TO et DATA partent en
+  une seule écriture ;
+- le débit est plafonné (messages par minute) ;
+- les erreurs temporaires (4xx, réseau) sont réessayées avec un délai
+  croissant, les refus définitifs (5xx) marquent le message en échec.
+
+Configuration : TT_SMTP_HOST, TT_SMTP_PORT, TT_SMTP_USER, TT_SMTP_PASSWORD,
+TT_SMTP_SECURITY (none, starttls, ssl), TT_SMTP_SENDER, TT_SMTP_RATE
+(messages par minute, 0 : sans limite), TT_SMTP_CONNECTIONS.
+Pour les essais, un serveur local suffit :
+    python -m aiosmtpd -n -l localhost:8025
+    TT_SMTP_HOST=localhost TT_SMTP_PORT=8025 python -m utils.mailer send
+
+Usage:
+    python -m utils.mailer status
+    python -m utils.mailer queue 2026-09          # factures émises du mois
+    python -m utils.mailer send
+    python -m utils.mailer send --loop 60         # relève la file toutes les 60 s
+"""
+import argparse
+import os
+import queue
+import re
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from email import policy
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+from typing import Dict, List, Optional, Tuple
+
+from data.models import OutboxMessage
+from utils.pdf_generator import build_invoice_data, company_from_profile, render_invoice_pdf
+
+BATCH_SIZE = 100
+QUERY_CHUNK = 500  # numéros par requête IN (...)
+LEASE = timedelta(minutes=10)
+RETRY_DELAYS = (timedelta(minutes=1), timedelta(minutes=5), timedelta(minutes=30), timedelta(hours=2))
+MAX_ATTEMPTS = len(RETRY_DELAYS) + 1
+NOOP_AFTER = 60  # secondes d'inactivité avant de vérifier la connexion
+EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+class MailerError(Exception):
+    pass
+
+
+@dataclass
+class SmtpSettings:
+    host: str
+    port: int = 25
+    username: str = ""
+    password: str = ""
+    security: str = "none"  # 'none', 'starttls', 'ssl'
+    sender: str = ""
+    rate_per_minute: int = 60
+    connections: int = 2
+    timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> Optional["SmtpSettings"]:
+        """Paramètres TT_SMTP_* ; None si aucun serveur n'est configuré"""
+        host = os.getenv("TT_SMTP_HOST")
+        if not host:
+            return None
+        security = os.getenv("TT_SMTP_SECURITY", "none")
+        return cls(
+            host=host,
+            port=int(os.getenv("TT_SMTP_PORT", {"ssl": 465, "starttls": 587}.get(security, 25))),
+            username=os.getenv("TT_SMTP_USER", ""),
+            password=os.getenv("TT_SMTP_PASSWORD", ""),
+            security=security,
+            sender=os.getenv("TT_SMTP_SENDER", ""),
+            rate_per_minute=int(os.getenv("TT_SMTP_RATE", 60)),
+            connections=int(os.getenv("TT_SMTP_CONNECTIONS", 2)),
+        )
+
+
+# ===== CONNEXIONS SMTP =====
+class RateLimiter:
+    """Seau à jetons partagé par les connexions : au plus `per_minute` messages par minute"""
+
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Rafale d'au plus une seconde de messages après une pause
+            slot = max(self._next, now - 1.0)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _dot_stuff(data: bytes) -> bytes:
+    data = re.sub(rb"(?m)^\.", b"..", data)
+    return data if data.endswith(b"\r\n") else data + b"\r\n"
+
+
+class SmtpConnection:
+    """Session SMTP ouverte à la demande et gardée entre les messages"""
+
+    def __init__(self, settings: SmtpSettings):
+        self.settings = settings
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _open(self) -> smtplib.SMTP:
+        s = self.settings
+        if s.security == "ssl":
+            smtp = smtplib.SMTP_SSL(s.host, s.port, timeout=s.timeout, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(s.host, s.port, timeout=s.timeout)
+            if s.security == "starttls":
+                smtp.starttls(context=ssl.create_default_context())
+        smtp.ehlo_or_helo_if_needed()
+        if s.username:
+            smtp.login(s.username, s.password)
+        return smtp
+
+    def _session(self) -> smtplib.SMTP:
+        if self._smtp is not None and time.monotonic() - self._last_used > NOOP_AFTER:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self.close()
+            except smtplib.SMTPException:
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._open()
+        return self._smtp
+
+    def send(self, sender: str, recipients: List[str], data: bytes):
+        """Envoie un message ; une connexion fermée par le serveur est rouverte une fois"""
+        for retry in (False, True):
+            smtp = self._session()
+            try:
+                if smtp.has_extn("pipelining"):
+                    self._send_pipelined(smtp, sender, recipients, data)
+                else:
+                    smtp.sendmail(sender, recipients, data)
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = None
+                if retry:
+                    raise
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # Message refusé : la session reste utilisable pour le suivant
+                self._reset()
+                raise
+            except OSError:
+                self.close()
+                raise
+
+    @staticmethod
+    def _send_pipelined(smtp: smtplib.SMTP, sender: str, recipients: List[str], data: bytes):
+        """Enveloppe en une écriture (RFC 2920), puis les réponses dans l'ordre"""
+        commands = [f"MAIL FROM:<{sender}>"] + [f"RCPT TO:<{rcpt}>" for rcpt in recipients] + ["DATA"]
+        smtp.send("".join(f"{command}\r\n" for command in commands))
+        replies = [smtp.getreply() for _ in commands]
+
+        code, message = replies[0]
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, message, sender)
+        refused = {rcpt: reply for rcpt, reply in zip(recipients, replies[1:-1]) if reply[0] not in (250, 251)}
+        code, message = replies[-1]
+        if code != 354:
+            if len(refused) == len(recipients):
+                raise smtplib.SMTPRecipientsRefused(refused)
+            raise smtplib.SMTPDataError(code, message)
+        smtp.send(_dot_stuff(data) + b".\r\n")
+        code, message = smtp.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, message)
+
+    def _reset(self):
+        try:
+            self._smtp.rset()
+        except (smtplib.SMTPException, OSError, AttributeError):
+            self.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
+
+
+class SmtpPool:
+    """Connexions persistantes partagées entre les fils d'envoi, avec un débit commun"""
+
+    def __init__(self, settings: SmtpSettings):
+        self.settings = settings
+        self.limiter = RateLimiter(settings.rate_per_minute)
+        self._idle = queue.LifoQueue()
+        for _ in range(max(1, settings.connections)):
+            self._idle.put(SmtpConnection(settings))
+
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def send(self, sender: str, recipients: List[str], data: bytes):
+        self.limiter.wait()
+        with self.connection() as conn:
+            conn.send(sender, recipients, data)
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get().close()
+
+
+# ===== FILE D'ENVOI =====
+def _company(database) -> dict:
+    from data.models import BusinessProfile
+
+    return company_from_profile(database.get_profile() or BusinessProfile())
+
+
+def invoice_message(invoice_data: dict, company: dict) -> Tuple[str, str]:
+    """Objet et texte du message accompagnant une facture"""
+    subject = f"Facture {invoice_data['id']} - {company['name']}"
+    due = invoice_data["due_date"]
+    body = (
+        f"Bonjour,\n\n"
+        f"Veuillez trouver ci-joint la facture {invoice_data['id']} d'un montant de "
+        f"{invoice_data['total_ttc']:,.3f} DT TTC, payable avant le {due:%d/%m/%Y}.\n\n"
+        f"Règlement par virement : RIB {company['rib']}.\n\n"
+        f"Cordialement,\n{company['name']}\n{company['phone']}\n"
+    )
+    return subject, body
+
+
+def queue_invoices(invoice_ids: List[str], database=None) -> Dict:
+    """Met en file l'envoi des factures à leur client ; rien n'est expédié ici"""
+    from data.database import db
+
+    database = database or db
+    company = _company(database)
+    clients = {client.id: client for client in database.get_clients()}
+    invoices = [invoice for i in range(0, len(invoice_ids), QUERY_CHUNK)
+                for invoice in database.get_invoices_by_id(invoice_ids[i:i + QUERY_CHUNK])]
+    messages, skipped = [], []
+    for invoice in invoices:
+        client = clients.get(invoice.client_id)
+        if client is None or not EMAIL.match(client.email or ""):
+            skipped.append(invoice.id)
+            continue
+        subject, body = invoice_message(build_invoice_data(invoice, client), company)
+        messages.append(OutboxMessage(None, invoice.id, client.email, subject, body))
+    return {"queued": database.enqueue_emails(messages), "skipped": skipped}
+
+
+def build_email(message: OutboxMessage, sender: str, company: dict, attachment: bytes) -> bytes:
+    email = EmailMessage(policy=policy.SMTP)
+    email["From"] = formataddr((company["name"], sender))
+    email["To"] = message.recipient
+    email["Subject"] = message.subject
+    email["Message-ID"] = make_msgid(f"outbox.{message.id}")
+    email.set_content(message.body)
+    email.add_attachment(attachment, maintype="application", subtype="pdf",
+                         filename=f"Facture_{message.invoice_id}.pdf")
+    return email.as_bytes()
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _retry_at(message: OutboxMessage, error: Exception) -> Optional[datetime]:
+    attempt = message.attempts + 1
+    if _is_permanent(error) or attempt >= MAX_ATTEMPTS:
+        return None
+    return datetime.now().replace(microsecond=0) + RETRY_DELAYS[attempt - 1]
+
+
+def dispatch_pending(database=None, settings: Optional[SmtpSettings] = None,
+                     batch_size: int = BATCH_SIZE) -> Dict:
+    """Envoie tous les messages dus de la file ; retourne les compteurs envoyés / reportés / en échec"""
+    from data.database import db
+
+    database = database or db
+    settings = settings or SmtpSettings.from_env()
+    if settings is None:
+        raise MailerError("serveur SMTP non configuré (TT_SMTP_HOST)")
+    company = _company(database)
+    sender = settings.sender or settings.username or company["email"]
+    clients = {client.id: client for client in database.get_clients()}
+
+    started = time.perf_counter()
+    counts = {"sent": 0, "retried": 0, "failed": 0}
+    pool = SmtpPool(settings)
+
+    def deliver(message: OutboxMessage, invoice) -> Optional[Exception]:
+        try:
+            if invoice is None:
+                raise MailerError("facture introuvable")
+            pdf = render_invoice_pdf(build_invoice_data(invoice, clients.get(invoice.client_id)), company)
+            pool.send(sender, [message.recipient], build_email(message, sender, company, pdf))
+        except (smtplib.SMTPException, OSError, MailerError) as e:
+            return e
+        except Exception as e:
+            # Facture illisible (PDF, données) : échec de ce seul message, le lot est enregistré quand même
+            return MailerError(f"{type(e).__name__}: {e}")
+        return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, settings.connections)) as executor:
+            while True:
+                messages = database.claim_outbox_messages(batch_size, LEASE)
+                if not messages:
+                    break
+                invoices = {inv.id: inv for inv in database.get_invoices_by_id([m.invoice_id for m in messages])}
+                errors = executor.map(lambda m: deliver(m, invoices.get(m.invoice_id)), messages)
+
+                sent, failures = [], []
+                for message, error in zip(messages, errors):
+                    if error is None:
+                        sent.append(message.id)
+                        continue
+                    retry_at = None if isinstance(error, MailerError) else _retry_at(message, error)
+                    failures.append((message.id, str(error)[:500], retry_at))
+                    counts["retried" if retry_at else "failed"] += 1
+                database.record_deliveries(sent, failures)
+                counts["sent"] += len(sent)
+    finally:
+        pool.close()
+
+    counts["duration"] = round(time.perf_counter() - started, 3)
+    return counts
+
+
+# Un seul fil d'envoi de fond par processus (interface Streamlit)
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def dispatch_in_background(database=None, settings: Optional[SmtpSettings] = None) -> bool:
+    """Lance l'envoi de la file dans un fil de fond s'il n'y en a pas déjà un ; False si déjà en cours"""
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return False
+        _worker = threading.Thread(target=dispatch_pending, args=(database, settings),
+                                   name="email-outbox", daemon=True)
+        _worker.start()
+        return True
+
+
+def main():
+    from data.database import DEFAULT_DB_PATH, Database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="état de la file")
+    queue_cmd = commands.add_parser("queue", help="mettre en file les factures émises d'un mois")
+    queue_cmd.add_argument("month", help="AAAA-MM")
+    send = commands.add_parser("send", help="envoyer les messages dus")
+    send.add_argument("--loop", type=int, metavar="SECONDES", help="relever la file en continu")
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    if args.command == "status":
+        for status, count in sorted(database.get_outbox_summary().items()):
+            print(f"{status:<12} {count:>8}")
+    elif args.command == "queue":
+        try:
+            start = datetime.strptime(args.month, "%Y-%m").date()
+        except ValueError:
+            parser.exit(1, f"Erreur : mois invalide {args.month!r} (AAAA-MM)\n")
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        ids = [inv.id for inv in database.get_invoices(start=start, end=end) if inv.status != "brouillon"]
+        result = queue_invoices(ids, database)
+        print(f"{result['queued']} message(s) mis en file, {len(result['skipped'])} client(s) sans email valide")
+    elif args.command == "send":
+        while True:
+            try:
+                result = dispatch_pending(database)
+            except MailerError as e:
+                parser.exit(1, f"Erreur : {e}\n")
+            print(f"{result['sent']} envoyé(s), {result['retried']} reporté(s), {result['failed']} en échec "
+                  f"en {result['duration']:.1f} s")
+            if not args.loop:
+                break
+            time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
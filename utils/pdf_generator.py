@@ -1,7 +1,21 @@
 from fpdf import FPDF
-from datetime import datetime
+from datetime import date, datetime
 import os
 
+# Les polices standard de FPDF sont en latin-1 : équivalents des caractères typographiques courants
+_LATIN1_REPLACEMENTS = str.maketrans({
+    "\u2019": "'", "\u2018": "'", "\u201c": '"', "\u201d": '"', "\u2013": "-", "\u2014": "-",
+    "\u2026": "...", "\u0153": "oe", "\u0152": "OE", "\u20ac": "EUR", "\u00a0": " ", "\u202f": " ",
+})
+
+
+def _latin1(text) -> str:
+    return str(text).translate(_LATIN1_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+
+def _format_date(value) -> str:
+    return value.strftime("%d/%m/%Y") if isinstance(value, date) else str(value)
+
 
 class InvoicePDF(FPDF):
     def __init__(self, invoice_data, company_data):
@@ -9,6 +23,12 @@ class InvoicePDF(FPDF):
         self.invoice_data = invoice_data
         self.company_data = company_data
 
+    def cell(self, w, h=0, txt='', border=0, ln=0, align='', fill=0, link=''):
+        super().cell(w, h, _latin1(txt), border, ln, align, fill, link)
+
+    def multi_cell(self, w, h, txt='', border=0, align='J', fill=0):
+        super().multi_cell(w, h, _latin1(txt), border, align, fill)
+
     def header(self):
         # Logo
         if os.path.exists("assets/logo.png"):
@@ -52,8 +72,8 @@ class InvoicePDF(FPDF):
 
     def add_invoice_details(self):
         self.set_font('Arial', '', 10)
-        self.cell(50, 6, f"Date de facturation: {self.invoice_data['invoice_date']}", 0, 0)
-        self.cell(0, 6, f"Date d'échéance: {self.invoice_data['due_date']}", 0, 1)
+        self.cell(50, 6, f"Date de facturation: {_format_date(self.invoice_data['invoice_date'])}", 0, 0)
+        self.cell(0, 6, f"Date d'échéance: {_format_date(self.invoice_data['due_date'])}", 0, 1)
         self.ln(5)
 
     def add_items_table(self):
@@ -123,11 +143,33 @@ class InvoicePDF(FPDF):
             self.ln(5)
 
 
-def generate_invoice_pdf(invoice_data, company_data, filename=None):
-    """Génère un PDF de facture"""
-    if filename is None:
-        filename = f"Facture_{invoice_data['id']}_{datetime.now().strftime('%Y%m%d')}.pdf"
-
+def build_invoice_data(invoice, client=None) -> dict:
+    """Données d'impression d'une facture et de son client (PDF, TEIF, email)"""
+    return {
+        "id": invoice.id,
+        "invoice_date": invoice.date,
+        "due_date": invoice.due_date,
+        "items": invoice.items,
+        "total_ht": invoice.total_amount - invoice.tva_amount,
+        "tva_amount": invoice.tva_amount,
+        "total_ttc": invoice.total_amount,
+        "notes": invoice.notes or "",
+        "client_id": invoice.client_id,
+        "client_name": client.name if client else invoice.client_id,
+        "client_matricule": client.matricule_fiscal if client else "",
+        "client_address": " ".join(filter(None, [client.address, client.city])) if client else "",
+        "client_phone": client.phone if client else "",
+        "client_email": client.email if client else "",
+    }
+
+
+def company_from_profile(profile) -> dict:
+    return {"name": profile.name, "matricule_fiscal": profile.matricule_fiscal, "address": profile.address,
+            "phone": profile.phone, "email": profile.email, "rib": profile.rib}
+
+
+def render_invoice_pdf(invoice_data, company_data) -> bytes:
+    """Génère le PDF d'une facture en mémoire (pièce jointe, téléchargement)"""
     pdf = InvoicePDF(invoice_data, company_data)
     pdf.add_page()
 
@@ -139,5 +181,14 @@ def generate_invoice_pdf(invoice_data, company_data, filename=None):
     pdf.add_payment_info()
     pdf.add_notes()
 
-    pdf.output(filename)
-    return filename
\ No newline at end of file
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def generate_invoice_pdf(invoice_data, company_data, filename=None):
+    """Génère un PDF de facture"""
+    if filename is None:
+        filename = f"Facture_{invoice_data['id']}_{datetime.now().strftime('%Y%m%d')}.pdf"
+
+    with open(filename, "wb") as f:
+        f.write(render_invoice_pdf(invoice_data, company_data))
+    return filename
@@ -0,0 +1,301 @@
+"""Import des relevés bancaires CSV et rapprochement des virements avec les factures.
+
+Le relevé doit porter le RIB du profil entreprise (en-tête « RIB : ... » ou
+colonne RIB). Chaque crédit est rapproché d'une facture ouverte :
+
+1. par référence : numéro de facture lu dans le libellé ou la colonne
+   référence, jointure par dictionnaire sur les numéros ouverts ;
+2. par montant et date : les factures sont triées sur la clé
+   (montant en millimes, date), et les candidats de chaque crédit (même
+   montant, facture émise dans les `window_days` jours précédant le
+   virement) sont trouvés par recherche dichotomique vectorisée.
+
+Un rapprochement est confirmé quand il est univoque ; les autres sont
+proposés à vérification. Les rapprochements confirmés soldent les factures
+en une transaction (Database.record_payments).
+
+Usage:
+    python -m utils.reconciliation releve.csv
+    python -m utils.reconciliation releve.csv --apply
+"""
+import argparse
+import csv
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from data.models import BankTransaction
+
+DEFAULT_WINDOW_DAYS = 180
+INVOICE_NUMBER = re.compile(r"FACT-\d{6}-\d+", re.IGNORECASE)
+DELIMITERS = (";", "\t", ",")
+RIB_LENGTH = 20
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y")
+_DAYS_PER_AMOUNT = 10 ** 6  # clé de tri : millimes * 10^6 + jour ordinal (< 10^6)
+
+# En-têtes reconnus (minuscules, sans accents)
+COLUMN_ALIASES = {
+    "date": ("date operation", "date", "date valeur", "date de valeur"),
+    "label": ("libelle", "libelle operation", "description", "operation", "motif", "designation"),
+    "credit": ("credit", "montant credit", "credit (dt)", "credit dt"),
+    "debit": ("debit", "montant debit", "debit (dt)", "debit dt"),
+    "amount": ("montant", "montant (dt)", "amount"),
+    "reference": ("reference", "ref", "ref."),
+    "rib": ("rib", "compte"),
+}
+
+
+class ReconciliationError(Exception):
+    pass
+
+
+@dataclass
+class Match:
+    transaction: BankTransaction
+    invoice_id: str
+    client_id: str
+    invoice_amount: float
+    method: str  # 'référence' ou 'montant'
+    confirmed: bool
+    note: str = ""
+
+
+@dataclass
+class ReconciliationResult:
+    matches: List[Match] = field(default_factory=list)
+    unmatched: List[BankTransaction] = field(default_factory=list)
+
+    @property
+    def confirmed(self) -> List[Match]:
+        return [m for m in self.matches if m.confirmed]
+
+    @property
+    def to_review(self) -> List[Match]:
+        return [m for m in self.matches if not m.confirmed]
+
+
+# ===== LECTURE DU RELEVÉ =====
+def normalize_rib(value: str) -> str:
+    return re.sub(r"\D", "", value or "")
+
+
+def _normalize_header(value: str) -> str:
+    value = unicodedata.normalize("NFKD", value.strip().lower())
+    return "".join(c for c in value if not unicodedata.combining(c))
+
+
+def parse_amount(value: str) -> float:
+    """'1 234,500', '1.234,500', '1234.5', '-12,000 DT' -> float"""
+    value = re.sub(r"[^\d,.\-]", "", (value or "").replace(" ", ""))
+    if not value or value == "-":
+        return 0.0
+    if "," in value and "." in value:
+        # Le dernier séparateur est le séparateur décimal
+        thousands = "." if value.rfind(",") > value.rfind(".") else ","
+        value = value.replace(thousands, "")
+    return float(value.replace(",", "."))
+
+
+def parse_date(value: str) -> datetime:
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ReconciliationError(f"date illisible : {value!r}")
+
+
+def _find_columns(header: List[str]) -> Optional[dict]:
+    names = [_normalize_header(h) for h in header]
+    columns = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in names:
+                columns[key] = names.index(alias)
+                break
+    if "date" in columns and ("credit" in columns or "amount" in columns):
+        return columns
+    return None
+
+
+def _row_reader(row: List[str], columns: dict):
+    def cell(key: str) -> str:
+        return row[columns[key]].strip() if key in columns and columns[key] < len(row) else ""
+    return cell
+
+
+def read_statement(content: bytes, expected_rib: str) -> List[BankTransaction]:
+    """Lit un relevé CSV et contrôle qu'il porte sur le compte `expected_rib`"""
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = content.decode("latin-1")
+    lines = text.splitlines()
+
+    # Séparateur : le premier qui fait apparaître la ligne d'en-tête, après un
+    # éventuel préambule (banque, RIB, période)
+    for delimiter in DELIMITERS:
+        rows = list(csv.reader(lines, delimiter=delimiter))
+        start = next((n for n, row in enumerate(rows) if _find_columns(row)), None)
+        if start is not None:
+            break
+    else:
+        raise ReconciliationError("en-tête du relevé introuvable (colonnes Date et Crédit ou Montant)")
+    columns = _find_columns(rows[start])
+    statement_rib = next((rib for rib in (normalize_rib(" ".join(row)) for row in rows[:start])
+                          if len(rib) == RIB_LENGTH), "")
+
+    expected = normalize_rib(expected_rib)
+    transactions = []
+    seen = {}
+    for row in rows[start + 1:]:
+        if not any(cell.strip() for cell in row) or len(row) <= columns["date"] or not row[columns["date"]].strip():
+            continue
+        cell = _row_reader(row, columns)
+        rib = normalize_rib(cell("rib")) or statement_rib
+        if rib != expected:
+            raise ReconciliationError(f"le relevé porte sur le RIB {rib or 'inconnu'}, "
+                                      f"pas sur celui de l'entreprise ({expected})")
+        if "amount" in columns:
+            amount = parse_amount(cell("amount"))
+        else:
+            amount = parse_amount(cell("credit")) - abs(parse_amount(cell("debit")))
+        when = parse_date(cell("date"))
+        label = cell("label")
+
+        # Empreinte stable : réimporter le même relevé n'ajoute rien, deux lignes identiques restent distinctes
+        fingerprint = f"{rib}|{when.date().isoformat()}|{amount:.3f}|{label}|{cell('reference')}"
+        seen[fingerprint] = seen.get(fingerprint, 0) + 1
+        transaction_id = "BNK-" + hashlib.sha1(f"{fingerprint}|{seen[fingerprint]}".encode()).hexdigest()[:16]
+        transactions.append(BankTransaction(id=transaction_id, rib=rib, date=when, label=label,
+                                            amount=round(amount, 3), reference=cell("reference") or None))
+    return transactions
+
+
+# ===== RAPPROCHEMENT =====
+def _references(transaction: BankTransaction) -> List[str]:
+    text = f"{transaction.label} {transaction.reference or ''}"
+    found = [m.upper() for m in INVOICE_NUMBER.findall(text)]
+    if transaction.reference:
+        found.append(transaction.reference.strip())
+    return found
+
+
+def reconcile(credits: Sequence[BankTransaction], open_invoices: Sequence[tuple],
+              window_days: int = DEFAULT_WINDOW_DAYS) -> ReconciliationResult:
+    """Rapproche les crédits des factures ouvertes (id, client_id, date, total_amount)"""
+    result = ReconciliationResult()
+    credits = sorted((t for t in credits if t.amount > 0), key=lambda t: t.date)
+    if not open_invoices:
+        result.unmatched = list(credits)
+        return result
+
+    ids = [row[0] for row in open_invoices]
+    position = {invoice_id: i for i, invoice_id in enumerate(ids)}
+    amounts = np.rint(np.fromiter((row[3] for row in open_invoices), float, len(ids)) * 1000).astype(np.int64)
+    days = np.fromiter((row[2].toordinal() for row in open_invoices), np.int64, len(ids))
+    used = np.zeros(len(ids), dtype=bool)
+
+    def match(transaction, i, method, confirmed, note=""):
+        used[i] = True
+        row = open_invoices[i]
+        result.matches.append(Match(transaction, row[0], row[1], row[3], method, confirmed, note))
+
+    # 1. Référence de facture : jointure par dictionnaire
+    remaining = []
+    for transaction in credits:
+        i = next((position[ref] for ref in _references(transaction)
+                  if ref in position and not used[position[ref]]), None)
+        if i is None:
+            remaining.append(transaction)
+        elif amounts[i] == round(transaction.amount * 1000):
+            match(transaction, i, "référence", True)
+        else:
+            match(transaction, i, "référence", False,
+                  f"montant {transaction.amount:,.3f} DT ≠ facture {open_invoices[i][3]:,.3f} DT")
+    if not remaining:
+        return result
+
+    # 2. Montant exact et facture émise dans la fenêtre : recherche dichotomique sur la clé triée
+    order = np.lexsort((days, amounts))
+    keys = amounts[order] * _DAYS_PER_AMOUNT + days[order]
+    credit_amounts = np.rint(np.array([t.amount for t in remaining]) * 1000).astype(np.int64)
+    credit_days = np.array([t.date.toordinal() for t in remaining], dtype=np.int64)
+    low = np.searchsorted(keys, credit_amounts * _DAYS_PER_AMOUNT + credit_days - window_days, side="left")
+    high = np.searchsorted(keys, credit_amounts * _DAYS_PER_AMOUNT + credit_days, side="right")
+
+    for transaction, lo, hi in zip(remaining, low, high):
+        candidates = [i for i in order[lo:hi] if not used[i]]
+        if not candidates:
+            result.unmatched.append(transaction)
+        elif len(candidates) == 1:
+            match(transaction, candidates[0], "montant", True)
+        else:
+            # Plusieurs factures du même montant : la plus ancienne est proposée
+            match(transaction, candidates[0], "montant", False,
+                  f"{len(candidates)} factures ouvertes de ce montant")
+    return result
+
+
+def import_statement(content: bytes, rib: str, database=None,
+                     window_days: int = DEFAULT_WINDOW_DAYS) -> ReconciliationResult:
+    """Enregistre le relevé puis rapproche tous les crédits encore non rapprochés du compte"""
+    from data.database import db
+
+    database = database or db
+    database.add_bank_transactions(read_statement(content, rib))
+    return reconcile(database.get_unmatched_credits(normalize_rib(rib)),
+                     database.get_open_invoice_keys(), window_days)
+
+
+def apply_matches(matches: Sequence[Match], database=None) -> Tuple[int, List[Tuple[str, str]]]:
+    """Solde les factures rapprochées ; retourne le nombre de factures payées et les
+    (facture, transaction) écartés, la facture ayant été réglée entre-temps"""
+    from data.database import db
+
+    database = database or db
+    return database.record_payments([(m.invoice_id, m.transaction.date, m.transaction.id) for m in matches])
+
+
+def main():
+    from data.database import DEFAULT_DB_PATH, Database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("statement", help="relevé CSV")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--rib", help="RIB attendu (par défaut celui du profil entreprise)")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW_DAYS, help="jours entre facture et virement")
+    parser.add_argument("--apply", action="store_true", help="solder les factures rapprochées sans ambiguïté")
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    profile = database.get_profile()
+    rib = args.rib or (profile.rib if profile else "")
+    with open(args.statement, "rb") as f:
+        content = f.read()
+    try:
+        result = import_statement(content, rib, database, args.window)
+    except ReconciliationError as e:
+        parser.exit(1, f"Erreur : {e}\n")
+
+    for m in result.matches:
+        flag = "OK " if m.confirmed else "?  "
+        print(f"{flag}{m.transaction.date:%d/%m/%Y} {m.transaction.amount:>14,.3f}  -> {m.invoice_id} "
+              f"({m.method}) {m.note}")
+    print(f"{len(result.confirmed)} rapprochements sûrs, {len(result.to_review)} à vérifier, "
+          f"{len(result.unmatched)} crédits sans facture")
+    if args.apply:
+        paid, skipped = apply_matches(result.confirmed, database)
+        print(f"{paid} factures soldées")
+        for invoice_id, transaction_id in skipped:
+            print(f"déjà payée : {invoice_id}, transaction {transaction_id} laissée à rapprocher")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""Factures électroniques TEIF (El Fatoora, TTN) au format XML.
+
+Le document est écrit au fil de l'eau par xml.sax.saxutils.XMLGenerator :
+aucun arbre DOM n'est construit, la mémoire reste constante quel que soit
+le nombre de lignes. L'export d'un mois répartit les factures par lots sur
+un pool de processus ; chaque fichier est contrôlé après écriture :
+
+- schéma XSD (lxml, optionnel) : utils/schemas/teif_subset.xsd par défaut,
+  ou le XSD officiel TTN désigné par TT_TEIF_XSD ;
+- règles de gestion, par lecture en flux : identifiants fiscaux, somme
+  des lignes = total HT, HT + TVA = TTC.
+
+La signature électronique (XAdES) exigée pour le dépôt sur El Fatoora se
+fait en aval, sur les fichiers produits.
+
+Usage:
+    python -m utils.teif export 2026-09 --output exports/teif
+    python -m utils.teif validate exports/teif/FACT-202609-001.xml
+"""
+import argparse
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import XMLGenerator
+
+from utils.calculations import line_amounts
+from utils.pdf_generator import build_invoice_data, company_from_profile
+
+TEIF_VERSION = "1.8.8"
+DEFAULT_XSD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas", "teif_subset.xsd")
+BATCH_SIZE = 250  # factures par tâche du pool
+
+# Codes TEIF utilisés
+ID_MATRICULE = "I-01"
+DOC_INVOICE = "I-11"
+DATE_INVOICE, DATE_DUE = "I-31", "I-32"
+PARTNER_SELLER, PARTNER_BUYER = "I-62", "I-64"
+TAX_TVA = "I-1602"
+AMOUNT_UNIT_PRICE = "I-183"
+AMOUNT_LINE_HT = "I-171"
+AMOUNT_TOTAL_HT = "I-176"
+AMOUNT_TAX_BASE = "I-177"
+AMOUNT_TAX = "I-178"
+AMOUNT_TOTAL_TAX = "I-181"
+AMOUNT_TOTAL_TTC = "I-180"
+PAYMENT_TERMS = "I-114"
+PAYMENT_ACCOUNT = "I-141"
+
+# Matricule fiscal sans séparateurs : 7 chiffres, clé, puis codes et établissement (optionnels)
+MATRICULE = re.compile(r"^\d{7}[A-Z]([A-Z]{1,2}\d{3})?$")
+
+
+def _amount(value: float) -> str:
+    return f"{value:.3f}"
+
+
+def _teif_date(value) -> str:
+    return value.strftime("%d%m%y")
+
+
+def normalize_matricule(value: str) -> str:
+    return re.sub(r"[\s/.\-]", "", value or "").upper()
+
+
+# ===== ÉCRITURE EN FLUX =====
+class TeifWriter:
+    """Écrit les éléments au fur et à mesure, avec indentation"""
+
+    def __init__(self, stream):
+        self._xml = XMLGenerator(stream, encoding="utf-8", short_empty_elements=True)
+        self._depth = 0
+        self._root = True
+
+    def start_document(self):
+        self._xml.startDocument()  # la déclaration se termine déjà par un saut de ligne
+
+    def end_document(self):
+        self._xml.ignorableWhitespace("\n")
+        self._xml.endDocument()
+
+    def _indent(self):
+        if self._root:
+            self._root = False
+            return
+        self._xml.ignorableWhitespace("\n" + "  " * self._depth)
+
+    @contextmanager
+    def element(self, name: str, **attrs):
+        self._indent()
+        self._xml.startElement(name, attrs)
+        self._depth += 1
+        yield
+        self._depth -= 1
+        self._indent()
+        self._xml.endElement(name)
+
+    def leaf(self, name: str, text, **attrs):
+        self._indent()
+        self._xml.startElement(name, attrs)
+        self._xml.characters(str(text))
+        self._xml.endElement(name)
+
+    def amount(self, code: str, value: float):
+        with self.element("Moa", amountTypeCode=code, currencyCodeList="ISO_4217"):
+            self.leaf("Amount", _amount(value), currencyIdentifier="TND")
+
+
+def _partner(writer: TeifWriter, function_code: str, matricule: str, name: str, address: str,
+             phone: Optional[str] = None, email: Optional[str] = None):
+    with writer.element("PartnerDetails", functionCode=function_code):
+        with writer.element("Nad"):
+            writer.leaf("PartnerIdentifier", normalize_matricule(matricule), type=ID_MATRICULE)
+            writer.leaf("PartnerName", name, nameType="Qualification")
+            with writer.element("PartnerAdresses", lang="fr"):
+                writer.leaf("AdressDescription", address or "")
+        if phone or email:
+            with writer.element("CtaSection"):
+                if phone:
+                    with writer.element("Communication"):
+                        writer.leaf("ComMeansType", "I-101")
+                        writer.leaf("ComAdress", phone)
+                if email:
+                    with writer.element("Communication"):
+                        writer.leaf("ComMeansType", "I-102")
+                        writer.leaf("ComAdress", email)
+
+
+def write_invoice(invoice: dict, company: dict, stream):
+    """Écrit la facture TEIF de `invoice` (même dictionnaire que generate_invoice_pdf,
+    avec client_matricule, client_phone, client_email) dans `stream` (binaire)"""
+    writer = TeifWriter(stream)
+    writer.start_document()
+    with writer.element("TEIF", controlingAgency="TTN", version=TEIF_VERSION):
+        with writer.element("InvoiceHeader"):
+            writer.leaf("MessageSenderIdentifier", normalize_matricule(company["matricule_fiscal"]), type=ID_MATRICULE)
+            writer.leaf("MessageRecieverIdentifier", normalize_matricule(invoice.get("client_matricule")),
+                        type=ID_MATRICULE)
+        with writer.element("InvoiceBody"):
+            with writer.element("Bgm"):
+                writer.leaf("DocumentIdentifier", invoice["id"])
+                writer.leaf("DocumentType", "Facture", code=DOC_INVOICE)
+            with writer.element("Dtm"):
+                writer.leaf("DateText", _teif_date(invoice["invoice_date"]), format="ddMMyy", functionCode=DATE_INVOICE)
+                writer.leaf("DateText", _teif_date(invoice["due_date"]), format="ddMMyy", functionCode=DATE_DUE)
+            with writer.element("PartnerSection"):
+                _partner(writer, PARTNER_SELLER, company["matricule_fiscal"], company["name"], company["address"],
+                         company.get("phone"), company.get("email"))
+                _partner(writer, PARTNER_BUYER, invoice.get("client_matricule"), invoice["client_name"],
+                         invoice.get("client_address"), invoice.get("client_phone"), invoice.get("client_email"))
+            if company.get("rib"):
+                with writer.element("PytSection"):
+                    with writer.element("PytSectionDetails"):
+                        with writer.element("Pyt"):
+                            writer.leaf("PaymentTearmsTypeCode", PAYMENT_TERMS)
+                            writer.leaf("PaymentTearmsDescription",
+                                        f"Paiement au plus tard le {invoice['due_date'].strftime('%d/%m/%Y')}")
+                        with writer.element("PytFii", functionCode=PAYMENT_ACCOUNT):
+                            with writer.element("AccountHolder"):
+                                writer.leaf("AccountNumber", re.sub(r"\D", "", company["rib"]))
+
+            # Lignes : écrites une à une, la ventilation par taux est cumulée au passage
+            taxes = OrderedDict()
+            total_ht = total_tva = 0.0
+            with writer.element("LinSection"):
+                for n, item in enumerate(invoice["items"], 1):
+                    line_ht, rate, line_tva = line_amounts(item)
+                    base, tax = taxes.get(rate, (0.0, 0.0))
+                    taxes[rate] = (base + line_ht, tax + line_tva)
+                    total_ht += line_ht
+                    total_tva += line_tva
+                    with writer.element("Lin"):
+                        writer.leaf("ItemIdentifier", n)
+                        with writer.element("LinImd", lang="fr"):
+                            writer.leaf("ItemCode", n)
+                            writer.leaf("ItemDescription", item.get("description", ""))
+                        with writer.element("LinQty"):
+                            writer.leaf("Quantity", item.get("quantity", 1), measurementUnit="UNIT")
+                        with writer.element("LinTax"):
+                            writer.leaf("TaxTypeName", "TVA", code=TAX_TVA)
+                            with writer.element("TaxDetails"):
+                                writer.leaf("TaxRate", f"{rate:g}")
+                        with writer.element("LinMoa"):
+                            with writer.element("MoaDetails"):
+                                writer.amount(AMOUNT_UNIT_PRICE, item.get("unit_price", line_ht))
+                            with writer.element("MoaDetails"):
+                                writer.amount(AMOUNT_LINE_HT, line_ht)
+
+            with writer.element("InvoiceMoa"):
+                for code, value in ((AMOUNT_TOTAL_HT, total_ht), (AMOUNT_TOTAL_TAX, total_tva),
+                                    (AMOUNT_TOTAL_TTC, total_ht + total_tva)):
+                    with writer.element("AmountDetails"):
+                        writer.amount(code, value)
+            with writer.element("InvoiceTax"):
+                for rate, (base, tax) in taxes.items():
+                    with writer.element("InvoiceTaxDetails"):
+                        with writer.element("Tax"):
+                            writer.leaf("TaxTypeName", "TVA", code=TAX_TVA)
+                            with writer.element("TaxDetails"):
+                                writer.leaf("TaxRate", f"{rate:g}")
+                        with writer.element("AmountDetails"):
+                            writer.amount(AMOUNT_TAX_BASE, base)
+                        with writer.element("AmountDetails"):
+                            writer.amount(AMOUNT_TAX, tax)
+    writer.end_document()
+
+
+def generate_invoice_teif(invoice_data: dict, company_data: dict, filename: Optional[str] = None) -> str:
+    """Génère le fichier XML TEIF d'une facture"""
+    if filename is None:
+        filename = f"{invoice_data['id']}.xml"
+    with open(filename, "wb") as f:
+        write_invoice(invoice_data, company_data, f)
+    return filename
+
+
+# ===== CONTRÔLE =====
+_schemas = {}
+
+
+def _schema_errors(path: str, xsd_path: str) -> List[str]:
+    """Erreurs XSD, ou [] si lxml n'est pas installé"""
+    try:
+        from lxml import etree
+    except ImportError:
+        return []
+    if xsd_path not in _schemas:
+        _schemas[xsd_path] = etree.XMLSchema(etree.parse(xsd_path))
+    schema = _schemas[xsd_path]
+    if schema.validate(etree.parse(path)):
+        return []
+    return [f"XSD ligne {e.line} : {e.message}" for e in schema.error_log]
+
+
+def _rule_errors(path: str) -> List[str]:
+    """Règles de gestion vérifiées en une lecture en flux"""
+    errors = []
+    totals = {}
+    lines_ht = 0.0
+    line_count = 0
+    amount_code = None
+    for event, element in iterparse(path, events=("start", "end")):
+        if event == "start":
+            if element.tag == "Moa":
+                amount_code = element.get("amountTypeCode")
+            continue
+        if element.tag == "PartnerIdentifier" and not MATRICULE.match(element.text or ""):
+            errors.append(f"matricule fiscal invalide : {element.text or '(vide)'}")
+        elif element.tag == "Amount":
+            value = float(element.text)
+            if amount_code == AMOUNT_LINE_HT:
+                lines_ht += value
+                line_count += 1
+            elif amount_code in (AMOUNT_TOTAL_HT, AMOUNT_TOTAL_TAX, AMOUNT_TOTAL_TTC):
+                totals[amount_code] = value
+        elif element.tag == "Lin":
+            element.clear()  # lignes déjà comptées : mémoire constante
+    if not line_count:
+        errors.append("aucune ligne de facture")
+    tolerance = 0.001 * (line_count + 1)
+    if abs(lines_ht - totals.get(AMOUNT_TOTAL_HT, 0.0)) > tolerance:
+        errors.append(f"somme des lignes {lines_ht:.3f} ≠ total HT {totals.get(AMOUNT_TOTAL_HT, 0.0):.3f}")
+    if abs(totals.get(AMOUNT_TOTAL_HT, 0.0) + totals.get(AMOUNT_TOTAL_TAX, 0.0)
+           - totals.get(AMOUNT_TOTAL_TTC, 0.0)) > 0.001:
+        errors.append("total HT + TVA ≠ total TTC")
+    return errors
+
+
+def validate_teif(path: str, xsd_path: Optional[str] = None) -> List[str]:
+    """Liste des erreurs d'un fichier TEIF (vide s'il est valide)"""
+    xsd_path = xsd_path or os.getenv("TT_TEIF_XSD", DEFAULT_XSD)
+    return _schema_errors(path, xsd_path) + _rule_errors(path)
+
+
+# ===== EXPORT PAR LOTS =====
+def _export_batch(args) -> Tuple[int, Dict[str, List[str]]]:
+    """Tâche du pool : écrit et contrôle un lot de factures"""
+    invoices, company, output_dir, validate = args
+    errors = {}
+    for invoice in invoices:
+        path = generate_invoice_teif(invoice, company, os.path.join(output_dir, f"{invoice['id']}.xml"))
+        if validate:
+            problems = validate_teif(path)
+            if problems:
+                errors[invoice["id"]] = problems
+    return len(invoices), errors
+
+
+def invoice_documents(start: date, end: date, database=None) -> List[dict]:
+    """Factures de [start, end) avec les coordonnées de leur client, prêtes à sérialiser"""
+    from data.database import db
+
+    database = database or db
+    clients = {client.id: client for client in database.get_clients()}
+    return [build_invoice_data(invoice, clients.get(invoice.client_id))
+            for invoice in database.get_invoices(start=start, end=end) if invoice.status != "brouillon"]
+
+
+def export_period(start: date, end: date, output_dir: str, company: dict, database=None,
+                  workers: Optional[int] = None, validate: bool = True) -> Dict:
+    """Exporte les factures émises de [start, end) en fichiers TEIF, par lots sur un pool de processus"""
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    documents = invoice_documents(start, end, database)
+    batches = [(documents[i:i + BATCH_SIZE], company, output_dir, validate)
+               for i in range(0, len(documents), BATCH_SIZE)]
+
+    if len(batches) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_export_batch, batches))
+    else:
+        results = [_export_batch(batch) for batch in batches]
+
+    errors = {}
+    for _, batch_errors in results:
+        errors.update(batch_errors)
+    written = sum(count for count, _ in results)
+
+    return {"written": written, "errors": errors, "output_dir": output_dir,
+            "duration": round(time.perf_counter() - started, 3)}
+
+
+def main():
+    from data.database import DEFAULT_DB_PATH, Database
+    from data.models import BusinessProfile
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="exporter les factures d'un mois")
+    export.add_argument("month", help="AAAA-MM")
+    export.add_argument("--output", default="exports/teif")
+    export.add_argument("--workers", type=int, help="processus (par défaut : nombre de cœurs)")
+    export.add_argument("--no-validate", action="store_true")
+    validate = commands.add_parser("validate", help="contrôler des fichiers TEIF")
+    validate.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "validate":
+        invalid = 0
+        for path in args.files:
+            errors = validate_teif(path)
+            invalid += bool(errors)
+            print(f"{path} : {'valide' if not errors else '; '.join(errors)}")
+        parser.exit(1 if invalid else 0)
+
+    try:
+        start = datetime.strptime(args.month, "%Y-%m").date()
+    except ValueError:
+        parser.exit(1, f"Erreur : mois invalide {args.month!r} (AAAA-MM)\n")
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    database = Database(args.db)
+    company = company_from_profile(database.get_profile() or BusinessProfile())
+    result = export_period(start, end, os.path.join(args.output, args.month), company, database,
+                           args.workers, not args.no_validate)
+    print(f"{result['written']} factures exportées en {result['duration']:.1f} s -> {result['output_dir']}")
+    for invoice_id, errors in list(result["errors"].items())[:20]:
+        print(f"  {invoice_id} : {'; '.join(errors)}")
+    if result["errors"]:
+        print(f"{len(result['errors'])} facture(s) non conformes")
+
+
+if __name__ == "__main__":
+    main()